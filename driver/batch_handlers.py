@@ -0,0 +1,526 @@
+"""
+内置数值处理器的批量(向量化)实现.
+
+当数据点的值为数值数组时(例如振动、电能质量等高频采样数据), 使用 NumPy 对整列数据一次完成缩放、保留小数位数、
+数值转换及有效/无效范围处理. 处理结果与对数组中每个值分别调用内置处理器的结果完全相同:
+
+- 内置处理器使用 Decimal 计算, 批量处理使用 float64 及双倍精度(double-double)运算. 只有当计算结果远离舍入边界时才使用
+  向量化结果, 靠近舍入边界的值(概率极低)仍然逐个调用内置处理器计算.
+- 依赖最新有效值的处理方式(变化率、差值、最新有效值)不支持批量处理.
+
+未安装 numpy 时不使用批量处理.
+"""
+from abc import abstractmethod
+from typing import Optional
+
+from airiot_python_sdk.driver.handler import DataHandler
+from airiot_python_sdk.driver.handler.convert_value_handler import ConvertValueDataHandler
+from airiot_python_sdk.driver.handler.invalid_range_value_handler import InvalidRangeValueDataHandler
+from airiot_python_sdk.driver.handler.round_and_scale_handler import RoundAndScaleDataHandler
+from airiot_python_sdk.driver.handler.valid_range_value_handler import ValidRangeValueDataHandler
+from airiot_python_sdk.driver.model.tag import Tag, RangeCondition
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# float64 可以精确表示的最大整数
+max_exact_int = 2 ** 53
+
+# 向量化计算支持的数值范围, 超出范围的值逐个计算
+max_magnitude = 2.0 ** 500
+min_magnitude = 2.0 ** -500
+
+
+def is_numeric_sequence(value: any) -> bool:
+    """
+    判断数据点的值是否为可以批量处理的数值数组. 数组中的值必须都是 int 或 float(不包括 bool)
+    """
+    if np is None:
+        return False
+
+    if isinstance(value, np.ndarray):
+        return value.ndim == 1 and value.size > 0 and value.dtype.kind in "iuf"
+
+    if not isinstance(value, (list, tuple)) or len(value) == 0:
+        return False
+
+    for item in value:
+        kind = type(item)
+        if kind is float:
+            continue
+        if kind is not int or not -max_exact_int <= item <= max_exact_int:
+            return False
+
+    return True
+
+
+def _two_sum(a, b):
+    s = a + b
+    bb = s - a
+    return s, (a - (s - bb)) + (b - bb)
+
+
+def _quick_two_sum(a, b):
+    s = a + b
+    return s, b - (s - a)
+
+
+def _split(a):
+    c = 134217729.0 * a
+    hi = c - (c - a)
+    return hi, a - hi
+
+
+def _two_prod(a, b):
+    p = a * b
+    ah, al = _split(a)
+    bh, bl = _split(b)
+    return p, ((ah * bh - p) + ah * bl + al * bh) + al * bl
+
+
+def _dd_add(ah, al, bh, bl):
+    s, e = _two_sum(ah, bh)
+    return _quick_two_sum(s, e + al + bl)
+
+
+def _dd_mul(ah, al, bh, bl):
+    p, e = _two_prod(ah, bh)
+    return _quick_two_sum(p, e + ah * bl + al * bh)
+
+
+def _dd_div(ah, al, bh, bl):
+    q1 = ah / bh
+    ph, pl = _dd_mul(bh, bl, q1, 0.0)
+    rh, rl = _dd_add(ah, al, -ph, -pl)
+    q2 = rh / bh
+    ph, pl = _dd_mul(bh, bl, q2, 0.0)
+    rh, rl = _dd_add(rh, rl, -ph, -pl)
+    q3 = rh / bh
+    q1, q2 = _quick_two_sum(q1, q2)
+    return _dd_add(q1, q2, q3, 0.0)
+
+
+def _near_midpoint(hi, lo, tolerance):
+    """
+    判断 hi + lo 是否靠近 hi 与相邻 float64 的中点. 靠近中点时 Decimal 的舍入结果可能与 hi 不同
+    """
+    up = np.nextafter(hi, np.inf) - hi
+    down = hi - np.nextafter(hi, -np.inf)
+    half = np.where(lo >= 0, up, down) / 2
+    return np.abs(np.abs(lo) - half) <= tolerance
+
+
+def _in_range(values):
+    magnitude = np.abs(values)
+    return (magnitude < max_magnitude) & ((magnitude > min_magnitude) | (magnitude == 0))
+
+
+class Column:
+    """
+    数组形式的数据点值.
+
+    计算得到的值保存在 float64 数组中. 原始值及配置中的常量(例如 int 类型的固定值)保存在对象数组中,
+    以保证转换为 list 后与逐个处理的结果类型相同.
+
+    Attributes:
+        values: 数值
+        objects: 原始对象. is_object 为 True 的元素使用该值
+        is_object: 是否使用原始对象
+        present: 是否存在该值. 不存在的值在转换为 list 时为 None
+    """
+
+    __slots__ = ("values", "objects", "is_object", "present")
+
+    def __init__(self, values, objects, is_object, present):
+        self.values = values
+        self.objects = objects
+        self.is_object = is_object
+        self.present = present
+
+    @staticmethod
+    def of(sequence) -> "Column":
+        """
+        根据数值数组创建
+        """
+        if isinstance(sequence, np.ndarray):
+            values = sequence.astype(np.float64)
+            items = sequence.tolist()
+        else:
+            values = np.asarray(sequence, dtype=np.float64)
+            items = sequence
+
+        objects = np.empty(len(values), dtype=object)
+        objects[:] = items
+        is_object = np.fromiter((type(item) is not float for item in items), dtype=bool, count=len(values))
+        return Column(values, objects, is_object, np.ones(len(values), dtype=bool))
+
+    @staticmethod
+    def empty(size: int) -> "Column":
+        return Column(np.zeros(size, dtype=np.float64), np.empty(size, dtype=object), np.zeros(size, dtype=bool),
+                      np.zeros(size, dtype=bool))
+
+    def __len__(self):
+        return len(self.values)
+
+    def get(self, index: int) -> any:
+        if not self.present[index]:
+            return None
+        if self.is_object[index]:
+            return self.objects[index]
+        return float(self.values[index])
+
+    def set(self, index: int, value: any):
+        if value is None:
+            self.present[index] = False
+            return
+
+        self.present[index] = True
+        if type(value) is float:
+            self.values[index] = value
+            self.is_object[index] = False
+        else:
+            self.objects[index] = value
+            self.values[index] = float(value) if isinstance(value, (int, float)) else np.nan
+            self.is_object[index] = True
+
+    def set_floats(self, mask, values):
+        self.values[mask] = values[mask]
+        self.is_object[mask] = False
+        self.present[mask] = True
+
+    def set_constant(self, mask, value: any):
+        if value is None:
+            self.present[mask] = False
+        elif type(value) is float:
+            self.values[mask] = value
+            self.is_object[mask] = False
+            self.present[mask] = True
+        else:
+            self.objects[mask] = value
+            self.values[mask] = float(value) if isinstance(value, (int, float)) else np.nan
+            self.is_object[mask] = True
+            self.present[mask] = True
+
+    def assign(self, mask, other: "Column"):
+        self.values[mask] = other.values[mask]
+        self.objects[mask] = other.objects[mask]
+        self.is_object[mask] = other.is_object[mask]
+        self.present[mask] = other.present[mask]
+
+    def to_list(self) -> list:
+        result = self.values.tolist()
+        for index in np.flatnonzero(self.is_object & self.present):
+            result[index] = self.objects[index]
+        for index in np.flatnonzero(~self.present):
+            result[index] = None
+        return result
+
+
+def _is_number(value: any) -> bool:
+    """
+    判断配置中的常量是否可以参与向量化计算. int 必须可以使用 float64 精确表示
+    """
+    if value is None:
+        return True
+    if type(value) is int:
+        return -max_exact_int <= value <= max_exact_int
+    return type(value) is float and abs(value) < max_magnitude
+
+
+class BatchDataHandler:
+    """
+    批量数据处理器. 对数组中的每个值执行与对应内置处理器相同的处理.
+
+    Attributes:
+        handler: 对应的内置处理器, 用于处理无法向量化计算的值
+    """
+
+    handler: DataHandler
+
+    def __init__(self, handler: DataHandler):
+        self.handler = handler
+
+    @abstractmethod
+    def support_batch(self, tag: Tag) -> bool:
+        """
+        判断是否支持批量处理该数据点. 只在内置处理器支持处理该数据点的数值时调用
+        :param tag: 数据点信息
+        :return: 支持时返回 True
+        """
+
+    @abstractmethod
+    def handle_batch(self, tag: Tag, column: Column):
+        """
+        批量处理数据
+        :param tag: 数据点信息
+        :param column: 数据点的值
+        :return: (处理的元素, 处理结果, 需要逐个处理的元素). 处理结果的 key 为数据点标识, value 为处理后的值
+        """
+
+    async def handle_column(self, table_id: str, device_id: str, tag: Tag, column: Column):
+        """
+        批量处理数据, 无法向量化计算的值逐个调用内置处理器处理
+        :return: (处理的元素, 处理结果)
+        """
+        with np.errstate(all="ignore"):
+            applied, results, fallback = self.handle_batch(tag, column)
+
+        for index in np.flatnonzero(fallback):
+            value = await self.handler.handle(table_id, device_id, tag, column.get(index))
+            for key in value:
+                if key not in results:
+                    results[key] = Column.empty(len(column))
+            results[tag.id].set(index, value.get(tag.id))
+            for key, item in value.items():
+                if key != tag.id:
+                    results[key].set(index, item)
+
+        return applied, results
+
+
+class BatchRoundAndScaleDataHandler(BatchDataHandler):
+    """
+    数值缩放及保留小数位数的批量处理
+    """
+
+    def support_batch(self, tag: Tag) -> bool:
+        if tag.fixed is not None and not 0 <= tag.fixed <= 15:
+            return False
+        return tag.mod is None or _is_number(tag.mod)
+
+    def handle_batch(self, tag: Tag, column: Column):
+        size = len(column)
+        values = column.values
+        applied = column.present.copy()
+        result = Column.empty(size)
+
+        # nan 或 inf 时丢弃该值
+        finite = np.isfinite(values)
+        mask = applied & finite
+
+        if tag.mod is not None:
+            hi, lo = _two_prod(values, float(tag.mod))
+            fallback = ~_in_range(values) | ~_in_range(hi)
+        else:
+            hi, lo = values, np.zeros(size)
+            fallback = np.zeros(size, dtype=bool)
+
+        if tag.fixed is None:
+            # Decimal 乘法结果保留 28 位有效数字, 只有乘积靠近 float64 舍入中点时结果才可能不同
+            fallback |= _near_midpoint(hi, lo, np.abs(hi) * 2.0 ** -80)
+            result_values = hi
+        else:
+            scale = 10.0 ** tag.fixed
+            scaled = hi * scale + lo * scale
+            magnitude = np.abs(scaled)
+            fraction = magnitude - np.floor(magnitude)
+
+            # 四舍五入(ROUND_HALF_UP). 靠近 .5 时逐个计算
+            fallback |= (magnitude >= 2.0 ** 40) | (np.abs(fraction - 0.5) <= np.maximum(magnitude * 2.0 ** -45,
+                                                                                         2.0 ** -60))
+            result_values = np.copysign(np.floor(magnitude + 0.5), hi) / scale
+
+        fallback &= mask
+        result.set_floats(mask & ~fallback, result_values)
+        return applied, {tag.id: result}, fallback
+
+
+class BatchConvertValueDataHandler(BatchDataHandler):
+    """
+    数值转换的批量处理
+    """
+
+    def support_batch(self, tag: Tag) -> bool:
+        tag_value = tag.tagValue
+        return all(_is_number(value) for value in (tag_value.minValue, tag_value.maxValue,
+                                                   tag_value.minRaw, tag_value.maxRaw))
+
+    def handle_batch(self, tag: Tag, column: Column):
+        size = len(column)
+        values = column.values
+        applied = column.present.copy()
+        result = Column.empty(size)
+
+        mask = applied & np.isfinite(values)
+        fallback = np.zeros(size, dtype=bool)
+
+        tag_value = tag.tagValue
+        min_raw = float(tag_value.minRaw)
+        max_raw = float(tag_value.maxRaw)
+        min_value = float(tag_value.minValue)
+        max_value = float(tag_value.maxValue)
+
+        # 如果原始最大值和最小值相等, 则不进行映射
+        if min_raw == max_raw:
+            result.assign(mask, column)
+            return applied, {tag.id: result}, fallback
+
+        clamped = np.minimum(np.maximum(values, min_raw), max_raw)
+
+        # (当前值 - minRawValue) / (maxRawValue - minRawValue) * (maxValue - minValue) + minValue
+        nh, nl = _two_sum(clamped, -min_raw)
+        dh, dl = _two_sum(max_raw, -min_raw)
+        wh, wl = _two_sum(max_value, -min_value)
+        qh, ql = _dd_div(nh, nl, dh, dl)
+        mh, ml = _dd_mul(qh, ql, wh, wl)
+        sh, sl = _dd_add(mh, ml, min_value, 0.0)
+
+        tolerance = (np.abs(mh) + abs(min_value) + np.abs(sh)) * 2.0 ** -80
+        fallback = mask & (~_in_range(values) | ~_in_range(mh) | ~_in_range(sh) | _near_midpoint(sh, sl, tolerance))
+
+        # 小于原始最小值的值映射后为最小值. 最小值为 0 时结果的符号与 Decimal 运算有关, 逐个计算
+        if min_value != 0:
+            lowest = mask & (clamped == min_raw)
+            fallback &= ~lowest
+            sh = np.where(lowest, min_value, sh)
+
+        result.set_floats(mask & ~fallback, sh)
+        return applied, {tag.id: result}, fallback
+
+
+def _condition_matched(condition: RangeCondition, values):
+    if condition.condition == "range":
+        return (values >= condition.minValue) & (values <= condition.maxValue)
+    elif condition.condition == "greater":
+        return values >= condition.maxValue
+    elif condition.condition == "less":
+        return values <= condition.minValue
+    return np.zeros(len(values), dtype=bool)
+
+
+def _range_supported(tag: Tag) -> bool:
+    range_config = tag.range
+    if range_config.active == "latest":
+        return False
+
+    for condition in range_config.conditions:
+        # 变化率及差值需要使用最新有效值
+        if condition.mode != "number":
+            return False
+        if not _is_number(condition.minValue) or not _is_number(condition.maxValue):
+            return False
+
+    return _is_number(range_config.fixedValue)
+
+
+class BatchValidRangeValueDataHandler(BatchDataHandler):
+    """
+    有效范围值的批量处理. 只支持数值模式, 并且不使用最新有效值的配置
+    """
+
+    def support_batch(self, tag: Tag) -> bool:
+        if not _range_supported(tag):
+            return False
+
+        # 使用边界值时必须有默认条件
+        if tag.range.active == "boundary":
+            return self.__default_condition__(tag) is not None
+
+        return True
+
+    @staticmethod
+    def __default_condition__(tag: Tag) -> Optional[RangeCondition]:
+        default = None
+        for condition in tag.range.conditions:
+            if condition.defaultCondition:
+                default = condition
+        return default
+
+    def handle_batch(self, tag: Tag, column: Column):
+        size = len(column)
+        values = column.values
+        applied = column.present.copy()
+        range_config = tag.range
+
+        mask = applied & np.isfinite(values)
+
+        matched = np.zeros(size, dtype=bool)
+        for condition in range_config.conditions:
+            matched |= _condition_matched(condition, values)
+
+        result = Column.empty(size)
+        result.assign(mask & matched, column)
+
+        invalid = mask & ~matched
+        if range_config.active == "fixedValue":
+            result.set_constant(invalid, range_config.fixedValue)
+        elif range_config.active == "boundary":
+            condition = self.__default_condition__(tag)
+            if condition.condition == "range":
+                result.set_constant(invalid & (values < condition.minValue), condition.minValue)
+                result.set_constant(invalid & (values > condition.maxValue), condition.maxValue)
+            elif condition.condition == "greater":
+                result.set_constant(invalid, condition.maxValue)
+            elif condition.condition == "less":
+                result.set_constant(invalid, condition.minValue)
+
+        results = {tag.id: result}
+
+        # 如果设置了保存无效值
+        if range_config.invalidAction == "save" and invalid.any():
+            saved = Column.empty(size)
+            saved.assign(invalid, column)
+            results["{}__invalid".format(tag.id)] = saved
+
+        return applied, results, np.zeros(size, dtype=bool)
+
+
+class BatchInvalidRangeValueDataHandler(BatchDataHandler):
+    """
+    无效范围值的批量处理. 只支持数值模式, 并且不使用最新有效值的配置
+    """
+
+    def support_batch(self, tag: Tag) -> bool:
+        return _range_supported(tag)
+
+    def handle_batch(self, tag: Tag, column: Column):
+        size = len(column)
+        values = column.values
+        applied = column.present.copy()
+        range_config = tag.range
+
+        mask = applied & np.isfinite(values)
+
+        # 第一个匹配的条件决定无效值类型
+        invalid = np.zeros(size, dtype=bool)
+        invalid_type = Column.empty(size)
+        for condition in range_config.conditions:
+            matched = mask & ~invalid & _condition_matched(condition, values)
+            invalid_type.set_constant(matched, condition.invalidType)
+            invalid |= matched
+
+        result = Column.empty(size)
+        result.assign(mask & ~invalid, column)
+        if range_config.active == "fixedValue":
+            result.set_constant(invalid, range_config.fixedValue)
+
+        results = {tag.id: result}
+        if invalid.any():
+            results["{}__invalid__type".format(tag.id)] = invalid_type
+
+            # 如果设置了保存无效值
+            if range_config.invalidAction == "save":
+                saved = Column.empty(size)
+                saved.assign(invalid, column)
+                results["{}__invalid".format(tag.id)] = saved
+
+        return applied, results, np.zeros(size, dtype=bool)
+
+
+def create_batch_handler(handler: DataHandler) -> Optional[BatchDataHandler]:
+    """
+    获取内置处理器对应的批量处理器. 不支持批量处理时返回 None
+    """
+    if np is None:
+        return None
+    if isinstance(handler, RoundAndScaleDataHandler):
+        return BatchRoundAndScaleDataHandler(handler)
+    if isinstance(handler, ConvertValueDataHandler):
+        return BatchConvertValueDataHandler(handler)
+    if isinstance(handler, ValidRangeValueDataHandler):
+        return BatchValidRangeValueDataHandler(handler)
+    if isinstance(handler, InvalidRangeValueDataHandler):
+        return BatchInvalidRangeValueDataHandler(handler)
+    return None
@@ -0,0 +1,389 @@
+import asyncio
+import json
+import logging
+import time
+import traceback
+from typing import Iterable, Optional
+
+from airiot_python_sdk.driver import DataSender
+from airiot_python_sdk.driver.model.point import Point, SimplePoint
+from airiot_python_sdk.driver.service.kafka_data_sender import KafkaDataSender
+from airiot_python_sdk.driver.service.mqtt_data_sender import MQTTDataSender
+from kafka_sender import BufferedKafkaDataSender
+from metrics import Histogram
+from paho.mqtt import client as mqtt_client
+from spool import SegmentSpool, SpoolRecord
+from uplink_codec import PointEncoder, dumps_point
+
+logger = logging.getLogger("batch_data_sender")
+
+
+class BatchDataSender:
+    """
+    批量数据发送器. 对 SDK 的 DataSender 进行封装, 支持一次发送多个设备的数据.
+
+    如果设置了合并窗口(window), 在窗口时间内同一工作表同一设备的多次数据会合并为一个 SimplePoint 发送,
+    相同数据点保留最新的值, 时间取最新的时间. 当等待发送的设备数量达到 max_points 时立即发送.
+    如果未设置合并窗口, 则每次调用 write_points 时立即发送.
+
+    如果设置了数据缓冲(spool), 与平台的连接断开或发送失败时数据写入磁盘缓冲, 连接恢复后按 replay_rate 限制的速率
+    按顺序重新发送. 缓冲中还有未发送的数据时, 新的数据同样写入缓冲, 保证同一设备的数据按顺序发送.
+
+    使用 BufferedKafkaDataSender 时, write_points 在 producer 的本地队列已满时等待(最多 block_timeout), 接收消息的任务
+    因此变慢, 由接收队列的溢出策略处理积压的消息. 等待超时后剩余的数据写入数据缓冲, 未配置数据缓冲时丢弃.
+
+    Attributes:
+        sender: SDK 的数据发送器
+        window: 合并窗口(毫秒). 0 表示不合并
+        max_points: 合并窗口内等待发送的最大设备数量
+        written: 写入的数据点数量(处理前)
+        sent: 实际发送的 SimplePoint 数量
+        coalesced: 被合并的数据点数量
+        spool: 数据缓冲. 为 None 时不缓冲, 发送失败时抛出异常
+        replay_rate: 重新发送缓冲数据的速率(条/秒), 包括缓冲期间新产生的数据. 0 表示不限制
+        replayed: 从缓冲中重新发送的数据数量
+        dropped: 未配置数据缓冲时因 Kafka 本地队列已满而丢弃的 SimplePoint 数量
+        encoder: 数据点编码器. 只用于 MQTT 和 Kafka 发送器, 数据缓冲中总是保存 JSON 格式
+        handle_latency: 数据处理器链处理每个数据的耗时. 为 None 时不统计
+    """
+
+    sender: DataSender
+    window: int
+    max_points: int
+
+    spool: Optional[SegmentSpool]
+    replay_rate: int
+    encoder: PointEncoder
+    handle_latency: Optional[Histogram]
+
+    written: int = 0
+    sent: int = 0
+    coalesced: int = 0
+    replayed: int = 0
+    dropped: int = 0
+
+    def __init__(self, sender: DataSender, window: int = 0, max_points: int = 1000,
+                 spool: Optional[SegmentSpool] = None, replay_rate: int = 0, encoder: Optional[PointEncoder] = None,
+                 handle_latency: Optional[Histogram] = None):
+        if window < 0:
+            raise ValueError("window must be greater than or equal to 0")
+        if max_points <= 0:
+            raise ValueError("max_points must be greater than 0")
+        if replay_rate < 0:
+            raise ValueError("replay_rate must be greater than or equal to 0")
+
+        self.sender = sender
+        self.window = window
+        self.max_points = max_points
+        self.spool = spool
+        self.replay_rate = replay_rate
+        # 其它发送器重新发送缓冲数据时需要解析 JSON
+        self.encoder = encoder if encoder is not None and isinstance(sender, (MQTTDataSender, KafkaDataSender)) \
+            else PointEncoder()
+        self.handle_latency = handle_latency
+
+        # 等待发送的数据. key 为 (工作表标识, 设备编号, 子设备编号)
+        self.pending: dict[tuple, SimplePoint] = {}
+        self.flush_task: Optional[asyncio.Task] = None
+        self.replay_task: Optional[asyncio.Task] = None
+        # 在事件循环中等待发送时, 保证各批数据按顺序发送
+        self.publishing = asyncio.Lock()
+
+    def start(self):
+        """
+        启动定时发送任务. 必须在驱动事件循环中调用
+        """
+        if self.window > 0 and self.flush_task is None:
+            self.flush_task = asyncio.get_running_loop().create_task(self.__flush_loop__())
+        if self.spool is not None and self.replay_task is None:
+            self.replay_task = asyncio.get_running_loop().create_task(self.__replay_loop__())
+
+    async def stop(self):
+        """
+        停止定时发送任务, 并发送所有等待发送的数据
+        """
+        for task in (self.flush_task, self.replay_task):
+            if task is not None:
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+        self.flush_task = None
+        self.replay_task = None
+
+        try:
+            self.flush()
+        finally:
+            if self.spool is not None:
+                self.spool.close()
+
+    async def write_point(self, point: Point):
+        """
+        向平台发送设备采集到的数据
+        :param point: 设备采集到的数据
+        :raise ValueError: point is None
+        """
+        if point is None:
+            raise ValueError("point is None")
+
+        await self.write_points((point,))
+
+    async def write_points(self, points: Iterable[Point]):
+        """
+        向平台批量发送设备采集到的数据. 每个数据都会经过数据处理器链处理
+        :param points: 设备采集到的数据
+        """
+
+        results = []
+        latency = self.handle_latency
+        for point in points:
+            if point is None:
+                continue
+
+            self.written += 1
+            if latency is None:
+                result = await self.sender.handler_chain.handle(point)
+            else:
+                begin = time.perf_counter()
+                result = await self.sender.handler_chain.handle(point)
+                latency.observe(time.perf_counter() - begin)
+            if result is not None:
+                results.append(result)
+
+        if len(results) == 0:
+            return
+
+        if self.window == 0:
+            await self.publish_wait(results)
+            return
+
+        for result in results:
+            self.__merge__(result)
+
+        if len(self.pending) >= self.max_points:
+            await self.flush_wait()
+
+    def flush(self):
+        """
+        立即发送合并窗口中等待发送的数据
+        """
+        if len(self.pending) == 0:
+            return
+
+        points = list(self.pending.values())
+        self.pending = {}
+        self.publish(points)
+
+    async def flush_wait(self):
+        """
+        立即发送合并窗口中等待发送的数据. Kafka 本地队列已满时在事件循环中等待, 见 publish_wait
+        """
+        if len(self.pending) == 0:
+            return
+
+        points = list(self.pending.values())
+        self.pending = {}
+        await self.publish_wait(points)
+
+    async def publish_wait(self, points: list[SimplePoint]):
+        """
+        发送处理后的数据. 与 publish 相同, 但 BufferedKafkaDataSender 的本地队列已满时在事件循环中等待并重试,
+        最多等待 block_timeout. 超时后剩余的数据写入数据缓冲, 未配置数据缓冲时丢弃
+        :param points: 处理后的数据
+        :raise BufferError: 等待超时, 并且未配置数据缓冲
+        """
+        sender = self.sender
+        if not isinstance(sender, BufferedKafkaDataSender) or not sender.production:
+            self.publish(points)
+            return
+
+        async with self.publishing:
+            if self.spool is not None and (self.spool.pending > 0 or not self.connected()):
+                self.__spool__(points)
+                return
+
+            sent = 0
+            try:
+                if not self.connected():
+                    raise Exception("kafka data sender is disconnected")
+                for point in points:
+                    point.source = "device"
+                    key = "{}/{}/{}".format(sender.project_id, point.table, point.id)
+                    payload = self.encoder.encode(point)
+                    # 本地队列未满时不创建协程
+                    if not sender.offer("data", key, payload):
+                        await sender.produce_wait("data", key, payload)
+                    sent += 1
+            except Exception as e:
+                if self.spool is None:
+                    self.dropped += len(points) - sent
+                    raise
+                logger.warning("发送数据失败, 写入数据缓冲: %s", e)
+                self.__spool__(points[sent:])
+            finally:
+                self.sent += sent
+
+    def publish(self, points: list[SimplePoint]):
+        """
+        发送处理后的数据. MQTT 和 Kafka 发送器在一次调用中发送所有数据, 其它发送器逐个发送.
+        配置了数据缓冲时, 未连接、缓冲中还有未发送的数据或发送失败时写入缓冲
+        :param points: 处理后的数据
+        :raise Exception: 数据发送器未连接, 并且未配置数据缓冲
+        """
+
+        if self.spool is not None and (self.spool.pending > 0 or not self.connected()):
+            self.__spool__(points)
+            return
+
+        sent = 0
+        try:
+            if not self.connected():
+                raise Exception("mqtt data sender is disconnected")
+            for point in points:
+                point.source = "device"
+                if isinstance(self.sender, (MQTTDataSender, KafkaDataSender)):
+                    self.__send_record__((point.table, point.id, self.encoder.encode(point)))
+                else:
+                    self.sender.__write_point__(point)
+                sent += 1
+        except Exception as e:
+            if self.spool is None:
+                raise
+            logger.warning("发送数据失败, 写入数据缓冲: %s", e)
+            self.__spool__(points[sent:])
+        finally:
+            self.sent += sent
+            if sent > 0:
+                self.__poll__()
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "written": self.written,
+            "sent": self.sent,
+            "coalesced": self.coalesced,
+            "replayed": self.replayed,
+            "dropped": self.dropped,
+            "pending": len(self.pending),
+        }
+
+    def connected(self) -> bool:
+        """
+        判断数据发送器是否已连接. 只能判断 MQTT 发送器的连接状态, 其它发送器在发送失败时写入缓冲
+        """
+        sender = self.sender
+        if isinstance(sender, MQTTDataSender):
+            return sender.client is not None and sender.client.is_connected()
+        if isinstance(sender, KafkaDataSender):
+            return sender.client is not None
+        return True
+
+    def __send_record__(self, record: SpoolRecord):
+        """
+        发送已编码的数据
+        :param record: (工作表标识, 设备编号, 按 encoder 格式编码的 SimplePoint)
+        :raise Exception: 发送失败
+        """
+        table_id, device_id, payload = record
+        sender = self.sender
+        if isinstance(sender, MQTTDataSender):
+            info = sender.client.publish("data/{}/{}/{}".format(sender.project_id, table_id, device_id),
+                                         payload=payload, qos=0)
+            if info.rc != mqtt_client.MQTT_ERR_SUCCESS:
+                raise Exception("发布消息失败: {}".format(mqtt_client.error_string(info.rc)))
+        elif isinstance(sender, BufferedKafkaDataSender):
+            # 本地队列已满时处理一次发送结果后重试, 仍然已满时立即抛出 BufferError
+            sender.produce("data", "{}/{}/{}".format(sender.project_id, table_id, device_id), payload)
+        elif isinstance(sender, KafkaDataSender):
+            # 发送队列已满时抛出 BufferError
+            sender.client.produce("data", key="{}/{}/{}".format(sender.project_id, table_id, device_id),
+                                  value=payload)
+        else:
+            point = json.loads(payload)
+            simple_point = SimplePoint(point["table"], point["id"], point["fields"], point.get("cid"),
+                                       point.get("time"), point.get("fieldTypes"))
+            simple_point.source = point.get("source")
+            sender.__write_point__(simple_point)
+
+    def __poll__(self):
+        """
+        处理 Kafka 发送结果. 每批数据只触发一次, 已有后台线程处理时不需要调用
+        """
+        sender = self.sender
+        if isinstance(sender, KafkaDataSender) and not (
+                isinstance(sender, BufferedKafkaDataSender) and sender.production):
+            sender.client.poll(0)
+
+    def __spool__(self, points: list[SimplePoint]):
+        for point in points:
+            point.source = "device"
+        self.spool.append((point.table, point.id, dumps_point(point)) for point in points)
+
+    def replay(self, limit: int) -> int:
+        """
+        按顺序重新发送缓冲中的数据
+        :param limit: 最多发送的数据数量
+        :return: 发送的数据数量
+        """
+        spool = self.spool
+        if spool is None or spool.pending == 0 or not self.connected():
+            return 0
+
+        records = spool.read(limit)
+        sent = 0
+        try:
+            for (table_id, device_id, payload), _ in records:
+                self.__send_record__((table_id, device_id, self.encoder.from_json(payload)))
+                sent += 1
+        except Exception as e:
+            logger.warning("重新发送缓冲数据失败: %s", e)
+        finally:
+            if sent > 0:
+                spool.commit(records[sent - 1][1], sent)
+                self.replayed += sent
+                self.sent += sent
+                self.__poll__()
+        return sent
+
+    def __merge__(self, point: SimplePoint):
+        key = (point.table, point.id, point.cid)
+        exists = self.pending.get(key)
+        if exists is None:
+            self.pending[key] = point
+            return
+
+        self.coalesced += 1
+        exists.fields.update(point.fields)
+        if point.fieldTypes:
+            exists.fieldTypes = {**exists.fieldTypes, **point.fieldTypes} if exists.fieldTypes else point.fieldTypes
+        if point.time is not None and (exists.time is None or point.time > exists.time):
+            exists.time = point.time
+
+    async def __replay_loop__(self, interval: float = 0.1):
+        budget = 0.0
+        while True:
+            await asyncio.sleep(interval)
+            if self.spool.pending == 0:
+                budget = 0.0
+                continue
+
+            # 按速率累计每次可以发送的数量, 最多累计 1 秒的数量
+            if self.replay_rate > 0:
+                budget = min(budget + self.replay_rate * interval, max(1.0, self.replay_rate))
+                limit = int(budget)
+            else:
+                limit = self.max_points
+            if limit <= 0:
+                continue
+
+            try:
+                budget -= self.replay(limit)
+            except Exception as e:
+                traceback.print_exception(e)
+                logger.error("重新发送缓冲数据异常: %s", e)
+
+    async def __flush_loop__(self):
+        while True:
+            await asyncio.sleep(self.window / 1000)
+            try:
+                await self.flush_wait()
+            except Exception as e:
+                traceback.print_exception(e)
+                logger.error("批量发送数据异常: %s", e)
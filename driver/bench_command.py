@@ -0,0 +1,149 @@
+"""
+批量指令发送性能测试. 模拟的 MQTT 服务器在网络线程中以固定的往返时间确认消息(PUBACK),
+对比逐个设备发送并等待确认(run)与批量流水线发送(batch_run).
+
+运行方式(driver 目录下): python bench_command.py [设备数量] [往返时间(ms)]
+默认 5000 个设备, 往返时间 1 ms.
+"""
+import asyncio
+import json
+import queue
+import sys
+import threading
+import time
+
+from airiot_python_sdk.driver.handler import DataHandlerChain
+
+from mqtt_driver import MqttDriverApp
+from paho.mqtt import client as mqtt_client
+
+javascript = """
+function handler(tableId, deviceId, command) {
+    return {"topic": "cmd/" + deviceId, "payload": command};
+}
+"""
+
+python = """
+def handler(table_id, device_id, command):
+    return {"topic": "cmd/" + device_id, "payload": command}
+"""
+
+
+class PublishInfo:
+
+    def __init__(self, mid: int):
+        self.rc = mqtt_client.MQTT_ERR_SUCCESS
+        self.mid = mid
+
+
+class LatencyClient:
+    """
+    模拟的 MQTT 连接. 消息在往返时间后由网络线程确认
+    """
+
+    def __init__(self, rtt: float):
+        self.rtt = rtt
+        self.mid = 0
+        self.on_connect = None
+        self.on_publish = None
+        self.queue = queue.Queue()
+        threading.Thread(target=self.__network__, daemon=True).start()
+
+    def is_connected(self) -> bool:
+        return True
+
+    def subscribe(self, topics):
+        pass
+
+    def publish(self, topic, payload=None, qos=0):
+        self.mid += 1
+        self.queue.put((time.perf_counter() + self.rtt, self.mid))
+        return PublishInfo(self.mid)
+
+    def __network__(self):
+        while True:
+            deadline, mid = self.queue.get()
+            delay = deadline - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            self.on_publish(self, None, mid)
+
+    def loop_start(self):
+        self.on_connect(self, None, None, 0)
+
+    def loop_stop(self):
+        pass
+
+    def disconnect(self, reasoncode=None):
+        pass
+
+
+class BenchDataSender:
+
+    def __init__(self):
+        self.handler_chain = DataHandlerChain([])
+
+    def send_warning(self, *args):
+        pass
+
+
+class BenchMqttDriverApp(MqttDriverApp):
+    rtt: float = 0.001
+
+    def __create_mqtt_client__(self, config):
+        self.client = LatencyClient(self.rtt)
+        self.client.on_connect = self.on_connect
+        self.client.on_publish = self.publish_tracker.on_publish
+
+
+def create_config(script: str, script_type: str, devices: int) -> str:
+    parse_script = "function handler() { return []; }"
+    if script_type == "python":
+        parse_script = "def handler(topic, message):\n    return []\n"
+    return json.dumps({
+        "id": "d1", "name": "mqtt", "driverType": "mqtt",
+        "device": {"settings": {"server": "tcp://127.0.0.1:1883", "command": {"timeout": 60000}}},
+        "tables": [{
+            "id": "t1",
+            "device": {"settings": {"topic": "data/#", "parseScript": parse_script,
+                                    "commandScript": script, "scriptType": script_type},
+                       "tags": [{"id": "temp", "name": "temp", "key": "temp"}]},
+            "devices": [{"id": "SN{}".format(i)} for i in range(devices)],
+        }],
+    })
+
+
+async def bench(name: str, script: str, script_type: str, devices: int, rtt: float):
+    app = BenchMqttDriverApp("bench", BenchDataSender())
+    app.rtt = rtt
+    await app.start(create_config(script, script_type, devices))
+    device_ids = ["SN{}".format(i) for i in range(devices)]
+    command = '{"action": "reboot"}'
+
+    # 逐个发送只测试部分设备
+    sequential = device_ids[:max(1, devices // 20)]
+    start = time.perf_counter()
+    for device_id in sequential:
+        await app.run("1", "t1", device_id, command)
+    run_rate = len(sequential) / (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    results = await app.batch_run("2", "t1", device_ids, command)
+    batch_rate = devices / (time.perf_counter() - start)
+    success = sum(1 for result in results if result["status"] == "success")
+
+    print("{:<10} run {:>8.0f} 条/s  batch_run {:>8.0f} 条/s  成功 {}/{}".format(
+        name, run_rate, batch_rate, success, devices))
+    await app.stop()
+
+
+async def main():
+    devices = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    rtt = float(sys.argv[2]) / 1000 if len(sys.argv) > 2 else 0.001
+    print("设备数量: {}, 往返时间: {:.1f} ms".format(devices, rtt * 1000))
+    await bench("python", python, "python", devices, rtt)
+    await bench("javascript", javascript, "javascript", devices, rtt)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
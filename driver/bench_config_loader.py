@@ -0,0 +1,66 @@
+"""
+驱动实例配置加载性能对比: jsons.loads 与 config_loader.load_driver_config. 工作表包含 50 个数据点, 设备均未自定义配置.
+
+运行方式(driver 目录下): python bench_config_loader.py [设备数量...]
+默认分别测试 1000、10000 及 100000 个设备. 100000 个设备时 jsons 需要约 100 秒.
+"""
+import gc
+import json
+import sys
+import time
+import tracemalloc
+
+import jsons
+
+from config_loader import load_driver_config
+from model import MQTTDriverConfig
+
+tag_count = 50
+
+
+def create_config(devices: int) -> str:
+    tags = [{"id": "tag{}".format(i), "name": "tag{}".format(i), "key": "tag{}".format(i), "fixed": 2,
+             "tagValue": {"minValue": 0, "maxValue": 100, "minRaw": 0, "maxRaw": 1000},
+             "range": {"method": "valid", "active": "boundary",
+                       "conditions": [{"mode": "number", "condition": "range", "minValue": 0, "maxValue": 100,
+                                       "defaultCondition": True}]}}
+            for i in range(tag_count)]
+    return json.dumps({
+        "id": "d1",
+        "name": "mqtt",
+        "driverType": "mqtt",
+        "device": {"settings": {"server": "tcp://127.0.0.1:1883"}},
+        "tables": [{
+            "id": "t1",
+            "device": {"settings": {"topic": "data/+", "parseScript": "function handler() {}"}, "tags": tags},
+            "devices": [{"id": "SN{}".format(i), "device": {"settings": {}, "tags": []}} for i in range(devices)],
+        }],
+    })
+
+
+def bench(name: str, load, config: str, devices: int):
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    driver_config = load(config)
+    for table in driver_config.tables:
+        table.merge_devices()
+    elapsed = time.perf_counter() - start
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print("{:<8} {:>8} 设备 {:>10.1f} ms  保留 {:>8.1f} MB  峰值 {:>8.1f} MB".format(
+        name, devices, elapsed * 1000, current / 1024 / 1024, peak / 1024 / 1024))
+    del driver_config
+
+
+def main():
+    counts = [int(arg) for arg in sys.argv[1:]] or [1000, 10000, 100000]
+    for devices in counts:
+        config = create_config(devices)
+        bench("jsons", lambda c: jsons.loads(c, MQTTDriverConfig), config, devices)
+        bench("loader", load_driver_config, config, devices)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+死区过滤效果: 模拟变化缓慢的设定值、状态位及带噪声的测量值, 统计配置死区前后发送的数据点数量及处理耗时.
+
+运行方式(driver 目录下): python bench_deadband.py [设备数量] [秒数]
+"""
+import asyncio
+import random
+import sys
+import time
+
+from airiot_python_sdk.driver.handler.round_and_scale_handler import RoundAndScaleDataHandler
+from airiot_python_sdk.driver.model.point import Point, Field
+from airiot_python_sdk.driver.model.tag import TagValue
+
+from deadband import DeadbandDataHandler
+from handler_chain import CompiledDataHandlerChain
+from model import Deadband, Device, DriverConfig, ModelConfig, MQTTTag
+
+
+def create_tags(deadband: bool) -> list[MQTTTag]:
+    # 10 个设定值, 5 个状态位, 5 个测量值(小数位数 1, 死区 0.5, 最长静默 60 秒)
+    tags = []
+    for i in range(20):
+        tag = MQTTTag("tag{}".format(i), "tag{}".format(i), TagValue(None, None, None, None) if i >= 15 else None,
+                      None, 1 if i >= 15 else None, None, "tag{}".format(i), None, None)
+        if deadband:
+            tag.deadband = Deadband("absolute", 0.5 if i >= 15 else 0, 60)
+        tags.append(tag)
+    return tags
+
+
+def create_points(tags: list[MQTTTag], devices: int, seconds: int) -> list[Point]:
+    rng = random.Random(1)
+    points = []
+    for second in range(seconds):
+        for device in range(devices):
+            point = Point()
+            point.table = "t1"
+            point.id = "SN{}".format(device)
+            point.time = second * 1000
+            fields = []
+            for i, tag in enumerate(tags):
+                if i < 10:
+                    # 设定值每 5 分钟变化一次
+                    value = 100 + (second // 300) + i
+                elif i < 15:
+                    # 状态位平均每 100 秒变化一次
+                    value = (second + device * 7 + i * 13) // 100 % 2 == 0
+                else:
+                    value = 50 + (second // 30) + rng.gauss(0, 0.1)
+                fields.append(Field(tag, value))
+            point.fields = fields
+            points.append(point)
+    return points
+
+
+async def bench(name: str, deadband: bool, devices: int, seconds: int):
+    tags = create_tags(deadband)
+    handlers = [RoundAndScaleDataHandler()]
+    if deadband:
+        handlers.append(DeadbandDataHandler(clock=lambda: now))
+    chain = CompiledDataHandlerChain(handlers)
+    chain.compile([ModelConfig("t1", DriverConfig(None, tags),
+                               [Device("SN{}".format(i), DriverConfig(None, tags)) for i in range(devices)])])
+
+    points = create_points(tags, devices, seconds)
+    values = sum(len(point.fields) for point in points)
+
+    sent_points = 0
+    sent_values = 0
+    start = time.perf_counter()
+    for point in points:
+        now = point.time / 1000
+        result = await chain.handle(point)
+        if result is not None:
+            sent_points += 1
+            sent_values += len(result.fields)
+    elapsed = time.perf_counter() - start
+
+    print("{:<10} 数据点: {:>8}, 发送数据点: {:>8} ({:5.1f}%), 发送消息: {:>7}, 耗时: {:6.3f} s".format(
+        name, values, sent_values, sent_values * 100 / values, sent_points, elapsed))
+
+
+async def main():
+    devices = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    seconds = int(sys.argv[2]) if len(sys.argv) > 2 else 600
+    await bench("不过滤", False, devices, seconds)
+    await bench("死区过滤", True, devices, seconds)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
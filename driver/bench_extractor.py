@@ -0,0 +1,77 @@
+"""
+消息解析性能对比: 数据处理脚本与声明式数据提取. 使用约 1KB 的 JSON 消息.
+
+运行方式(driver 目录下): python bench_extractor.py [消息数量]
+"""
+import asyncio
+import json
+import sys
+import time
+
+import jsons
+
+from model import ModelConfig
+from mqtt_driver import MqttSubscription
+from script_engine import ScriptEngine
+
+parse_script = """
+function handler(topic, message) {
+    var data = JSON.parse(message);
+    var fields = {};
+    for (var key in data.values) {
+        fields[key] = data.values[key];
+    }
+    return [{"id": data.id, "time": data.ts, "fields": fields}];
+}
+"""
+
+tag_count = 48
+
+
+class NullDataSender:
+
+    async def write_points(self, points):
+        pass
+
+
+def create_table(extract: dict, script: str) -> ModelConfig:
+    tags = [{"id": "tag{}".format(i), "name": "tag{}".format(i), "key": "tag{}".format(i)} for i in range(tag_count)]
+    return jsons.load({
+        "id": "t1",
+        "device": {"settings": {"topic": "data/#", "extract": extract, "parseScript": script}, "tags": tags},
+        "devices": [{"id": "SN1", "device": {"settings": {}, "tags": []}}],
+    }, ModelConfig)
+
+
+def create_payload() -> bytes:
+    values = {"tag{}".format(i): 1234.5678 + i for i in range(tag_count)}
+    payload = {"id": "SN1", "ts": 1700000000000, "model": "sensor-x1", "firmware": "1.2.3", "values": values}
+    return json.dumps(payload).encode("utf-8")
+
+
+async def bench(name: str, subscription: MqttSubscription, payload: bytes, count: int):
+    start = time.perf_counter()
+    for _ in range(count):
+        await subscription.handle_message("data/SN1", payload, 0)
+    elapsed = time.perf_counter() - start
+    print("{:<12} {:>10.0f} msg/s {:>10.1f} us/msg".format(name, count / elapsed, elapsed / count * 1e6))
+
+
+async def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+
+    payload = create_payload()
+    print("== 消息大小: {} bytes, 数据点数量: {}, 消息数量: {}".format(len(payload), tag_count, count))
+
+    engine = ScriptEngine(cache_dir=None)
+    script = MqttSubscription(None, None, NullDataSender(), create_table(None, parse_script), engine)
+    extract = MqttSubscription(None, None, NullDataSender(),
+                               create_table({"deviceIdPath": "id", "timePath": "ts", "fieldsPath": "values"}, None),
+                               engine)
+
+    await bench("script", script, payload, max(count // 10, 1))
+    await bench("extract", extract, payload, count)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
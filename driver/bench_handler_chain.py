@@ -0,0 +1,80 @@
+"""
+数据处理器链性能对比: SDK 默认的 DataHandlerChain 与预编译的 CompiledDataHandlerChain.
+
+运行方式(driver 目录下): python bench_handler_chain.py [数据点数量] [轮数]
+"""
+import asyncio
+import logging
+import sys
+import time
+
+from airiot_python_sdk.driver.handler import DataHandlerChain
+from airiot_python_sdk.driver.handler.boolean_to_integer_handler import BooleanToIntegerDataHandler
+from airiot_python_sdk.driver.handler.bytes_to_hex_handler import ByteToHexDataHandler
+from airiot_python_sdk.driver.handler.convert_value_handler import ConvertValueDataHandler
+from airiot_python_sdk.driver.handler.invalid_range_value_handler import InvalidRangeValueDataHandler
+from airiot_python_sdk.driver.handler.round_and_scale_handler import RoundAndScaleDataHandler
+from airiot_python_sdk.driver.handler.valid_range_value_handler import ValidRangeValueDataHandler
+from airiot_python_sdk.driver.model.point import Point, Field
+from airiot_python_sdk.driver.model.tag import Tag, TagValue
+
+from handler_chain import CompiledDataHandlerChain
+from model import ModelConfig, Device, DriverConfig
+
+
+def create_handlers():
+    return [
+        RoundAndScaleDataHandler(),
+        ConvertValueDataHandler(),
+        ValidRangeValueDataHandler(),
+        InvalidRangeValueDataHandler(),
+        BooleanToIntegerDataHandler(),
+        ByteToHexDataHandler(),
+    ]
+
+
+def create_tags(count: int) -> list[Tag]:
+    # 80% 的数据点未配置任何规则, 20% 配置了缩放及小数位数
+    tags = []
+    for i in range(count):
+        if i % 5 == 0:
+            tags.append(Tag("tag{}".format(i), "tag{}".format(i), TagValue(None, None, None, None), None, 2, 0.1))
+        else:
+            tags.append(Tag("tag{}".format(i), "tag{}".format(i), None, None, None, None))
+    return tags
+
+
+async def bench(name: str, chain: DataHandlerChain, point: Point, rounds: int):
+    await chain.handle(point)
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        await chain.handle(point)
+    elapsed = time.perf_counter() - start
+
+    fields = len(point.fields) * rounds
+    print("{:<28} {:>12.0f} fields/s {:>8.2f} us/field".format(name, fields / elapsed, elapsed / fields * 1e6))
+
+
+async def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+
+    logging.basicConfig(level="INFO")
+
+    tags = create_tags(count)
+    point = Point()
+    point.table = "t1"
+    point.id = "SN1"
+    point.fields = [Field(tag, 1234.5678 + i) for i, tag in enumerate(tags)]
+
+    compiled = CompiledDataHandlerChain(create_handlers())
+    compiled.compile([ModelConfig("t1", DriverConfig(None, tags), [Device("SN1", DriverConfig(None, tags))])])
+
+    print("== {} 个数据点, {} 轮".format(count, rounds))
+    await bench("DataHandlerChain", DataHandlerChain(create_handlers()), point, rounds)
+    await bench("CompiledDataHandlerChain", compiled, point, rounds)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
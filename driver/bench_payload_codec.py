@@ -0,0 +1,72 @@
+"""
+消息解码性能对比: JSON, MessagePack 及二进制帧(struct). 每条消息包含相同的 48 个 float64 数据点.
+
+运行方式(driver 目录下): python bench_payload_codec.py [消息数量]
+"""
+import asyncio
+import json
+import struct
+import sys
+import time
+
+import jsons
+
+from model import ModelConfig
+from mqtt_driver import MqttSubscription
+from script_engine import ScriptEngine
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+tag_count = 48
+
+
+class NullDataSender:
+
+    async def write_points(self, points):
+        pass
+
+
+def create_subscription(codec: dict, extract: dict) -> MqttSubscription:
+    tags = [{"id": "tag{}".format(i), "name": "tag{}".format(i), "key": "tag{}".format(i), "offset": 12 + i * 8,
+             "dataType": "float64"} for i in range(tag_count)]
+    table = jsons.load({
+        "id": "t1",
+        "device": {"settings": {"topic": "data/#", "codec": codec, "extract": extract}, "tags": tags},
+        "devices": [{"id": "SN1", "device": {"settings": {"customDeviceId": "1"}, "tags": []}}],
+    }, ModelConfig)
+    return MqttSubscription(None, None, NullDataSender(), table, ScriptEngine(cache_dir=None))
+
+
+async def bench(name: str, subscription: MqttSubscription, payload: bytes, count: int):
+    start = time.perf_counter()
+    for _ in range(count):
+        await subscription.handle_message("data/1", payload, 0)
+    elapsed = time.perf_counter() - start
+
+    per_message = elapsed / count * 1e6
+    print("{:<10} {:>6} bytes {:>10.0f} msg/s {:>8.1f} us/msg {:>8.1f} us/KB".format(
+        name, len(payload), count / elapsed, per_message, per_message / len(payload) * 1024))
+
+
+async def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+
+    values = [1234.5678 + i for i in range(tag_count)]
+    record = {"id": 1, "ts": 1700000000000}
+    record.update({"tag{}".format(i): value for i, value in enumerate(values)})
+    extract = {"deviceIdPath": "id", "timePath": "ts"}
+
+    await bench("json", create_subscription(None, extract), json.dumps(record).encode("utf-8"), count)
+    if msgpack is not None:
+        await bench("msgpack", create_subscription({"type": "msgpack"}, extract), msgpack.packb(record), count)
+
+    frame = struct.pack("<IQ{}d".format(tag_count), 1, 1700000000000, *values)
+    codec = {"type": "struct", "deviceIdOffset": 0, "timeOffset": 4}
+    await bench("struct", create_subscription(codec, None), frame, count)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
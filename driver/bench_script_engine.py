@@ -0,0 +1,81 @@
+"""
+数据处理脚本性能对比: 原 js2py.eval_js 方式与 ScriptEngine(javascript/python) 方式.
+
+运行方式(driver 目录下): python bench_script_engine.py [工作表数量] [消息数量]
+"""
+import json
+import sys
+import tempfile
+import time
+
+import js2py
+
+from script_engine import ScriptEngine, to_native
+
+# 原方式中 eval_js 需要脚本为函数表达式
+js_script = """(function (topic, message) {
+    var data = JSON.parse(message);
+    var result = [];
+    for (var i = 0; i < data.devices.length; i++) {
+        var dev = data.devices[i];
+        result.push({"id": dev.id, "fields": {"temp": dev.temp, "humidity": dev.humidity}});
+    }
+    return result;
+})"""
+
+py_script = """
+import json
+
+def handler(topic, message):
+    data = json.loads(message)
+    return [{"id": dev["id"], "fields": {"temp": dev["temp"], "humidity": dev["humidity"]}} for dev in data["devices"]]
+"""
+
+payload = json.dumps({"devices": [{"id": "SN{}".format(i), "temp": 20.5 + i, "humidity": 40 + i} for i in range(5)]})
+
+
+def bench_calls(name: str, func, messages: int):
+    func("data/test", payload)
+    start = time.perf_counter()
+    for _ in range(messages):
+        func("data/test", payload)
+    elapsed = time.perf_counter() - start
+    print("{:<24} {:>10.1f} us/msg {:>10.0f} msg/s".format(name, elapsed / messages * 1e6, messages / elapsed))
+
+
+def main():
+    tables = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    messages = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+
+    print("== 编译 {} 个使用相同脚本的工作表".format(tables))
+
+    start = time.perf_counter()
+    legacy = None
+    for _ in range(tables):
+        legacy = js2py.eval_js(js_script)
+    print("{:<24} {:>10.3f} s".format("js2py.eval_js", time.perf_counter() - start))
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        engine = ScriptEngine(cache_dir)
+        start = time.perf_counter()
+        for _ in range(tables):
+            engine.compile(js_script)
+        print("{:<24} {:>10.3f} s".format("engine (冷启动)", time.perf_counter() - start))
+
+        # 模拟驱动重启, 从磁盘缓存加载
+        engine = ScriptEngine(cache_dir)
+        start = time.perf_counter()
+        for _ in range(tables):
+            compiled = engine.compile(js_script)
+        print("{:<24} {:>10.3f} s".format("engine (磁盘缓存)", time.perf_counter() - start))
+
+        native = engine.compile(py_script, "python")
+
+        print("== 单条消息处理耗时, {} 条消息".format(messages))
+        bench_calls("js2py.eval_js", lambda topic, message: to_native(legacy(topic, message)), messages)
+        bench_calls("engine javascript", compiled, messages)
+        bench_calls("engine python", native, messages * 10)
+
+
+if __name__ == "__main__":
+    main()
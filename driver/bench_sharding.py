@@ -0,0 +1,117 @@
+"""
+分片消息接收的吞吐量测试. 使用模拟的 MQTT 服务器(共享订阅时在各连接之间平均分配消息), 每条消息包含 48 个数据点,
+使用声明式数据提取解析. 分别测试 1, 2, 4 个子进程.
+
+运行方式(driver 目录下): python bench_sharding.py [消息总数] [子进程数量...]
+吞吐量随子进程数量的增长受 CPU 核数限制.
+"""
+import asyncio
+import functools
+import json
+import os
+import sys
+import threading
+import time
+from types import SimpleNamespace
+
+from airiot_python_sdk.driver.handler import DataHandlerChain
+
+from batch_sender import BatchDataSender
+from config_loader import load_driver_config
+from model import ShardSettings
+from sharding import ShardedIngest
+
+tag_count = 48
+device_count = 100
+
+
+class FloodClient:
+    """
+    模拟的 MQTT 服务器连接. 订阅后发送指定数量的消息
+    """
+
+    def __init__(self, messages: int):
+        self.messages = messages
+        self.on_connect = None
+        self.on_message = None
+        self.thread = None
+        self.topics = []
+
+    def subscribe(self, topics):
+        self.topics = [topic.split("/", 2)[2] for topic, _ in topics]
+
+    def loop_start(self):
+        self.on_connect(self, None, None, 0)
+        self.thread = threading.Thread(target=self.__publish__)
+        self.thread.start()
+
+    def __publish__(self):
+        record = {"tag{}".format(i): 1234.5678 + i for i in range(tag_count)}
+        payloads = [json.dumps(dict(record, id="SN{}".format(i))).encode("utf-8") for i in range(device_count)]
+        topic = self.topics[0].replace("#", "x")
+        for i in range(self.messages):
+            self.on_message(self, None, SimpleNamespace(topic=topic, payload=payloads[i % device_count]))
+
+    def loop_stop(self):
+        self.thread.join()
+
+    def disconnect(self):
+        pass
+
+
+def create_flood_client(messages: int, client_id: str, settings) -> FloodClient:
+    return FloodClient(messages)
+
+
+class NullSender:
+
+    def __init__(self):
+        self.handler_chain = DataHandlerChain([])
+
+    def __write_point__(self, point):
+        pass
+
+
+def create_config() -> dict:
+    return {
+        "id": "d1", "name": "mqtt", "driverType": "mqtt",
+        "device": {"settings": {"server": "tcp://127.0.0.1:1883", "ingest": {"queueSize": 1000, "workers": 1}}},
+        "tables": [{
+            "id": "t1",
+            "device": {"settings": {"topic": "data/#", "extract": {"deviceIdPath": "id"}},
+                       "tags": [{"id": "tag{}".format(i), "name": "tag{}".format(i), "key": "tag{}".format(i)}
+                                for i in range(tag_count)]},
+            "devices": [{"id": "SN{}".format(i), "device": {"settings": {"customDeviceId": "SN{}".format(i)},
+                                                          "tags": []}}
+                        for i in range(device_count)],
+        }],
+    }
+
+
+async def bench(processes: int, messages: int):
+    config = create_config()
+    shards = ShardedIngest("bench", config, load_driver_config(config).tables, ShardSettings(processes, "share", None),
+                           BatchDataSender(NullSender()),
+                           functools.partial(create_flood_client, messages // processes))
+
+    start = time.perf_counter()
+    shards.start(asyncio.get_running_loop())
+    expected = messages // processes * processes
+    while shards.received < expected:
+        await asyncio.sleep(0.01)
+    elapsed = time.perf_counter() - start
+    await shards.stop()
+
+    print("{:>2} 个子进程 {:>10.0f} msg/s  {:>8.2f} s".format(processes, expected / elapsed, elapsed))
+
+
+async def main():
+    messages = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    counts = [int(arg) for arg in sys.argv[2:]] or [1, 2, 4]
+    print("CPU 核数: {}, 消息数量: {}".format(os.cpu_count(), messages))
+    for processes in counts:
+        await bench(processes, messages)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
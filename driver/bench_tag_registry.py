@@ -0,0 +1,75 @@
+"""
+设备数据点映射的内存占用对比: 每个设备一个 key -> 数据点字典与 TagRegistry.
+
+运行方式(driver 目录下): python bench_tag_registry.py [设备数量] [每个设备的数据点数量] [自定义数据点的设备比例]
+默认 10000 个设备, 每个设备 100 个数据点, 10% 的设备自定义一个数据点.
+"""
+import gc
+import sys
+import time
+import tracemalloc
+
+from config_loader import load_table
+from model import ModelConfig
+from tag_registry import TagRegistry
+
+
+def create_table(devices: int, tags: int, custom: float) -> ModelConfig:
+    step = max(1, round(1 / custom)) if custom > 0 else 0
+    table = load_table({
+        "id": "t1",
+        "device": {"settings": {"topic": "data/+"},
+                   "tags": [{"id": "tag{}".format(i), "name": "tag{}".format(i), "key": "tag{}".format(i)}
+                            for i in range(tags)]},
+        "devices": [{"id": "SN{}".format(i),
+                     "device": {"settings": {},
+                                "tags": [{"id": "tag0", "name": "tag0", "key": "custom"}] if step and i % step == 0
+                                else []}}
+                    for i in range(devices)],
+    })
+    table.merge_devices()
+    return table
+
+
+def per_device(table: ModelConfig) -> dict:
+    device_tags = {}
+    for device in table.devices:
+        device_tags[device.id] = {tag.key: tag for tag in device.device.tags}
+    return device_tags
+
+
+def registry(table: ModelConfig) -> TagRegistry:
+    tag_registry = TagRegistry()
+    for device in table.devices:
+        tag_registry.register(device.id, device.device.tags)
+    return tag_registry
+
+
+def bench(name: str, build, table: ModelConfig):
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = build(table)
+    elapsed = time.perf_counter() - start
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print("{:<10} {:>10.1f} ms  保留 {:>8.2f} MB  峰值 {:>8.2f} MB  {:>8.1f} bytes/设备".format(
+        name, elapsed * 1000, current / 1024 / 1024, peak / 1024 / 1024, current / len(table.devices)))
+    return result
+
+
+def main():
+    devices = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    tags = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    custom = float(sys.argv[3]) if len(sys.argv) > 3 else 0.1
+
+    table = create_table(devices, tags, custom)
+    print("{} 个设备, 每个设备 {} 个数据点, {:.0%} 的设备自定义数据点".format(devices, tags, custom))
+    bench("dict", per_device, table)
+    result = bench("registry", registry, table)
+    print("驻留的数据点集合数量: {}".format(len(result.sets)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""
+数据点有效值存储的内存占用及写入性能对比: SDK 的 TagValueCache 与 TagValueStore.
+
+运行方式(driver 目录下): python bench_tag_value_store.py [每个设备的数据点数量] [数据点总数...]
+默认每个设备 100 个数据点, 分别测试 10 万及 100 万个数据点.
+"""
+import asyncio
+import gc
+import sys
+import time
+import tracemalloc
+
+from airiot_python_sdk.driver.handler.tag_value_cache import TagValueCache
+
+from tag_value_store import TagValueStore
+
+
+async def fill(cache, devices: int, tags: int, tag_ids: list[str]):
+    for device in range(devices):
+        device_id = "SN{}".format(device)
+        for tag_id in tag_ids[:tags]:
+            await cache.set_value("t1", device_id, tag_id, 1.5)
+
+
+async def bench(name: str, factory, devices: int, tags: int):
+    tag_ids = ["tag{}".format(i) for i in range(tags)]
+
+    gc.collect()
+    tracemalloc.start()
+    cache = factory()
+    await fill(cache, devices, tags, tag_ids)
+    memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    await fill(cache, devices, tags, tag_ids)
+    elapsed = time.perf_counter() - start
+
+    count = devices * tags
+    print("{:<16} {:>10} tags {:>10.1f} MB {:>8.1f} bytes/tag {:>12.0f} writes/s".format(
+        name, count, memory / 1024 / 1024, memory / count, count / elapsed))
+
+
+async def main():
+    tags = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    totals = [int(arg) for arg in sys.argv[2:]] or [100000, 1000000]
+
+    for total in totals:
+        devices = max(total // tags, 1)
+        await bench("TagValueCache", TagValueCache, devices, tags)
+        await bench("TagValueStore", TagValueStore, devices, tags)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,75 @@
+"""
+上行数据编码性能对比: jsons.dumps 与预编译的 JSON 编码器及 MessagePack 编码器.
+
+运行方式(driver 目录下): python bench_uplink_codec.py [数据点数量] [每个数据点的字段数量]
+"""
+import random
+import sys
+import time
+from datetime import datetime, timezone
+
+import jsons
+
+from airiot_python_sdk.driver.model.point import SimplePoint
+from airiot_python_sdk.driver.model.warning import Table, TableData, WarningData, WarningField
+
+from uplink_codec import create_point_encoder, dumps_point, dumps_warning, msgpack
+
+
+def create_points(count: int, fields: int) -> list[SimplePoint]:
+    rng = random.Random(1)
+    points = []
+    for i in range(count):
+        values = {}
+        for j in range(fields):
+            kind = j % 4
+            if kind == 0:
+                values["temperature{}".format(j)] = round(rng.uniform(-20, 80), 2)
+            elif kind == 1:
+                values["counter{}".format(j)] = rng.randint(0, 1 << 20)
+            elif kind == 2:
+                values["running{}".format(j)] = rng.random() < 0.5
+            else:
+                values["status{}".format(j)] = "正常"
+        point = SimplePoint("t1", "SN{}".format(i), values, None, 1700000000000 + i, {})
+        point.source = "device"
+        points.append(point)
+    return points
+
+
+def bench(name: str, encode, items: list) -> tuple[float, int]:
+    encode(items[0])
+    start = time.perf_counter()
+    size = 0
+    for item in items:
+        size += len(encode(item))
+    elapsed = time.perf_counter() - start
+    print("{:<20} 每条耗时: {:7.2f} us, 平均长度: {:6.1f} 字节".format(
+        name, elapsed * 1e6 / len(items), size / len(items)))
+    return elapsed, size
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    fields = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+
+    points = create_points(count, fields)
+    print("数据点: {} 条, 每条 {} 个字段".format(count, fields))
+    baseline, _ = bench("jsons.dumps", jsons.dumps, points)
+    elapsed, _ = bench("预编译 JSON", dumps_point, points)
+    print("{:<20} 加速: {:.1f}x".format("", baseline / elapsed))
+    if msgpack is not None:
+        elapsed, _ = bench("MessagePack", create_point_encoder("msgpack").encode, points)
+        print("{:<20} 加速: {:.1f}x".format("", baseline / elapsed))
+
+    warnings = [WarningData("w{}".format(i), Table("t1"), TableData("SN{}".format(i)), "高", "r1",
+                            [WarningField("temperature", 85.5, "温度")], ["超限"], "未处理", "未确认",
+                            datetime.now(timezone.utc), True, True, "温度过高") for i in range(count // 10)]
+    print("报警: {} 条".format(len(warnings)))
+    baseline, _ = bench("jsons.dumps", jsons.dumps, warnings)
+    elapsed, _ = bench("预编译 JSON", dumps_warning, warnings)
+    print("{:<20} 加速: {:.1f}x".format("", baseline / elapsed))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+"""
+设备指令发送.
+
+指令处理脚本根据指令内容生成要发送的消息, 返回值为对象 {"topic": 目标主题, "payload": 消息内容, "qos": 服务质量}
+或该对象的数组. payload 不是字符串时使用 JSON 编码, qos 未设置时使用驱动实例配置中的 qos(默认为 1).
+
+消息按 QoS 1 发布时, 在收到服务器的 PUBACK 后才认为发送成功. 批量指令的所有消息先全部发布(受 paho 的最大在途消息数限制,
+超出的消息在 paho 中排队), 再统一等待确认, 不需要逐个等待. 超时未确认的设备返回 timeout.
+"""
+import asyncio
+import json
+import logging
+import threading
+from typing import Iterable, Optional
+
+from paho.mqtt import client as mqtt_client
+
+from script_engine import CompiledScript
+
+logger = logging.getLogger("mqtt_command")
+
+SUCCESS = "success"
+TIMEOUT = "timeout"
+ERROR = "error"
+
+# 指令处理脚本生成的消息: (主题, 消息内容, qos)
+CommandMessage = tuple[str, bytes | str, int]
+
+
+def parse_command(command: str) -> any:
+    """
+    解析平台发送的指令内容. 不是 JSON 时返回原始内容
+    """
+    try:
+        return json.loads(command)
+    except (TypeError, ValueError):
+        return command
+
+
+def render_messages(script: CompiledScript, table_id: str, device_id: str, command: any,
+                    qos: int) -> list[CommandMessage]:
+    """
+    执行指令处理脚本, 生成要发送的消息
+    :param script: 指令处理脚本
+    :param table_id: 工作表标识
+    :param device_id: 资产编号
+    :param command: 指令内容
+    :param qos: 默认的服务质量
+    :return: 要发送的消息
+    :raise ValueError: 脚本返回值格式错误
+    """
+    result = script(table_id, device_id, command)
+    if result is None:
+        raise ValueError("指令处理脚本返回结果为空")
+    if isinstance(result, dict):
+        result = (result,)
+
+    messages = []
+    for message in result:
+        if not isinstance(message, dict) or not message.get("topic"):
+            raise ValueError("指令处理脚本返回结果中 topic 为空: {}".format(message))
+
+        payload = message.get("payload")
+        if not isinstance(payload, (str, bytes)):
+            payload = json.dumps(payload, ensure_ascii=False)
+        message_qos = message.get("qos")
+        messages.append((message["topic"], payload, qos if message_qos is None else int(message_qos)))
+    return messages
+
+
+class PublishTracker:
+    """
+    跟踪已发布消息的确认. 在驱动事件循环中发布消息, 在 MQTT 网络线程中通过 on_publish 回调确认
+
+    QoS 1 的消息在收到 PUBACK 时确认, QoS 0 的消息在写入网络后确认.
+
+    Attributes:
+        pending: 等待确认的消息. key 为消息 ID
+        acked: 正在发布时收到确认的消息 ID. 只在 publish 调用期间记录, 返回时清空
+        publishing: 是否正在调用 client.publish
+    """
+
+    pending: dict[int, asyncio.Future]
+    acked: set[int]
+    publishing: bool
+
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+        self.pending = {}
+        self.acked = set()
+        self.publishing = False
+        # 只保护 pending 和 acked, 持有锁时不调用 paho 的方法, 避免与 paho 内部的锁相互等待
+        self.lock = threading.Lock()
+
+    @property
+    def inflight(self) -> int:
+        return len(self.pending)
+
+    def publish(self, client: mqtt_client.Client, topic: str, payload: bytes | str, qos: int) -> asyncio.Future:
+        """
+        发布消息. 必须在驱动事件循环中调用
+        :return: 消息确认时完成的 Future
+        :raise Exception: 消息无法发布
+        """
+        # 消息可能在 client.publish 返回前被确认, 期间收到的确认记录在 acked 中
+        with self.lock:
+            self.publishing = True
+        try:
+            info = client.publish(topic, payload, qos=qos)
+        except BaseException:
+            with self.lock:
+                self.publishing = False
+                self.acked.clear()
+            raise
+
+        future = self.loop.create_future()
+        with self.lock:
+            self.publishing = False
+            # 只在事件循环中发布, 同一时间只有一个 publish 调用. 其它消息 ID 的确认属于已放弃等待的消息
+            acked = info.mid in self.acked
+            self.acked.clear()
+            # 未连接时消息在 paho 中排队, 连接成功后发送
+            if info.rc not in (mqtt_client.MQTT_ERR_SUCCESS, mqtt_client.MQTT_ERR_NO_CONN):
+                raise Exception("发布消息失败: {}".format(mqtt_client.error_string(info.rc)))
+            if acked:
+                future.set_result(info.mid)
+            else:
+                self.pending[info.mid] = future
+        return future
+
+    def on_publish(self, client, userdata, mid):
+        """
+        消息确认回调. 在 MQTT 网络线程中调用
+        """
+        with self.lock:
+            future = self.pending.pop(mid, None)
+            if future is None:
+                # 不在 publish 调用期间时为已放弃等待的消息的确认, 忽略. paho 会重复使用消息 ID
+                if self.publishing:
+                    self.acked.add(mid)
+                return
+        self.loop.call_soon_threadsafe(self.__resolve__, future, mid)
+
+    def discard(self, futures: Iterable[asyncio.Future]):
+        """
+        放弃等待超时的消息
+        """
+        futures = set(futures)
+        with self.lock:
+            self.pending = {mid: future for mid, future in self.pending.items() if future not in futures}
+
+    def cancel(self):
+        """
+        取消所有等待确认的消息. 驱动停止时调用
+        """
+        with self.lock:
+            pending, self.pending = self.pending, {}
+            self.acked = set()
+        for future in pending.values():
+            future.cancel()
+
+    @staticmethod
+    def __resolve__(future: asyncio.Future, mid: int):
+        if not future.done():
+            future.set_result(mid)
+
+
+async def wait_results(device_futures: list[tuple[str, Optional[str], list[asyncio.Future]]], timeout: float,
+                       tracker: PublishTracker) -> list[dict]:
+    """
+    等待所有设备的消息确认
+    :param device_futures: 各设备的 (资产编号, 错误信息, 消息确认)
+    :param timeout: 等待确认的最长时间(秒)
+    :param tracker: 消息确认跟踪
+    :return: 各设备的执行结果. {"id": 资产编号, "status": success/timeout/error, "error": 错误信息}
+    """
+    futures = [future for _, _, device in device_futures for future in device]
+    if len(futures) > 0:
+        _, not_done = await asyncio.wait(futures, timeout=timeout)
+        if len(not_done) > 0:
+            tracker.discard(not_done)
+
+    results = []
+    for device_id, error, device in device_futures:
+        if error is not None:
+            results.append({"id": device_id, "status": ERROR, "error": error})
+        elif all(future.done() and not future.cancelled() for future in device):
+            results.append({"id": device_id, "status": SUCCESS})
+        else:
+            results.append({"id": device_id, "status": TIMEOUT})
+    return results
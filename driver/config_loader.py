@@ -0,0 +1,195 @@
+"""
+驱动实例配置加载.
+
+jsons 通过反射逐个字段解析 dataclass, 设备数量很多时启动很慢. 该模块按 model 中的结构直接创建配置对象,
+结果与 jsons.loads(config, MQTTDriverConfig) 相同. 数据点标识及键名等重复出现的字符串使用 sys.intern 驻留.
+
+注: 数据点的缩放比例(mod)保留配置中的原始值, jsons 会按 Optional[int] 将 0.1 截断为 0.
+"""
+import json
+import sys
+from typing import Optional, Union
+
+from airiot_python_sdk.driver.model.tag import TagValue, Range, RangeCondition
+
+from model import (BatchSettings, CodecSettings, CommandSettings, Deadband, Device, DriverConfig, ExtractSettings,
+                   IngestSettings, MetricsSettings, ModelConfig, MQTTDriverConfig, MQTTTag, Settings, ShardSettings,
+                   SpoolSettings, UplinkSettings, WarningSettings)
+
+
+def _intern(value: any) -> any:
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+def _float(value: any) -> any:
+    # 与 jsons 相同, 类型为 float 的字段中的整数转换为 float
+    return float(value) if type(value) is int else value
+
+
+def load_ingest_settings(raw: Optional[dict]) -> Optional[IngestSettings]:
+    if raw is None:
+        return None
+    return IngestSettings(raw.get("queueSize"), raw.get("workers"), raw.get("overflow"))
+
+
+def load_batch_settings(raw: Optional[dict]) -> Optional[BatchSettings]:
+    if raw is None:
+        return None
+    return BatchSettings(raw.get("window"), raw.get("maxPoints"))
+
+
+def load_shard_settings(raw: Optional[dict]) -> Optional[ShardSettings]:
+    if raw is None:
+        return None
+    return ShardSettings(raw.get("processes"), raw.get("mode"), raw.get("shareGroup"))
+
+
+def load_command_settings(raw: Optional[dict]) -> Optional[CommandSettings]:
+    if raw is None:
+        return None
+    return CommandSettings(raw.get("qos"), raw.get("timeout"), raw.get("maxInflight"))
+
+
+def load_spool_settings(raw: Optional[dict]) -> Optional[SpoolSettings]:
+    if raw is None:
+        return None
+    return SpoolSettings(raw.get("enabled"), raw.get("path"), raw.get("maxSize"), raw.get("segmentSize"),
+                         raw.get("overflow"), raw.get("replayRate"))
+
+
+def load_warning_settings(raw: Optional[dict]) -> Optional[WarningSettings]:
+    if raw is None:
+        return None
+    return WarningSettings(raw.get("queueSize"), raw.get("batchSize"), raw.get("dedupWindow"), raw.get("qos"),
+                           raw.get("timeout"))
+
+
+def load_uplink_settings(raw: Optional[dict]) -> Optional[UplinkSettings]:
+    if raw is None:
+        return None
+    return UplinkSettings(raw.get("format"))
+
+
+def load_metrics_settings(raw: Optional[dict]) -> Optional[MetricsSettings]:
+    if raw is None:
+        return None
+    return MetricsSettings(raw.get("sampleRate"), raw.get("sampleSize"))
+
+
+def load_extract_settings(raw: Optional[dict]) -> Optional[ExtractSettings]:
+    if raw is None:
+        return None
+    return ExtractSettings(raw.get("enabled"), raw.get("deviceIdPath"), raw.get("timePath"), raw.get("fieldsPath"))
+
+
+def load_codec_settings(raw: Optional[dict]) -> Optional[CodecSettings]:
+    if raw is None:
+        return None
+    return CodecSettings(raw.get("type"), raw.get("byteOrder"), raw.get("recordSize"), raw.get("deviceIdOffset"),
+                         raw.get("deviceIdType"), raw.get("timeOffset"), raw.get("timeType"),
+                         raw.get("protobufMessage"))
+
+
+def load_settings(raw: Optional[dict]) -> Optional[Settings]:
+    if raw is None:
+        return None
+    return Settings(
+        server=raw.get("server"),
+        username=raw.get("username"),
+        password=raw.get("password"),
+        topic=raw.get("topic"),
+        deviceIdLevel=raw.get("deviceIdLevel"),
+        parseScript=raw.get("parseScript"),
+        extract=load_extract_settings(raw.get("extract")),
+        codec=load_codec_settings(raw.get("codec")),
+        commandScript=raw.get("commandScript"),
+        scriptType=raw.get("scriptType"),
+        customDeviceId=raw.get("customDeviceId"),
+        ingest=load_ingest_settings(raw.get("ingest")),
+        batch=load_batch_settings(raw.get("batch")),
+        shard=load_shard_settings(raw.get("shard")),
+        command=load_command_settings(raw.get("command")),
+        spool=load_spool_settings(raw.get("spool")),
+        warning=load_warning_settings(raw.get("warning")),
+        uplink=load_uplink_settings(raw.get("uplink")),
+        metrics=load_metrics_settings(raw.get("metrics")),
+    )
+
+
+def load_range(raw: Optional[dict]) -> Optional[Range]:
+    if raw is None:
+        return None
+
+    conditions = raw.get("conditions")
+    if conditions is not None:
+        conditions = [RangeCondition(condition.get("mode"), condition.get("condition"),
+                                     _float(condition.get("minValue")), _float(condition.get("maxValue")),
+                                     _float(condition.get("value")), condition.get("defaultCondition"),
+                                     condition.get("invalidType"))
+                      for condition in conditions]
+
+    return Range(raw.get("method"), conditions, _float(raw.get("minValue")), _float(raw.get("maxValue")),
+                 _float(raw.get("fixedValue")), raw.get("active"), raw.get("invalidAction"))
+
+
+def load_tag(raw: dict) -> MQTTTag:
+    tag_value = raw.get("tagValue")
+    if tag_value is not None:
+        tag_value = TagValue(_float(tag_value.get("minValue")), _float(tag_value.get("maxValue")),
+                             _float(tag_value.get("minRaw")), _float(tag_value.get("maxRaw")))
+
+    deadband = raw.get("deadband")
+    if deadband is not None:
+        deadband = Deadband(deadband.get("type"), _float(deadband.get("value")), _float(deadband.get("heartbeat")))
+
+    return MQTTTag(_intern(raw.get("id")), _intern(raw.get("name")), tag_value, load_range(raw.get("range")),
+                   raw.get("fixed"), raw.get("mod"), _intern(raw.get("key")), raw.get("offset"), raw.get("dataType"),
+                   deadband)
+
+
+def load_device_config(raw: Optional[dict]) -> Optional[DriverConfig]:
+    if raw is None:
+        return None
+
+    # 未配置数据点时不为每个设备创建空列表, 合并时使用工作表的数据点
+    tags = raw.get("tags")
+    tags = [load_tag(tag) for tag in tags] if tags else None
+    return DriverConfig(load_settings(raw.get("settings")), tags)
+
+
+def load_custom_device_config(raw: Optional[dict]) -> Optional[DriverConfig]:
+    """
+    加载设备的自定义配置
+    :param raw: 设备配置(JSON 对象)
+    :return: 设备配置. 未自定义任何配置时返回 None, 合并时直接使用工作表的配置对象
+    """
+    config = load_device_config(raw)
+    if config is not None and config.tags is None and (config.settings is None or config.settings.empty()):
+        return None
+    return config
+
+
+def load_table(raw: dict) -> ModelConfig:
+    """
+    加载工作表配置
+    :param raw: 工作表配置(JSON 对象)
+    """
+    # 设备编号各不相同, 驻留不能共享字符串, 只会使解释器的驻留表变大
+    devices = [Device(device.get("id"), load_custom_device_config(device.get("device")))
+               for device in raw.get("devices") or []]
+    return ModelConfig(_intern(raw.get("id")), load_device_config(raw.get("device")), devices)
+
+
+def load_driver_config(config: Union[str, bytes, dict]) -> MQTTDriverConfig:
+    """
+    加载驱动实例配置
+    :param config: 驱动实例配置. JSON 字符串或已解析的 JSON 对象
+    """
+    raw = json.loads(config) if isinstance(config, (str, bytes)) else config
+
+    tables = raw.get("tables")
+    if tables is not None:
+        tables = [load_table(table) for table in tables]
+
+    return MQTTDriverConfig(raw.get("id"), raw.get("name"), raw.get("driverType"),
+                            load_device_config(raw.get("device")), tables)
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# 驱动以 driver 目录为工作目录运行(python main.py), 模块间使用 from model import ... 的方式导入
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
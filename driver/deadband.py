@@ -0,0 +1,110 @@
+"""
+死区过滤(report-by-exception).
+
+设定值、状态位等变化缓慢的数据点每次上报的值大多与上次相同. 配置了死区的数据点只在数据变化超过死区时发送:
+
+- absolute: 与上次发送值的差值的绝对值大于死区大小时发送
+- percent: 差值的绝对值大于上次发送值的绝对值 * 死区大小 / 100 时发送
+- 非数值类型(bool, str 等)的数据与上次发送值不同时发送
+
+配置了最长静默时间(heartbeat)时, 超过该时间未发送的数据点即使未变化也发送一次, 平台可以据此判断设备仍然在线.
+上次发送值按 (工作表标识, 资产编号, 数据点标识) 保存, 过滤在所有其它数据处理器之后进行, 比较的是处理后的值.
+"""
+import math
+import time
+from typing import Callable, Iterable, Optional
+
+from airiot_python_sdk.driver.handler import DataHandler
+from airiot_python_sdk.driver.model.tag import Tag
+
+ABSOLUTE = "absolute"
+PERCENT = "percent"
+
+
+class DeadbandDataHandler(DataHandler):
+    """
+    死区过滤数据处理器
+
+    Attributes:
+        last: 上次发送的值及发送时间. key 为 (工作表标识, 资产编号, 数据点标识)
+        forwarded: 发送的数据数量
+        suppressed: 被过滤的数据数量
+    """
+
+    last: dict[tuple[str, str, str], tuple[any, float]]
+    forwarded: int = 0
+    suppressed: int = 0
+
+    def __init__(self, clock: Callable[[], float] = time.monotonic):
+        self.last = {}
+        self.clock = clock
+
+    def name(self) -> str:
+        return "死区过滤"
+
+    def order(self) -> int:
+        # 在所有内置数据处理器之后执行, 比较处理后的值
+        return 100000
+
+    def support(self, table_id: str, device_id: str, tag: Tag, value: any) -> bool:
+        return getattr(tag, "deadband", None) is not None and value is not None and not isinstance(
+            value, (list, tuple, dict))
+
+    async def handle(self, table_id: str, device_id: str, tag: Tag, value: any) -> dict[str, any]:
+        if self.filter(table_id, device_id, tag, value):
+            return {tag.id: value}
+        return {}
+
+    def filter(self, table_id: str, device_id: str, tag: Tag, value: any) -> bool:
+        """
+        判断数据是否需要发送. 需要发送时记录为上次发送值
+        :param table_id: 工作表标识
+        :param device_id: 资产编号
+        :param tag: 数据点信息, 必须配置了死区
+        :param value: 处理后的数据值
+        :return: 需要发送时返回 True
+        """
+        key = (table_id, device_id, tag.id)
+        now = self.clock()
+        last = self.last.get(key)
+        if last is not None and not self.__changed__(tag.deadband, last[0], value):
+            heartbeat = tag.deadband.heartbeat
+            if not heartbeat or now - last[1] < heartbeat:
+                self.suppressed += 1
+                return False
+
+        self.last[key] = (value, now)
+        self.forwarded += 1
+        return True
+
+    @staticmethod
+    def __changed__(deadband, last: any, value: any) -> bool:
+        # bool 及其它类型只比较是否相等
+        if type(value) not in (int, float) or type(last) not in (int, float):
+            return value != last
+        if math.isnan(value) or math.isnan(last):
+            return math.isnan(value) != math.isnan(last)
+
+        band = deadband.value or 0
+        if deadband.type == PERCENT:
+            band = abs(last) * band / 100
+        return abs(value - last) > band
+
+    def clear(self, table_ids: Optional[Iterable[str]] = None):
+        """
+        清除上次发送值. 驱动配置变化时调用
+        :param table_ids: 配置变化的工作表. 为 None 时清除所有工作表
+        """
+        if table_ids is None:
+            self.last = {}
+            return
+
+        table_ids = set(table_ids)
+        self.last = {key: last for key, last in self.last.items() if key[0] not in table_ids}
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "forwarded": self.forwarded,
+            "suppressed": self.suppressed,
+            "tracked": len(self.last),
+        }
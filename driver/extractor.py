@@ -0,0 +1,208 @@
+import copy
+import json
+from typing import Callable, Optional, Sequence, Union
+
+from airiot_python_sdk.driver.model.point import Field, Point
+
+from model import ExtractSettings, MQTTTag
+
+# 路径中的一级. 字符串为对象的键名, 整数为数组下标
+PathKey = Union[str, int]
+
+missing = object()
+
+
+def compile_path(path: Optional[str]) -> Optional[tuple[PathKey, ...]]:
+    """
+    编译字段路径. 使用 . 分隔各级键名, 数字表示数组下标. 例如: data.sensors.0.temp
+    :param path: 字段路径
+    :return: 各级键名. 路径为空时返回 None
+    """
+    if path is None or len(path.strip()) == 0:
+        return None
+    return tuple(int(key) if key.isdigit() else key for key in path.strip().split("."))
+
+
+def resolve(data: any, path: tuple[PathKey, ...]) -> any:
+    """
+    获取路径对应的值. 不存在时返回 missing
+    """
+    for key in path:
+        if isinstance(key, int):
+            if not isinstance(data, list) or key >= len(data):
+                return missing
+            data = data[key]
+        elif isinstance(data, dict):
+            data = data.get(key, missing)
+            if data is missing:
+                return missing
+        else:
+            return missing
+    return data
+
+
+class DeviceExtractor:
+    """
+    设备数据点的提取规则
+
+    Attributes:
+        device_id: 资产编号
+        keys: 单级键名的数据点, 直接从对象中获取
+        paths: 多级路径的数据点
+    """
+
+    __slots__ = ("device_id", "keys", "paths")
+
+    def __init__(self, device_id: str, tags: list[MQTTTag]):
+        self.device_id = device_id
+        self.keys = []
+        self.paths = []
+        for tag in tags:
+            path = compile_path(tag.key)
+            if path is None:
+                continue
+            if len(path) == 1 and isinstance(path[0], str):
+                self.keys.append((path[0], tag))
+            else:
+                self.paths.append((path, tag))
+
+    def fields(self, data: any) -> list[Field]:
+        fields = []
+        if isinstance(data, dict):
+            get = data.get
+            for key, tag in self.keys:
+                value = get(key, missing)
+                if value is not missing:
+                    fields.append(Field(tag, value))
+
+        for path, tag in self.paths:
+            value = resolve(data, path)
+            if value is not missing:
+                fields.append(Field(tag, value))
+
+        return fields
+
+
+class FieldExtractor:
+    """
+    声明式的数据提取. 按配置的路径直接从 JSON 消息中提取设备编号、时间及数据点的值, 不执行数据处理脚本.
+
+    消息内容可以是 JSON 对象或 JSON 对象数组, 每个对象为一个设备的数据. 数据点的值按数据点的 key 从 fieldsPath
+    对应的对象中获取, key 同样可以为多级路径. 使用 MessagePack 等其它格式时, 只需要提供将消息解码为对象的函数.
+
+    Attributes:
+        table_id: 工作表标识
+        device_path: 设备编号的路径. 为 None 时从主题中获取设备编号
+        device_level: 设备编号在主题中的层级
+        time_path: 时间戳(毫秒)的路径. 为 None 时使用接收时间
+        fields_path: 数据点所在对象的路径. 为 None 时为消息对象本身
+        devices: 设备的提取规则. key 为自定义设备 ID
+        shared: 按数据点列表共享的提取规则. 数据点相同的设备只编译一次
+        decode: 将消息内容解码为对象的函数
+    """
+
+    table_id: str
+    device_path: Optional[tuple[PathKey, ...]]
+    device_level: Optional[int]
+    time_path: Optional[tuple[PathKey, ...]]
+    fields_path: Optional[tuple[PathKey, ...]]
+    devices: dict[str, DeviceExtractor]
+    shared: dict[int, tuple[Sequence[MQTTTag], DeviceExtractor]]
+    decode: Callable[[bytes], any]
+
+    def __init__(self, table_id: str, settings: ExtractSettings, device_level: Optional[int],
+                 decode: Callable[[bytes], any] = json.loads):
+        self.table_id = table_id
+        self.decode = decode
+        self.device_path = compile_path(settings.deviceIdPath)
+        self.device_level = device_level
+        self.time_path = compile_path(settings.timePath)
+        self.fields_path = compile_path(settings.fieldsPath)
+        self.devices = {}
+        self.shared = {}
+
+        if self.device_path is None and device_level is None:
+            raise ValueError("未配置设备编号路径(deviceIdPath)或设备编号层级(deviceIdLevel)")
+
+    @staticmethod
+    def enabled(settings: Optional[ExtractSettings]) -> bool:
+        return settings is not None and (settings.enabled is None or settings.enabled)
+
+    def add_device(self, custom_device_id: str, device_id: str, tags: Sequence[MQTTTag]):
+        """
+        添加设备
+        :param custom_device_id: 自定义设备 ID, 即消息中的设备编号
+        :param device_id: 资产编号
+        :param tags: 设备的数据点
+        """
+        shared = self.shared.get(id(tags))
+        if shared is not None and shared[0] is tags:
+            # 复制时共享已编译的规则, 只替换资产编号
+            device = copy.copy(shared[1])
+            device.device_id = device_id
+        else:
+            device = DeviceExtractor(device_id, tags)
+            self.shared[id(tags)] = (tags, device)
+        self.devices[custom_device_id] = device
+
+    def extract(self, topic: str, payload: bytes, receive_time: int) -> Optional[list[Point]]:
+        """
+        从消息中提取设备数据
+        :param topic: 消息主题
+        :param payload: 消息内容
+        :param receive_time: 接收时间(毫秒时间戳)
+        :return: 设备数据. 如果消息无法解码或未找到任何设备时返回 None
+        """
+        try:
+            data = self.decode(payload)
+        except Exception:
+            return None
+
+        topic_device_id = None
+        if self.device_level is not None:
+            levels = topic.split("/")
+            if self.device_level < len(levels):
+                topic_device_id = levels[self.device_level]
+
+        if isinstance(data, dict):
+            records = (data,)
+        elif isinstance(data, list):
+            records = data
+        else:
+            return None
+
+        points = None
+        for record in records:
+            if self.device_path is None:
+                device_id = topic_device_id
+            else:
+                device_id = resolve(record, self.device_path)
+                if device_id is missing or device_id is None:
+                    device_id = topic_device_id
+                elif not isinstance(device_id, str):
+                    device_id = str(device_id)
+
+            device = self.devices.get(device_id)
+            if device is None:
+                continue
+            if points is None:
+                points = []
+
+            fields = device.fields(record if self.fields_path is None else resolve(record, self.fields_path))
+            if len(fields) == 0:
+                continue
+
+            point_time = receive_time
+            if self.time_path is not None:
+                value = resolve(record, self.time_path)
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    point_time = int(value)
+
+            point = Point()
+            point.table = self.table_id
+            point.id = device.device_id
+            point.fields = fields
+            point.time = point_time
+            points.append(point)
+
+        return points
@@ -0,0 +1,118 @@
+"""
+驱动测试共用的模拟对象及配置. 测试模块只从这里导入共用的对象, 不相互导入
+"""
+import json
+from types import SimpleNamespace
+
+from paho.mqtt import client as mqtt_client
+
+from airiot_python_sdk.driver.handler import DataHandlerChain
+
+from mqtt_driver import MqttDriverApp
+
+
+class FakeMqttClient:
+    """
+    驱动订阅消息及发送指令使用的 MQTT 客户端. loop_start 时连接成功
+    """
+
+    def __init__(self):
+        self.subscribed = []
+        self.unsubscribed = []
+        self.published = []
+        self.connected = False
+        self.stopped = False
+        self.on_connect = None
+        self.on_publish = None
+
+    def is_connected(self) -> bool:
+        return self.connected
+
+    def subscribe(self, topics):
+        self.subscribed.extend(topic for topic, _ in topics)
+
+    def unsubscribe(self, topics):
+        self.unsubscribed.extend(topics)
+
+    def loop_start(self):
+        self.connected = True
+        self.on_connect(self, None, None, 0)
+
+    def publish(self, topic, payload=None, qos=0):
+        self.published.append((topic, payload, qos))
+        return SimpleNamespace(rc=mqtt_client.MQTT_ERR_SUCCESS, mid=len(self.published))
+
+    def loop_stop(self):
+        self.stopped = True
+
+    def disconnect(self, reasoncode=None):
+        pass
+
+
+class FakeDataSender:
+    """
+    记录发送的数据, 其它方法不执行任何操作
+    """
+
+    def __init__(self):
+        self.handler_chain = DataHandlerChain([])
+        self.points = []
+
+    async def write_points(self, points):
+        self.points.extend(points)
+
+    def send_warning(self, *args):
+        pass
+
+
+class FakeMqttDriverApp(MqttDriverApp):
+    """
+    使用 FakeMqttClient 的驱动
+    """
+    clients: list[FakeMqttClient]
+
+    def __create_mqtt_client__(self, config):
+        self.client = FakeMqttClient()
+        self.client.on_connect = self.on_connect
+        self.client.on_publish = self.publish_tracker.on_publish
+        self.clients.append(self.client)
+
+
+def create_table(table_id: str, topic: str) -> dict:
+    return {
+        "id": table_id,
+        "device": {
+            "settings": {"topic": topic, "parseScript": "function handler(topic, message) { return []; }"},
+            "tags": [{"id": "temp", "name": "temp", "key": "temp"}],
+        },
+        "devices": [{"id": "SN1", "device": {"settings": {}, "tags": []}}],
+    }
+
+
+def create_config(tables: list[dict], server: str = "tcp://127.0.0.1:1883") -> str:
+    return json.dumps({
+        "id": "d1",
+        "name": "mqtt",
+        "driverType": "mqtt",
+        "device": {"settings": {"server": server}},
+        "tables": tables,
+    })
+
+
+class FakePublishClient:
+    """
+    SDK MQTTDataSender 使用的 MQTT 客户端. 只记录发布的消息, 断开连接时返回 MQTT_ERR_NO_CONN
+    """
+
+    def __init__(self):
+        self.messages = []
+        self.connected = True
+
+    def is_connected(self) -> bool:
+        return self.connected
+
+    def publish(self, topic: str, payload: str = None, qos: int = 0):
+        if not self.connected:
+            return SimpleNamespace(rc=mqtt_client.MQTT_ERR_NO_CONN)
+        self.messages.append((topic, payload))
+        return SimpleNamespace(rc=mqtt_client.MQTT_ERR_SUCCESS)
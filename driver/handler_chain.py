@@ -0,0 +1,317 @@
+import logging
+from types import MappingProxyType
+from typing import Iterable, List, Mapping, Optional
+
+import airiot_python_sdk.driver.handler as handler_module
+from airiot_python_sdk.driver.handler import DataHandler, DataHandlerChain
+from airiot_python_sdk.driver.handler.boolean_to_integer_handler import BooleanToIntegerDataHandler
+from airiot_python_sdk.driver.handler.bytes_to_hex_handler import ByteToHexDataHandler
+from airiot_python_sdk.driver.handler.convert_value_handler import ConvertValueDataHandler
+from airiot_python_sdk.driver.handler.invalid_range_value_handler import InvalidRangeValueDataHandler
+from airiot_python_sdk.driver.handler.round_and_scale_handler import RoundAndScaleDataHandler
+from airiot_python_sdk.driver.handler.valid_range_value_handler import ValidRangeValueDataHandler
+from airiot_python_sdk.driver.model.point import Point, SimplePoint
+from airiot_python_sdk.driver.model.tag import Tag
+
+from batch_handlers import BatchDataHandler, Column, create_batch_handler, is_numeric_sequence
+from deadband import DeadbandDataHandler
+from model import ModelConfig
+
+logger = logging.getLogger("compiled_data_handler_chain")
+
+# support 方法只与数据点配置及数据值类型有关的内置数据处理器
+static_handlers = (
+    RoundAndScaleDataHandler,
+    ConvertValueDataHandler,
+    ValidRangeValueDataHandler,
+    InvalidRangeValueDataHandler,
+    BooleanToIntegerDataHandler,
+    ByteToHexDataHandler,
+)
+
+# 数据值类型及用于判断处理器是否支持该类型的样例值. bool 是 int 的子类, 需要先判断
+value_kinds = (
+    (type(None), None),
+    (bool, True),
+    (int, 1),
+    (float, 1.0),
+    (bytes, b""),
+    (bytearray, bytearray()),
+    (str, ""),
+)
+
+exact_kinds = {kind: kind for kind, _ in value_kinds}
+
+numeric_kinds = frozenset((int, float))
+
+# 数据点的值被死区过滤时的处理结果. 与其它处理器丢弃数据不同, 不记录日志
+SUPPRESSED: Mapping[str, any] = MappingProxyType({})
+
+
+def value_kind(value: any) -> Optional[type]:
+    """
+    获取数据值的类型. 不是内置类型时返回 None
+    """
+    kind = exact_kinds.get(type(value))
+    if kind is not None:
+        return kind
+
+    for kind, _ in value_kinds:
+        if isinstance(value, kind):
+            return kind
+
+    return None
+
+
+class TagPipeline:
+    """
+    数据点的处理流程. 只包含可能处理该数据点的数据处理器
+
+    Attributes:
+        tag: 数据点信息
+        steps: 数据处理器及其支持的数据值类型. 类型为 None 时表示需要在运行时调用 support 方法判断
+        kinds: 所有数据处理器支持的数据值类型. 数据值类型不在其中时直接返回原始值
+        batch: 数值数组的批量处理器. 为 None 时表示不支持批量处理
+        deadband: 是否在处理完成后进行死区过滤
+    """
+
+    tag: Tag
+    steps: tuple[tuple[DataHandler, Optional[frozenset]], ...]
+    kinds: frozenset
+    dynamic: bool
+    batch: Optional[tuple[BatchDataHandler, ...]]
+    deadband: bool
+
+    def __init__(self, tag: Tag, steps: list[tuple[DataHandler, Optional[frozenset]]],
+                 batch: Optional[list[BatchDataHandler]] = None, deadband: bool = False):
+        self.tag = tag
+        self.steps = tuple(steps)
+        self.batch = tuple(batch) if batch else None
+        self.deadband = deadband
+        self.dynamic = any(kinds is None for _, kinds in steps)
+
+        kinds = set()
+        for _, handler_kinds in steps:
+            if handler_kinds is not None:
+                kinds.update(handler_kinds)
+        self.kinds = frozenset(kinds)
+
+    def passthrough(self, kind: Optional[type]) -> bool:
+        """
+        判断该类型的数据值是否不需要任何处理
+        """
+        if len(self.steps) == 0:
+            return True
+        return not self.dynamic and kind is not None and kind not in self.kinds
+
+
+class CompiledDataHandlerChain(DataHandlerChain):
+    """
+    预编译的数据处理器链.
+
+    加载驱动配置时为每个工作表的每个数据点生成处理流程, 只保留可能处理该数据点的数据处理器.
+    内置数据处理器是否支持处理某个值只与数据点配置及值的类型有关, 因此在编译时按类型计算一次,
+    运行时不再调用 support 方法, 也不再记录每个处理器的调试日志. 没有配置任何规则的数据点直接返回原始值.
+    自定义数据处理器仍然在运行时调用 support 方法判断.
+
+    数据点的值为数值数组时, 如果该数据点的所有数值处理器都支持批量处理, 则使用 NumPy 对整个数组进行处理,
+    结果中每个数据点标识对应一个数组, 数组中被丢弃的值为 None.
+
+    死区过滤处理器不参与编译, 只对配置了死区的数据点在其它处理器之后执行. 数值数组不进行死区过滤.
+    """
+
+    # 数据点处理流程. key 为 (工作表标识, 数据点标识, 数据点对象 ID)
+    pipelines: dict[tuple[str, str, int], TagPipeline]
+    # 死区过滤处理器. 未添加时为 None
+    deadband: Optional[DeadbandDataHandler]
+
+    def __init__(self, handlers: List[DataHandler]):
+        super().__init__(handlers)
+        self.pipelines = {}
+        self.deadband = next((handler for handler in self.handlers if isinstance(handler, DeadbandDataHandler)),
+                             None)
+
+    def invalidate(self, table_ids: Optional[Iterable[str]] = None):
+        """
+        清空已编译的处理流程. 驱动配置变化时调用
+        :param table_ids: 配置变化的工作表. 为 None 时清空所有工作表的处理流程
+        """
+        if table_ids is not None:
+            table_ids = set(table_ids)
+        if self.deadband is not None:
+            self.deadband.clear(table_ids)
+
+        if table_ids is None:
+            self.pipelines = {}
+            return
+
+        self.pipelines = {key: pipeline for key, pipeline in self.pipelines.items() if key[0] not in table_ids}
+
+    def compile(self, tables: Iterable[ModelConfig]):
+        """
+        为工作表中所有设备的数据点编译处理流程. 需要在工作表与设备配置合并后调用
+        :param tables: 工作表配置
+        """
+        count = 0
+        for table in tables:
+            for device in table.devices:
+                if device.device is None or device.device.tags is None:
+                    continue
+                for tag in device.device.tags:
+                    key = (table.id, tag.id, id(tag))
+                    if key not in self.pipelines:
+                        self.pipelines[key] = self.__compile_tag__(table.id, tag)
+                        count += 1
+
+        passthrough = sum(1 for pipeline in self.pipelines.values()
+                          if pipeline.passthrough(int) and pipeline.passthrough(float))
+        logger.info("数据处理流程编译完成, 数据点数量: %d, 数值无需处理的数据点数量: %d", count, passthrough)
+
+    def __compile_tag__(self, table_id: str, tag: Tag) -> TagPipeline:
+        steps = []
+        for handler in self.handlers:
+            if handler is self.deadband:
+                continue
+            if not isinstance(handler, static_handlers):
+                steps.append((handler, None))
+                continue
+
+            kinds = frozenset(kind for kind, sample in value_kinds if handler.support(table_id, "", tag, sample))
+            if len(kinds) > 0:
+                steps.append((handler, kinds))
+
+        deadband = self.deadband is not None and getattr(tag, "deadband", None) is not None
+        return TagPipeline(tag, steps, self.__compile_batch__(tag, steps), deadband)
+
+    @staticmethod
+    def __compile_batch__(tag: Tag, steps: list[tuple[DataHandler, Optional[frozenset]]]) -> Optional[list]:
+        batch = []
+        for handler, kinds in steps:
+            # 自定义数据处理器可能处理任意类型的值
+            if kinds is None:
+                return None
+            if kinds.isdisjoint(numeric_kinds):
+                continue
+
+            batch_handler = create_batch_handler(handler)
+            if batch_handler is None or not batch_handler.support_batch(tag):
+                return None
+            batch.append(batch_handler)
+
+        return batch
+
+    async def __handle__(self, table_id: str, device_id: str, tag: Tag, value: any) -> Optional[dict[str, any]]:
+        tag_id = tag.id
+        key = (table_id, tag_id, id(tag))
+        pipeline = self.pipelines.get(key)
+        if pipeline is None or pipeline.tag is not tag:
+            # 未在加载配置时编译的数据点, 例如驱动中动态创建的数据点, 按原流程处理
+            return await super().__handle__(table_id, device_id, tag, value)
+
+        if pipeline.batch is not None and is_numeric_sequence(value):
+            return await self.__handle_batch__(table_id, device_id, pipeline, value)
+
+        final_value = {tag_id: value}
+        if not pipeline.passthrough(value_kind(value)):
+            for handler, kinds in pipeline.steps:
+                tag_value = final_value.get(tag_id)
+                if kinds is not None:
+                    kind = value_kind(tag_value)
+                    if kind is None:
+                        if not handler.support(table_id, device_id, tag, tag_value):
+                            continue
+                    elif kind not in kinds:
+                        continue
+                elif not handler.support(table_id, device_id, tag, tag_value):
+                    continue
+
+                new_value = await handler.handle(table_id, device_id, tag, tag_value)
+                if new_value is None:
+                    continue
+
+                final_value.update(new_value)
+                if new_value.get(tag_id) is None:
+                    final_value.pop(tag_id)
+
+        if tag_id in final_value:
+            tag_value = final_value[tag_id]
+            # 缓冲最新有效值. 被死区过滤的值同样是有效值
+            await handler_module.tag_value_cache.set_value(table_id, device_id, tag_id, tag_value)
+
+            if pipeline.deadband and self.deadband.support(table_id, device_id, tag, tag_value) and \
+                    not self.deadband.filter(table_id, device_id, tag, tag_value):
+                if len(final_value) == 1:
+                    return SUPPRESSED
+                final_value.pop(tag_id)
+
+        return final_value
+
+    async def handle(self, point: Point) -> Optional[SimplePoint]:
+        """
+        处理设备数据. 与 DataHandlerChain.handle 相同, 但被死区过滤的数据点不记录日志
+        :param point: 设备数据
+        :return: 处理后的设备数据. 所有数据点的数据都被丢弃时返回 None
+        """
+        if point.fields is None or len(point.fields) == 0:
+            logger.debug("未定义任何数据点信息, %s", point)
+            return None
+
+        new_fields = {}
+        suppressed = 0
+        for field in point.fields:
+            if field is None or field.tag is None:
+                logger.warning("字段信息或数据点信息为空, %s", point)
+                continue
+
+            new_value = await self.__handle__(point.table, point.id, field.tag, field.value)
+            if new_value is SUPPRESSED:
+                suppressed += 1
+                continue
+            if new_value is None or len(new_value) == 0:
+                logger.info("数据点[%s]的处理结果为 None, 原始值: %s", field.tag.id, field.value)
+                continue
+
+            new_fields.update(new_value)
+
+        if len(new_fields) == 0:
+            if suppressed == 0:
+                logger.warning("所有数据点的数据都被丢弃, %s", point)
+            return None
+
+        return SimplePoint(point.table, point.id, new_fields, cid=point.cid, time=point.time,
+                           field_types=point.fieldTypes)
+
+    async def __handle_batch__(self, table_id: str, device_id: str, pipeline: TagPipeline,
+                               values: any) -> Optional[dict[str, any]]:
+        """
+        批量处理数值数组. 对数组中每个值的处理结果与单独处理该值的结果相同
+        """
+        tag_id = pipeline.tag.id
+        column = Column.of(values)
+        extra_columns: dict[str, Column] = {}
+
+        for batch_handler in pipeline.batch:
+            applied, results = await batch_handler.handle_column(table_id, device_id, pipeline.tag, column)
+
+            # 合并处理结果, 与逐个处理时相同: 更新处理器返回的值, 未返回数据点的值时丢弃该值
+            for key, result in results.items():
+                if key == tag_id:
+                    continue
+                if key not in extra_columns:
+                    extra_columns[key] = Column.empty(len(column))
+                extra_columns[key].assign(applied & result.present, result)
+
+            column.assign(applied, results[tag_id])
+
+        final_value = {}
+        present = column.present.nonzero()[0]
+        if len(present) > 0:
+            final_value[tag_id] = column.to_list()
+
+            # 缓冲最新有效值
+            await handler_module.tag_value_cache.set_value(table_id, device_id, tag_id, column.get(present[-1]))
+
+        for key, extra_column in extra_columns.items():
+            final_value[key] = extra_column.to_list()
+
+        return final_value
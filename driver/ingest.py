@@ -0,0 +1,241 @@
+import asyncio
+import collections
+import logging
+import threading
+import traceback
+from asyncio import AbstractEventLoop
+from enum import Enum
+from typing import Awaitable, Callable, Optional
+
+logger = logging.getLogger("mqtt_ingest")
+
+# 消息处理函数. 参数为 topic, payload, 接收时间(毫秒时间戳)
+MessageHandler = Callable[[str, bytes, int], Awaitable]
+
+
+class OverflowPolicy(str, Enum):
+    """
+    接收队列已满时的处理策略
+
+    Attributes:
+        BLOCK: 阻塞 MQTT 网络线程, 直到队列有空闲位置
+        DROP_OLDEST: 丢弃队列中最早的消息
+        DROP_NEWEST: 丢弃新接收到的消息
+    """
+
+    BLOCK = "block"
+    DROP_OLDEST = "drop-oldest"
+    DROP_NEWEST = "drop-newest"
+
+
+class IngestQueue:
+    """
+    消息接收队列.
+
+    MQTT 网络线程只负责将接收到的消息放入有界队列, 消息的解码、脚本解析及数据发送由驱动事件循环中的多个 worker 处理,
+    避免单条消息处理过慢时影响 MQTT 心跳及其它工作表的消息接收.
+
+    队列使用加锁的 deque 实现, 网络线程在放入消息时直接执行溢出策略, 队列长度不会超过 max_size.
+    队列由空变为非空时才唤醒事件循环中的 worker, 每条消息不需要单独调度事件循环回调.
+
+    Attributes:
+        received: 接收到的消息数量
+        processed: 处理完成的消息数量
+        failed: 处理失败的消息数量
+        dropped: 因队列已满或队列已关闭而丢弃的消息数量
+        max_depth: 队列的最大深度
+    """
+
+    received: int = 0
+    processed: int = 0
+    failed: int = 0
+    dropped: int = 0
+    max_depth: int = 0
+
+    def __init__(self, loop: AbstractEventLoop, max_size: int = 10000, workers: int = 4,
+                 policy: OverflowPolicy = OverflowPolicy.BLOCK):
+        if max_size <= 0:
+            raise ValueError("max_size must be greater than 0")
+        if workers <= 0:
+            raise ValueError("workers must be greater than 0")
+
+        self.loop = loop
+        self.max_size = max_size
+        self.workers = workers
+        self.policy = OverflowPolicy(policy)
+        self.items: collections.deque[tuple] = collections.deque()
+        # 保护 items 及计数. 持有锁时不执行消息处理函数
+        self.lock = threading.Lock()
+        # BLOCK 策略下网络线程等待队列有空闲位置
+        self.not_full = threading.Condition(self.lock)
+        # 已放入队列但未处理完成的消息数量
+        self.unfinished = 0
+        # 已调度唤醒 worker, 尚未执行
+        self.wakeup_pending = False
+        # 以下事件只在事件循环中使用
+        self.ready = asyncio.Event()
+        self.idle = asyncio.Event()
+        self.idle.set()
+        self.tasks = []
+        self.closed = True
+
+    @property
+    def depth(self) -> int:
+        """
+        当前队列深度
+        """
+        return len(self.items)
+
+    def stats(self) -> dict[str, int]:
+        """
+        获取队列的统计信息
+        """
+        return {
+            "received": self.received,
+            "processed": self.processed,
+            "failed": self.failed,
+            "dropped": self.dropped,
+            "depth": self.depth,
+            "maxDepth": self.max_depth,
+        }
+
+    def start(self):
+        """
+        启动 worker. 必须在驱动事件循环中调用
+        """
+        if not self.closed:
+            return
+
+        self.closed = False
+        self.tasks = [self.loop.create_task(self.__worker__(i)) for i in range(self.workers)]
+        logger.info("消息接收队列已启动, 队列大小: %d, worker 数量: %d, 溢出策略: %s",
+                    self.max_size, self.workers, self.policy.value)
+
+    async def stop(self):
+        """
+        停止 worker, 并丢弃队列中未处理的消息
+        """
+        with self.lock:
+            self.closed = True
+            # 释放被阻塞的网络线程
+            self.not_full.notify_all()
+
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+
+        with self.lock:
+            discarded = len(self.items)
+            self.items.clear()
+            self.unfinished = 0
+            self.dropped += discarded
+        self.idle.set()
+
+        logger.info("消息接收队列已停止, 丢弃未处理的消息: %d, 统计: %s", discarded, self.stats())
+
+    async def join(self):
+        """
+        等待队列中的消息全部处理完成. 必须在驱动事件循环中调用
+        """
+        while True:
+            self.idle.clear()
+            with self.lock:
+                if self.unfinished == 0:
+                    self.idle.set()
+                    return
+            await self.idle.wait()
+
+    def offer(self, handler: MessageHandler, topic: str, payload: bytes, receive_time: int):
+        """
+        将消息放入队列. 由 MQTT 网络线程调用, 不能在驱动事件循环中调用
+        :param handler: 消息处理函数
+        :param topic: 消息主题
+        :param payload: 消息内容
+        :param receive_time: 接收时间(毫秒时间戳)
+        """
+
+        item = (handler, topic, payload, receive_time)
+        with self.lock:
+            self.received += 1
+            if self.policy == OverflowPolicy.BLOCK:
+                while not self.closed and len(self.items) >= self.max_size:
+                    # 定时检查, 队列关闭时释放被阻塞的网络线程
+                    self.not_full.wait(1)
+
+            if self.closed:
+                self.dropped += 1
+                return
+
+            if len(self.items) >= self.max_size:
+                self.dropped += 1
+                if self.policy == OverflowPolicy.DROP_NEWEST:
+                    return
+                self.items.popleft()
+                self.unfinished -= 1
+
+            self.items.append(item)
+            self.unfinished += 1
+            if len(self.items) > self.max_depth:
+                self.max_depth = len(self.items)
+
+            wakeup = not self.wakeup_pending
+            self.wakeup_pending = True
+
+        if wakeup:
+            self.loop.call_soon_threadsafe(self.__wakeup__)
+
+    def __wakeup__(self):
+        with self.lock:
+            self.wakeup_pending = False
+        self.ready.set()
+
+    def __take__(self) -> Optional[tuple]:
+        with self.lock:
+            if len(self.items) == 0:
+                return None
+            item = self.items.popleft()
+            self.not_full.notify()
+            return item
+
+    def __done__(self):
+        with self.lock:
+            self.unfinished -= 1
+            idle = self.unfinished == 0
+        if idle:
+            self.idle.set()
+
+    async def __worker__(self, index: int):
+        while True:
+            item = self.__take__()
+            if item is None:
+                # 清除后再检查一次, 避免错过清除前放入的消息. 清除后放入的消息会再次唤醒
+                self.ready.clear()
+                item = self.__take__()
+                if item is None:
+                    await self.ready.wait()
+                    continue
+
+            handler, topic, payload, receive_time = item
+            try:
+                await handler(topic, payload, receive_time)
+                self.processed += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.failed += 1
+                traceback.print_exception(e)
+                logger.error("worker-%d: 处理消息异常, topic: %s, %s", index, topic, e)
+            finally:
+                self.__done__()
+
+
+def create_ingest_queue(loop: AbstractEventLoop, queue_size: Optional[int], workers: Optional[int],
+                        policy: Optional[str]) -> IngestQueue:
+    """
+    根据驱动配置创建消息接收队列. 未配置的参数使用默认值
+    """
+    return IngestQueue(loop,
+                       max_size=10000 if queue_size is None else queue_size,
+                       workers=4 if workers is None else workers,
+                       policy=OverflowPolicy.BLOCK if policy is None else OverflowPolicy(policy))
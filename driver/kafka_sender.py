@@ -0,0 +1,299 @@
+"""
+Kafka 数据发送器.
+
+SDK 的 KafkaDataSender 使用固定的 batch.size(100 字节)及 linger.ms(500), 从不调用 poll() 处理发送结果,
+停止时也不等待未发送的消息. BufferedKafkaDataSender 按 KafkaConfig 中的配置创建 producer, 在后台线程中处理发送结果,
+停止时在超时时间内发送完队列中的消息. producer 的本地队列已满时:
+
+- produce: 处理一次发送结果后重试, 仍然已满时立即抛出 BufferError, 不阻塞驱动的事件循环
+- produce_wait: 在事件循环中等待并处理发送结果, 最多等待 block_timeout. BatchDataSender.write_points 使用该方法,
+  调用方(接收消息的任务)因此变慢, 由接收队列的溢出策略处理积压的消息. 超时后抛出 BufferError
+
+通过 install_kafka_data_sender 替换 SDK 启动器使用的 KafkaDataSender. 配置文件 mq.kafka 中可以使用以下配置:
+
+- mode: production(默认) 或 default(使用 SDK 的配置)
+- batch_size: 每个分区的批次大小(字节), 默认为 1048576
+- linger_ms: 等待批次填满的时间(毫秒), 默认为 20
+- compression: 压缩方式. none, gzip, snappy, lz4(默认), zstd
+- idempotence: 是否启用幂等发送, 默认为 true. 可以使用 true/false, yes/no, on/off 或 1/0
+- acks: 确认方式, 默认为 all
+- queue_max_messages: 本地队列的最大消息数量, 默认为 100000
+- queue_max_kbytes: 本地队列的最大长度(KB), 默认为 1048576
+- poll_interval: 后台线程处理发送结果的间隔(毫秒), 默认为 100
+- flush_timeout: 停止时等待发送完成的最长时间(秒), 默认为 10
+- block_timeout: 本地队列已满时 produce_wait 等待的最长时间(毫秒), 默认为 1000
+"""
+import asyncio
+import logging
+import threading
+import time
+from typing import Callable, Optional
+
+import confluent_kafka
+
+import airiot_python_sdk.driver.launcher as launcher
+from airiot_python_sdk.driver.config import KafkaConfig
+from airiot_python_sdk.driver.handler import DataHandlerChain
+from airiot_python_sdk.driver.model.point import SimplePoint
+from airiot_python_sdk.driver.model.warning import WarningData, WarningRecovery
+from airiot_python_sdk.driver.service.kafka_data_sender import KafkaDataSender
+from uplink_codec import dumps_point, dumps_recovery, dumps_warning
+
+logger = logging.getLogger("kafka_data_sender")
+
+
+def parse_bool(value) -> bool:
+    """
+    解析布尔类型的配置. bool("false") 为 True, 不能直接转换
+    :raise ValueError: 无法解析的值
+    """
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, int) and value in (0, 1):
+        return value == 1
+    if isinstance(value, str):
+        text = value.strip().lower()
+        if text in ("true", "yes", "on", "1"):
+            return True
+        if text in ("false", "no", "off", "0"):
+            return False
+    raise ValueError("invalid boolean value: {!r}".format(value))
+
+
+class ProducerSettings:
+    """
+    Kafka producer 配置. 未在 KafkaConfig 中配置的项使用默认值
+    """
+
+    mode: str = "production"
+    batch_size: int = 1048576
+    linger_ms: int = 20
+    compression: str = "lz4"
+    idempotence: bool = True
+    acks: str = "all"
+    queue_max_messages: int = 100000
+    queue_max_kbytes: int = 1048576
+    poll_interval: int = 100
+    flush_timeout: int = 10
+    block_timeout: int = 1000
+
+    def __init__(self, config: KafkaConfig):
+        for name in ProducerSettings.__annotations__:
+            value = getattr(config, name, None)
+            if value is None:
+                continue
+            kind = type(getattr(ProducerSettings, name))
+            try:
+                setattr(self, name, parse_bool(value) if kind is bool else kind(value))
+            except (TypeError, ValueError):
+                raise ValueError("kafka 配置 {} 的值无效: {!r}".format(name, value))
+
+    def __str__(self):
+        return "ProducerSettings({})".format(
+            ", ".join("{}={}".format(name, getattr(self, name)) for name in ProducerSettings.__annotations__))
+
+
+def producer_config(config: KafkaConfig, settings: ProducerSettings, client_id: str) -> dict:
+    """
+    生成 confluent_kafka.Producer 的配置
+    :param config: SDK 的 Kafka 配置
+    :param settings: producer 配置
+    :param client_id: 客户端 ID
+    """
+    return {
+        "client.id": client_id,
+        "bootstrap.servers": ",".join(config.brokers),
+        "socket.connection.setup.timeout.ms": config.connect_timeout * 1000,
+        "reconnect.backoff.ms": config.reconnect_interval * 1000,
+        "reconnect.backoff.max.ms": config.reconnect_interval * 3 * 1000,
+        "request.timeout.ms": int(config.deliver_timeout * 1000 / 3),
+        "delivery.timeout.ms": config.deliver_timeout * 1000,
+        "batch.size": settings.batch_size,
+        "linger.ms": settings.linger_ms,
+        "compression.type": settings.compression,
+        "enable.idempotence": settings.idempotence,
+        "acks": settings.acks,
+        "queue.buffering.max.messages": settings.queue_max_messages,
+        "queue.buffering.max.kbytes": settings.queue_max_kbytes,
+    }
+
+
+class BufferedKafkaDataSender(KafkaDataSender):
+    """
+    批量发送、压缩及跟踪发送结果的 Kafka 数据发送器
+
+    Attributes:
+        settings: producer 配置
+        producer_factory: 创建 producer 的函数, 测试时可以替换
+        delivered: 发送成功的消息数量
+        failed: 发送失败的消息数量
+        rejected: 本地队列已满而拒绝发送的次数. produce_wait 只在等待超时后计数
+        blocked: produce_wait 因本地队列已满而等待的次数
+    """
+
+    settings: ProducerSettings
+    producer_factory: Callable[[dict], confluent_kafka.Producer] = confluent_kafka.Producer
+
+    delivered: int = 0
+    failed: int = 0
+    rejected: int = 0
+    blocked: int = 0
+
+    def __init__(self, project_id: str, driver_id: str, driver_name: str, service_id: str, config: KafkaConfig,
+                 chain: DataHandlerChain):
+        super().__init__(project_id, driver_id, driver_name, service_id, config, chain)
+        self.settings = ProducerSettings(config)
+        self.poll_thread: Optional[threading.Thread] = None
+        self.stopping = threading.Event()
+        # 发送结果回调在 poll 线程及发送方线程中都可能被调用
+        self.lock = threading.Lock()
+
+    @property
+    def production(self) -> bool:
+        return self.settings.mode != "default"
+
+    def start(self):
+        if not self.production:
+            super().start()
+            return
+
+        logger.info("start connect to kafka, %s, %s", self.config, self.settings)
+        client_id = "driver_{}_{}".format(self.driver_id, self.service_id)
+        self.client = self.producer_factory(producer_config(self.config, self.settings, client_id))
+
+        self.stopping.clear()
+        self.poll_thread = threading.Thread(target=self.__poll_loop__, name="kafka_poll", daemon=True)
+        self.poll_thread.start()
+
+    def stop(self):
+        """
+        停止后台线程, 并在超时时间内发送完本地队列中的消息
+        """
+        if not self.production or self.client is None:
+            return
+
+        self.stopping.set()
+        if self.poll_thread is not None:
+            self.poll_thread.join()
+            self.poll_thread = None
+
+        remaining = self.client.flush(self.settings.flush_timeout)
+        if remaining > 0:
+            logger.error("kafka 数据发送器停止时仍有 %d 条消息未发送", remaining)
+        logger.info("kafka 数据发送器已停止, 统计: %s", self.stats())
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "delivered": self.delivered,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "blocked": self.blocked,
+            "queued": 0 if self.client is None else len(self.client),
+        }
+
+    def produce(self, topic: str, key: str, value: str, partition: Optional[int] = None):
+        """
+        发送消息. 不等待: 本地队列已满时处理一次发送结果后重试, 仍然已满时抛出 BufferError
+        :raise BufferError: 本地队列已满
+        """
+        if not self.production:
+            if partition is None:
+                self.client.produce(topic, key=key, value=value)
+            else:
+                self.client.produce(topic, key=key, value=value, partition=partition)
+            return
+
+        if not self.offer(topic, key, value, partition):
+            with self.lock:
+                self.rejected += 1
+            raise BufferError("Local: Queue full")
+
+    async def produce_wait(self, topic: str, key: str, value: str, partition: Optional[int] = None):
+        """
+        发送消息. 在驱动的事件循环中调用, 本地队列已满时让出事件循环并处理发送结果, 最多等待 block_timeout
+        :raise BufferError: 等待超时后本地队列仍然已满
+        """
+        if not self.production:
+            self.produce(topic, key, value, partition)
+            return
+        if self.offer(topic, key, value, partition):
+            return
+
+        with self.lock:
+            self.blocked += 1
+        deadline = time.monotonic() + self.settings.block_timeout / 1000
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            await asyncio.sleep(min(0.01, remaining))
+            if self.offer(topic, key, value, partition):
+                return
+
+        with self.lock:
+            self.rejected += 1
+        raise BufferError("Local: Queue full")
+
+    def offer(self, topic: str, key: str, value: str, partition: Optional[int] = None) -> bool:
+        """
+        尝试将消息放入本地队列. 已满时处理一次发送结果(poll(0), 不等待)后重试
+        :return: 是否放入本地队列
+        """
+        kwargs = {"key": key, "value": value, "on_delivery": self.__on_delivery__}
+        if partition is not None:
+            kwargs["partition"] = partition
+
+        try:
+            self.client.produce(topic, **kwargs)
+            return True
+        except BufferError:
+            self.client.poll(0)
+
+        try:
+            self.client.produce(topic, **kwargs)
+            return True
+        except BufferError:
+            return False
+
+    def __write_point__(self, point: SimplePoint):
+        key = "{}/{}/{}".format(self.project_id, point.table, point.id)
+        point.source = "device"
+        self.produce("data", key, dumps_point(point))
+
+    def __log__(self, level: str, table_id: str, device_id: str, message: str):
+        self.produce("logs", "{}/{}/{}/{}".format(self.project_id, level, table_id, device_id), message)
+
+    def send_warning(self, warning: WarningData):
+        key = "{}/{}/{}".format(self.project_id, warning.table.id, warning.tableData.id)
+        self.produce("warningStorage", key, dumps_warning(warning), self.config.partition)
+
+    def send_warning_recovery(self, table_id: str, device_id: str, recovery: WarningRecovery):
+        key = "{}/{}/{}".format(self.project_id, table_id, device_id)
+        self.produce("warningUpdate", key, dumps_recovery(recovery), self.config.partition)
+
+    def __poll_loop__(self):
+        interval = self.settings.poll_interval / 1000
+        while not self.stopping.is_set():
+            try:
+                self.client.poll(interval)
+            except Exception as e:
+                logger.error("处理 kafka 发送结果异常: %s", e)
+
+    def __on_delivery__(self, err, msg):
+        with self.lock:
+            if err is None:
+                self.delivered += 1
+                return
+            self.failed += 1
+            failed = self.failed
+
+        # 只记录部分失败日志, 避免连接中断时大量输出
+        if failed & (failed - 1) == 0:
+            logger.error("kafka 消息发送失败, 累计失败: %d, topic: %s, %s", failed, msg.topic(), err)
+
+
+def install_kafka_data_sender():
+    """
+    替换 SDK 启动器使用的 KafkaDataSender. 必须在启动驱动之前调用
+    """
+    launcher.KafkaDataSender = BufferedKafkaDataSender
@@ -1,6 +1,8 @@
 from airiot_python_sdk.driver.startup import Startup
-from driver.mqtt_driver import MqttDriverFactory
+from kafka_sender import install_kafka_data_sender
+from mqtt_driver import MqttDriverFactory
 
 if __name__ == "__main__":
+    install_kafka_data_sender()
     command_line = Startup()
     command_line.run(MqttDriverFactory())
@@ -0,0 +1,305 @@
+"""
+驱动运行指标.
+
+在消息处理的关键路径上只做整数累加及一次 bisect, 不加锁: 每个计数器只由一个线程写入
+(接收数量在 MQTT 网络线程中累加, 其它指标在驱动事件循环中累加), 读取时允许看到稍旧的值.
+
+调试采样替代在每条消息上 print 主题、消息内容及脚本结果: 每接收 sample_rate 条消息保存一条, 最多保存 sample_size 条.
+
+指标通过 http_proxy 提供给平台, 格式为 JSON 或 Prometheus 文本格式.
+"""
+import bisect
+import collections
+import logging
+import re
+import time
+from typing import Callable, Optional
+
+logger = logging.getLogger("metrics")
+
+# 延迟直方图的桶上限(秒)
+LATENCY_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+# 调试采样中保存的消息内容的最大长度
+SAMPLE_PAYLOAD_LENGTH = 1024
+
+PROMETHEUS_PREFIX = "mqtt_driver_"
+
+
+class Histogram:
+    """
+    固定桶的直方图
+
+    Attributes:
+        bounds: 各个桶的上限, 升序
+        counts: 落入各个桶的数量, 最后一个为超过最大上限的数量
+        count: 观测次数
+        sum: 观测值之和
+    """
+
+    bounds: tuple[float, ...]
+    counts: list[int]
+    count: int
+    sum: float
+
+    def __init__(self, bounds: tuple[float, ...] = LATENCY_BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def buckets(self) -> list[tuple[float, int]]:
+        """
+        获取累计的桶计数
+        :return: [(桶上限, 小于等于该上限的数量)], 最后一个桶的上限为 inf
+        """
+        result = []
+        total = 0
+        for bound, count in zip(self.bounds + (float("inf"),), self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+    def quantile(self, q: float) -> float:
+        """
+        按桶估算分位数, 返回第一个累计数量达到分位的桶的上限
+        :param q: 分位, 0 到 1
+        """
+        if self.count == 0:
+            return 0.0
+        rank = q * self.count
+        for bound, total in self.buckets():
+            if total >= rank:
+                return bound if bound != float("inf") else self.bounds[-1]
+        return self.bounds[-1]
+
+    def snapshot(self) -> dict[str, any]:
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "p50": self.quantile(0.5),
+            "p99": self.quantile(0.99),
+        }
+
+
+class TableMetrics:
+    """
+    工作表的消息处理指标. 驱动重新加载工作表时保留
+
+    Attributes:
+        received: 接收到的消息数量
+        handled: 已处理的消息数量
+        points: 解析得到的设备数据数量
+        empty: 未解析出设备数据的消息数量
+        errors: 解析异常的消息数量
+        parse: 消息解析(数据处理脚本或数据提取)耗时
+    """
+
+    received: int = 0
+    handled: int = 0
+    points: int = 0
+    empty: int = 0
+    errors: int = 0
+    parse: Histogram
+
+    def __init__(self):
+        self.parse = Histogram()
+
+    def snapshot(self) -> dict[str, any]:
+        return {
+            "received": self.received,
+            "handled": self.handled,
+            "points": self.points,
+            "empty": self.empty,
+            "errors": self.errors,
+            "parse": self.parse.snapshot(),
+        }
+
+
+class DebugSampler:
+    """
+    调试采样. 每 rate 次保存一条消息及解析结果, 只保留最近的 size 条
+
+    Attributes:
+        rate: 采样间隔. 0 表示不采样
+        seen: 经过的消息数量
+    """
+
+    rate: int
+    seen: int = 0
+
+    def __init__(self, rate: int = 1000, size: int = 100):
+        if rate < 0 or size <= 0:
+            raise ValueError("rate must be greater than or equal to 0 and size must be greater than 0")
+        self.rate = rate
+        self.samples: collections.deque[dict] = collections.deque(maxlen=size)
+
+    def hit(self) -> bool:
+        """
+        判断是否采样当前消息
+        """
+        if self.rate == 0:
+            return False
+        self.seen += 1
+        return self.seen % self.rate == 0
+
+    def capture(self, table_id: str, topic: str, payload: str | bytes, result: any):
+        """
+        保存一条采样
+        :param table_id: 工作表标识
+        :param topic: 消息主题
+        :param payload: 消息内容. 二进制内容保存为十六进制字符串
+        :param result: 解析结果
+        """
+        if isinstance(payload, (bytes, bytearray)):
+            payload = payload[:SAMPLE_PAYLOAD_LENGTH // 2].hex()
+        else:
+            payload = payload[:SAMPLE_PAYLOAD_LENGTH]
+        logger.debug("消息采样, 工作表: %s, topic: %s, payload: %s, result: %s", table_id, topic, payload, result)
+        self.samples.append({
+            "time": int(time.time() * 1000),
+            "table": table_id,
+            "topic": topic,
+            "payload": payload,
+            "result": result,
+        })
+
+    def resize(self, rate: int, size: int):
+        """
+        修改采样配置, 保留已有的采样
+        """
+        if rate < 0 or size <= 0:
+            raise ValueError("rate must be greater than or equal to 0 and size must be greater than 0")
+        self.rate = rate
+        if size != self.samples.maxlen:
+            self.samples = collections.deque(self.samples, maxlen=size)
+
+
+class DriverMetrics:
+    """
+    驱动运行指标. 由驱动实例持有, 驱动重新启动时保留
+
+    Attributes:
+        tables: 各工作表的指标. key 为工作表标识
+        handle: 数据处理器链处理一个设备数据的耗时
+        sampler: 调试采样
+        sources: 各组件的统计信息. key 为组件名称, value 返回组件当前的统计信息, 组件未启动时返回 None
+    """
+
+    tables: dict[str, TableMetrics]
+    handle: Histogram
+    sampler: DebugSampler
+    sources: dict[str, Callable[[], Optional[dict[str, int]]]]
+
+    def __init__(self, sampler: Optional[DebugSampler] = None):
+        self.tables = {}
+        self.handle = Histogram()
+        self.sampler = DebugSampler() if sampler is None else sampler
+        self.sources = {}
+
+    def table(self, table_id: str) -> TableMetrics:
+        """
+        获取工作表的指标, 不存在时创建
+        """
+        metrics = self.tables.get(table_id)
+        if metrics is None:
+            metrics = self.tables[table_id] = TableMetrics()
+        return metrics
+
+    def register(self, name: str, source: Callable[[], Optional[dict[str, int]]]):
+        """
+        注册组件的统计信息
+        :param name: 组件名称
+        :param source: 返回组件当前的统计信息
+        """
+        self.sources[name] = source
+
+    def collect(self) -> dict[str, dict[str, int]]:
+        """
+        获取各组件当前的统计信息. 未启动的组件不返回
+        """
+        result = {}
+        for name, source in self.sources.items():
+            try:
+                stats = source()
+            except Exception as e:
+                logger.warning("获取 %s 的统计信息失败: %s", name, e)
+                continue
+            if stats is not None:
+                result[name] = stats
+        return result
+
+    def snapshot(self) -> dict[str, any]:
+        """
+        获取所有指标. 用于返回给平台
+        """
+        return {
+            "tables": {table_id: metrics.snapshot() for table_id, metrics in self.tables.items()},
+            "handle": self.handle.snapshot(),
+            "components": self.collect(),
+        }
+
+    def samples(self) -> list[dict]:
+        return list(self.sampler.samples)
+
+    def prometheus(self) -> str:
+        """
+        按 Prometheus 文本格式输出所有指标
+        """
+        lines = []
+        tables = list(self.tables.items())
+        for name, help_text in (("received", "接收到的消息数量"), ("handled", "已处理的消息数量"),
+                                ("points", "解析得到的设备数据数量"), ("empty", "未解析出设备数据的消息数量"),
+                                ("errors", "解析异常的消息数量")):
+            metric = "{}messages_{}_total".format(PROMETHEUS_PREFIX, name)
+            lines.append("# HELP {} {}".format(metric, help_text))
+            lines.append("# TYPE {} counter".format(metric))
+            for table_id, metrics in tables:
+                lines.append('{}{{table="{}"}} {}'.format(metric, _escape(table_id), getattr(metrics, name)))
+
+        metric = PROMETHEUS_PREFIX + "parse_seconds"
+        lines.append("# HELP {} 消息解析耗时".format(metric))
+        lines.append("# TYPE {} histogram".format(metric))
+        for table_id, metrics in tables:
+            _histogram(lines, metric, metrics.parse, 'table="{}",'.format(_escape(table_id)))
+
+        metric = PROMETHEUS_PREFIX + "handle_seconds"
+        lines.append("# HELP {} 数据处理器链处理一个设备数据的耗时".format(metric))
+        lines.append("# TYPE {} histogram".format(metric))
+        _histogram(lines, metric, self.handle, "")
+
+        for component, stats in self.collect().items():
+            for key, value in stats.items():
+                metric = "{}{}_{}".format(PROMETHEUS_PREFIX, component, _snake_case(key))
+                lines.append("# TYPE {} untyped".format(metric))
+                lines.append("{} {}".format(metric, value))
+
+        lines.append("")
+        return "\n".join(lines)
+
+
+def _histogram(lines: list[str], metric: str, histogram: Histogram, labels: str):
+    for bound, total in histogram.buckets():
+        lines.append('{}_bucket{{{}le="{}"}} {}'.format(metric, labels, "+Inf" if bound == float("inf") else bound,
+                                                        total))
+    labels = labels.rstrip(",")
+    labels = "{{{}}}".format(labels) if labels else ""
+    lines.append("{}_sum{} {}".format(metric, labels, histogram.sum))
+    lines.append("{}_count{} {}".format(metric, labels, histogram.count))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+_CAMEL = re.compile(r"(?<=[a-z0-9])([A-Z])")
+
+
+def _snake_case(name: str) -> str:
+    return _CAMEL.sub(r"_\1", name).lower()
+
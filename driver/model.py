@@ -4,7 +4,173 @@ from typing import Optional
 from airiot_python_sdk.driver.model.tag import Tag
 
 
-@dataclasses.dataclass
+@dataclasses.dataclass(slots=True)
+class IngestSettings:
+    """
+    消息接收队列配置
+
+    Attributes:
+        queueSize: 队列大小, 默认为 10000
+        workers: 处理消息的 worker 数量, 默认为 4
+        overflow: 队列已满时的处理策略. block(阻塞, 默认), drop-oldest(丢弃最早的消息), drop-newest(丢弃最新的消息)
+    """
+    queueSize: Optional[int]
+    workers: Optional[int]
+    overflow: Optional[str]
+
+
+@dataclasses.dataclass(slots=True)
+class BatchSettings:
+    """
+    数据批量发送配置
+
+    Attributes:
+        window: 合并窗口(毫秒). 窗口内同一设备的多次数据合并为一条发送. 默认为 0, 即不合并
+        maxPoints: 合并窗口内等待发送的最大设备数量, 达到该数量时立即发送. 默认为 1000
+    """
+    window: Optional[int]
+    maxPoints: Optional[int]
+
+
+@dataclasses.dataclass(slots=True)
+class SpoolSettings:
+    """
+    数据缓冲配置. 与平台的连接断开时数据写入磁盘缓冲, 连接恢复后按顺序重新发送
+
+    Attributes:
+        enabled: 是否启用, 默认为 false
+        path: 缓冲目录, 默认为 spool/{服务ID}
+        maxSize: 磁盘占用上限(MB), 默认为 256
+        segmentSize: 单个分段文件的大小(MB), 默认为 4
+        overflow: 超过磁盘占用上限时的处理策略. drop-oldest(丢弃最早的数据, 默认), drop-newest(丢弃新的数据)
+        replayRate: 连接恢复后重新发送的速率(条/秒), 包括缓冲期间新产生的数据. 默认为 0, 即不限制
+    """
+    enabled: Optional[bool]
+    path: Optional[str]
+    maxSize: Optional[int]
+    segmentSize: Optional[int]
+    overflow: Optional[str]
+    replayRate: Optional[int]
+
+
+@dataclasses.dataclass(slots=True)
+class ShardSettings:
+    """
+    分片配置. 将消息的接收及解析分配到多个子进程, 每个子进程使用独立的 MQTT 连接
+
+    Attributes:
+        processes: 子进程数量. 未配置或小于 2 时不分片, 在驱动进程中接收消息
+        mode: 分片方式. table(默认, 按工作表分配到各子进程), share(各子进程使用共享订阅 $share 接收所有工作表的消息,
+            由 MQTT 服务器分配消息, 需要服务器支持共享订阅)
+        shareGroup: 共享订阅的分组名称, 默认为 mqtt_driver_{服务ID}
+    """
+    processes: Optional[int]
+    mode: Optional[str]
+    shareGroup: Optional[str]
+
+
+@dataclasses.dataclass(slots=True)
+class CommandSettings:
+    """
+    指令发送配置
+
+    Attributes:
+        qos: 指令消息的服务质量, 默认为 1. 指令处理脚本返回的 qos 优先
+        timeout: 等待服务器确认的最长时间(毫秒), 默认为 10000
+        maxInflight: 同时等待确认的最大消息数量, 超出的消息在客户端排队. 默认为 1000
+    """
+    qos: Optional[int]
+    timeout: Optional[int]
+    maxInflight: Optional[int]
+
+
+@dataclasses.dataclass(slots=True)
+class WarningSettings:
+    """
+    报警发送配置. 报警及报警恢复信息先进入队列, 在后台批量发送
+
+    Attributes:
+        queueSize: 队列大小, 默认为 10000. 队列已满时丢弃新的报警
+        batchSize: 每批发送的最大数量, 默认为 500
+        dedupWindow: 去重窗口(毫秒). 窗口内同一设备同一报警规则的重复报警只发送一次. 默认为 0, 即不去重
+        qos: 报警消息的服务质量, 默认为 1
+        timeout: 等待服务器确认的最长时间(毫秒), 默认为 5000
+    """
+    queueSize: Optional[int]
+    batchSize: Optional[int]
+    dedupWindow: Optional[int]
+    qos: Optional[int]
+    timeout: Optional[int]
+
+
+@dataclasses.dataclass(slots=True)
+class UplinkSettings:
+    """
+    上行数据配置
+
+    Attributes:
+        format: 数据点的编码格式. json(默认), msgpack(需要平台支持). 报警信息总是使用 JSON 格式
+    """
+    format: Optional[str]
+
+
+@dataclasses.dataclass(slots=True)
+class MetricsSettings:
+    """
+    运行指标配置
+
+    Attributes:
+        sampleRate: 调试采样间隔. 每接收该数量的消息保存一条消息及数据处理脚本的结果, 默认为 1000. 0 表示不采样
+        sampleSize: 保存的最大采样数量, 默认为 100
+    """
+    sampleRate: Optional[int]
+    sampleSize: Optional[int]
+
+
+@dataclasses.dataclass(slots=True)
+class ExtractSettings:
+    """
+    声明式数据提取配置. 配置后按路径直接从 JSON 消息中提取数据, 不执行数据处理脚本.
+    路径使用 . 分隔各级键名, 数字表示数组下标, 例如: data.sensors.0.temp. 数据点的 key 同样可以为路径
+
+    Attributes:
+        enabled: 是否启用, 默认为 true
+        deviceIdPath: 设备编号的路径. 未配置时使用主题中 deviceIdLevel 层级的设备编号
+        timePath: 时间戳(毫秒)的路径. 未配置时使用消息的接收时间
+        fieldsPath: 数据点所在对象的路径. 未配置时为消息对象本身
+    """
+    enabled: Optional[bool]
+    deviceIdPath: Optional[str]
+    timePath: Optional[str]
+    fieldsPath: Optional[str]
+
+
+@dataclasses.dataclass(slots=True)
+class CodecSettings:
+    """
+    消息格式配置
+
+    Attributes:
+        type: 消息格式. json(默认), msgpack, protobuf, struct(二进制帧)
+        byteOrder: 二进制帧的字节序. little(默认) 或 big
+        recordSize: 二进制帧中每个记录的长度. 未配置时整个消息为一个记录
+        deviceIdOffset: 二进制帧中设备编号(整数)在记录中的偏移量. 未配置时使用主题中的设备编号
+        deviceIdType: 二进制帧中设备编号的数据类型, 默认为 uint32
+        timeOffset: 二进制帧中时间戳(毫秒)在记录中的偏移量. 未配置时使用消息的接收时间
+        timeType: 二进制帧中时间戳的数据类型, 默认为 uint64
+        protobufMessage: protobuf 消息类型, 格式为 模块名.类名. 例如: telemetry_pb2.Telemetry
+    """
+    type: Optional[str]
+    byteOrder: Optional[str]
+    recordSize: Optional[int]
+    deviceIdOffset: Optional[int]
+    deviceIdType: Optional[str]
+    timeOffset: Optional[int]
+    timeType: Optional[str]
+    protobufMessage: Optional[str]
+
+
+@dataclasses.dataclass(slots=True)
 class Settings:
     """
     驱动配置
@@ -14,17 +180,47 @@ class Settings:
         username: MQTT 用户名
         password: MQTT 密码
         topic: MQTT 主题
+        deviceIdLevel: 设备编号在主题中的层级(从 0 开始). 设置后按主题中的设备编号分发消息
         parseScript: 解析脚本
+        extract: 声明式数据提取配置. 配置后不执行解析脚本, 无法提取数据时使用解析脚本
+        codec: 消息格式配置. 未配置时为 json
         commandScript: 命令脚本
+        scriptType: 脚本类型. javascript(默认) 或 python
         customDeviceId: 自定义设备 ID
+        ingest: 消息接收队列配置, 只在驱动实例配置中有效
+        batch: 数据批量发送配置, 只在驱动实例配置中有效
+        shard: 分片配置, 只在驱动实例配置中有效
+        command: 指令发送配置, 只在驱动实例配置中有效
+        spool: 数据缓冲配置, 只在驱动实例配置中有效
+        warning: 报警发送配置, 只在驱动实例配置中有效
+        uplink: 上行数据配置, 只在驱动实例配置中有效
+        metrics: 运行指标配置, 只在驱动实例配置中有效
     """
     server: Optional[str]
     username: Optional[str]
     password: Optional[str]
     topic: Optional[str]
+    deviceIdLevel: Optional[int]
     parseScript: Optional[str]
+    extract: Optional[ExtractSettings]
+    codec: Optional[CodecSettings]
     commandScript: Optional[str]
+    scriptType: Optional[str]
     customDeviceId: Optional[str]
+    ingest: Optional[IngestSettings]
+    batch: Optional[BatchSettings]
+    shard: Optional[ShardSettings]
+    command: Optional[CommandSettings]
+    spool: Optional[SpoolSettings]
+    warning: Optional[WarningSettings]
+    uplink: Optional[UplinkSettings]
+    metrics: Optional[MetricsSettings]
+
+    def empty(self) -> bool:
+        """
+        判断是否未设置任何配置
+        """
+        return all(getattr(self, field.name) is None for field in dataclasses.fields(self))
 
     def merge(self, other):
         """
@@ -39,9 +235,36 @@ class Settings:
         self.username = self.username if self.username is not None else other.username
         self.password = self.password if self.password is not None else other.password
         self.topic = self.topic if self.topic is not None else other.topic
+        self.deviceIdLevel = self.deviceIdLevel if self.deviceIdLevel is not None else other.deviceIdLevel
         self.parseScript = self.parseScript if self.parseScript is not None else other.parseScript
+        self.extract = self.extract if self.extract is not None else other.extract
+        self.codec = self.codec if self.codec is not None else other.codec
         self.commandScript = self.commandScript if self.commandScript is not None else other.commandScript
+        self.scriptType = self.scriptType if self.scriptType is not None else other.scriptType
         self.customDeviceId = self.customDeviceId if self.customDeviceId is not None else other.customDeviceId
+        self.ingest = self.ingest if self.ingest is not None else other.ingest
+        self.batch = self.batch if self.batch is not None else other.batch
+        self.shard = self.shard if self.shard is not None else other.shard
+        self.command = self.command if self.command is not None else other.command
+        self.spool = self.spool if self.spool is not None else other.spool
+        self.warning = self.warning if self.warning is not None else other.warning
+        self.uplink = self.uplink if self.uplink is not None else other.uplink
+        self.metrics = self.metrics if self.metrics is not None else other.metrics
+
+
+@dataclasses.dataclass(slots=True)
+class Deadband:
+    """
+    数据点死区配置. 数据变化未超过死区时不发送, 超过静默时间后仍然发送一次
+
+    Attributes:
+        type: 死区类型. absolute(绝对值, 默认), percent(相对上次发送值的百分比)
+        value: 死区大小. 默认为 0, 即数据变化时发送
+        heartbeat: 最长静默时间(秒). 超过该时间未发送时, 即使数据未变化也发送. 默认为 0, 即不限制
+    """
+    type: Optional[str]
+    value: Optional[float]
+    heartbeat: Optional[float]
 
 
 @dataclasses.dataclass
@@ -51,11 +274,17 @@ class MQTTTag(Tag):
 
     Attributes:
         key: 数据点在 MQTT 消息中的键名
+        offset: 二进制帧中数据点在记录中的偏移量
+        dataType: 二进制帧中数据点的数据类型. 例如: int16, uint32, float32, float64, bool
+        deadband: 死区配置. 为 None 时发送所有数据
     """
     key: str
+    offset: Optional[int]
+    dataType: Optional[str]
+    deadband: Optional[Deadband] = None
 
 
-@dataclasses.dataclass
+@dataclasses.dataclass(slots=True)
 class DriverConfig:
     """
     设备配置
@@ -77,13 +306,16 @@ class DriverConfig:
         if other is None:
             return
 
-        if self.settings is None and other.settings is not None:
+        # 设备未自定义任何配置时直接使用工作表的配置, 不复制
+        if (self.settings is None or self.settings.empty()) and other.settings is not None:
             self.settings = other.settings
         elif self.settings is not None and other.settings is not None:
             self.settings.merge(other.settings)
 
         if self.tags is None:
             self.tags = [] if other.tags is None else other.tags
+        elif other.tags is None:
+            return
         elif len(self.tags) == 0 and len(other.tags) > 0:
             self.tags = other.tags
         elif len(self.tags) > 0 and len(other.tags) > 0:
@@ -96,7 +328,7 @@ class DriverConfig:
                     self.tags.append(tag)
 
 
-@dataclasses.dataclass
+@dataclasses.dataclass(slots=True)
 class Device:
     """
     设备配置
@@ -109,7 +341,7 @@ class Device:
     device: DriverConfig
 
 
-@dataclasses.dataclass
+@dataclasses.dataclass(slots=True)
 class ModelConfig:
     """
     模型配置
@@ -123,8 +355,19 @@ class ModelConfig:
     device: DriverConfig
     devices: list[Device]
 
+    def merge_devices(self):
+        """
+        合并工作表和设备的配置. 未自定义配置的设备与工作表共享同一个配置对象
+        """
+        config = self.device
+        for device in self.devices:
+            if device.device is None:
+                device.device = config
+            else:
+                device.device.merge(config)
 
-@dataclasses.dataclass
+
+@dataclasses.dataclass(slots=True)
 class MQTTDriverConfig:
     """
     驱动实例配置
@@ -1,110 +1,241 @@
 import asyncio
-import datetime
+import concurrent.futures
+import json
 import logging
+import os
+import time
 import traceback
-from asyncio import AbstractEventLoop
-from typing import List, Optional, Callable
+from typing import List, Optional
 
-import js2py
-import jsons
-import urllib3.util
 from paho.mqtt import client as mqtt_client
 from paho.mqtt.reasoncodes import ReasonCodes
 
 from airiot_python_sdk.driver import DriverApp, DataSender, DriverAppFactory
 from airiot_python_sdk.driver.model.point import Field, Point
-from model import MQTTDriverConfig, ModelConfig, MQTTTag
+from airiot_python_sdk.driver.model.warning import WarningData, WarningRecovery
+from batch_sender import BatchDataSender
+from command import PublishTracker, parse_command, render_messages, wait_results
+from config_loader import load_driver_config, load_table
+from deadband import DeadbandDataHandler
+from extractor import FieldExtractor
+from handler_chain import CompiledDataHandlerChain
+from ingest import IngestQueue, create_ingest_queue
+from kafka_sender import BufferedKafkaDataSender
+from metrics import DriverMetrics, TableMetrics
+from model import MQTTDriverConfig, ModelConfig
+from payload_codec import StructExtractor, create_extractor
+from script_engine import ScriptEngine, CompiledScript
+from sharding import ShardedIngest, create_mqtt_client
+from spool import EvictionPolicy, SegmentSpool
+from tag_registry import TagRegistry
+from tag_value_store import TagValueStore, install_tag_value_store
+from topic_trie import TopicTrie, minimal_filters, validate_filter
+from uplink_codec import create_point_encoder
+from warning_sender import WarningSender
 
 logger = logging.getLogger("mqtt_driver")
 
+# 批量指令每次在指令线程中执行脚本的设备数量
+COMMAND_CHUNK_SIZE = 500
+
 
 class MqttSubscription:
     """
     工作表消息订阅处理
     """
 
-    data_sender: DataSender
+    data_sender: BatchDataSender
     client: mqtt_client.Client
     table: ModelConfig
 
-    # 工作表中各设备的数据点信息
-    device_tags: dict[str, dict[str, MQTTTag]] = {}
+    # 工作表中各设备的数据点信息. 由该订阅独占, 工作表重新加载时随订阅一起释放
+    device_tags: TagRegistry
+
+    parse_script: Optional[CompiledScript]
+    command_script: Optional[CompiledScript]
+    # 声明式数据提取或二进制帧读取. 为 None 时使用数据处理脚本解析消息
+    extractor: Optional[FieldExtractor | StructExtractor]
+
+    # 设备编号在主题中的层级. 为 None 时不按设备编号分发消息
+    device_level: Optional[int]
+    # 工作表中所有设备的自定义设备 ID
+    device_ids: set[str]
 
-    parse_script: Callable
-    command_script: Callable
+    # 工作表的消息处理指标
+    metrics: TableMetrics
 
-    def __init__(self, loop: AbstractEventLoop, client: mqtt_client.Client, data_sender: DataSender,
-                 table: ModelConfig):
+    def __init__(self, ingest: IngestQueue, client: mqtt_client.Client, data_sender: BatchDataSender,
+                 table: ModelConfig, script_engine: ScriptEngine, metrics: Optional[DriverMetrics] = None):
         self.data_sender = data_sender
         self.client = client
         self.table = table
-        self.parse_script = js2py.eval_js(table.device.settings.parseScript)
-        self.command_script = js2py.eval_js(table.device.settings.commandScript)
-        self.loop = loop
+        if metrics is None:
+            metrics = DriverMetrics()
+        self.metrics = metrics.table(table.id)
+        self.sampler = metrics.sampler
+
+        # 相同内容的脚本只编译一次, 由所有工作表共享
+        settings = table.device.settings
+        self.extractor = create_extractor(table.id, settings)
+        self.parse_script = None
+
+        # 二进制格式不使用数据处理脚本
+        text = settings.codec is None or settings.codec.type in (None, "json")
+        if text and settings.parseScript is not None and len(settings.parseScript.strip()) > 0:
+            self.parse_script = script_engine.compile(settings.parseScript, settings.scriptType)
+        if self.extractor is None and self.parse_script is None:
+            raise ValueError("未配置数据处理脚本")
+        self.command_script = None
+        if settings.commandScript is not None and len(settings.commandScript.strip()) > 0:
+            self.command_script = script_engine.compile(settings.commandScript, settings.scriptType)
+        self.ingest = ingest
+        self.device_level = settings.deviceIdLevel
+        self.device_ids = set()
+        self.device_tags = TagRegistry()
+
+        # 合并工作表和设备的配置
+        table.merge_devices()
 
-        config = table.device
         for device in table.devices:
-            # 合并工作表和设备的配置
-            if device.device is None:
-                device.device = config
-            else:
-                device.device.merge(config)
-
-            device_settings = device.device.settings
+            # 如果设备配置中没有自定义设备 ID，则使用资产编号作为自定义设备 ID.
+            # 设备可能与工作表共享配置对象, 不修改配置
+            custom_device_id = device.device.settings.customDeviceId
+            if custom_device_id is None:
+                custom_device_id = device.id
+            self.device_ids.add(custom_device_id)
 
-            # 如果设备配置中没有自定义设备 ID，则使用资产编号作为自定义设备 ID
-            if device_settings.customDeviceId is None:
-                device_settings.customDeviceId = device.id
-
-            device_tags = {}
             if device.device.tags is None or len(device.device.tags) == 0:
                 continue
 
-            for tag in device.device.tags:
-                device_tags[tag.key] = tag
+            # 数据点相同的设备共享同一个数据点集合
+            tag_set = self.device_tags.register(device.id, device.device.tags)
+            if self.extractor is not None:
+                self.extractor.add_device(custom_device_id, device.id, tag_set.tags)
 
-            self.device_tags[device.id] = device_tags
+    def render_commands(self, device_ids: list[str], command: any, qos: int) -> list[tuple]:
+        """
+        执行指令处理脚本, 生成各设备要发送的消息. 在指令线程中调用, 不阻塞驱动事件循环
+        :param device_ids: 资产编号
+        :param command: 指令内容
+        :param qos: 默认的服务质量
+        :return: 各设备的 (资产编号, 要发送的消息, 错误信息)
+        """
+        rendered = []
+        for device_id in device_ids:
+            try:
+                rendered.append((device_id, render_messages(self.command_script, self.table.id, device_id, command,
+                                                            qos), None))
+            except Exception as e:
+                logger.error("执行指令处理脚本异常, 工作表: %s, 资产编号: %s, %s", self.table.id, device_id, e)
+                rendered.append((device_id, None, str(e)))
+        return rendered
 
-    def subscribe(self):
-        settings = self.table.device.settings
-        self.client.message_callback_add(settings.topic, self.on_message)
-        self.client.subscribe(settings.topic)
+    @property
+    def topic(self) -> str:
+        return self.table.device.settings.topic
 
-    def on_message(self, mosq, obj, msg):
-        topic = msg.topic
-        payload = msg.payload.decode("utf-8")
+    def accepts(self, topic: str) -> bool:
+        """
+        判断是否需要处理该主题的消息. 配置了设备编号层级时, 只处理主题中的设备编号属于该工作表的消息
+        :param topic: 消息主题
+        """
+        if self.device_level is None:
+            return True
 
-        points = []
+        levels = topic.split("/")
+        if self.device_level >= len(levels):
+            return False
+        return levels[self.device_level] in self.device_ids
+
+    async def handle_message(self, topic: str, payload: bytes, receive_time: int):
+        """
+        处理接收到的消息. 由接收队列的 worker 调用
+        :param topic: 消息主题
+        :param payload: 消息内容
+        :param receive_time: 接收时间(毫秒时间戳)
+        """
+
+        metrics = self.metrics
+        metrics.handled += 1
+        sample = self.sampler.hit()
+        begin = time.perf_counter()
+
+        points = None
+        if self.extractor is not None:
+            try:
+                points = self.extractor.extract(topic, payload, receive_time)
+            except Exception as e:
+                metrics.errors += 1
+                logger.error("提取数据异常, 工作表: %s, topic: %s, %s", self.table.id, topic, e)
+
+            if points is None and self.parse_script is None:
+                metrics.parse.observe(time.perf_counter() - begin)
+                metrics.empty += 1
+                logger.warning("无法从消息中提取数据, 工作表: %s, topic: %s, payload: %s", self.table.id, topic, payload)
+                return
 
+            if sample and points is not None:
+                self.sampler.capture(self.table.id, topic, payload, [
+                    {"id": point.id, "fields": {field.tag.id: field.value for field in point.fields}}
+                    for point in points])
+
+        if points is None:
+            points = self.parse(topic, payload, receive_time, sample)
+
+        metrics.parse.observe(time.perf_counter() - begin)
+        if len(points) == 0:
+            metrics.empty += 1
+            return
+        metrics.points += len(points)
+
+        # 一次解析得到的多个设备的数据批量发送
         try:
-            print("topic:", topic)
-            print("payload:", payload)
+            await self.data_sender.write_points(points)
+        except Exception as e:
+            traceback.print_exception(e)
+            logger.error("发送数据点异常: %s", e)
 
+    def parse(self, topic: str, payload: bytes, receive_time: int, sample: bool = False) -> list[Point]:
+        """
+        使用数据处理脚本解析消息
+        :param topic: 消息主题
+        :param payload: 消息内容
+        :param receive_time: 接收时间(毫秒时间戳)
+        :param sample: 是否将消息及脚本结果保存到调试采样
+        :return: 设备数据
+        """
+
+        payload = payload.decode("utf-8")
+
+        points = []
+
+        try:
             result = self.parse_script(topic, payload)
-            print("result:", result)
+            if sample:
+                self.sampler.capture(self.table.id, topic, payload, result)
 
             if result is None or len(result) == 0:
                 logger.warning("数据处理脚本返回结果为空, 工作表: %s, topic: %s, payload: %s",
                                self.table.id, topic, payload)
-                return
+                return points
 
             for dev in result:
                 dev_id = dev.get("id")
                 if dev_id is None:
-                    logger.warning("未找到资产, 工作表: %s, 资产编号: %s", self.table.id, dev.id)
+                    logger.warning("未找到资产, 工作表: %s, 数据: %s", self.table.id, dev)
                     continue
 
                 fields = dev.get("fields")
                 if fields is None or len(fields) == 0:
                     logger.warning("数据处理脚本返回结果中 fields 为空, 工作表: %s, topic: %s, payload: %s, result: %s",
                                    self.table.id, topic, payload, dev)
-                    return
+                    return []
 
-                if dev_id not in self.device_tags:
+                dev_tags = self.device_tags.get(dev_id)
+                if dev_tags is None:
                     logger.warning("数据处理脚本返回结果: 未找到设备 '%s', data=%s", dev_id, dev)
                     continue
 
-                dev_tags = self.device_tags[dev_id]
                 send_fields = []
 
                 for field in fields:
@@ -123,19 +254,15 @@ class MqttSubscription:
                 point.table = self.table.id
                 point.id = dev_id
                 point.fields = send_fields
-                point.time = int(datetime.datetime.now().timestamp()) * 1000
+                point.time = receive_time
 
                 points.append(point)
         except Exception as e:
+            self.metrics.errors += 1
             traceback.print_exception(e)
             logger.error("解析数据处理脚本返回值异常: %s", e)
-        
-        for point in points:
-            try:
-                self.loop.run_until_complete(self.data_sender.write_point(point))
-            except Exception as e:
-                traceback.print_exception(e)
-                logger.error("发送数据点异常: %s", e)
+
+        return points
 
 
 class MqttDriverApp(DriverApp):
@@ -145,11 +272,66 @@ class MqttDriverApp(DriverApp):
 
     # 工作表与订阅. key 为工作表 ID, value 为订阅对象
     subscriptions: dict[str, MqttSubscription] = {}
+    # 主题树, 用于查找与消息主题匹配的订阅
+    topics: TopicTrie[MqttSubscription] = TopicTrie()
+    # 向 MQTT 服务器订阅的主题过滤器
+    topic_filters: list[str] = []
+
+    # 当前运行的驱动实例配置及各工作表的配置(未解析的 JSON), 用于重新启动时比较配置的变化
+    raw_device: Optional[dict] = None
+    raw_tables: dict[str, dict] = {}
+
+    # 脚本引擎. 驱动重启时保留已编译的脚本
+    script_engine: ScriptEngine
+    # 消息接收队列
+    ingest: Optional[IngestQueue] = None
+    # 批量数据发送器
+    batch_sender: Optional[BatchDataSender] = None
+    # 报警发送队列
+    warning_sender: Optional[WarningSender] = None
+    # 分片消息接收. 配置分片时消息在子进程中接收及解析
+    shards: Optional[ShardedIngest] = None
+    # 数据点最新有效值
+    tag_value_store: TagValueStore
+    # 安装 tag_value_store 前 SDK 使用的 tag_value_cache. 为 None 时未安装
+    previous_tag_value_cache: any = None
+    # 指令消息的确认跟踪
+    publish_tracker: Optional[PublishTracker] = None
+    # 指令发送配置
+    command_qos: int = 1
+    command_timeout: float = 10
+    # 执行指令处理脚本的线程
+    command_executor: concurrent.futures.ThreadPoolExecutor
+    # 运行指标. 驱动重启时保留
+    metrics: DriverMetrics
 
     def __init__(self, service_id: str, data_sender: DataSender):
         self.service_id = service_id
         self.data_sender = data_sender
-        self.loop = asyncio.new_event_loop()
+        self.script_engine = ScriptEngine()
+        self.command_executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="mqtt_command")
+        self.metrics = DriverMetrics()
+
+        # 无锁的有效值存储. 启动时替换 SDK 的 TagValueCache, 停止时恢复
+        self.tag_value_store = TagValueStore()
+
+        # 使用预编译的数据处理器链替换默认的数据处理器链, 并添加死区过滤
+        if not isinstance(data_sender.handler_chain, CompiledDataHandlerChain):
+            data_sender.handler_chain = CompiledDataHandlerChain(
+                data_sender.handler_chain.handlers + [DeadbandDataHandler()])
+
+        # 各组件的统计信息. 组件在驱动启动时创建, 未创建时不返回
+        metrics = self.metrics
+        metrics.register("ingest", lambda: None if self.ingest is None else self.ingest.stats())
+        metrics.register("batch", lambda: None if self.batch_sender is None else self.batch_sender.stats())
+        metrics.register("spool", lambda: None if self.batch_sender is None or self.batch_sender.spool is None
+                         else self.batch_sender.spool.stats())
+        metrics.register("warning", lambda: None if self.warning_sender is None else self.warning_sender.stats())
+        metrics.register("shard", lambda: None if self.shards is None else self.shards.stats())
+        metrics.register("deadband", lambda: None if self.data_sender.handler_chain.deadband is None
+                         else self.data_sender.handler_chain.deadband.stats())
+        metrics.register("kafka", lambda: self.data_sender.stats()
+                         if isinstance(self.data_sender, BufferedKafkaDataSender) else None)
 
     def __create_mqtt_client__(self, config: MQTTDriverConfig):
         """
@@ -158,17 +340,18 @@ class MqttDriverApp(DriverApp):
         :return:
         """
         settings = config.device.settings
-        broker_url = urllib3.util.parse_url(settings.server)
 
         logger.info("connect to mqtt: %s", settings.server)
 
-        self.client = mqtt_client.Client(client_id="mqtt_driver_{}".format(self.service_id),
-                                         clean_session=True, protocol=mqtt_client.MQTTv311)
-        self.client.username_pw_set(settings.username, settings.password)
-        self.client.reconnect_delay_set(min_delay=1, max_delay=120)
+        self.client = create_mqtt_client("mqtt_driver_{}".format(self.service_id), settings)
+        self.client.on_connect = self.on_connect
+        self.client.on_message = self.on_message
+        self.client.on_publish = self.publish_tracker.on_publish
+        command = settings.command
+        self.client.max_inflight_messages_set(1000 if command is None or command.maxInflight is None
+                                              else command.maxInflight)
         # self.client.on_disconnect = lambda: (logger.error("mqtt client disconnected"))
         # self.client.on_connect = lambda x1, x2, x3, x4: logger.info("mqtt client connected")
-        self.client.connect(host=broker_url.host, port=broker_url.port, keepalive=60)
 
     def handle_table(self, table: ModelConfig):
         """
@@ -197,24 +380,134 @@ class MqttDriverApp(DriverApp):
             logger.warning("工作表 '%s' 的设备配置中 topic 为空", table_id)
             return
 
+        # 主题无效时只忽略该工作表, 不影响其它工作表的订阅
+        try:
+            validate_filter(settings.topic)
+        except ValueError as e:
+            logger.error("工作表 '%s' 的 topic 无效, 忽略该工作表: %s", table_id, e)
+            return
+
         logger.info("工作表 '%s', 订阅主题: %s", table_id, settings.topic)
-        subscription = MqttSubscription(self.loop, self.client, self.data_sender, table)
-        subscription.subscribe()
+        subscription = MqttSubscription(self.ingest, self.client, self.batch_sender, table, self.script_engine,
+                                        self.metrics)
         self.subscriptions[table_id] = subscription
 
+    def __update_topics__(self):
+        """
+        根据当前的订阅重建主题树, 并向 MQTT 服务器订阅新增的主题过滤器, 取消订阅不再使用的主题过滤器
+        """
+        topics = TopicTrie()
+        for subscription in self.subscriptions.values():
+            topics.insert(subscription.topic, subscription)
+
+        # 合并相互包含的主题, 只订阅最少的主题过滤器
+        previous = self.topic_filters
+        topic_filters = minimal_filters(subscription.topic for subscription in self.subscriptions.values())
+
+        # 主题树及主题过滤器在 MQTT 网络线程中使用, 整体替换
+        self.topics = topics
+        self.topic_filters = topic_filters
+
+        # 未连接时在连接成功后订阅
+        if self.client is None or not self.client.is_connected():
+            return
+
+        removed = [topic_filter for topic_filter in previous if topic_filter not in topic_filters]
+        added = [topic_filter for topic_filter in topic_filters if topic_filter not in previous]
+        if len(removed) > 0:
+            logger.info("取消订阅主题: %s", removed)
+            self.client.unsubscribe(removed)
+        if len(added) > 0:
+            logger.info("订阅主题: %s", added)
+            self.client.subscribe([(topic_filter, 0) for topic_filter in added])
+
+    def on_connect(self, client, userdata, flags, rc):
+        """
+        连接成功后订阅主题. 使用 clean session 连接, 重连后需要重新订阅
+        """
+        if rc != 0:
+            logger.error("连接 mqtt 服务器失败: %s", rc)
+            return
+
+        topic_filters = self.topic_filters
+        if len(topic_filters) > 0:
+            logger.info("订阅主题: %s", topic_filters)
+            client.subscribe([(topic_filter, 0) for topic_filter in topic_filters])
+
+    def on_message(self, client, userdata, msg):
+        """
+        将消息分发给主题匹配的工作表. 在 MQTT 网络线程中只将消息放入接收队列, 由驱动事件循环中的 worker 处理
+        """
+        ingest = self.ingest
+        if ingest is None:
+            return
+
+        receive_time = int(time.time() * 1000)
+        for subscription in self.topics.match(msg.topic):
+            if subscription.accepts(msg.topic):
+                subscription.metrics.received += 1
+                ingest.offer(subscription.handle_message, msg.topic, msg.payload, receive_time)
+
     async def start(self, config: str):
         logger.info("driver start: {}".format(config))
-        driver_config: MQTTDriverConfig = jsons.loads(config, MQTTDriverConfig)
+        begin = time.perf_counter()
+
+        # 只解析一次 JSON, 按工作表比较配置
+        raw_config = json.loads(config)
+        raw_device = raw_config.get("device")
+        raw_tables = {raw_table.get("id"): raw_table for raw_table in raw_config.get("tables") or []}
+
+        # 驱动实例配置未变化并且已经连接时, 只重新加载变化的工作表
+        if self.client is not None and self.ingest is not None and raw_device == self.raw_device \
+                and len(raw_tables) > 0:
+            await self.reload(raw_tables, begin)
+            return
+
+        driver_config: MQTTDriverConfig = load_driver_config(raw_config)
         logger.info("driver start, config: {}".format(driver_config))
 
+        dropped = 0 if self.ingest is None else self.ingest.dropped
+        previous_ingest = self.ingest
         await self.stop()
+        if previous_ingest is not None:
+            dropped = previous_ingest.dropped - dropped
+
+        self.previous_tag_value_cache = install_tag_value_store(self.tag_value_store)
+
+        metrics = driver_config.device.settings.metrics
+        if metrics is None:
+            self.metrics.sampler.resize(1000, 100)
+        else:
+            self.metrics.sampler.resize(1000 if metrics.sampleRate is None else metrics.sampleRate,
+                                        100 if metrics.sampleSize is None else metrics.sampleSize)
 
         tables = driver_config.tables
         if tables is None or len(tables) == 0:
             logger.warning("没有任何工作表使用该驱动")
             return
 
+        shard = driver_config.device.settings.shard
+        if shard is not None and shard.processes is not None and shard.processes > 1:
+            await self.start_shards(raw_config, driver_config, begin)
+            return
+
+        # 创建消息接收队列, 消息在驱动的事件循环中处理
+        ingest = driver_config.device.settings.ingest
+        if ingest is None:
+            self.ingest = create_ingest_queue(asyncio.get_running_loop(), None, None, None)
+        else:
+            self.ingest = create_ingest_queue(asyncio.get_running_loop(), ingest.queueSize, ingest.workers,
+                                              ingest.overflow)
+        self.ingest.start()
+
+        self.__create_batch_sender__(driver_config)
+        self.__create_warning_sender__(driver_config)
+
         # 创建 mqtt 客户端
+        command = driver_config.device.settings.command
+        self.command_qos = 1 if command is None or command.qos is None else command.qos
+        self.command_timeout = 10 if command is None or command.timeout is None else command.timeout / 1000
+        self.publish_tracker = PublishTracker(asyncio.get_running_loop())
         self.__create_mqtt_client__(driver_config)
 
         # 处理每个使用该驱动实例的工作表
@@ -225,20 +518,189 @@ class MqttDriverApp(DriverApp):
                 traceback.print_stack()
                 logger.error("处理工作表 '{}' 时出错: {}".format(table.id, e))
 
-        logger.info("mqtt driver started")
+        # 连接成功后订阅
+        self.__update_topics__()
 
-        self.data_sender.send_warning()
+        # 工作表与设备配置合并后编译数据点的处理流程
+        self.data_sender.handler_chain.compile(subscription.table for subscription in self.subscriptions.values())
+
+        self.raw_device = raw_device
+        self.raw_tables = raw_tables
+
+        logger.info("mqtt driver started, 耗时: %.1f ms, 工作表数量: %d, 丢弃消息数量: %d",
+                    (time.perf_counter() - begin) * 1000, len(self.subscriptions), dropped)
 
         self.client.loop_start()
 
+    def __create_batch_sender__(self, driver_config: MQTTDriverConfig):
+        """
+        创建批量数据发送器
+        """
+        settings = driver_config.device.settings
+        spool = None
+        replay_rate = 0
+        if settings.spool is not None and settings.spool.enabled:
+            config = settings.spool
+            spool = SegmentSpool(config.path or os.path.join("spool", self.service_id),
+                                 max_bytes=(256 if config.maxSize is None else config.maxSize) * 1024 * 1024,
+                                 segment_bytes=(4 if config.segmentSize is None else config.segmentSize) * 1024 * 1024,
+                                 policy=EvictionPolicy.DROP_OLDEST if config.overflow is None
+                                 else EvictionPolicy(config.overflow))
+            replay_rate = 0 if config.replayRate is None else config.replayRate
+
+        encoder = create_point_encoder(None if settings.uplink is None else settings.uplink.format)
+
+        batch = settings.batch
+        if batch is None:
+            self.batch_sender = BatchDataSender(self.data_sender, spool=spool, replay_rate=replay_rate,
+                                                encoder=encoder, handle_latency=self.metrics.handle)
+        else:
+            self.batch_sender = BatchDataSender(self.data_sender,
+                                                window=0 if batch.window is None else batch.window,
+                                                max_points=1000 if batch.maxPoints is None else batch.maxPoints,
+                                                spool=spool, replay_rate=replay_rate, encoder=encoder,
+                                                handle_latency=self.metrics.handle)
+        self.batch_sender.start()
+
+    def __create_warning_sender__(self, driver_config: MQTTDriverConfig):
+        """
+        创建报警发送队列
+        """
+        config = driver_config.device.settings.warning
+        if config is None:
+            self.warning_sender = WarningSender(self.data_sender)
+        else:
+            self.warning_sender = WarningSender(
+                self.data_sender,
+                queue_size=10000 if config.queueSize is None else config.queueSize,
+                batch_size=500 if config.batchSize is None else config.batchSize,
+                dedup_window=(0 if config.dedupWindow is None else config.dedupWindow) / 1000,
+                qos=1 if config.qos is None else config.qos,
+                timeout=(5000 if config.timeout is None else config.timeout) / 1000)
+        self.warning_sender.start()
+
+    def send_warning(self, warning: WarningData) -> bool:
+        """
+        发送报警信息. 放入报警发送队列后立即返回, 不等待发送结果
+        :param warning: 报警信息
+        :return: 是否放入队列. 重复的报警或队列已满时返回 False
+        """
+        return self.warning_sender.send_warning(warning)
+
+    def send_warning_recovery(self, table_id: str, device_id: str, recovery: WarningRecovery) -> bool:
+        """
+        发送报警恢复信息. 放入报警发送队列后立即返回, 不等待发送结果
+        :param table_id: 报警设备所属工作表标识
+        :param device_id: 报警设备编号
+        :param recovery: 报警恢复信息
+        :return: 是否放入队列. 重复的报警恢复或队列已满时返回 False
+        """
+        return self.warning_sender.send_warning_recovery(table_id, device_id, recovery)
+
+    async def start_shards(self, raw_config: dict, driver_config: MQTTDriverConfig, begin: float):
+        """
+        分片启动. 消息在子进程中接收及解析, 驱动进程只处理子进程发送的数据并发送到平台.
+        配置变化时总是重新启动所有子进程
+        :param raw_config: 驱动实例配置(JSON 对象)
+        :param driver_config: 驱动实例配置
+        :param begin: 开始启动的时间
+        """
+        self.__create_batch_sender__(driver_config)
+        self.__create_warning_sender__(driver_config)
+
+        self.shards = ShardedIngest(self.service_id, raw_config, driver_config.tables,
+                                    driver_config.device.settings.shard, self.batch_sender)
+        self.data_sender.handler_chain.compile(driver_config.tables)
+        self.shards.start(asyncio.get_running_loop())
+
+        logger.info("mqtt driver started, 耗时: %.1f ms, 工作表数量: %d, 分片数量: %d",
+                    (time.perf_counter() - begin) * 1000, len(driver_config.tables), len(self.shards.processes))
+
+    async def reload(self, raw_tables: dict[str, dict], begin: float):
+        """
+        重新加载变化的工作表. 保持 MQTT 连接, 未变化的工作表的订阅、已编译的脚本及数据处理流程保持不变
+        :param raw_tables: 新的工作表配置. key 为工作表标识
+        :param begin: 开始重新加载的时间
+        """
+        dropped = self.ingest.dropped
+
+        removed = [table_id for table_id in self.raw_tables if table_id not in raw_tables]
+        changed = [table_id for table_id, raw_table in raw_tables.items() if raw_table != self.raw_tables.get(table_id)]
+        added = [table_id for table_id in changed if table_id not in self.raw_tables]
+
+        for table_id in removed + changed:
+            self.subscriptions.pop(table_id, None)
+        self.data_sender.handler_chain.invalidate(removed + changed)
+        # 删除的工作表及配置变化的工作表的有效值不再使用
+        self.tag_value_store.remove_tables(removed + changed)
+
+        for table_id in changed:
+            try:
+                self.handle_table(load_table(raw_tables[table_id]))
+            except Exception as e:
+                traceback.print_stack()
+                logger.error("处理工作表 '{}' 时出错: {}".format(table_id, e))
+
+        self.__update_topics__()
+        self.data_sender.handler_chain.compile(self.subscriptions[table_id].table for table_id in changed
+                                               if table_id in self.subscriptions)
+        self.raw_tables = raw_tables
+
+        logger.info("mqtt driver reloaded, 耗时: %.1f ms, 新增工作表: %s, 更新工作表: %s, 删除工作表: %s, "
+                    "未变化工作表数量: %d, 丢弃消息数量: %d", (time.perf_counter() - begin) * 1000, added,
+                    [table_id for table_id in changed if table_id not in added], removed,
+                    len(raw_tables) - len(changed), self.ingest.dropped - dropped)
+
     async def stop(self):
         logger.info("stopping mqtt driver")
 
+        # 停止子进程, 子进程发送完已解析的数据后退出
+        if self.shards is not None:
+            await self.shards.stop()
+            self.shards = None
+
+        # 先关闭接收队列, 释放可能被阻塞的 MQTT 网络线程
+        if self.ingest is not None:
+            await self.ingest.stop()
+            self.ingest = None
+
+        # 发送合并窗口中等待发送的数据
+        if self.batch_sender is not None:
+            try:
+                await self.batch_sender.stop()
+            except Exception as e:
+                logger.error("发送等待发送的数据异常: %s", e)
+            self.batch_sender = None
+
+        # 发送队列中的报警
+        if self.warning_sender is not None:
+            try:
+                await self.warning_sender.stop()
+            except Exception as e:
+                logger.error("发送队列中的报警异常: %s", e)
+            self.warning_sender = None
+
+        if self.publish_tracker is not None:
+            self.publish_tracker.cancel()
+            self.publish_tracker = None
+
         if self.client is not None:
             self.client.loop_stop()
             self.client.disconnect(reasoncode=ReasonCodes)
+            self.client = None
 
         self.subscriptions = {}
+        self.topics = TopicTrie()
+        self.topic_filters = []
+        self.raw_device = None
+        self.raw_tables = {}
+        self.data_sender.handler_chain.invalidate()
+
+        # 清除有效值, 并恢复 SDK 原来的 tag_value_cache
+        self.tag_value_store.clear()
+        if self.previous_tag_value_cache is not None:
+            install_tag_value_store(self.previous_tag_value_cache)
+            self.previous_tag_value_cache = None
 
         logger.info("mqtt driver stopped")
 
@@ -246,19 +708,76 @@ class MqttDriverApp(DriverApp):
         return "v4.0.0"
 
     def http_proxy_enabled(self) -> bool:
-        return False
+        return True
 
     async def http_proxy(self, request_type: str, headers: dict[str, List[str]], data: str) -> any:
-        return data
+        """
+        平台通过 HTTP 请求代理获取驱动的运行指标. 支持的请求类型:
+
+        - getMetrics: 所有指标(JSON)
+        - getPrometheusMetrics: 所有指标(Prometheus 文本格式)
+        - getSamples: 最近的调试采样, 包括消息内容及数据处理脚本的结果
+        """
+        if request_type == "getMetrics":
+            return self.metrics.snapshot()
+        if request_type == "getPrometheusMetrics":
+            return self.metrics.prometheus()
+        if request_type == "getSamples":
+            return self.metrics.samples()
+        raise Exception("不支持的请求类型: {}".format(request_type))
 
     async def run(self, serial_no: str, table_id: str, device_id: str, command: str) -> any:
-        pass
+        results = await self.__execute__(table_id, [device_id], command)
+        return results[0]
 
     async def batch_run(self, serial_no: str, table_id: str, device_ids: List[str], command: str) -> any:
-        pass
+        return await self.__execute__(table_id, device_ids, command)
 
     async def write_tag(self, serial_no: str, table_id: str, device_id: str, tag: str) -> any:
-        pass
+        # 写数据点同样由指令处理脚本生成消息, 指令内容为数据点信息及写入的值
+        results = await self.__execute__(table_id, [device_id], tag)
+        return results[0]
+
+    async def __execute__(self, table_id: str, device_ids: List[str], command: str) -> list[dict]:
+        """
+        执行指令. 指令处理脚本在指令线程中分批执行, 每批生成的消息立即发布, 所有消息发布后统一等待服务器确认
+        :param table_id: 工作表标识
+        :param device_ids: 资产编号
+        :param command: 指令内容
+        :return: 各设备的执行结果. {"id": 资产编号, "status": success/timeout/error, "error": 错误信息}
+        :raise Exception: 未连接 MQTT 服务器, 或工作表未配置指令处理脚本
+        """
+        if self.shards is not None:
+            raise Exception("分片模式下不支持发送指令")
+        client = self.client
+        tracker = self.publish_tracker
+        if client is None or tracker is None:
+            raise Exception("未连接 MQTT 服务器")
+
+        subscription = self.subscriptions.get(table_id)
+        if subscription is None:
+            raise Exception("未找到工作表 '{}'".format(table_id))
+        if subscription.command_script is None:
+            raise Exception("工作表 '{}' 未配置指令处理脚本".format(table_id))
+
+        command = parse_command(command)
+        loop = asyncio.get_running_loop()
+        device_futures = []
+        for start in range(0, len(device_ids), COMMAND_CHUNK_SIZE):
+            chunk = device_ids[start:start + COMMAND_CHUNK_SIZE]
+            rendered = await loop.run_in_executor(self.command_executor, subscription.render_commands, chunk,
+                                                  command, self.command_qos)
+            for device_id, messages, error in rendered:
+                futures = []
+                if error is None:
+                    try:
+                        for topic, payload, qos in messages:
+                            futures.append(tracker.publish(client, topic, payload, qos))
+                    except Exception as e:
+                        error = str(e)
+                device_futures.append((device_id, error, futures))
+
+        return await wait_results(device_futures, self.command_timeout, tracker)
 
     async def debug(self, debug: str) -> str:
         pass
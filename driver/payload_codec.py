@@ -0,0 +1,280 @@
+"""
+消息内容解码. 每个工作表可以配置消息格式:
+
+- json(默认): 使用声明式数据提取或数据处理脚本
+- msgpack: 使用 MessagePack 解码后按声明式数据提取的路径提取数据. 需要安装 msgpack
+- protobuf: 使用指定的 protobuf 消息类型解码后按声明式数据提取的路径提取数据
+- struct: 二进制帧. 按数据点配置的偏移量及数据类型直接从消息中读取数值
+
+二进制格式不使用数据处理脚本.
+"""
+import copy
+import importlib
+import json
+import struct
+from typing import Callable, Optional, Sequence
+
+from airiot_python_sdk.driver.model.point import Field, Point
+
+from extractor import FieldExtractor
+from model import CodecSettings, ExtractSettings, MQTTTag, Settings
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# 数据类型与 struct 格式字符
+struct_types = {
+    "int8": "b",
+    "uint8": "B",
+    "int16": "h",
+    "uint16": "H",
+    "int32": "i",
+    "uint32": "I",
+    "int64": "q",
+    "uint64": "Q",
+    "float32": "f",
+    "float64": "d",
+    "bool": "?",
+}
+
+byte_orders = {
+    None: "<",
+    "little": "<",
+    "big": ">",
+}
+
+
+def struct_format(data_type: str) -> str:
+    """
+    获取数据类型对应的 struct 格式字符. 数据类型可以为 int16 等类型名称, 也可以直接使用 struct 格式字符
+    """
+    fmt = struct_types.get(data_type, data_type)
+    if fmt is None or len(fmt) != 1 or fmt not in "bBhHiIqQfd?":
+        raise ValueError("不支持的数据类型: {}".format(data_type))
+    return fmt
+
+
+class StructDevice:
+    """
+    设备的二进制帧读取规则.
+
+    数据点之间没有重叠时, 将所有数据点合并为一个 struct 格式, 使用一次 unpack_from 读取所有值.
+
+    Attributes:
+        device_id: 资产编号
+        tags: 数据点, 顺序与读取结果相同
+        layout: 合并后的格式. 数据点之间存在重叠时为 None
+        fields: 数据点及其偏移量和格式. layout 为 None 时逐个读取
+    """
+
+    __slots__ = ("device_id", "tags", "layout", "fields")
+
+    def __init__(self, device_id: str, tags: list[MQTTTag], byte_order: str):
+        self.device_id = device_id
+        self.fields = []
+        for tag in tags:
+            if tag.offset is None or tag.dataType is None:
+                continue
+            self.fields.append((tag, tag.offset, struct.Struct(byte_order + struct_format(tag.dataType))))
+        self.fields.sort(key=lambda field: field[1])
+        self.tags = [tag for tag, _, _ in self.fields]
+
+        # 使用填充字节 x 合并为一个格式
+        fmt = byte_order
+        position = 0
+        for tag, offset, item in self.fields:
+            if offset < position:
+                fmt = None
+                break
+            fmt += "{}x{}".format(offset - position, item.format[-1]) if offset > position else item.format[-1]
+            position = offset + item.size
+        self.layout = struct.Struct(fmt) if fmt is not None and len(self.fields) > 0 else None
+
+    @property
+    def size(self) -> int:
+        """
+        读取所有数据点需要的最小长度
+        """
+        return max((offset + item.size for _, offset, item in self.fields), default=0)
+
+    def read(self, view: memoryview, base: int) -> list[Field]:
+        if self.layout is not None:
+            return [Field(tag, value) for tag, value in zip(self.tags, self.layout.unpack_from(view, base))]
+        return [Field(tag, item.unpack_from(view, base + offset)[0]) for tag, offset, item in self.fields]
+
+
+class StructExtractor:
+    """
+    二进制帧数据提取. 使用 memoryview 及 struct.unpack_from 直接从消息中读取数值, 不复制消息内容.
+
+    消息可以包含多个长度相同的记录(recordSize), 每个记录为一个设备的数据. 设备编号从记录中 deviceIdOffset
+    处的整数读取, 未配置时使用主题中 deviceIdLevel 层级的设备编号. 时间戳从 timeOffset 处读取.
+
+    Attributes:
+        table_id: 工作表标识
+        byte_order: 字节序
+        record_size: 记录长度. 为 None 时整个消息为一个记录
+        device_id: 设备编号的偏移量及格式
+        device_level: 设备编号在主题中的层级
+        time: 时间戳(毫秒)的偏移量及格式
+        devices: 设备的读取规则. key 为自定义设备 ID
+        shared: 按数据点列表共享的读取规则. 数据点相同的设备只编译一次
+    """
+
+    table_id: str
+    byte_order: str
+    record_size: Optional[int]
+    device_id: Optional[tuple[int, struct.Struct]]
+    device_level: Optional[int]
+    time: Optional[tuple[int, struct.Struct]]
+    devices: dict[str, StructDevice]
+    shared: dict[int, tuple[Sequence[MQTTTag], StructDevice]]
+
+    def __init__(self, table_id: str, settings: CodecSettings, device_level: Optional[int]):
+        if settings.byteOrder not in byte_orders:
+            raise ValueError("不支持的字节序: {}".format(settings.byteOrder))
+
+        self.table_id = table_id
+        self.byte_order = byte_orders[settings.byteOrder]
+        self.record_size = settings.recordSize
+        self.device_level = device_level
+        self.devices = {}
+        self.shared = {}
+
+        self.device_id = None
+        if settings.deviceIdOffset is not None:
+            fmt = struct_format(settings.deviceIdType or "uint32")
+            self.device_id = (settings.deviceIdOffset, struct.Struct(self.byte_order + fmt))
+
+        self.time = None
+        if settings.timeOffset is not None:
+            fmt = struct_format(settings.timeType or "uint64")
+            self.time = (settings.timeOffset, struct.Struct(self.byte_order + fmt))
+
+        if self.device_id is None and device_level is None:
+            raise ValueError("未配置设备编号偏移量(deviceIdOffset)或设备编号层级(deviceIdLevel)")
+        if self.record_size is not None and self.record_size <= 0:
+            raise ValueError("记录长度(recordSize)必须大于 0")
+
+    def add_device(self, custom_device_id: str, device_id: str, tags: Sequence[MQTTTag]):
+        """
+        添加设备
+        :param custom_device_id: 自定义设备 ID, 即消息中的设备编号
+        :param device_id: 资产编号
+        :param tags: 设备的数据点
+        """
+        shared = self.shared.get(id(tags))
+        if shared is not None and shared[0] is tags:
+            # 复制时共享已编译的规则, 只替换资产编号
+            device = copy.copy(shared[1])
+            device.device_id = device_id
+        else:
+            device = StructDevice(device_id, tags, self.byte_order)
+            self.shared[id(tags)] = (tags, device)
+        self.devices[custom_device_id] = device
+
+    def extract(self, topic: str, payload: bytes, receive_time: int) -> Optional[list[Point]]:
+        """
+        从二进制帧中读取设备数据
+        :param topic: 消息主题
+        :param payload: 消息内容
+        :param receive_time: 接收时间(毫秒时间戳)
+        :return: 设备数据. 如果未找到任何设备时返回 None
+        """
+        view = memoryview(payload)
+
+        topic_device_id = None
+        if self.device_level is not None:
+            levels = topic.split("/")
+            if self.device_level < len(levels):
+                topic_device_id = levels[self.device_level]
+
+        record_size = len(view) if self.record_size is None else self.record_size
+        points = None
+        for base in range(0, len(view) - record_size + 1, record_size) if record_size > 0 else ():
+            device_id = topic_device_id
+            if self.device_id is not None:
+                offset, item = self.device_id
+                device_id = str(item.unpack_from(view, base + offset)[0])
+
+            device = self.devices.get(device_id)
+            if device is None:
+                continue
+            if points is None:
+                points = []
+
+            if device.size > record_size:
+                # 记录长度不足, 无法读取所有数据点
+                continue
+
+            fields = device.read(view, base)
+            if len(fields) == 0:
+                continue
+
+            point_time = receive_time
+            if self.time is not None:
+                offset, item = self.time
+                point_time = int(item.unpack_from(view, base + offset)[0])
+
+            point = Point()
+            point.table = self.table_id
+            point.id = device.device_id
+            point.fields = fields
+            point.time = point_time
+            points.append(point)
+
+        return points
+
+
+def create_decoder(settings: CodecSettings) -> Callable[[bytes], any]:
+    """
+    创建将消息解码为对象的函数
+    """
+    codec_type = settings.type
+    if codec_type is None or codec_type == "json":
+        return json.loads
+
+    if codec_type == "msgpack":
+        if msgpack is None:
+            raise ValueError("使用 MessagePack 格式需要安装 msgpack")
+        return lambda payload: msgpack.unpackb(payload, raw=False)
+
+    if codec_type == "protobuf":
+        from google.protobuf.json_format import MessageToDict
+
+        if settings.protobufMessage is None or "." not in settings.protobufMessage:
+            raise ValueError("未配置 protobuf 消息类型(protobufMessage), 例如: telemetry_pb2.Telemetry")
+
+        module_name, class_name = settings.protobufMessage.rsplit(".", 1)
+        message_type = getattr(importlib.import_module(module_name), class_name)
+
+        def decode(payload: bytes) -> dict:
+            message = message_type()
+            message.ParseFromString(payload)
+            return MessageToDict(message, preserving_proto_field_name=True)
+
+        return decode
+
+    raise ValueError("不支持的消息格式: {}".format(codec_type))
+
+
+def create_extractor(table_id: str, settings: Settings):
+    """
+    根据工作表的消息格式及数据提取配置创建数据提取器
+    :return: 数据提取器. 使用 json 格式并且未配置声明式数据提取时返回 None, 使用数据处理脚本
+    """
+    codec = settings.codec
+    codec_type = None if codec is None else codec.type
+
+    if codec_type == "struct":
+        return StructExtractor(table_id, codec, settings.deviceIdLevel)
+
+    if codec_type is None or codec_type == "json":
+        if not FieldExtractor.enabled(settings.extract):
+            return None
+        return FieldExtractor(table_id, settings.extract, settings.deviceIdLevel)
+
+    extract = settings.extract if settings.extract is not None else ExtractSettings(None, None, None, None)
+    return FieldExtractor(table_id, extract, settings.deviceIdLevel, create_decoder(codec))
@@ -19,6 +19,188 @@
                         "title": "密码",
                         "fieldType": "password"
                     },
+                    "ingest": {
+                        "type": "object",
+                        "title": "消息接收队列",
+                        "properties": {
+                            "queueSize": {
+                                "title": "队列大小",
+                                "description": "等待处理的消息数量上限, 默认为 10000",
+                                "type": "number"
+                            },
+                            "workers": {
+                                "title": "处理线程数",
+                                "description": "同时处理消息的 worker 数量, 默认为 4",
+                                "type": "number"
+                            },
+                            "overflow": {
+                                "title": "队列已满时的策略",
+                                "type": "string",
+                                "enum": ["block", "drop-oldest", "drop-newest"],
+                                "enum_title": ["阻塞", "丢弃最早的消息", "丢弃最新的消息"]
+                            }
+                        }
+                    },
+                    "batch": {
+                        "type": "object",
+                        "title": "批量发送",
+                        "properties": {
+                            "window": {
+                                "title": "合并窗口(ms)",
+                                "description": "窗口内同一设备的多次数据合并为一条发送. 0 表示不合并",
+                                "type": "number"
+                            },
+                            "maxPoints": {
+                                "title": "最大合并设备数",
+                                "description": "等待发送的设备数量达到该值时立即发送, 默认为 1000",
+                                "type": "number"
+                            }
+                        }
+                    },
+                    "shard": {
+                        "type": "object",
+                        "title": "分片",
+                        "description": "将消息的接收及解析分配到多个子进程, 每个子进程使用独立的 MQTT 连接",
+                        "properties": {
+                            "processes": {
+                                "title": "子进程数量",
+                                "description": "小于 2 时不分片",
+                                "type": "number"
+                            },
+                            "mode": {
+                                "title": "分片方式",
+                                "type": "string",
+                                "enum": ["table", "share"],
+                                "enum_title": ["按工作表分配", "共享订阅($share)"]
+                            },
+                            "shareGroup": {
+                                "title": "共享订阅分组",
+                                "description": "默认为 mqtt_driver_{服务ID}",
+                                "type": "string"
+                            }
+                        }
+                    },
+                    "command": {
+                        "type": "object",
+                        "title": "指令发送",
+                        "properties": {
+                            "qos": {
+                                "title": "QoS",
+                                "description": "指令消息的服务质量, 默认为 1. 指令处理脚本返回的 qos 优先",
+                                "type": "number",
+                                "enum": [0, 1, 2]
+                            },
+                            "timeout": {
+                                "title": "确认超时时间(ms)",
+                                "description": "等待服务器确认的最长时间, 默认为 10000",
+                                "type": "number"
+                            },
+                            "maxInflight": {
+                                "title": "最大在途消息数",
+                                "description": "同时等待确认的最大消息数量, 超出的消息在客户端排队. 默认为 1000",
+                                "type": "number"
+                            }
+                        }
+                    },
+                    "spool": {
+                        "type": "object",
+                        "title": "数据缓冲",
+                        "description": "与平台的连接断开时数据写入磁盘缓冲, 连接恢复后按顺序重新发送",
+                        "properties": {
+                            "enabled": {
+                                "title": "启用",
+                                "type": "boolean"
+                            },
+                            "path": {
+                                "title": "缓冲目录",
+                                "description": "默认为 spool/{服务ID}",
+                                "type": "string"
+                            },
+                            "maxSize": {
+                                "title": "磁盘占用上限(MB)",
+                                "description": "默认为 256",
+                                "type": "number"
+                            },
+                            "segmentSize": {
+                                "title": "分段文件大小(MB)",
+                                "description": "默认为 4",
+                                "type": "number"
+                            },
+                            "overflow": {
+                                "title": "超过上限时的策略",
+                                "type": "string",
+                                "enum": ["drop-oldest", "drop-newest"],
+                                "enum_title": ["丢弃最早的数据", "丢弃新的数据"]
+                            },
+                            "replayRate": {
+                                "title": "重新发送速率(条/秒)",
+                                "description": "连接恢复后重新发送的速率, 包括缓冲期间新产生的数据. 0 表示不限制",
+                                "type": "number"
+                            }
+                        }
+                    },
+                    "warning": {
+                        "type": "object",
+                        "title": "报警发送",
+                        "description": "报警及报警恢复信息先进入队列, 在后台批量发送",
+                        "properties": {
+                            "queueSize": {
+                                "title": "队列大小",
+                                "description": "默认为 10000. 队列已满时丢弃新的报警",
+                                "type": "number"
+                            },
+                            "batchSize": {
+                                "title": "每批发送数量",
+                                "description": "默认为 500",
+                                "type": "number"
+                            },
+                            "dedupWindow": {
+                                "title": "去重窗口(ms)",
+                                "description": "窗口内同一设备同一报警规则的重复报警只发送一次. 0 表示不去重",
+                                "type": "number"
+                            },
+                            "qos": {
+                                "title": "QoS",
+                                "description": "报警消息的服务质量, 默认为 1",
+                                "type": "number",
+                                "enum": [0, 1, 2]
+                            },
+                            "timeout": {
+                                "title": "确认超时时间(ms)",
+                                "description": "等待服务器确认的最长时间, 默认为 5000",
+                                "type": "number"
+                            }
+                        }
+                    },
+                    "uplink": {
+                        "type": "object",
+                        "title": "上行数据",
+                        "properties": {
+                            "format": {
+                                "title": "数据格式",
+                                "description": "数据点的编码格式, 默认为 JSON. 使用 MessagePack 需要平台支持. 报警信息总是使用 JSON",
+                                "type": "string",
+                                "enum": ["json", "msgpack"],
+                                "enum_title": ["JSON", "MessagePack"]
+                            }
+                        }
+                    },
+                    "metrics": {
+                        "type": "object",
+                        "title": "运行指标",
+                        "properties": {
+                            "sampleRate": {
+                                "title": "调试采样间隔",
+                                "description": "每接收该数量的消息保存一条消息及数据处理脚本的结果, 用于调试, 默认为 1000. 0 表示不采样",
+                                "type": "number"
+                            },
+                            "sampleSize": {
+                                "title": "最大采样数量",
+                                "description": "保存的最大采样数量, 默认为 100",
+                                "type": "number"
+                            }
+                        }
+                    },
                     "network": {
                         "type": "object",
                         "title": "通讯监控参数",
@@ -46,6 +228,11 @@
                         "title": "主题",
                         "descripption": "接收数据的主题. 例如: /data/#"
                     },
+                    "deviceIdLevel": {
+                        "type": "number",
+                        "title": "设备编号层级",
+                        "description": "设备编号在主题中的层级, 从 0 开始. 例如主题为 data/SN10001/telemetry 时为 1. 设置后只有主题中的设备编号属于该工作表时才执行数据处理脚本"
+                    },
                     "parseScript": {
                         "type": "string",
                         "title": "数据处理脚本",
@@ -69,6 +256,81 @@
                             "\t];\n" +
                             "}"
                     },
+                    "extract": {
+                        "type": "object",
+                        "title": "数据提取",
+                        "description": "按路径直接从 JSON 消息中提取数据, 不执行数据处理脚本. 路径使用 . 分隔各级键名, 例如: data.temp. 数据点的 key 同样可以为路径. 无法提取数据时使用数据处理脚本",
+                        "properties": {
+                            "enabled": {
+                                "type": "boolean",
+                                "title": "启用"
+                            },
+                            "deviceIdPath": {
+                                "type": "string",
+                                "title": "设备编号路径",
+                                "description": "未配置时使用主题中的设备编号(设备编号层级)"
+                            },
+                            "timePath": {
+                                "type": "string",
+                                "title": "时间戳路径",
+                                "description": "毫秒时间戳. 未配置时使用消息的接收时间"
+                            },
+                            "fieldsPath": {
+                                "type": "string",
+                                "title": "数据点路径",
+                                "description": "数据点所在对象的路径. 未配置时为消息对象本身"
+                            }
+                        }
+                    },
+                    "codec": {
+                        "type": "object",
+                        "title": "消息格式",
+                        "description": "二进制格式(msgpack, protobuf, struct)不使用数据处理脚本. msgpack 和 protobuf 按数据提取中的路径提取数据, struct 按数据点的偏移量及数据类型读取",
+                        "properties": {
+                            "type": {
+                                "type": "string",
+                                "title": "格式",
+                                "enum": ["json", "msgpack", "protobuf", "struct"],
+                                "enum_title": ["JSON", "MessagePack", "Protobuf", "二进制帧"]
+                            },
+                            "byteOrder": {
+                                "type": "string",
+                                "title": "字节序",
+                                "enum": ["little", "big"],
+                                "enum_title": ["小端", "大端"]
+                            },
+                            "recordSize": {
+                                "type": "number",
+                                "title": "记录长度",
+                                "description": "二进制帧中每个记录的字节数, 每个记录为一个设备的数据. 未配置时整个消息为一个记录"
+                            },
+                            "deviceIdOffset": {
+                                "type": "number",
+                                "title": "设备编号偏移量",
+                                "description": "设备编号(整数)在记录中的偏移量. 未配置时使用主题中的设备编号"
+                            },
+                            "deviceIdType": {
+                                "type": "string",
+                                "title": "设备编号类型",
+                                "enum": ["uint8", "uint16", "uint32", "uint64"]
+                            },
+                            "timeOffset": {
+                                "type": "number",
+                                "title": "时间戳偏移量",
+                                "description": "毫秒时间戳在记录中的偏移量. 未配置时使用消息的接收时间"
+                            },
+                            "timeType": {
+                                "type": "string",
+                                "title": "时间戳类型",
+                                "enum": ["uint32", "uint64", "int64", "float64"]
+                            },
+                            "protobufMessage": {
+                                "type": "string",
+                                "title": "Protobuf 消息类型",
+                                "description": "格式为 模块名.类名, 例如: telemetry_pb2.Telemetry"
+                            }
+                        }
+                    },
                     "commandScript": {
                         "type": "string",
                         "title": "指令处理脚本",
@@ -93,6 +355,13 @@
                             "\t};\n" +
                             "}"
                     },
+                    "scriptType": {
+                        "type": "string",
+                        "title": "脚本类型",
+                        "description": "数据处理脚本和指令处理脚本的类型. python 脚本同样需要定义 'handler' 函数, 参数及返回值与 javascript 脚本相同",
+                        "enum": ["javascript", "python"],
+                        "enum_title": ["JavaScript", "Python"]
+                    },
                     "network": {
                         "type": "object",
                         "title": "通讯监控参数",
@@ -127,6 +396,40 @@
                             "type": "string",
                             "title": "键名",
                             "description": "数据点在 JSON 对象中的 key"
+                        },
+                        "offset": {
+                            "type": "number",
+                            "title": "偏移量",
+                            "description": "二进制帧中数据点在记录中的字节偏移量"
+                        },
+                        "dataType": {
+                            "type": "string",
+                            "title": "数据类型",
+                            "description": "二进制帧中数据点的数据类型",
+                            "enum": ["int8", "uint8", "int16", "uint16", "int32", "uint32", "int64", "uint64", "float32", "float64", "bool"]
+                        },
+                        "deadband": {
+                            "type": "object",
+                            "title": "死区",
+                            "description": "数据变化未超过死区时不发送. 非数值类型的数据点只在数据变化时发送",
+                            "properties": {
+                                "type": {
+                                    "type": "string",
+                                    "title": "死区类型",
+                                    "enum": ["absolute", "percent"],
+                                    "enum_title": ["绝对值", "百分比"]
+                                },
+                                "value": {
+                                    "type": "number",
+                                    "title": "死区大小",
+                                    "description": "数据与上次发送值的差值超过该值时发送. 类型为百分比时相对上次发送值计算"
+                                },
+                                "heartbeat": {
+                                    "type": "number",
+                                    "title": "最长静默时间(秒)",
+                                    "description": "超过该时间未发送时, 即使数据未变化也发送. 0 表示不限制"
+                                }
+                            }
                         }
                     },
                     "required": ["id", "name", "key"]
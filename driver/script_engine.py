@@ -0,0 +1,235 @@
+import hashlib
+import logging
+import os
+import stat
+from importlib import metadata
+from threading import Lock
+from typing import Callable, Optional
+
+import js2py
+from js2py.base import JsObjectWrapper, to_python
+
+logger = logging.getLogger("script_engine")
+
+# 脚本入口函数名称
+entrypoint = "handler"
+
+# 脚本类型
+JAVASCRIPT = "javascript"
+PYTHON = "python"
+
+# 默认的脚本翻译结果缓存目录. 缓存的代码会被执行, 只能保存在当前用户私有的目录中, 不能使用共享的临时目录
+default_cache_dir = os.path.join(os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"),
+                                 "mqtt_driver", "scripts")
+
+
+def _js2py_version() -> str:
+    try:
+        return metadata.version("js2py")
+    except metadata.PackageNotFoundError:
+        return "unknown"
+
+
+def private_dir(path: str) -> str:
+    """
+    创建只有当前用户可以访问的目录(0700). 目录已存在时检查类型及所有者, 并移除其它用户的访问权限
+    :param path: 目录路径
+    :return: 目录路径
+    :raise PermissionError: 路径不是目录(包括符号链接)或目录不属于当前用户
+    """
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    info = os.lstat(path)
+    if not stat.S_ISDIR(info.st_mode):
+        raise PermissionError("缓存路径不是目录: {}".format(path))
+    if hasattr(os, "getuid"):
+        if info.st_uid != os.getuid():
+            raise PermissionError("缓存目录不属于当前用户: {}".format(path))
+        if info.st_mode & 0o077:
+            os.chmod(path, 0o700)
+    return path
+
+
+def to_native(value: any) -> any:
+    """
+    将 js2py 返回的 JS 对象递归转换为 Python 原生对象(list, dict, int, float, str, bool, None)
+    :param value: 脚本返回值
+    :return: Python 原生对象
+    """
+    value = to_python(value)
+    if not isinstance(value, JsObjectWrapper):
+        return value
+
+    if value._obj.Class in ("Array", "Arguments"):
+        return value.to_list()
+
+    return value.to_dict()
+
+
+class CompiledScript:
+    """
+    已编译的脚本. 相同内容的脚本只编译一次, 由所有使用该脚本的工作表共享
+
+    Attributes:
+        signature: 脚本签名(脚本类型及内容的 sha256 值)
+        language: 脚本类型. javascript 或 python
+        function: 脚本入口函数
+    """
+
+    signature: str
+    language: str
+    function: Callable
+
+    def __init__(self, signature: str, language: str, function: Callable):
+        self.signature = signature
+        self.language = language
+        self.function = function
+
+    def __call__(self, *args):
+        result = self.function(*args)
+        if self.language == JAVASCRIPT:
+            return to_native(result)
+        return result
+
+    def __str__(self):
+        return "CompiledScript(signature={}, language={})".format(self.signature, self.language)
+
+
+class ScriptEngine:
+    """
+    脚本引擎. 负责编译数据处理脚本和指令处理脚本.
+
+    javascript 脚本只在第一次使用时通过 js2py 翻译为 Python 代码, 翻译结果按脚本内容的哈希值缓存在磁盘上,
+    驱动重启后可以直接加载, 不需要再次翻译. 缓存目录只允许当前用户访问, 无法使用时不缓存翻译结果. 编译后的脚本按内容哈希值在内存中共享, 多个工作表使用相同的脚本时只编译一次.
+
+    python 脚本需要定义入口函数 handler, 参数及返回值与 javascript 脚本相同.
+    """
+
+    # 已编译的脚本. key 为脚本签名
+    scripts: dict[str, CompiledScript]
+
+    def __init__(self, cache_dir: Optional[str] = default_cache_dir):
+        if cache_dir is not None:
+            try:
+                cache_dir = private_dir(cache_dir)
+            except OSError as e:
+                logger.warning("脚本缓存目录不可用, 不缓存翻译结果: %s", e)
+                cache_dir = None
+        self.cache_dir = cache_dir
+        self.scripts = {}
+        self.lock = Lock()
+        self.version = _js2py_version()
+
+    def compile(self, script: str, language: Optional[str] = None) -> CompiledScript:
+        """
+        编译脚本. 如果相同内容的脚本已经编译过, 则直接返回已编译的脚本
+        :param script: 脚本内容
+        :param language: 脚本类型, javascript 或 python. 默认为 javascript
+        :return: 已编译的脚本
+        :raise ValueError: 脚本为空或脚本类型不支持
+        """
+
+        if script is None or len(script.strip()) == 0:
+            raise ValueError("script is None or empty")
+
+        language = JAVASCRIPT if language is None or len(language) == 0 else language
+        if language not in (JAVASCRIPT, PYTHON):
+            raise ValueError("不支持的脚本类型: {}".format(language))
+
+        signature = hashlib.sha256("{}|{}".format(language, script).encode("utf-8")).hexdigest()
+
+        with self.lock:
+            if signature in self.scripts:
+                logger.debug("compile: compiled. signature = %s", signature)
+                return self.scripts[signature]
+
+            if language == PYTHON:
+                function = self.__compile_python__(signature, script)
+            else:
+                function = self.__compile_javascript__(signature, script)
+
+            compiled = CompiledScript(signature, language, function)
+            self.scripts[signature] = compiled
+            return compiled
+
+    def clear(self):
+        """
+        清空内存中已编译的脚本. 磁盘上的翻译结果不会被删除
+        """
+        with self.lock:
+            self.scripts = {}
+
+    def __compile_python__(self, signature: str, script: str) -> Callable:
+        ctx = {}
+        bytecode = compile(script, "<{}>".format(signature), "exec")
+        exec(bytecode, ctx)
+
+        if entrypoint not in ctx or not callable(ctx[entrypoint]):
+            raise ValueError("未找到入口函数 {}".format(entrypoint))
+
+        return ctx[entrypoint]
+
+    def __compile_javascript__(self, signature: str, script: str) -> Callable:
+        # js2py 版本不同时翻译结果可能不同, 因此缓存文件名中包含 js2py 的版本号
+        key = hashlib.sha256("{}|{}".format(self.version, signature).encode("utf-8")).hexdigest()
+
+        code = self.__load_translated__(key)
+        if code is None:
+            code = self.__translate__(script)
+            self.__save_translated__(key, code)
+        else:
+            logger.debug("compile: load translated script from disk cache, signature = %s", signature)
+
+        scope = self.__execute_translated__(signature, code)
+        return scope.get(entrypoint)
+
+    def __translate__(self, script: str) -> str:
+        # 脚本定义了 handler 函数时直接翻译
+        code = js2py.translate_js(script)
+        try:
+            self.__execute_translated__("translate", code)
+            return code
+        except ValueError:
+            pass
+
+        # 兼容脚本内容为函数表达式的情况, 例如: (function(topic, payload) {...})
+        expression = script.strip().rstrip(";")
+        return js2py.translate_js("var {} = ({});".format(entrypoint, expression))
+
+    def __execute_translated__(self, name: str, code: str):
+        ctx = {}
+        exec(compile(code, "<js:{}>".format(name), "exec"), ctx)
+        scope = ctx["var"]
+        if entrypoint not in scope.own or not scope.get(entrypoint).is_callable():
+            raise ValueError("未找到入口函数 {}".format(entrypoint))
+        return scope
+
+    def __cache_path__(self, key: str) -> Optional[str]:
+        if self.cache_dir is None:
+            return None
+        return os.path.join(self.cache_dir, "{}.py".format(key))
+
+    def __load_translated__(self, key: str) -> Optional[str]:
+        path = self.__cache_path__(key)
+        if path is None or not os.path.exists(path):
+            return None
+
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return f.read()
+        except OSError as e:
+            logger.warning("读取脚本缓存失败: %s, %s", path, e)
+            return None
+
+    def __save_translated__(self, key: str, code: str):
+        path = self.__cache_path__(key)
+        if path is None:
+            return
+
+        # 先写入临时文件再重命名, 避免多个驱动实例同时写入时读取到不完整的文件
+        tmp_path = "{}.{}.tmp".format(path, os.getpid())
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(code)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning("写入脚本缓存失败: %s, %s", path, e)
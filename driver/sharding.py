@@ -0,0 +1,383 @@
+"""
+消息接收分片.
+
+驱动进程只有一个 MQTT 连接时, 所有消息的解码及脚本解析都在一个 Python 进程中执行, 受 GIL 限制只能使用一个 CPU.
+配置分片(shard)后, 消息的接收及解析分配到多个子进程, 每个子进程使用独立的 MQTT 连接:
+
+- table: 按工作表分配. 每个工作表只由一个子进程订阅, 按设备数量均衡分配
+- share: 共享订阅. 每个子进程使用 $share/{分组}/{主题} 订阅所有工作表的主题, 由 MQTT 服务器在各连接之间分配消息
+
+子进程将解析得到的数据编码为元组, 批量通过管道发送给驱动进程. 驱动进程保持与平台的连接,
+按数据点键名还原数据点后经过数据处理器链及批量发送器发送到平台, 数据点的有效值等状态只保存在驱动进程中.
+"""
+import asyncio
+import logging
+import multiprocessing
+import threading
+import time
+import traceback
+from multiprocessing.connection import Connection
+from typing import Callable, Iterable, Optional
+
+import urllib3.util
+from paho.mqtt import client as mqtt_client
+
+from airiot_python_sdk.driver.model.point import Field, Point
+from batch_sender import BatchDataSender
+from model import ModelConfig, Settings, ShardSettings
+from tag_registry import TagRegistry
+from topic_trie import TopicTrie, minimal_filters, validate_filter
+
+logger = logging.getLogger("mqtt_shard")
+
+# 子进程发送给驱动进程的数据: (工作表标识, 资产编号, 时间戳, ((数据点键名, 值), ...))
+ShardPoint = tuple[str, str, int, tuple[tuple[str, any], ...]]
+
+# 创建并连接 MQTT 客户端的函数. 参数为客户端 ID 及驱动实例配置. 在子进程中调用, 必须可以被 pickle
+ClientFactory = Callable[[str, Settings], mqtt_client.Client]
+
+
+def create_mqtt_client(client_id: str, settings: Settings) -> mqtt_client.Client:
+    """
+    创建 MQTT 客户端并连接服务器
+    :param client_id: 客户端 ID
+    :param settings: 驱动实例配置
+    """
+    broker_url = urllib3.util.parse_url(settings.server)
+    client = mqtt_client.Client(client_id=client_id, clean_session=True, protocol=mqtt_client.MQTTv311)
+    client.username_pw_set(settings.username, settings.password)
+    client.reconnect_delay_set(min_delay=1, max_delay=120)
+    client.connect(host=broker_url.host, port=broker_url.port, keepalive=60)
+    return client
+
+
+def partition_tables(raw_tables: list[dict], shards: int) -> list[list[dict]]:
+    """
+    按设备数量将工作表均衡分配到各分片. 设备数量多的工作表优先分配到当前设备数量最少的分片
+    :param raw_tables: 工作表配置(JSON 对象)
+    :param shards: 分片数量
+    :return: 各分片的工作表. 工作表数量少于分片数量时只返回有工作表的分片
+    """
+    partitions = [[] for _ in range(min(shards, len(raw_tables)))]
+    loads = [0] * len(partitions)
+    order = sorted(raw_tables, key=lambda raw_table: -len(raw_table.get("devices") or []))
+    for raw_table in order:
+        index = loads.index(min(loads))
+        partitions[index].append(raw_table)
+        loads[index] += max(1, len(raw_table.get("devices") or []))
+    return partitions
+
+
+def shared_filter(topic_filter: str, group: Optional[str]) -> str:
+    """
+    转换为共享订阅的主题过滤器
+    :param topic_filter: 主题过滤器
+    :param group: 共享订阅分组. 为 None 时不转换
+    """
+    return topic_filter if group is None else "$share/{}/{}".format(group, topic_filter)
+
+
+def table_registry(table: ModelConfig) -> TagRegistry:
+    """
+    合并工作表和设备的配置, 并注册所有设备的数据点
+    :param table: 工作表配置
+    """
+    table.merge_devices()
+    registry = TagRegistry()
+    for device in table.devices:
+        if device.device.tags is not None and len(device.device.tags) > 0:
+            registry.register(device.id, device.device.tags)
+    return registry
+
+
+class PipeDataSender:
+    """
+    子进程中的数据发送器. 将解析得到的数据编码为元组, 批量通过管道发送给驱动进程
+
+    Attributes:
+        conn: 发送数据的管道
+        max_points: 等待发送的最大设备数量, 达到该数量时立即发送
+        sent: 发送的设备数据数量
+    """
+
+    conn: Connection
+    max_points: int
+    sent: int = 0
+
+    def __init__(self, conn: Connection, max_points: int = 500):
+        self.conn = conn
+        self.max_points = max_points
+        self.pending: list[ShardPoint] = []
+
+    async def write_points(self, points: Iterable[Point]):
+        pending = self.pending
+        for point in points:
+            pending.append((point.table, point.id, point.time,
+                            tuple((field.tag.key, field.value) for field in point.fields)))
+        if len(pending) >= self.max_points:
+            self.flush()
+
+    def flush(self):
+        if len(self.pending) == 0:
+            return
+        pending, self.pending = self.pending, []
+        self.conn.send(pending)
+        self.sent += len(pending)
+
+
+class ShardWorker:
+    """
+    子进程中的消息接收及解析. 与驱动进程中的处理相同, 解析得到的数据通过管道发送给驱动进程
+
+    Attributes:
+        client_id: MQTT 客户端 ID
+        config: 该分片的驱动实例配置(JSON 对象)
+        share_group: 共享订阅分组. 为 None 时不使用共享订阅
+        topics: 主题树
+        topic_filters: 向 MQTT 服务器订阅的主题过滤器
+    """
+
+    client_id: str
+    config: dict
+    share_group: Optional[str]
+    topics: TopicTrie
+    topic_filters: list[str]
+
+    def __init__(self, client_id: str, config: dict, share_group: Optional[str], conn: Connection,
+                 stop_event, client_factory: ClientFactory, flush_interval: float = 0.005):
+        self.client_id = client_id
+        self.config = config
+        self.share_group = share_group
+        self.conn = conn
+        self.stop_event = stop_event
+        self.client_factory = client_factory
+        self.flush_interval = flush_interval
+        self.topics = TopicTrie()
+        self.topic_filters = []
+        self.ingest = None
+
+    async def run(self):
+        # 子进程中导入, 驱动进程导入该模块时不依赖 mqtt_driver
+        from config_loader import load_driver_config
+        from ingest import create_ingest_queue
+        from mqtt_driver import MqttSubscription
+        from script_engine import ScriptEngine
+
+        driver_config = load_driver_config(self.config)
+        settings = driver_config.device.settings
+        ingest = settings.ingest
+        if ingest is None:
+            self.ingest = create_ingest_queue(asyncio.get_running_loop(), None, None, None)
+        else:
+            self.ingest = create_ingest_queue(asyncio.get_running_loop(), ingest.queueSize, ingest.workers,
+                                              ingest.overflow)
+        self.ingest.start()
+
+        sender = PipeDataSender(self.conn)
+        script_engine = ScriptEngine()
+        subscriptions = []
+        for table in driver_config.tables or []:
+            table_settings = None if table.device is None else table.device.settings
+            if table_settings is None or not table_settings.topic or len(table.devices) == 0:
+                continue
+            try:
+                validate_filter(table_settings.topic)
+                subscriptions.append(MqttSubscription(self.ingest, None, sender, table, script_engine))
+            except Exception as e:
+                logger.error("%s: 处理工作表 '%s' 时出错: %s", self.client_id, table.id, e)
+
+        for subscription in subscriptions:
+            self.topics.insert(subscription.topic, subscription)
+        self.topic_filters = [shared_filter(topic_filter, self.share_group)
+                              for topic_filter in minimal_filters(subscription.topic for subscription in subscriptions)]
+
+        client = self.client_factory(self.client_id, settings)
+        client.on_connect = self.on_connect
+        client.on_message = self.on_message
+        client.loop_start()
+        logger.info("%s: 分片已启动, 工作表数量: %d, 订阅主题: %s", self.client_id, len(subscriptions),
+                    self.topic_filters)
+
+        try:
+            while not self.stop_event.is_set():
+                await asyncio.sleep(self.flush_interval)
+                sender.flush()
+        finally:
+            client.loop_stop()
+            client.disconnect()
+            await self.ingest.stop()
+            sender.flush()
+            # 通知驱动进程数据已发送完成
+            self.conn.send(None)
+            self.conn.close()
+            logger.info("%s: 分片已停止, 发送设备数据: %d, 接收队列: %s", self.client_id, sender.sent,
+                        self.ingest.stats())
+
+    def on_connect(self, client, userdata, flags, rc):
+        if rc != 0:
+            logger.error("%s: 连接 mqtt 服务器失败: %s", self.client_id, rc)
+            return
+        if len(self.topic_filters) > 0:
+            client.subscribe([(topic_filter, 0) for topic_filter in self.topic_filters])
+
+    def on_message(self, client, userdata, msg):
+        receive_time = int(time.time() * 1000)
+        for subscription in self.topics.match(msg.topic):
+            if subscription.accepts(msg.topic):
+                self.ingest.offer(subscription.handle_message, msg.topic, msg.payload, receive_time)
+
+
+def run_shard_worker(client_id: str, config: dict, share_group: Optional[str], conn: Connection, stop_event,
+                     client_factory: ClientFactory):
+    """
+    子进程入口
+    """
+    logging.basicConfig(level=logging.INFO)
+    worker = ShardWorker(client_id, config, share_group, conn, stop_event, client_factory)
+    try:
+        asyncio.run(worker.run())
+    except KeyboardInterrupt:
+        pass
+
+
+class ShardedIngest:
+    """
+    分片消息接收. 在驱动进程中启动子进程, 并将子进程发送的数据交给批量发送器
+
+    Attributes:
+        processes: 子进程
+        registries: 各工作表的数据点注册表, 用于按数据点键名还原数据点. key 为工作表标识
+        received: 从子进程接收到的设备数据数量
+        batches: 从子进程接收到的批次数量
+        unknown: 未找到设备或数据点而丢弃的设备数据数量
+    """
+
+    processes: list[multiprocessing.Process]
+    registries: dict[str, TagRegistry]
+
+    received: int = 0
+    batches: int = 0
+    unknown: int = 0
+
+    def __init__(self, service_id: str, raw_config: dict, tables: Iterable[ModelConfig], settings: ShardSettings,
+                 data_sender: BatchDataSender, client_factory: ClientFactory = create_mqtt_client):
+        self.service_id = service_id
+        self.raw_config = raw_config
+        self.settings = settings
+        self.data_sender = data_sender
+        self.client_factory = client_factory
+        self.registries = {table.id: table_registry(table) for table in tables}
+        self.processes = []
+        self.readers = []
+        self.loop = None
+        self.context = multiprocessing.get_context("spawn")
+        self.stop_event = self.context.Event()
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "processes": len(self.processes),
+            "received": self.received,
+            "batches": self.batches,
+            "unknown": self.unknown,
+        }
+
+    def configs(self) -> list[dict]:
+        """
+        生成各子进程的驱动实例配置
+        """
+        raw_tables = self.raw_config.get("tables") or []
+        processes = self.settings.processes
+        if self.settings.mode == "share":
+            partitions = [raw_tables] * processes
+        elif self.settings.mode in (None, "table"):
+            partitions = partition_tables(raw_tables, processes)
+        else:
+            raise ValueError("不支持的分片方式: {}".format(self.settings.mode))
+
+        return [dict(self.raw_config, tables=partition) for partition in partitions]
+
+    def start(self, loop: asyncio.AbstractEventLoop):
+        """
+        启动子进程. 必须在驱动事件循环中调用
+        :param loop: 驱动事件循环
+        """
+        self.loop = loop
+        share_group = None
+        if self.settings.mode == "share":
+            share_group = self.settings.shareGroup or "mqtt_driver_{}".format(self.service_id)
+
+        for index, config in enumerate(self.configs()):
+            reader, writer = self.context.Pipe(duplex=False)
+            client_id = "mqtt_driver_{}_{}".format(self.service_id, index)
+            process = self.context.Process(target=run_shard_worker, name=client_id, daemon=True,
+                                           args=(client_id, config, share_group, writer, self.stop_event,
+                                                 self.client_factory))
+            process.start()
+            # 关闭驱动进程中的写入端, 子进程退出时读取端可以收到 EOF
+            writer.close()
+
+            thread = threading.Thread(target=self.__read__, args=(client_id, reader), name=client_id, daemon=True)
+            thread.start()
+            self.processes.append(process)
+            self.readers.append(thread)
+
+        logger.info("已启动 %d 个分片, 分片方式: %s", len(self.processes), self.settings.mode or "table")
+
+    async def stop(self, timeout: float = 10):
+        """
+        停止子进程, 并等待子进程发送完已解析的数据
+        :param timeout: 等待子进程退出的最长时间(秒)
+        """
+        self.stop_event.set()
+        for thread in self.readers:
+            await asyncio.to_thread(thread.join, timeout)
+        for process in self.processes:
+            await asyncio.to_thread(process.join, timeout)
+            if process.is_alive():
+                logger.warning("分片 %s 未在 %s 秒内退出, 强制结束", process.name, timeout)
+                process.terminate()
+
+        self.processes = []
+        self.readers = []
+        logger.info("分片已停止, 接收设备数据: %d, 批次: %d, 丢弃: %d", self.received, self.batches, self.unknown)
+
+    def __read__(self, name: str, conn: Connection):
+        """
+        读取子进程发送的数据. 在独立的线程中执行, 等待驱动事件循环处理完一个批次后再读取下一个批次
+        """
+        while True:
+            try:
+                batch = conn.recv()
+            except (EOFError, OSError):
+                break
+            if batch is None:
+                break
+
+            future = asyncio.run_coroutine_threadsafe(self.__write__(batch), self.loop)
+            try:
+                future.result()
+            except Exception as e:
+                traceback.print_exception(e)
+                logger.error("%s: 发送数据点异常: %s", name, e)
+        conn.close()
+
+    async def __write__(self, batch: list[ShardPoint]):
+        self.batches += 1
+        self.received += len(batch)
+
+        points = []
+        for table_id, device_id, point_time, fields in batch:
+            registry = self.registries.get(table_id)
+            tags = None if registry is None else registry.get(device_id)
+            if tags is None:
+                self.unknown += 1
+                continue
+
+            point = Point()
+            point.table = table_id
+            point.id = device_id
+            point.time = point_time
+            point.fields = [Field(tags[key], value) for key, value in fields if key in tags]
+            points.append(point)
+
+        await self.data_sender.write_points(points)
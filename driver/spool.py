@@ -0,0 +1,300 @@
+"""
+数据发送缓冲(store-and-forward).
+
+与平台的连接断开时, 发送的数据按顺序追加写入磁盘上的分段文件, 连接恢复后按写入顺序重新发送.
+只要缓冲中还有未发送的数据, 新的数据也写入缓冲, 保证同一设备的数据按产生的顺序发送.
+
+分段文件名为 {序号}.seg, 每条记录的格式为: 长度(uint32) + crc32(uint32) + 工作表标识\\0设备编号\\0消息内容.
+读取位置保存在 cursor 文件中, 驱动重启后从上次发送的位置继续发送. 磁盘占用超过上限时按策略丢弃数据:
+drop-oldest(默认) 删除最早的分段文件, drop-newest 丢弃新写入的数据.
+"""
+import logging
+import os
+import struct
+import zlib
+from enum import Enum
+from typing import BinaryIO, Iterable, Optional
+
+logger = logging.getLogger("data_spool")
+
+header = struct.Struct("<II")
+
+# 缓冲中的记录: (工作表标识, 设备编号, 消息内容)
+SpoolRecord = tuple[str, str, str]
+
+# 读取位置: (分段序号, 偏移量)
+SpoolPosition = tuple[int, int]
+
+
+class EvictionPolicy(str, Enum):
+    """
+    磁盘占用超过上限时的处理策略
+
+    Attributes:
+        DROP_OLDEST: 删除最早的分段文件
+        DROP_NEWEST: 丢弃新写入的数据
+    """
+
+    DROP_OLDEST = "drop-oldest"
+    DROP_NEWEST = "drop-newest"
+
+
+def encode_record(record: SpoolRecord) -> bytes:
+    table_id, device_id, payload = record
+    body = "{}\0{}\0{}".format(table_id, device_id, payload).encode("utf-8")
+    return header.pack(len(body), zlib.crc32(body)) + body
+
+
+class SegmentSpool:
+    """
+    分段文件缓冲. 只在驱动事件循环中使用, 不支持多线程访问
+
+    Attributes:
+        path: 缓冲目录
+        segment_bytes: 单个分段文件的最大长度
+        max_bytes: 磁盘占用上限
+        policy: 磁盘占用超过上限时的处理策略
+        segments: 分段文件的序号及记录数量, 按写入顺序排列
+        position: 读取位置
+        pending: 未发送的记录数量
+        size: 所有分段文件的长度
+        written: 写入的记录数量
+        evicted: 因磁盘占用超过上限而丢弃的记录数量
+    """
+
+    path: str
+    segment_bytes: int
+    max_bytes: int
+    policy: EvictionPolicy
+    segments: dict[int, int]
+    position: SpoolPosition
+    pending: int = 0
+    size: int = 0
+    written: int = 0
+    evicted: int = 0
+
+    def __init__(self, path: str, max_bytes: int = 256 * 1024 * 1024, segment_bytes: int = 4 * 1024 * 1024,
+                 policy: EvictionPolicy = EvictionPolicy.DROP_OLDEST):
+        if segment_bytes <= 0 or max_bytes < segment_bytes:
+            raise ValueError("max_bytes must be greater than or equal to segment_bytes")
+
+        self.path = path
+        self.max_bytes = max_bytes
+        self.segment_bytes = segment_bytes
+        self.policy = EvictionPolicy(policy)
+        self.segments = {}
+        self.writer: Optional[BinaryIO] = None
+        self.reader: Optional[BinaryIO] = None
+        self.reader_seq = -1
+
+        os.makedirs(path, exist_ok=True)
+        self.__recover__()
+
+    def __segment_path__(self, seq: int) -> str:
+        return os.path.join(self.path, "{:012d}.seg".format(seq))
+
+    def __recover__(self):
+        """
+        加载已有的分段文件及读取位置, 并统计未发送的记录数量
+        """
+        for name in sorted(os.listdir(self.path)):
+            if name.endswith(".seg"):
+                self.segments[int(name[:-4])] = 0
+
+        self.position = (min(self.segments, default=0), 0)
+        cursor = os.path.join(self.path, "cursor")
+        if os.path.exists(cursor):
+            with open(cursor, "r") as file:
+                seq, offset = file.read().split()
+            if int(seq) in self.segments:
+                self.position = (int(seq), int(offset))
+
+        # 删除已经发送完成的分段文件
+        for seq in [seq for seq in self.segments if seq < self.position[0]]:
+            self.__remove__(seq)
+
+        for seq in self.segments:
+            count, _ = self.__scan__(seq)
+            self.segments[seq] = count
+            self.size += os.path.getsize(self.__segment_path__(seq))
+            if seq == self.position[0] and self.position[1] > 0:
+                count -= self.__scan__(seq, self.position[1])[0]
+            self.pending += count
+
+        if len(self.segments) > 0:
+            logger.info("加载数据缓冲: %s, 分段数量: %d, 未发送记录: %d", self.path, len(self.segments), self.pending)
+
+    def __scan__(self, seq: int, limit: Optional[int] = None) -> tuple[int, int]:
+        """
+        统计分段文件中完整记录的数量
+        :param seq: 分段序号
+        :param limit: 只统计该偏移量之前的记录
+        :return: 记录数量及完整记录的长度
+        """
+        count = 0
+        offset = 0
+        with open(self.__segment_path__(seq), "rb") as file:
+            while limit is None or offset < limit:
+                data = file.read(header.size)
+                if len(data) < header.size:
+                    break
+                length, _ = header.unpack(data)
+                if len(file.read(length)) < length:
+                    break
+                count += 1
+                offset += header.size + length
+        return count, offset
+
+    def __remove__(self, seq: int):
+        if self.reader is not None and self.reader_seq == seq:
+            self.reader.close()
+            self.reader = None
+            self.reader_seq = -1
+        if self.writer is not None and seq == max(self.segments):
+            self.writer.close()
+            self.writer = None
+
+        path = self.__segment_path__(seq)
+        if os.path.exists(path):
+            self.size -= os.path.getsize(path)
+            os.remove(path)
+        self.segments.pop(seq, None)
+
+    def append(self, records: Iterable[SpoolRecord]):
+        """
+        按顺序追加记录
+        :param records: 记录
+        """
+        for record in records:
+            data = encode_record(record)
+            if not self.__reserve__(len(data)):
+                self.evicted += 1
+                continue
+
+            if self.writer is None or self.writer.tell() + len(data) > self.segment_bytes:
+                self.__roll__()
+            self.writer.write(data)
+            self.segments[max(self.segments)] += 1
+            self.size += len(data)
+            self.pending += 1
+            self.written += 1
+
+        if self.writer is not None:
+            self.writer.flush()
+
+    def __reserve__(self, length: int) -> bool:
+        """
+        确保磁盘占用不超过上限
+        :return: 是否可以写入
+        """
+        while self.size + length > self.max_bytes:
+            if self.policy == EvictionPolicy.DROP_NEWEST or len(self.segments) == 0:
+                return False
+
+            oldest = min(self.segments)
+            dropped = self.segments[oldest]
+            if oldest == self.position[0]:
+                dropped -= self.__scan__(oldest, self.position[1])[0] if self.position[1] > 0 else 0
+            self.evicted += dropped
+            self.pending -= dropped
+            logger.warning("数据缓冲超过上限 %d 字节, 丢弃最早的分段: %d, 记录数量: %d", self.max_bytes, oldest, dropped)
+
+            last = oldest == max(self.segments)
+            self.__remove__(oldest)
+            if last:
+                self.position = (oldest + 1, 0)
+            elif oldest == self.position[0]:
+                self.position = (min(self.segments), 0)
+        return True
+
+    def __roll__(self):
+        """
+        创建新的分段文件
+        """
+        if self.writer is not None:
+            self.writer.close()
+        # 驱动重启后不再写入已有的分段
+        seq = max(self.segments) + 1 if len(self.segments) > 0 else self.position[0]
+        self.segments[seq] = 0
+        self.writer = open(self.__segment_path__(seq), "ab")
+
+    def read(self, limit: int) -> list[tuple[SpoolRecord, SpoolPosition]]:
+        """
+        从读取位置开始按顺序读取记录, 不移动读取位置
+        :param limit: 最多读取的记录数量
+        :return: 记录及读取该记录后的位置
+        """
+        records = []
+        seq, offset = self.position
+        while len(records) < limit and seq in self.segments:
+            if self.reader_seq != seq:
+                if self.reader is not None:
+                    self.reader.close()
+                self.reader = open(self.__segment_path__(seq), "rb")
+                self.reader_seq = seq
+
+            self.reader.seek(offset)
+            data = self.reader.read(header.size)
+            if len(data) == header.size:
+                length, crc = header.unpack(data)
+                body = self.reader.read(length)
+                if len(body) == length:
+                    offset += header.size + length
+                    if zlib.crc32(body) != crc:
+                        # 已读取的记录发送后再跳过该记录
+                        if len(records) > 0:
+                            break
+                        logger.warning("数据缓冲记录校验失败, 分段: %d, 偏移量: %d", seq, offset)
+                        self.__move__((seq, offset), 1)
+                        continue
+                    table_id, device_id, payload = body.decode("utf-8").split("\0", 2)
+                    records.append(((table_id, device_id, payload), (seq, offset)))
+                    continue
+
+            # 当前分段已读取完成. 正在写入的分段等待新的记录
+            following = [next_seq for next_seq in self.segments if next_seq > seq]
+            if len(following) == 0:
+                break
+            seq, offset = min(following), 0
+            if len(records) > 0:
+                records[-1] = (records[-1][0], (seq, 0))
+            else:
+                self.__move__((seq, 0), 0)
+        return records
+
+    def commit(self, position: SpoolPosition, count: int):
+        """
+        移动读取位置. 在记录发送成功后调用
+        :param position: 最后一条已发送记录之后的位置
+        :param count: 已发送的记录数量
+        """
+        self.__move__(position, count)
+
+    def __move__(self, position: SpoolPosition, count: int):
+        self.position = position
+        self.pending -= count
+        for seq in [seq for seq in self.segments if seq < position[0]]:
+            self.__remove__(seq)
+
+        cursor = os.path.join(self.path, "cursor")
+        with open(cursor + ".tmp", "w") as file:
+            file.write("{} {}".format(*position))
+        os.replace(cursor + ".tmp", cursor)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+        if self.reader is not None:
+            self.reader.close()
+            self.reader = None
+            self.reader_seq = -1
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "pending": self.pending,
+            "size": self.size,
+            "segments": len(self.segments),
+            "written": self.written,
+            "evicted": self.evicted,
+        }
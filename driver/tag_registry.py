@@ -0,0 +1,162 @@
+"""
+设备数据点注册表.
+
+工作表中的大部分设备继承工作表的数据点, 与工作表配置合并后共享同一组数据点对象. 自定义数据点的设备即使配置相同,
+数据点对象也各不相同. 注册表按数据点的内容驻留数据点集合, 数据点相同的设备共享同一个只读的 key -> 数据点映射,
+不再为每个设备创建一个字典.
+注册表由订阅对象持有, 工作表重新加载或驱动停止时随订阅对象一起释放.
+"""
+import dataclasses
+from types import MappingProxyType
+from typing import Iterable, Mapping, Optional
+
+from model import MQTTTag
+
+
+def content_signature(value: any) -> any:
+    """
+    计算配置对象的内容签名. 数据类按字段递归计算, 列表转换为元组. 内容相同的对象签名相等
+    :param value: 配置对象, 例如 MQTTTag
+    :return: 可以作为字典 key 的签名
+    """
+    if dataclasses.is_dataclass(value):
+        return (type(value),) + tuple(content_signature(getattr(value, field.name))
+                                      for field in dataclasses.fields(value))
+    if isinstance(value, (list, tuple)):
+        return tuple(content_signature(item) for item in value)
+    if isinstance(value, dict):
+        return tuple(sorted((key, content_signature(item)) for key, item in value.items()))
+    return value
+
+
+class TagSet:
+    """
+    驻留的数据点集合, 由数据点相同的设备共享. 创建后不再修改
+
+    Attributes:
+        tags: 数据点, 顺序与配置相同
+        keys: 只读的数据点映射. key 为数据点的键名(MQTTTag.key)
+    """
+
+    __slots__ = ("tags", "keys")
+
+    tags: tuple[MQTTTag, ...]
+    keys: Mapping[str, MQTTTag]
+
+    def __init__(self, tags: tuple[MQTTTag, ...]):
+        self.tags = tags
+        self.keys = MappingProxyType({tag.key: tag for tag in tags})
+
+    def __len__(self) -> int:
+        return len(self.tags)
+
+
+class TagRegistry:
+    """
+    设备数据点注册表
+
+    Attributes:
+        sets: 已驻留的数据点集合. key 为各数据点的内容编号组成的元组
+        contents: 数据点的内容编号. key 为数据点的内容签名, 内容相同的数据点编号相同
+        identities: 按数据点对象标识查找已驻留的集合, 避免重复计算内容签名
+        signatures: 数据点的内容编号. key 为数据点对象标识. 继承工作表数据点的设备只需要计算自定义数据点的签名
+        devices: 设备的数据点集合. key 为资产编号
+
+    identities 及 signatures 只记录已驻留集合中的数据点对象, 集合持有这些对象, 标识不会被复用
+    """
+
+    sets: dict[tuple[int, ...], TagSet]
+    contents: dict[tuple, int]
+    identities: dict[tuple[int, ...], TagSet]
+    signatures: dict[int, int]
+    devices: dict[str, TagSet]
+
+    def __init__(self):
+        self.sets = {}
+        self.contents = {}
+        self.identities = {}
+        self.signatures = {}
+        self.devices = {}
+        # 上一次注册的数据点列表. 共享工作表配置的设备连续注册时不需要重新计算标识
+        self.__last = None
+
+    def intern(self, tags: Iterable[MQTTTag]) -> TagSet:
+        """
+        驻留数据点集合. 内容相同(按顺序)的数据点集合只创建一次, 使用第一次注册的数据点对象
+        :param tags: 数据点
+        :return: 共享的数据点集合
+        """
+        last = self.__last
+        if last is not None and last[0] is tags:
+            return last[1]
+        if not isinstance(tags, (list, tuple)):
+            tags = tuple(tags)
+
+        identity = tuple(map(id, tags))
+        tag_set = self.identities.get(identity)
+        if tag_set is None:
+            signatures = self.signatures
+            numbers = list(map(signatures.get, identity))
+            if None in numbers:
+                numbers = [self.__content__(tag) if number is None else number for tag, number in zip(tags, numbers)]
+            signature = tuple(numbers)
+            tag_set = self.sets.get(signature)
+            if tag_set is None:
+                tag_set = TagSet(tuple(tags))
+                self.sets[signature] = tag_set
+                self.identities[identity] = tag_set
+                signatures.update(zip(identity, signature))
+
+        self.__last = (tags, tag_set)
+        return tag_set
+
+    def __content__(self, tag: MQTTTag) -> int:
+        content = content_signature(tag)
+        number = self.contents.get(content)
+        if number is None:
+            number = self.contents[content] = len(self.contents)
+        return number
+
+    def register(self, device_id: str, tags: Iterable[MQTTTag]) -> TagSet:
+        """
+        注册设备的数据点
+        :param device_id: 资产编号
+        :param tags: 设备的数据点(已与工作表配置合并)
+        :return: 设备的数据点集合
+        """
+        tag_set = self.intern(tags)
+        self.devices[device_id] = tag_set
+        return tag_set
+
+    def get(self, device_id: str) -> Optional[Mapping[str, MQTTTag]]:
+        """
+        获取设备的数据点映射
+        :param device_id: 资产编号
+        :return: 数据点映射. 设备未注册时返回 None
+        """
+        tag_set = self.devices.get(device_id)
+        return None if tag_set is None else tag_set.keys
+
+    def resolve(self, device_id: str, key: str) -> Optional[MQTTTag]:
+        """
+        查找设备的数据点
+        :param device_id: 资产编号
+        :param key: 数据点键名
+        :return: 数据点. 设备或数据点不存在时返回 None
+        """
+        tag_set = self.devices.get(device_id)
+        return None if tag_set is None else tag_set.keys.get(key)
+
+    def __contains__(self, device_id: str) -> bool:
+        return device_id in self.devices
+
+    def __len__(self) -> int:
+        return len(self.devices)
+
+    def clear(self):
+        self.sets = {}
+        self.contents = {}
+        self.identities = {}
+        self.signatures = {}
+        self.devices = {}
+        self.__last = None
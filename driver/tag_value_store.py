@@ -0,0 +1,257 @@
+"""
+数据点最新有效值存储. 用于替换 SDK 中的 TagValueCache.
+
+SDK 的 TagValueCache 每次写入都需要获取全局锁及设备锁, 拼接设备 key 字符串, 并为每个数据点创建一个 TagValue 对象.
+数据处理器链只在驱动的事件循环中调用, 不存在并发写入, 因此 TagValueStore 不使用锁:
+
+- 设备 key 为 (工作表标识, 设备编号), 字符串使用 sys.intern 驻留
+- 同一工作表的设备共享数据点标识到槽位的映射, 每个设备只保存值列表及时间戳数组
+- 设备按 key 的哈希值分片存储, 避免设备数量很大时单个 dict 扩容造成的停顿, 也便于分片导出
+"""
+import sys
+import time
+from array import array
+from typing import Iterable, Iterator, Optional
+
+import airiot_python_sdk.driver.handler as handler_module
+import airiot_python_sdk.driver.handler.invalid_range_value_handler as invalid_range_module
+import airiot_python_sdk.driver.handler.valid_range_value_handler as valid_range_module
+
+# 有效值记录: (工作表标识, 设备编号, 数据点标识, 有效值, 时间戳)
+TagValueRecord = tuple[str, str, str, any, int]
+
+
+class TagLayout:
+    """
+    工作表的数据点槽位. 同一工作表的所有设备共享
+
+    Attributes:
+        slots: 数据点标识到槽位的映射
+        tag_ids: 槽位对应的数据点标识
+    """
+
+    __slots__ = ("slots", "tag_ids")
+
+    def __init__(self):
+        self.slots = {}
+        self.tag_ids = []
+
+    def slot(self, tag_id: str) -> int:
+        """
+        获取数据点的槽位, 不存在时分配新的槽位
+        """
+        slot = self.slots.get(tag_id)
+        if slot is None:
+            slot = len(self.tag_ids)
+            tag_id = sys.intern(tag_id)
+            self.slots[tag_id] = slot
+            self.tag_ids.append(tag_id)
+        return slot
+
+
+class DeviceValues:
+    """
+    设备的数据点有效值
+
+    Attributes:
+        table_id: 工作表标识
+        device_id: 设备编号
+        layout: 工作表的数据点槽位
+        values: 数据点有效值, 下标为槽位. 未设置的值为 None
+        timestamps: 有效值的时间戳(毫秒), 下标为槽位
+    """
+
+    __slots__ = ("table_id", "device_id", "layout", "values", "timestamps")
+
+    def __init__(self, table_id: str, device_id: str, layout: TagLayout):
+        self.table_id = table_id
+        self.device_id = device_id
+        self.layout = layout
+        self.values = []
+        self.timestamps = array("q")
+
+    def set(self, tag_id: str, value: any, timestamp: int):
+        slot = self.layout.slot(tag_id)
+        if slot >= len(self.values):
+            grow = slot + 1 - len(self.values)
+            self.values.extend([None] * grow)
+            self.timestamps.extend([0] * grow)
+
+        self.values[slot] = value
+        self.timestamps[slot] = timestamp
+
+    def get(self, tag_id: str) -> Optional[any]:
+        slot = self.layout.slots.get(tag_id)
+        if slot is None or slot >= len(self.values):
+            return None
+        return self.values[slot]
+
+    def items(self) -> Iterator[tuple[str, any, int]]:
+        """
+        遍历已设置的有效值
+        :return: (数据点标识, 有效值, 时间戳)
+        """
+        tag_ids = self.layout.tag_ids
+        for slot, value in enumerate(self.values):
+            if value is not None:
+                yield tag_ids[slot], value, self.timestamps[slot]
+
+
+class TagValueStore:
+    """
+    数据点最新有效值存储. 只能在驱动的事件循环线程中使用.
+
+    提供与 TagValueCache 相同的异步方法 set_value 及 get_value, 可以直接替换 SDK 中的 tag_value_cache.
+    同时提供同步方法 put 及 lookup, 以及批量导出 export/snapshot 和导入 load 方法.
+
+    Attributes:
+        shards: 设备分片. key 为 (工作表标识, 设备编号)
+        layouts: 工作表的数据点槽位. key 为工作表标识
+    """
+
+    shards: tuple[dict[tuple[str, str], DeviceValues], ...]
+    layouts: dict[str, TagLayout]
+
+    def __init__(self, shards: int = 16):
+        if shards <= 0:
+            raise ValueError("shards must be greater than 0")
+
+        self.shards = tuple({} for _ in range(shards))
+        self.layouts = {}
+
+    def __len__(self) -> int:
+        return sum(1 for shard in self.shards for device in shard.values() for _ in device.items())
+
+    def __device__(self, table_id: str, device_id: str, create: bool) -> Optional[DeviceValues]:
+        key = (table_id, device_id)
+        shard = self.shards[hash(key) % len(self.shards)]
+        device = shard.get(key)
+        if device is None and create:
+            layout = self.layouts.get(table_id)
+            if layout is None:
+                layout = self.layouts[sys.intern(table_id)] = TagLayout()
+
+            table_id = sys.intern(table_id)
+            device_id = sys.intern(device_id)
+            device = shard[(table_id, device_id)] = DeviceValues(table_id, device_id, layout)
+        return device
+
+    def put(self, table_id: str, device_id: str, tag_id: str, value: any, timestamp: Optional[int] = None):
+        """
+        设置数据点有效值
+        :param table_id: 工作表标识
+        :param device_id: 设备编号
+        :param tag_id: 数据点标识
+        :param value: 数据点有效值. 为 None 时清除该数据点的有效值
+        :param timestamp: 时间戳(毫秒). 为 None 时使用当前时间
+        """
+        if timestamp is None:
+            timestamp = int(time.time() * 1000)
+        self.__device__(table_id, device_id, True).set(tag_id, value, timestamp)
+
+    def lookup(self, table_id: str, device_id: str, tag_id: str) -> Optional[any]:
+        """
+        获取数据点有效值
+        :param table_id: 工作表标识
+        :param device_id: 设备编号
+        :param tag_id: 数据点标识
+        :return: 数据点有效值. 不存在时返回 None
+        """
+        device = self.__device__(table_id, device_id, False)
+        if device is None:
+            return None
+        return device.get(tag_id)
+
+    async def set_value(self, table_id: str, device_id: str, tag_id: str, value: any):
+        """
+        设置数据点有效值. 与 TagValueCache.set_value 相同
+        """
+        self.put(table_id, device_id, tag_id, value)
+
+    async def get_value(self, table_id: str, device_id: str, tag_id: str) -> Optional[any]:
+        """
+        获取数据点有效值. 与 TagValueCache.get_value 相同
+        """
+        return self.lookup(table_id, device_id, tag_id)
+
+    # InvalidRangeValueDataHandler 使用 get 方法获取有效值
+    get = get_value
+
+    def device_values(self, table_id: str, device_id: str) -> dict[str, any]:
+        """
+        获取设备所有数据点的有效值
+        :return: key 为数据点标识, value 为有效值
+        """
+        device = self.__device__(table_id, device_id, False)
+        if device is None:
+            return {}
+        return {tag_id: value for tag_id, value, _ in device.items()}
+
+    def export(self) -> Iterator[TagValueRecord]:
+        """
+        按分片顺序导出所有有效值
+        :return: (工作表标识, 设备编号, 数据点标识, 有效值, 时间戳)
+        """
+        for shard in self.shards:
+            for device in list(shard.values()):
+                for tag_id, value, timestamp in device.items():
+                    yield device.table_id, device.device_id, tag_id, value, timestamp
+
+    def snapshot(self) -> dict[tuple[str, str], dict[str, tuple[any, int]]]:
+        """
+        获取所有有效值的快照
+        :return: key 为 (工作表标识, 设备编号), value 为数据点标识到 (有效值, 时间戳) 的映射
+        """
+        result = {}
+        for shard in self.shards:
+            for key, device in shard.items():
+                values = {tag_id: (value, timestamp) for tag_id, value, timestamp in device.items()}
+                if len(values) > 0:
+                    result[key] = values
+        return result
+
+    def load(self, records: Iterable[TagValueRecord]) -> int:
+        """
+        批量导入有效值. 例如驱动重启时恢复 export 导出的数据
+        :param records: (工作表标识, 设备编号, 数据点标识, 有效值, 时间戳)
+        :return: 导入的数量
+        """
+        count = 0
+        for table_id, device_id, tag_id, value, timestamp in records:
+            self.put(table_id, device_id, tag_id, value, timestamp)
+            count += 1
+        return count
+
+    def remove_tables(self, table_ids: Iterable[str]) -> int:
+        """
+        删除工作表的所有有效值及数据点槽位. 用于工作表被删除或配置变化时
+        :param table_ids: 工作表标识
+        :return: 删除的设备数量
+        """
+        table_ids = set(table_ids)
+        count = 0
+        for shard in self.shards:
+            for key in [key for key in shard if key[0] in table_ids]:
+                del shard[key]
+                count += 1
+        for table_id in table_ids:
+            self.layouts.pop(table_id, None)
+        return count
+
+    def clear(self):
+        for shard in self.shards:
+            shard.clear()
+        self.layouts = {}
+
+
+def install_tag_value_store(store: TagValueStore) -> any:
+    """
+    使用 TagValueStore 替换 SDK 数据处理器使用的 tag_value_cache
+    :param store: 有效值存储
+    :return: 替换前的 tag_value_cache
+    """
+    previous = handler_module.tag_value_cache
+    handler_module.tag_value_cache = store
+    valid_range_module.tag_value_cache = store
+    invalid_range_module.tag_value_cache = store
+    return previous
@@ -0,0 +1,163 @@
+import random
+import unittest
+
+from airiot_python_sdk.driver.handler import DataHandler, DataHandlerChain
+from airiot_python_sdk.driver.handler.boolean_to_integer_handler import BooleanToIntegerDataHandler
+from airiot_python_sdk.driver.handler.bytes_to_hex_handler import ByteToHexDataHandler
+from airiot_python_sdk.driver.handler.convert_value_handler import ConvertValueDataHandler
+from airiot_python_sdk.driver.handler.invalid_range_value_handler import InvalidRangeValueDataHandler
+from airiot_python_sdk.driver.handler.round_and_scale_handler import RoundAndScaleDataHandler
+from airiot_python_sdk.driver.handler.valid_range_value_handler import ValidRangeValueDataHandler
+from airiot_python_sdk.driver.model.tag import Tag, TagValue, Range, RangeCondition
+
+from batch_handlers import is_numeric_sequence
+from handler_chain import CompiledDataHandlerChain
+from model import ModelConfig, Device, DriverConfig
+from tag_value_store import TagValueStore, install_tag_value_store
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+def create_handlers() -> list[DataHandler]:
+    return [
+        RoundAndScaleDataHandler(),
+        ConvertValueDataHandler(),
+        ValidRangeValueDataHandler(),
+        InvalidRangeValueDataHandler(),
+        BooleanToIntegerDataHandler(),
+        ByteToHexDataHandler(),
+    ]
+
+
+def valid_range(active: str, action: str = None, fixed_value: any = None) -> Range:
+    conditions = [
+        RangeCondition("number", "range", -20, 20.5, None, True, None),
+        RangeCondition("number", "greater", None, 90, None, False, None),
+    ]
+    return Range("valid", conditions, None, None, fixed_value, active, action)
+
+
+def invalid_range(active: str, action: str = None, fixed_value: any = None) -> Range:
+    conditions = [
+        RangeCondition("number", "less", -1000, None, None, False, "low"),
+        RangeCondition("number", "range", 10, 20, None, False, None),
+        RangeCondition("number", "greater", None, 15, None, False, "high"),
+    ]
+    return Range("invalid", conditions, None, None, fixed_value, active, action)
+
+
+tags = [
+    Tag("scaled", "scaled", TagValue(None, None, None, None), None, 2, 0.1),
+    Tag("mod", "mod", TagValue(None, None, None, None), None, None, 0.001),
+    Tag("fixed0", "fixed0", TagValue(None, None, None, None), None, 0, None),
+    Tag("fixed3", "fixed3", TagValue(None, None, None, None), None, 3, 3),
+    Tag("converted", "converted", TagValue(-50, 50, -5000, 5000), None, None, None),
+    Tag("converted2", "converted2", TagValue(0.3, 1.7, 4, 20), None, 3, None),
+    Tag("converted3", "converted3", TagValue(0.0, 1.7, 4, 20), None, None, None),
+    Tag("flat", "flat", TagValue(0, 1, 5, 5), None, None, None),
+    Tag("boundary", "boundary", TagValue(None, None, None, None), valid_range("boundary", "save"), 1, 0.5),
+    Tag("fixedValue", "fixedValue", TagValue(None, None, None, None), valid_range("fixedValue", None, 0),
+        None, None),
+    Tag("discard", "discard", TagValue(-50, 50, -5000, 5000), valid_range("discard", "save"), None, None),
+    Tag("invalidFixed", "invalidFixed", TagValue(None, None, None, None), invalid_range("fixedValue", "save", -1.5),
+        2, None),
+    Tag("invalidDiscard", "invalidDiscard", TagValue(None, None, None, None), invalid_range("discard"), None, None),
+]
+
+
+def random_values(count: int) -> list:
+    rng = random.Random(20240601)
+    values = [0, 0.0, -0.0, 1.005, 2.675, -2.5, 0.5, 1e-300, 1e300, float("nan"), float("inf"), -float("inf"),
+              2 ** 53, -7, 5000, -5000, 20.5, 90, 1e15, 123456789.125]
+    while len(values) < count:
+        kind = rng.randrange(4)
+        if kind == 0:
+            values.append(rng.randint(-10000, 10000))
+        elif kind == 1:
+            values.append(rng.uniform(-100, 100))
+        elif kind == 2:
+            # 小数点后位数较少的值, 容易出现在四舍五入的边界
+            values.append(rng.randint(-100000, 100000) / 1000)
+        else:
+            values.append(rng.uniform(-1, 1) * 10 ** rng.randint(-8, 8))
+    return values
+
+
+@unittest.skipIf(np is None, "numpy 未安装")
+class TestBatchDataHandler(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.previous = install_tag_value_store(TagValueStore())
+        self.chain = DataHandlerChain(create_handlers())
+        self.compiled = CompiledDataHandlerChain(create_handlers())
+        self.compiled.compile([ModelConfig("t1", DriverConfig(None, tags),
+                                           [Device("SN1", DriverConfig(None, tags))])])
+
+    def tearDown(self):
+        install_tag_value_store(self.previous)
+
+    async def test_same_result_as_scalar(self):
+        values = random_values(2000)
+
+        for tag in tags:
+            self.assertIsNotNone(self.compiled.pipelines[("t1", tag.id, id(tag))].batch, tag.id)
+
+            expected = {}
+            for index, value in enumerate(values):
+                try:
+                    result = await self.chain.__handle__("t1", "SN1", tag, value)
+                except ArithmeticError:
+                    continue
+                for key, item in result.items():
+                    expected.setdefault(key, [None] * len(values))[index] = item
+
+            try:
+                actual = await self.compiled.__handle__("t1", "SN1", tag, values)
+            except ArithmeticError:
+                # 超出 Decimal 精度时与逐个处理相同抛出异常, 去掉这些值后再比较
+                actual = None
+
+            if actual is None:
+                kept = []
+                for index, value in enumerate(values):
+                    try:
+                        await self.chain.__handle__("t1", "SN1", tag, value)
+                        kept.append(index)
+                    except ArithmeticError:
+                        pass
+                actual = await self.compiled.__handle__("t1", "SN1", tag, [values[i] for i in kept])
+                expected = {key: [items[i] for i in kept] for key, items in expected.items()}
+
+            self.assertEqual(sorted(expected.keys()), sorted(actual.keys()), tag.id)
+            for key, items in expected.items():
+                for index, item in enumerate(items):
+                    self.assertEqual(repr(item), repr(actual[key][index]),
+                                     "tag = {}, key = {}, index = {}".format(tag.id, key, index))
+
+    async def test_numpy_array(self):
+        tag = tags[0]
+        values = np.array([12.345, -0.004, 99.995])
+        actual = await self.compiled.__handle__("t1", "SN1", tag, values)
+        self.assertEqual({"scaled": [1.23, -0.0, 10.0]}, actual)
+
+        actual = await self.compiled.__handle__("t1", "SN1", tag, np.arange(5, dtype=np.int32))
+        self.assertEqual({"scaled": [0.0, 0.1, 0.2, 0.3, 0.4]}, actual)
+
+    async def test_not_numeric_sequence(self):
+        self.assertTrue(is_numeric_sequence([1, 2.5, -3]))
+        self.assertFalse(is_numeric_sequence([]))
+        self.assertFalse(is_numeric_sequence([1, True]))
+        self.assertFalse(is_numeric_sequence([1, None]))
+        self.assertFalse(is_numeric_sequence([2 ** 60]))
+        self.assertFalse(is_numeric_sequence("abc"))
+
+        # 非数值数组与原流程相同, 直接返回原始值
+        actual = await self.compiled.__handle__("t1", "SN1", tags[0], [1, "a"])
+        self.assertEqual({"scaled": [1, "a"]}, actual)
+
+
+if __name__ == '__main__':
+    unittest.main()
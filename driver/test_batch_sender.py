@@ -0,0 +1,124 @@
+import asyncio
+import json
+import tempfile
+import unittest
+
+from airiot_python_sdk.driver.config import MqttConfig
+from airiot_python_sdk.driver.handler import DataHandlerChain
+from airiot_python_sdk.driver.model.point import Point, Field
+from airiot_python_sdk.driver.model.tag import Tag
+from airiot_python_sdk.driver.service.mqtt_data_sender import MQTTDataSender
+
+from batch_sender import BatchDataSender
+from fakes import FakePublishClient
+from spool import SegmentSpool
+
+
+def create_point(device_id: str, tag_id: str, value: any, time: int) -> Point:
+    point = Point()
+    point.table = "t1"
+    point.id = device_id
+    point.time = time
+    point.fields = [Field(Tag(tag_id, tag_id, None, None, None, None), value)]
+    return point
+
+
+class TestBatchDataSender(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.sender = MQTTDataSender("p1", "d1", "driver", "s1", MqttConfig(), DataHandlerChain([]))
+        self.sender.client = FakePublishClient()
+
+    async def test_write_points_without_window(self):
+        batch = BatchDataSender(self.sender)
+        await batch.write_points([create_point("SN1", "a", 1, 1000), create_point("SN2", "a", 2, 1000)])
+
+        topics = [topic for topic, _ in self.sender.client.messages]
+        self.assertEqual(["data/p1/t1/SN1", "data/p1/t1/SN2"], topics)
+        self.assertEqual(2, batch.sent)
+
+    async def test_coalesce_in_window(self):
+        batch = BatchDataSender(self.sender, window=60000, max_points=10)
+        batch.start()
+
+        await batch.write_points([create_point("SN1", "a", 1, 1000), create_point("SN2", "a", 2, 1000)])
+        await batch.write_points([create_point("SN1", "b", 3, 2000), create_point("SN1", "a", 4, 3000)])
+        self.assertEqual(0, len(self.sender.client.messages))
+
+        await batch.stop()
+
+        self.assertEqual(2, batch.sent)
+        self.assertEqual(2, batch.coalesced)
+        point = batch.sender.client.messages[0][1]
+        self.assertIn('"fields": {"a": 4, "b": 3}', point)
+        self.assertIn('"time": 3000', point)
+
+    async def test_flush_when_full(self):
+        batch = BatchDataSender(self.sender, window=60000, max_points=2)
+        await batch.write_points([create_point("SN1", "a", 1, 1000)])
+        self.assertEqual(0, len(self.sender.client.messages))
+
+        await batch.write_points([create_point("SN2", "a", 1, 1000)])
+        self.assertEqual(2, len(self.sender.client.messages))
+
+    async def test_flush_by_timer(self):
+        batch = BatchDataSender(self.sender, window=20, max_points=100)
+        batch.start()
+        await batch.write_points([create_point("SN1", "a", 1, 1000)])
+        await asyncio.sleep(0.1)
+        self.assertEqual(1, len(self.sender.client.messages))
+        await batch.stop()
+
+
+    async def test_disconnected_without_spool(self):
+        self.sender.client.connected = False
+        batch = BatchDataSender(self.sender)
+        with self.assertRaises(Exception):
+            await batch.write_points([create_point("SN1", "a", 1, 1000)])
+
+    async def test_spool_and_replay(self):
+        with tempfile.TemporaryDirectory() as path:
+            client = self.sender.client
+            batch = BatchDataSender(self.sender, spool=SegmentSpool(path, max_bytes=4096, segment_bytes=1024))
+
+            await batch.write_points([create_point("SN1", "a", 1, 1000)])
+            client.connected = False
+            await batch.write_points([create_point("SN1", "a", 2, 2000), create_point("SN2", "a", 3, 2000)])
+            self.assertEqual(2, batch.spool.pending)
+
+            # 缓冲中还有数据时, 新的数据同样写入缓冲
+            client.connected = True
+            await batch.write_points([create_point("SN1", "a", 4, 3000)])
+            self.assertEqual(1, len(client.messages))
+            self.assertEqual(3, batch.spool.pending)
+
+            self.assertEqual(2, batch.replay(2))
+            self.assertEqual(1, batch.replay(10))
+            self.assertEqual(0, batch.replay(10))
+            self.assertEqual(4, batch.sent)
+            self.assertEqual(3, batch.replayed)
+
+            values = [(topic, json.loads(payload)["fields"]["a"]) for topic, payload in client.messages]
+            self.assertEqual([("data/p1/t1/SN1", 1), ("data/p1/t1/SN1", 2), ("data/p1/t1/SN2", 3),
+                              ("data/p1/t1/SN1", 4)], values)
+            await batch.stop()
+
+    async def test_replay_rate(self):
+        with tempfile.TemporaryDirectory() as path:
+            client = self.sender.client
+            client.connected = False
+            batch = BatchDataSender(self.sender, spool=SegmentSpool(path, max_bytes=65536, segment_bytes=1024),
+                                    replay_rate=50)
+            batch.start()
+            await batch.write_points([create_point("SN{}".format(i), "a", i, 1000) for i in range(20)])
+
+            client.connected = True
+            await asyncio.sleep(0.25)
+            # 每 0.1 秒最多发送 5 条
+            self.assertLessEqual(len(client.messages), 10)
+            self.assertGreater(len(client.messages), 0)
+            await batch.stop()
+
+
+if __name__ == '__main__':
+    unittest.main()
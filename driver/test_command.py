@@ -0,0 +1,137 @@
+import asyncio
+import json
+import threading
+import unittest
+from types import SimpleNamespace
+
+from paho.mqtt import client as mqtt_client
+
+from command import PublishTracker, render_messages
+from fakes import FakeDataSender, FakeMqttClient, FakeMqttDriverApp, create_config, create_table
+from mqtt_driver import COMMAND_CHUNK_SIZE
+from script_engine import ScriptEngine
+
+command_script = """
+function handler(tableId, deviceId, command) {
+    if (deviceId === "bad") {
+        return {"payload": "x"};
+    }
+    return {"topic": "cmd/" + deviceId, "payload": {"table": tableId, "command": command}};
+}
+"""
+
+
+class AckingClient(FakeMqttClient):
+    """
+    在另一个线程中确认消息, 主题 cmd/lost 的消息不确认
+    """
+
+    def publish(self, topic, payload=None, qos=0):
+        info = super().publish(topic, payload, qos)
+        if topic != "cmd/lost":
+            threading.Thread(target=self.on_publish, args=(self, None, info.mid)).start()
+        return info
+
+
+class ReusingClient:
+    """
+    按指定的消息 ID 发布消息, 模拟 paho 重复使用消息 ID. acks 中的消息 ID 在 publish 返回前确认
+    """
+
+    def __init__(self, tracker: PublishTracker):
+        self.tracker = tracker
+        self.mids = []
+        self.acks = []
+
+    def publish(self, topic, payload=None, qos=0):
+        for mid in self.acks:
+            self.tracker.on_publish(self, None, mid)
+        self.acks = []
+        return SimpleNamespace(rc=mqtt_client.MQTT_ERR_SUCCESS, mid=self.mids.pop(0))
+
+
+class TestPublishTracker(unittest.IsolatedAsyncioTestCase):
+
+    async def test_late_ack(self):
+        tracker = PublishTracker(asyncio.get_running_loop())
+        client = ReusingClient(tracker)
+
+        # 消息 1 超时后收到确认, 不记录
+        client.mids = [1, 1, 2, 3]
+        timed_out = tracker.publish(client, "a", b"1", 1)
+        tracker.discard([timed_out])
+        tracker.on_publish(client, None, 1)
+        self.assertEqual(set(), tracker.acked)
+
+        # 重复使用消息 ID 1 的消息需要等待自己的确认
+        reused = tracker.publish(client, "a", b"2", 1)
+        self.assertFalse(reused.done())
+        tracker.on_publish(client, None, 1)
+        await asyncio.sleep(0)
+        self.assertTrue(reused.done())
+
+        # publish 返回前收到的确认
+        client.acks = [2]
+        self.assertTrue(tracker.publish(client, "a", b"3", 1).done())
+
+        # publish 期间收到的其它消息的确认不保留
+        client.acks = [7]
+        self.assertFalse(tracker.publish(client, "a", b"4", 1).done())
+        self.assertEqual(set(), tracker.acked)
+        self.assertEqual(1, tracker.inflight)
+
+
+class TestCommand(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.app = FakeMqttDriverApp("s1", FakeDataSender())
+        self.app.clients = []
+        table = create_table("t1", "a/#")
+        table["device"]["settings"]["commandScript"] = command_script
+        config = json.loads(create_config([table, create_table("t2", "b/#")]))
+        config["device"]["settings"]["command"] = {"timeout": 200}
+        await self.app.start(json.dumps(config))
+
+        client = AckingClient()
+        client.on_publish = self.app.publish_tracker.on_publish
+        self.app.client = client
+
+    async def asyncTearDown(self):
+        await self.app.stop()
+
+    def test_render_messages(self):
+        script = ScriptEngine(cache_dir=None).compile(
+            "def handler(table_id, device_id, command):\n"
+            "    return [{'topic': 'a', 'payload': b'1'}, {'topic': 'b', 'payload': [1], 'qos': 0}]\n", "python")
+        self.assertEqual([("a", b"1", 1), ("b", "[1]", 0)], render_messages(script, "t1", "SN1", None, 1))
+
+    async def test_run(self):
+        result = await self.app.run("1", "t1", "SN1", '{"on": true}')
+        self.assertEqual({"id": "SN1", "status": "success"}, result)
+
+        topic, payload, qos = self.app.client.published[0]
+        self.assertEqual("cmd/SN1", topic)
+        self.assertEqual({"table": "t1", "command": {"on": True}}, json.loads(payload))
+        self.assertEqual(1, qos)
+
+        result = await self.app.write_tag("2", "t1", "SN1", '{"id": "temp", "value": 1}')
+        self.assertEqual("success", result["status"])
+
+        with self.assertRaises(Exception):
+            await self.app.run("3", "t2", "SN1", "{}")
+        with self.assertRaises(Exception):
+            await self.app.run("4", "t9", "SN1", "{}")
+
+    async def test_batch_run(self):
+        device_ids = ["SN{}".format(i) for i in range(COMMAND_CHUNK_SIZE + 10)] + ["lost", "bad"]
+        results = await self.app.batch_run("1", "t1", device_ids, "reboot")
+
+        self.assertEqual(device_ids, [result["id"] for result in results])
+        self.assertTrue(all(result["status"] == "success" for result in results[:-2]))
+        self.assertEqual("timeout", results[-2]["status"])
+        self.assertEqual("error", results[-1]["status"])
+        self.assertEqual(0, self.app.publish_tracker.inflight)
+
+
+if __name__ == '__main__':
+    unittest.main()
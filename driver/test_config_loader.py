@@ -0,0 +1,98 @@
+import json
+import unittest
+
+import jsons
+
+from config_loader import load_driver_config, load_table
+from model import MQTTDriverConfig
+
+config = {
+    "id": "d1",
+    "name": "mqtt",
+    "driverType": "mqtt",
+    "device": {
+        "settings": {"server": "tcp://127.0.0.1:1883", "username": "u", "password": "p",
+                     "ingest": {"queueSize": 10, "workers": 2, "overflow": "drop-oldest"},
+                     "batch": {"window": 100, "maxPoints": 10}},
+    },
+    "tables": [
+        {
+            "id": "t1",
+            "device": {
+                "settings": {"topic": "data/+", "deviceIdLevel": 1, "parseScript": "function handler() {}",
+                             "scriptType": "javascript", "extract": {"deviceIdPath": "id", "fieldsPath": "values"},
+                             "codec": {"type": "struct", "byteOrder": "big", "recordSize": 8}},
+                "tags": [
+                    {"id": "temp", "name": "温度", "key": "temp", "fixed": 2, "mod": 10,
+                     "tagValue": {"minValue": 0, "maxValue": 10, "minRaw": 0, "maxRaw": 100},
+                     "range": {"method": "valid", "active": "boundary", "invalidAction": "save",
+                               "conditions": [{"mode": "number", "condition": "range", "minValue": 0,
+                                               "maxValue": 100, "defaultCondition": True}]}},
+                    {"id": "count", "name": "count", "key": "count", "offset": 4, "dataType": "uint16",
+                     "deadband": {"type": "percent", "value": 5, "heartbeat": 60}},
+                ],
+            },
+            "devices": [
+                {"id": "SN1", "device": {"settings": {}, "tags": []}},
+                {"id": "SN2", "device": {"settings": {"customDeviceId": "2"},
+                                         "tags": [{"id": "temp", "name": "temp", "key": "t"}]}},
+                {"id": "SN3", "device": {"tags": []}},
+            ],
+        },
+    ],
+}
+
+
+class TestConfigLoader(unittest.TestCase):
+
+    def test_same_as_jsons(self):
+        # 未自定义配置的设备不创建设备配置, 与工作表合并后与 jsons 的结果相同
+        expected = jsons.loads(json.dumps(config), MQTTDriverConfig)
+        for table in expected.tables:
+            table.merge_devices()
+        for actual in (load_driver_config(json.dumps(config)), load_driver_config(config)):
+            for table in actual.tables:
+                table.merge_devices()
+            self.assertEqual(expected, actual)
+
+        table = load_table(config["tables"][0])
+        table.merge_devices()
+        self.assertEqual(expected.tables[0], table)
+
+    def test_keep_mod(self):
+        tag = load_table({"id": "t1", "device": {"tags": [{"id": "a", "key": "a", "mod": 0.1}]}}).device.tags[0]
+        self.assertEqual(0.1, tag.mod)
+
+    def test_merge_devices(self):
+        table = load_driver_config(config).tables[0]
+        table.merge_devices()
+
+        sn1, sn2, sn3 = table.devices
+
+        # 未自定义配置的设备共享工作表的配置
+        self.assertIs(table.device.settings, sn3.device.settings)
+        self.assertIs(table.device.settings, sn1.device.settings)
+        self.assertIs(table.device.tags, sn1.device.tags)
+
+        self.assertIsNot(table.device.settings, sn2.device.settings)
+        self.assertEqual("2", sn2.device.settings.customDeviceId)
+        self.assertEqual("data/+", sn2.device.settings.topic)
+        self.assertEqual(["t", "count"], [tag.key for tag in sn2.device.tags])
+        self.assertIsNone(table.device.settings.customDeviceId)
+
+        # 设备配置为空时不创建设备配置及数据点列表
+        table = load_table(config["tables"][0])
+        self.assertIsNone(table.devices[0].device)
+        table = load_table({"id": "t2", "device": {"settings": {"topic": "a"}, "tags": []},
+                            "devices": [{"id": "SN4", "device": {"settings": {"customDeviceId": "4"}, "tags": []}}]})
+        self.assertIsNone(table.device.tags)
+        self.assertIsNone(table.devices[0].device.tags)
+
+        # 未配置设备配置时直接使用工作表的配置
+        table = load_table({"id": "t2", "device": {"settings": {"topic": "a"}}, "devices": [{"id": "SN4"}]})
+        table.merge_devices()
+        self.assertIs(table.device, table.devices[0].device)
+
+
+if __name__ == '__main__':
+    unittest.main()
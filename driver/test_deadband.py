@@ -0,0 +1,125 @@
+import math
+import unittest
+
+from airiot_python_sdk.driver.handler import DataHandlerChain
+from airiot_python_sdk.driver.handler.round_and_scale_handler import RoundAndScaleDataHandler
+from airiot_python_sdk.driver.model.point import Point, Field
+from airiot_python_sdk.driver.model.tag import TagValue
+
+from deadband import DeadbandDataHandler
+from handler_chain import CompiledDataHandlerChain
+from model import Deadband, Device, DriverConfig, ModelConfig, MQTTTag
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def create_tag(tag_id: str, deadband: Deadband = None, fixed: int = None) -> MQTTTag:
+    return MQTTTag(tag_id, tag_id, TagValue(None, None, None, None) if fixed is not None else None, None, fixed,
+                   None, tag_id, None, None, deadband)
+
+
+class TestDeadband(unittest.TestCase):
+
+    def test_absolute(self):
+        handler = DeadbandDataHandler(FakeClock())
+        tag = create_tag("temp", Deadband("absolute", 0.5, None))
+
+        results = [handler.filter("t1", "SN1", tag, value) for value in (20.0, 20.3, 20.5, 20.6, 20.1, 20.0)]
+        self.assertEqual([True, False, False, True, False, True], results)
+        self.assertEqual(handler.stats(), {"forwarded": 3, "suppressed": 3, "tracked": 1})
+
+        # 各设备分别记录上次发送值
+        self.assertTrue(handler.filter("t1", "SN2", tag, 20.3))
+
+    def test_percent(self):
+        handler = DeadbandDataHandler(FakeClock())
+        tag = create_tag("flow", Deadband("percent", 10, None))
+
+        results = [handler.filter("t1", "SN1", tag, value) for value in (100, 109, 111, 121, 0, 0, 1)]
+        self.assertEqual([True, False, True, False, True, False, True], results)
+
+    def test_report_by_exception(self):
+        handler = DeadbandDataHandler(FakeClock())
+        tag = create_tag("status", Deadband(None, None, None))
+
+        values = (True, True, False, 1, 1, "on", "on", "off", math.nan, math.nan, 2.0, math.inf, math.inf)
+        results = [handler.filter("t1", "SN1", tag, value) for value in values]
+        self.assertEqual([True, False, True, True, False, True, False, True, True, False, True, True, False], results)
+
+    def test_heartbeat(self):
+        clock = FakeClock()
+        handler = DeadbandDataHandler(clock)
+        tag = create_tag("setpoint", Deadband("absolute", 1, 60))
+
+        self.assertTrue(handler.filter("t1", "SN1", tag, 50))
+        clock.now = 59
+        self.assertFalse(handler.filter("t1", "SN1", tag, 50))
+        clock.now = 60
+        self.assertTrue(handler.filter("t1", "SN1", tag, 50))
+        clock.now = 100
+        self.assertFalse(handler.filter("t1", "SN1", tag, 50.5))
+
+    def test_clear(self):
+        handler = DeadbandDataHandler(FakeClock())
+        tag = create_tag("temp", Deadband(None, None, None))
+        handler.filter("t1", "SN1", tag, 1)
+        handler.filter("t2", "SN1", tag, 1)
+
+        handler.clear(["t1"])
+        self.assertEqual(list(handler.last), [("t2", "SN1", "temp")])
+        handler.clear()
+        self.assertEqual(len(handler.last), 0)
+
+
+class TestDeadbandChain(unittest.IsolatedAsyncioTestCase):
+
+    async def test_compiled_chain(self):
+        tags = [create_tag("temp", Deadband("absolute", 0.5, None), 1), create_tag("plain")]
+        handler = DeadbandDataHandler(FakeClock())
+        chain = CompiledDataHandlerChain([RoundAndScaleDataHandler(), handler])
+        chain.compile([ModelConfig("t1", DriverConfig(None, tags), [Device("SN1", DriverConfig(None, tags))])])
+
+        self.assertTrue(chain.pipelines[("t1", "temp", id(tags[0]))].deadband)
+        self.assertFalse(chain.pipelines[("t1", "plain", id(tags[1]))].deadband)
+        # 死区过滤不作为编译后的处理步骤
+        self.assertTrue(chain.pipelines[("t1", "plain", id(tags[1]))].passthrough(float))
+
+        def point(temp: float, plain: int) -> Point:
+            result = Point()
+            result.table = "t1"
+            result.id = "SN1"
+            result.time = 1000
+            result.fields = [Field(tags[0], temp), Field(tags[1], plain)]
+            return result
+
+        self.assertEqual((await chain.handle(point(20.04, 1))).fields, {"temp": 20.0, "plain": 1})
+        # 比较保留小数位数后的值
+        self.assertEqual((await chain.handle(point(20.46, 2))).fields, {"plain": 2})
+        self.assertEqual((await chain.handle(point(20.56, 3))).fields, {"temp": 20.6, "plain": 3})
+
+        tags[1].deadband = Deadband(None, None, None)
+        chain.invalidate()
+        chain.compile([ModelConfig("t1", DriverConfig(None, tags), [Device("SN1", DriverConfig(None, tags))])])
+        self.assertIsNotNone(await chain.handle(point(20.56, 3)))
+        with self.assertNoLogs("compiled_data_handler_chain"):
+            self.assertIsNone(await chain.handle(point(20.56, 3)))
+        self.assertEqual(handler.suppressed, 3)
+
+    async def test_default_chain(self):
+        tag = create_tag("temp", Deadband("absolute", 1, None))
+        chain = DataHandlerChain([DeadbandDataHandler(FakeClock())])
+
+        self.assertEqual(await chain.__handle__("t1", "SN1", tag, 10), {"temp": 10})
+        self.assertEqual(await chain.__handle__("t1", "SN1", tag, 10.5), {})
+        self.assertEqual(await chain.__handle__("t1", "SN1", tag, [1, 2]), {"temp": [1, 2]})
+
+
+if __name__ == '__main__':
+    unittest.main()
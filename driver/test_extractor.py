@@ -0,0 +1,87 @@
+import json
+import unittest
+
+import jsons
+
+from extractor import FieldExtractor, compile_path, resolve, missing
+from fakes import FakeDataSender
+from model import ModelConfig, ExtractSettings
+from mqtt_driver import MqttSubscription
+from script_engine import ScriptEngine
+
+
+def create_table(extract: dict, parse_script: str = None) -> ModelConfig:
+    return jsons.load({
+        "id": "t1",
+        "device": {
+            "settings": {"topic": "data/+", "deviceIdLevel": 1, "extract": extract, "parseScript": parse_script},
+            "tags": [
+                {"id": "temp", "name": "temp", "key": "temp"},
+                {"id": "hum", "name": "hum", "key": "env.hum"},
+                {"id": "first", "name": "first", "key": "list.0"},
+            ],
+        },
+        "devices": [
+            {"id": "SN1", "device": {"settings": {"customDeviceId": "dev-1"}, "tags": []}},
+            {"id": "SN2", "device": {"settings": {}, "tags": []}},
+        ],
+    }, ModelConfig)
+
+
+class TestFieldExtractor(unittest.IsolatedAsyncioTestCase):
+
+    def test_path(self):
+        self.assertIsNone(compile_path(" "))
+        self.assertEqual(("a", 0, "b"), compile_path("a.0.b"))
+        self.assertEqual(2, resolve({"a": [{"b": 2}]}, ("a", 0, "b")))
+        self.assertIs(missing, resolve({"a": [{"b": 2}]}, ("a", 1, "b")))
+        self.assertIs(missing, resolve({"a": 1}, ("a", "b")))
+
+    async def test_extract(self):
+        sender = FakeDataSender()
+        table = create_table({"deviceIdPath": "id", "timePath": "ts"})
+        subscription = MqttSubscription(None, None, sender, table, ScriptEngine(cache_dir=None))
+        self.assertIsNone(subscription.parse_script)
+
+        payload = [
+            {"id": "dev-1", "ts": 1700000000000, "temp": 21.5, "env": {"hum": 40}, "list": [1, 2], "other": 1},
+            {"id": "SN2", "temp": None},
+            {"id": "SN9", "temp": 1},
+        ]
+        await subscription.handle_message("data/x", json.dumps(payload).encode("utf-8"), 1000)
+
+        self.assertEqual(2, len(sender.points))
+        self.assertEqual("SN1", sender.points[0].id)
+        self.assertEqual(1700000000000, sender.points[0].time)
+        self.assertEqual({"temp": 21.5, "hum": 40, "first": 1},
+                         {field.tag.id: field.value for field in sender.points[0].fields})
+        self.assertEqual("SN2", sender.points[1].id)
+        self.assertEqual(1000, sender.points[1].time)
+        self.assertEqual([None], [field.value for field in sender.points[1].fields])
+
+    async def test_device_id_from_topic(self):
+        sender = FakeDataSender()
+        table = create_table({"fieldsPath": "data"})
+        subscription = MqttSubscription(None, None, sender, table, ScriptEngine(cache_dir=None))
+
+        await subscription.handle_message("data/dev-1", b'{"data": {"temp": 1}}', 1000)
+        await subscription.handle_message("data/unknown", b'{"data": {"temp": 2}}', 1000)
+        self.assertEqual(["SN1"], [point.id for point in sender.points])
+
+    async def test_fallback_to_script(self):
+        sender = FakeDataSender()
+        script = "function handler(topic, message) { return [{id: 'SN2', fields: {temp: message.length}}]; }"
+        table = create_table({"deviceIdPath": "id"}, script)
+        subscription = MqttSubscription(None, None, sender, table, ScriptEngine(cache_dir=None))
+
+        await subscription.handle_message("data/x", b"not json", 1000)
+        self.assertEqual("SN2", sender.points[0].id)
+        self.assertEqual(8, sender.points[0].fields[0].value)
+
+    def test_requires_device_id(self):
+        with self.assertRaises(ValueError):
+            FieldExtractor("t1", ExtractSettings(None, None, None, None), None)
+
+
+if __name__ == '__main__':
+    unittest.main()
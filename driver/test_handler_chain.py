@@ -0,0 +1,104 @@
+import math
+import unittest
+
+from airiot_python_sdk.driver.handler import DataHandler, DataHandlerChain
+from airiot_python_sdk.driver.handler.boolean_to_integer_handler import BooleanToIntegerDataHandler
+from airiot_python_sdk.driver.handler.bytes_to_hex_handler import ByteToHexDataHandler
+from airiot_python_sdk.driver.handler.convert_value_handler import ConvertValueDataHandler
+from airiot_python_sdk.driver.handler.round_and_scale_handler import RoundAndScaleDataHandler
+from airiot_python_sdk.driver.handler.valid_range_value_handler import ValidRangeValueDataHandler
+from airiot_python_sdk.driver.model.point import Point, Field
+from airiot_python_sdk.driver.model.tag import Tag, TagValue, Range, RangeCondition
+
+from handler_chain import CompiledDataHandlerChain
+from model import ModelConfig, Device, DriverConfig
+
+
+class SuffixDataHandler(DataHandler):
+    """
+    自定义处理器: 为字符串值添加后缀
+    """
+
+    def name(self) -> str:
+        return "suffix"
+
+    def support(self, table_id: str, device_id: str, tag: Tag, value: any) -> bool:
+        return isinstance(value, str) and tag.id == "text"
+
+    async def handle(self, table_id: str, device_id: str, tag: Tag, value: any) -> dict[str, any]:
+        return {tag.id: value + "!"}
+
+    def order(self) -> int:
+        return 50
+
+
+def create_handlers() -> list[DataHandler]:
+    return [
+        RoundAndScaleDataHandler(),
+        ConvertValueDataHandler(),
+        ValidRangeValueDataHandler(),
+        BooleanToIntegerDataHandler(),
+        ByteToHexDataHandler(),
+        SuffixDataHandler(),
+    ]
+
+
+tags = [
+    Tag("plain", "plain", None, None, None, None),
+    Tag("scaled", "scaled", TagValue(None, None, None, None), None, 2, 0.1),
+    Tag("converted", "converted", TagValue(-50, 50, -5000, 5000), None, None, None),
+    Tag("ranged", "ranged", TagValue(None, None, None, None),
+        Range("valid", [RangeCondition("number", "range", 0, 100, None, True, None)], None, None, 0, "boundary",
+              "save"), None, None),
+    Tag("text", "text", None, None, None, None),
+]
+
+values = [None, True, False, 0, 7, -12345, 1.005, 2452.0, 150.0, -3.5, math.nan, math.inf, "abc", b"\x01\xff",
+          bytearray(b"\x02"), [1, 2]]
+
+
+class TestCompiledDataHandlerChain(unittest.IsolatedAsyncioTestCase):
+
+    async def test_same_result_as_default_chain(self):
+        chain = DataHandlerChain(create_handlers())
+        compiled = CompiledDataHandlerChain(create_handlers())
+        compiled.compile([ModelConfig("t1", DriverConfig(None, tags), [Device("SN1", DriverConfig(None, tags))])])
+
+        for tag in tags:
+            for value in values:
+                expected = await chain.__handle__("t1", "SN1", tag, value)
+                actual = await compiled.__handle__("t1", "SN1", tag, value)
+                self.assertEqual(str(expected), str(actual), "tag = {}, value = {}".format(tag.id, value))
+
+    async def test_passthrough_pipeline(self):
+        compiled = CompiledDataHandlerChain(create_handlers()[:-1])
+        compiled.compile([ModelConfig("t1", DriverConfig(None, tags), [Device("SN1", DriverConfig(None, tags))])])
+
+        # 未配置任何规则的数据点只有布尔值和字节数组需要处理
+        pipeline = compiled.pipelines[("t1", "plain", id(tags[0]))]
+        self.assertTrue(pipeline.passthrough(float))
+        self.assertTrue(pipeline.passthrough(str))
+        self.assertFalse(pipeline.passthrough(bool))
+        self.assertEqual(2, len(pipeline.steps))
+
+        # 存在自定义处理器时需要在运行时判断
+        compiled = CompiledDataHandlerChain(create_handlers())
+        compiled.compile([ModelConfig("t1", DriverConfig(None, tags), [Device("SN1", DriverConfig(None, tags))])])
+        self.assertFalse(compiled.pipelines[("t1", "plain", id(tags[0]))].passthrough(float))
+
+    async def test_uncompiled_tag(self):
+        compiled = CompiledDataHandlerChain(create_handlers())
+        point = Point()
+        point.table = "t1"
+        point.id = "SN1"
+        point.fields = [Field(tags[1], 12.345)]
+
+        result = await compiled.handle(point)
+        self.assertEqual({"scaled": 1.23}, result.fields)
+
+        compiled.invalidate()
+        self.assertEqual(0, len(compiled.pipelines))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+import asyncio
+import threading
+import unittest
+
+from ingest import IngestQueue, OverflowPolicy
+
+
+class TestIngestQueue(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.handled = []
+        self.release = asyncio.Event()
+
+    async def handler(self, topic: str, payload: bytes, receive_time: int):
+        await self.release.wait()
+        self.handled.append(payload)
+
+    async def offer_from_thread(self, queue: IngestQueue, payloads: list[bytes]):
+        # offer 只能由 MQTT 网络线程调用
+        thread = threading.Thread(
+            target=lambda: [queue.offer(self.handler, "data/test", p, 0) for p in payloads])
+        thread.start()
+        while thread.is_alive():
+            await asyncio.sleep(0.01)
+        await asyncio.sleep(0.01)
+
+    async def test_process_in_order(self):
+        queue = IngestQueue(asyncio.get_running_loop(), max_size=10, workers=1)
+        queue.start()
+        self.release.set()
+
+        await self.offer_from_thread(queue, [b"1", b"2", b"3"])
+        await queue.join()
+
+        self.assertEqual([b"1", b"2", b"3"], self.handled)
+        self.assertEqual(3, queue.processed)
+        await queue.stop()
+
+    async def test_drop_newest(self):
+        queue = IngestQueue(asyncio.get_running_loop(), max_size=2, workers=1, policy=OverflowPolicy.DROP_NEWEST)
+        queue.start()
+
+        # worker 取出第一条消息后阻塞, 队列中保留 2 条
+        await self.offer_from_thread(queue, [b"1"])
+        await self.offer_from_thread(queue, [b"2", b"3", b"4", b"5"])
+        self.assertEqual(2, queue.dropped)
+        self.assertEqual(2, queue.depth)
+
+        self.release.set()
+        await queue.join()
+        self.assertEqual([b"1", b"2", b"3"], self.handled)
+        await queue.stop()
+
+    async def test_drop_oldest(self):
+        queue = IngestQueue(asyncio.get_running_loop(), max_size=2, workers=1, policy=OverflowPolicy.DROP_OLDEST)
+        queue.start()
+
+        await self.offer_from_thread(queue, [b"1"])
+        await self.offer_from_thread(queue, [b"2", b"3", b"4", b"5"])
+        self.assertEqual(2, queue.dropped)
+        self.assertEqual(2, queue.max_depth)
+
+        self.release.set()
+        await queue.join()
+        self.assertEqual([b"1", b"4", b"5"], self.handled)
+        await queue.stop()
+
+    async def test_bounded_while_loop_is_busy(self):
+        queue = IngestQueue(asyncio.get_running_loop(), max_size=2, workers=1, policy=OverflowPolicy.DROP_OLDEST)
+        queue.start()
+        self.release.set()
+
+        # 事件循环被阻塞时, 网络线程直接执行溢出策略, 队列长度不超过 max_size
+        thread = threading.Thread(
+            target=lambda: [queue.offer(self.handler, "data/test", str(i).encode(), 0) for i in range(1000)])
+        thread.start()
+        thread.join()
+        self.assertEqual(2, queue.depth)
+        self.assertEqual(998, queue.dropped)
+
+        await queue.join()
+        self.assertEqual([b"998", b"999"], self.handled)
+        await queue.stop()
+
+    async def test_stop_releases_blocked_offer(self):
+        queue = IngestQueue(asyncio.get_running_loop(), max_size=1, workers=1, policy=OverflowPolicy.BLOCK)
+        queue.start()
+
+        thread = threading.Thread(
+            target=lambda: [queue.offer(self.handler, "data/test", p, 0) for p in [b"1", b"2", b"3"]])
+        thread.start()
+        await asyncio.sleep(0.1)
+        self.assertTrue(thread.is_alive())
+
+        await queue.stop()
+        while thread.is_alive():
+            await asyncio.sleep(0.05)
+
+        self.assertEqual([], self.handled)
+        self.assertEqual(3, queue.received)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,325 @@
+import asyncio
+import json
+import time
+import unittest
+
+from airiot_python_sdk.driver.config import KafkaConfig
+from airiot_python_sdk.driver.handler import DataHandlerChain
+from airiot_python_sdk.driver.model.point import Point, Field, SimplePoint
+from airiot_python_sdk.driver.model.tag import Tag
+from airiot_python_sdk.driver.model.warning import WarningRecovery, WarningRecoveryData
+
+import airiot_python_sdk.driver.launcher as launcher
+from airiot_python_sdk.driver.service.kafka_data_sender import KafkaDataSender
+from batch_sender import BatchDataSender
+from kafka_sender import BufferedKafkaDataSender, ProducerSettings, install_kafka_data_sender, producer_config
+
+
+class FakeMessage:
+
+    def __init__(self, topic: str, key: str, value: str, partition):
+        self.topic_name = topic
+        self.key = key
+        self.value = value
+        self.partition = partition
+
+    def topic(self) -> str:
+        return self.topic_name
+
+
+class FakeProducer:
+    """
+    模拟 confluent_kafka.Producer. 队列已满时 produce 抛出 BufferError, poll 时按 fail 设置触发发送结果回调
+    """
+
+    def __init__(self, config: dict, capacity: int = 1000):
+        self.config = config
+        self.capacity = capacity
+        self.queue = []
+        self.delivered = []
+        self.fail = False
+        self.polls = 0
+
+    def produce(self, topic: str, key: str = None, value: str = None, partition: int = None, on_delivery=None):
+        if len(self.queue) >= self.capacity:
+            raise BufferError("Local: Queue full")
+        self.queue.append((FakeMessage(topic, key, value, partition), on_delivery))
+
+    def poll(self, timeout: float = 0) -> int:
+        self.polls += 1
+        queue, self.queue = self.queue, []
+        for message, on_delivery in queue:
+            self.delivered.append(message)
+            if on_delivery is not None:
+                on_delivery("broker down" if self.fail else None, message)
+        return len(queue)
+
+    def flush(self, timeout: float = 0) -> int:
+        self.poll(timeout)
+        return len(self.queue)
+
+    def __len__(self) -> int:
+        return len(self.queue)
+
+
+class StuckProducer(FakeProducer):
+    """
+    无法发送任何消息的 producer
+    """
+
+    def poll(self, timeout: float = 0) -> int:
+        self.polls += 1
+        return 0
+
+    def flush(self, timeout: float = 0) -> int:
+        return len(self.queue)
+
+
+class ReleasingProducer(StuckProducer):
+    """
+    调用 release 之前无法发送任何消息的 producer
+    """
+
+    released = False
+
+    def poll(self, timeout: float = 0) -> int:
+        if self.released:
+            return FakeProducer.poll(self, timeout)
+        return StuckProducer.poll(self, timeout)
+
+    def release(self):
+        self.released = True
+
+
+def create_point(device_id: str) -> Point:
+    point = Point()
+    point.table = "t1"
+    point.id = device_id
+    point.time = 1000
+    point.fields = [Field(Tag("a", "a", None, None, None, None), 1)]
+    return point
+
+
+def create_config(**kwargs) -> KafkaConfig:
+    config = KafkaConfig()
+    config.brokers = ["127.0.0.1:9092"]
+    for key, value in kwargs.items():
+        setattr(config, key, value)
+    return config
+
+
+def create_sender(config: KafkaConfig, producer_class=FakeProducer) -> BufferedKafkaDataSender:
+    sender = BufferedKafkaDataSender("p1", "d1", "driver", "s1", config, DataHandlerChain([]))
+    sender.producer_factory = producer_class
+    return sender
+
+
+def start_paused(sender: BufferedKafkaDataSender):
+    """
+    启动发送器并停止后台线程, 由测试控制 poll 的时机
+    """
+    sender.start()
+    sender.stopping.set()
+    sender.poll_thread.join()
+
+
+class TestKafkaSender(unittest.TestCase):
+
+    def test_producer_config(self):
+        config = create_config(batch_size=65536, linger_ms=5, compression="zstd", idempotence=False)
+        settings = ProducerSettings(config)
+        producer = producer_config(config, settings, "driver_d1_s1")
+
+        self.assertEqual(producer["batch.size"], 65536)
+        self.assertEqual(producer["linger.ms"], 5)
+        self.assertEqual(producer["compression.type"], "zstd")
+        self.assertFalse(producer["enable.idempotence"])
+        # 未配置的项使用默认值
+        self.assertEqual(producer["acks"], "all")
+        self.assertEqual(producer["queue.buffering.max.messages"], 100000)
+        self.assertEqual(producer["bootstrap.servers"], "127.0.0.1:9092")
+
+    def test_bool_settings(self):
+        for value, expected in (("false", False), ("False", False), ("off", False), (0, False),
+                                ("true", True), ("yes", True), (1, True), (True, True)):
+            self.assertIs(ProducerSettings(create_config(idempotence=value)).idempotence, expected)
+        for value in ("maybe", 2, ""):
+            with self.assertRaises(ValueError):
+                ProducerSettings(create_config(idempotence=value))
+        with self.assertRaises(ValueError):
+            ProducerSettings(create_config(batch_size="large"))
+
+    def test_delivery_counters(self):
+        sender = create_sender(create_config())
+        start_paused(sender)
+        sender.__write_point__(SimplePoint("t1", "dev1", {"a": 1}, None, 1000, {}))
+        sender.__write_point__(SimplePoint("t1", "dev2", {"a": 2}, None, 1000, {}))
+        sender.client.poll()
+        sender.client.fail = True
+        sender.send_warning_recovery("t1", "dev1", WarningRecovery(["w1"], WarningRecoveryData(None, [])))
+        sender.stop()
+
+        self.assertEqual(sender.delivered, 2)
+        self.assertEqual(sender.failed, 1)
+        self.assertEqual(len(sender.client.queue), 0)
+        self.assertEqual(sender.client.config["compression.type"], "lz4")
+
+        messages = sender.client.delivered
+        self.assertEqual(messages[0].topic(), "data")
+        self.assertEqual(messages[0].key, "p1/t1/dev1")
+        self.assertEqual(json.loads(messages[0].value)["fields"], {"a": 1})
+        self.assertEqual(messages[2].topic(), "warningUpdate")
+
+    def test_flush_on_stop(self):
+        sender = create_sender(create_config())
+        start_paused(sender)
+
+        sender.produce("data", "p1/t1/dev1", "{}")
+        sender.produce("data", "p1/t1/dev2", "{}")
+        self.assertEqual(sender.stats()["queued"], 2)
+
+        sender.stop()
+        self.assertEqual(sender.stats(), {"delivered": 2, "failed": 0, "rejected": 0, "blocked": 0,
+                                          "queued": 0})
+
+    def test_queue_full(self):
+        sender = create_sender(create_config())
+        start_paused(sender)
+        sender.client.capacity = 1
+
+        # 队列已满时处理发送结果后继续发送
+        sender.produce("data", "p1/t1/dev1", "{}")
+        sender.produce("data", "p1/t1/dev2", "{}")
+        self.assertEqual(sender.rejected, 0)
+        self.assertEqual(sender.delivered, 1)
+        sender.stop()
+
+    def test_queue_full_fails_fast(self):
+        sender = create_sender(create_config(), StuckProducer)
+        start_paused(sender)
+        sender.client.capacity = 1
+
+        sender.produce("data", "p1/t1/dev1", "{}")
+        polls = sender.client.polls
+        begin = time.monotonic()
+        with self.assertRaises(BufferError):
+            sender.produce("data", "p1/t1/dev2", "{}")
+        # 不等待队列释放, 不阻塞事件循环
+        self.assertLess(time.monotonic() - begin, 0.05)
+        self.assertEqual(polls + 1, sender.client.polls)
+        self.assertEqual(1, sender.rejected)
+
+        # 停止时无法发送的消息保留在队列中
+        sender.stop()
+        self.assertEqual(sender.stats()["queued"], 1)
+
+    def test_write_points_wait(self):
+        sender = create_sender(create_config(), ReleasingProducer)
+        start_paused(sender)
+        sender.client.capacity = 1
+        batch = BatchDataSender(sender, 0, 100)
+
+        async def write():
+            # 本地队列已满时 write_points 等待, 不阻塞事件循环
+            asyncio.get_running_loop().call_later(0.05, sender.client.release)
+            begin = time.monotonic()
+            await batch.write_points([create_point("dev1"), create_point("dev2")])
+            return time.monotonic() - begin
+
+        self.assertGreaterEqual(asyncio.run(write()), 0.04)
+        self.assertEqual((2, 0), (batch.sent, batch.dropped))
+        self.assertEqual((1, 0), (sender.blocked, sender.rejected))
+        sender.stop()
+
+    def test_write_points_timeout(self):
+        sender = create_sender(create_config(block_timeout=50), StuckProducer)
+        start_paused(sender)
+        sender.client.capacity = 1
+        batch = BatchDataSender(sender, 0, 100)
+
+        ticks = []
+
+        async def tick():
+            while True:
+                ticks.append(time.monotonic())
+                await asyncio.sleep(0.01)
+
+        async def write():
+            task = asyncio.create_task(tick())
+            try:
+                await batch.write_points([create_point("dev1"), create_point("dev2"), create_point("dev3")])
+            finally:
+                task.cancel()
+
+        # 等待超时后才丢弃, 等待期间其它任务继续执行
+        with self.assertRaises(BufferError):
+            asyncio.run(write())
+        self.assertGreater(len(ticks), 2)
+        self.assertEqual((1, 2), (batch.sent, batch.dropped))
+        self.assertEqual((1, 1), (sender.blocked, sender.rejected))
+        sender.stop()
+
+    def test_default_mode(self):
+        sender = create_sender(create_config(mode="default"))
+        self.assertFalse(sender.production)
+        sender.client = FakeProducer({})
+        sender.produce("data", "p1/t1/dev1", "{}")
+        self.assertEqual(len(sender.client.queue), 1)
+        self.assertIsNone(sender.client.queue[0][1])
+        sender.stop()
+        self.assertEqual(len(sender.client.queue), 1)
+
+    def test_batch_sender(self):
+        sender = create_sender(create_config())
+        start_paused(sender)
+        batch = BatchDataSender(sender, 0, 100)
+
+        point = Point()
+        point.table = "t1"
+        point.id = "dev1"
+        point.time = 1000
+        point.fields = [Field(Tag("a", "a", None, None, None, None), 1)]
+        polls = sender.client.polls
+        asyncio.run(batch.write_points([point]))
+
+        self.assertEqual(batch.sent, 1)
+        # 后台线程处理发送结果, 发送时不调用 poll
+        self.assertEqual(sender.client.polls, polls)
+        self.assertEqual(sender.client.queue[0][0].key, "p1/t1/dev1")
+        sender.stop()
+        self.assertEqual(sender.delivered, 1)
+
+    def test_install(self):
+        original = launcher.KafkaDataSender
+        try:
+            install_kafka_data_sender()
+            self.assertIs(launcher.KafkaDataSender, BufferedKafkaDataSender)
+            self.assertTrue(issubclass(launcher.KafkaDataSender, KafkaDataSender))
+        finally:
+            launcher.KafkaDataSender = original
+
+    def test_install_from_main(self):
+        import main
+
+        original = launcher.KafkaDataSender
+        try:
+            main.install_kafka_data_sender()
+            sender = launcher.KafkaDataSender("p1", "d1", "driver", "s1", create_config(), DataHandlerChain([]))
+        finally:
+            launcher.KafkaDataSender = original
+
+        # main 与其它驱动模块使用同一个 kafka_sender 模块, 批量发送器按 BufferedKafkaDataSender 发送
+        self.assertIsInstance(sender, BufferedKafkaDataSender)
+        sender.producer_factory = FakeProducer
+        start_paused(sender)
+        batch = BatchDataSender(sender, 0, 100)
+        polls = sender.client.polls
+        batch.__send_record__(("t1", "dev1", "{}"))
+        batch.__poll__()
+        self.assertEqual(polls, sender.client.polls)
+        self.assertIsNotNone(sender.client.queue[0][1])
+        sender.stop()
+
+
+if __name__ == '__main__':
+    unittest.main()
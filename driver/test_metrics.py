@@ -0,0 +1,107 @@
+import json
+import unittest
+
+from config_loader import load_table
+from fakes import FakeDataSender
+from metrics import DebugSampler, DriverMetrics, Histogram
+from model import ModelConfig
+from mqtt_driver import MqttSubscription
+from script_engine import ScriptEngine
+
+parse_script = """
+import json
+
+def handler(topic, message):
+    data = json.loads(message)
+    return [{"id": data["id"], "fields": {"temp": data["temp"]}}]
+"""
+
+
+def create_table() -> ModelConfig:
+    return load_table({
+        "id": "t1",
+        "device": {
+            "settings": {"topic": "data/+", "parseScript": parse_script, "scriptType": "python"},
+            "tags": [{"id": "temp", "name": "temp", "key": "temp"}],
+        },
+        "devices": [{"id": "SN1", "device": {"settings": {}, "tags": []}}],
+    })
+
+
+class TestMetrics(unittest.IsolatedAsyncioTestCase):
+
+    def test_histogram(self):
+        histogram = Histogram((0.001, 0.01))
+        for value in (0.0005, 0.001, 0.005, 0.5):
+            histogram.observe(value)
+
+        self.assertEqual([(0.001, 2), (0.01, 3), (float("inf"), 4)], histogram.buckets())
+        self.assertEqual(4, histogram.count)
+        self.assertEqual(0.001, histogram.quantile(0.5))
+        self.assertEqual(0.01, histogram.quantile(0.99))
+        self.assertEqual(0.0, Histogram().quantile(0.5))
+
+    def test_sampler(self):
+        sampler = DebugSampler(rate=3, size=2)
+        hits = [sampler.hit() for _ in range(9)]
+        self.assertEqual([False, False, True] * 3, hits)
+
+        for i in range(3):
+            sampler.capture("t1", "data/SN{}".format(i), b"\x01\x02", None)
+        self.assertEqual(["data/SN1", "data/SN2"], [sample["topic"] for sample in sampler.samples])
+        self.assertEqual("0102", sampler.samples[0]["payload"])
+
+        sampler.resize(0, 1)
+        self.assertFalse(sampler.hit())
+        self.assertEqual(["data/SN2"], [sample["topic"] for sample in sampler.samples])
+
+    async def test_subscription(self):
+        metrics = DriverMetrics(DebugSampler(rate=2))
+        sender = FakeDataSender()
+        subscription = MqttSubscription(None, None, sender, create_table(), ScriptEngine(cache_dir=None), metrics)
+
+        for device_id in ("SN1", "SN2", "SN1"):
+            payload = json.dumps({"id": device_id, "temp": 1.5}).encode("utf-8")
+            await subscription.handle_message("data/" + device_id, payload, 1000)
+
+        table = metrics.snapshot()["tables"]["t1"]
+        self.assertEqual(3, table["handled"])
+        self.assertEqual(2, table["points"])
+        self.assertEqual(1, table["empty"])
+        self.assertEqual(3, table["parse"]["count"])
+
+        # 第二条消息被采样, 保存数据处理脚本的结果
+        samples = metrics.samples()
+        self.assertEqual(1, len(samples))
+        self.assertEqual("data/SN2", samples[0]["topic"])
+        self.assertEqual([{"id": "SN2", "fields": {"temp": 1.5}}], samples[0]["result"])
+
+        # 工作表重新加载后保留指标
+        MqttSubscription(None, None, sender, create_table(), ScriptEngine(cache_dir=None), metrics)
+        self.assertEqual(3, metrics.table("t1").handled)
+
+    def test_components(self):
+        metrics = DriverMetrics()
+        metrics.register("ingest", lambda: {"dropped": 2, "maxDepth": 10})
+        metrics.register("spool", lambda: None)
+        metrics.register("broken", lambda: 1 / 0)
+        self.assertEqual({"ingest": {"dropped": 2, "maxDepth": 10}}, metrics.snapshot()["components"])
+
+    def test_prometheus(self):
+        metrics = DriverMetrics()
+        metrics.table('t"1').received = 5
+        metrics.table('t"1').parse.observe(0.002)
+        metrics.register("ingest", lambda: {"maxDepth": 10})
+
+        lines = metrics.prometheus().splitlines()
+        self.assertIn("# TYPE mqtt_driver_messages_received_total counter", lines)
+        self.assertIn('mqtt_driver_messages_received_total{table="t\\"1"} 5', lines)
+        self.assertIn('mqtt_driver_parse_seconds_bucket{table="t\\"1",le="0.0025"} 1', lines)
+        self.assertIn('mqtt_driver_parse_seconds_bucket{table="t\\"1",le="+Inf"} 1', lines)
+        self.assertIn('mqtt_driver_parse_seconds_count{table="t\\"1"} 1', lines)
+        self.assertIn("mqtt_driver_handle_seconds_count 0", lines)
+        self.assertIn("mqtt_driver_ingest_max_depth 10", lines)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,102 @@
+import copy
+import unittest
+
+import airiot_python_sdk.driver.handler as handler_module
+
+from fakes import FakeDataSender, FakeMqttDriverApp, create_config, create_table
+
+
+class TestMqttDriverApp(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.app = FakeMqttDriverApp("s1", FakeDataSender())
+        self.app.clients = []
+
+    async def asyncTearDown(self):
+        await self.app.stop()
+
+    async def test_reload_changed_tables(self):
+        tables = [create_table("t1", "a/#"), create_table("t2", "b/+"), create_table("t3", "c/1")]
+        await self.app.start(create_config(tables))
+
+        client = self.app.client
+        t1 = self.app.subscriptions["t1"]
+        t2 = self.app.subscriptions["t2"]
+        self.assertEqual(["a/#", "b/+", "c/1"], client.subscribed)
+        self.assertEqual(3, len(self.app.data_sender.handler_chain.pipelines))
+
+        # 修改 t2 的主题, 删除 t3, 新增 t4
+        tables = copy.deepcopy(tables[:2])
+        tables[1]["device"]["settings"]["topic"] = "b/x"
+        tables.append(create_table("t4", "a/b"))
+        await self.app.start(create_config(tables))
+
+        # 保持连接, 未变化的工作表不重新创建
+        self.assertIs(client, self.app.client)
+        self.assertEqual(1, len(self.app.clients))
+        self.assertIs(t1, self.app.subscriptions["t1"])
+        self.assertIsNot(t2, self.app.subscriptions["t2"])
+        self.assertEqual(["t1", "t2", "t4"], sorted(self.app.subscriptions))
+
+        # a/b 包含在 a/# 中, 不需要订阅
+        self.assertEqual(["a/#", "b/x"], self.app.topic_filters)
+        self.assertEqual(["b/+", "c/1"], client.unsubscribed)
+        self.assertEqual(["a/#", "b/+", "c/1", "b/x"], client.subscribed)
+        self.assertEqual(3, len(self.app.data_sender.handler_chain.pipelines))
+        self.assertEqual([t1], self.app.topics.match("a/c"))
+
+    async def test_invalid_topic(self):
+        tables = [create_table("t1", "a/#"), create_table("t2", "b/#/c")]
+        await self.app.start(create_config(tables))
+
+        # 主题无效的工作表被忽略, 其它工作表正常订阅
+        self.assertEqual(["t1"], sorted(self.app.subscriptions))
+        self.assertEqual(["a/#"], self.app.client.subscribed)
+
+        tables = [create_table("t1", "a/x+"), create_table("t2", "b/+")]
+        await self.app.start(create_config(tables))
+        self.assertEqual(["t2"], sorted(self.app.subscriptions))
+        self.assertEqual(["b/+"], self.app.topic_filters)
+
+    async def test_tag_value_store(self):
+        previous = handler_module.tag_value_cache
+        tables = [create_table("t1", "a/#"), create_table("t2", "b/+")]
+        await self.app.start(create_config(tables))
+        store = self.app.tag_value_store
+        self.assertIs(store, handler_module.tag_value_cache)
+
+        store.put("t1", "SN1", "temp", 1)
+        store.put("t2", "SN1", "temp", 2)
+
+        # 删除 t2 后不保留 t2 的有效值
+        await self.app.start(create_config(tables[:1]))
+        self.assertEqual(1, store.lookup("t1", "SN1", "temp"))
+        self.assertIsNone(store.lookup("t2", "SN1", "temp"))
+        self.assertNotIn("t2", store.layouts)
+
+        # 停止后清除有效值并恢复 SDK 原来的 tag_value_cache
+        await self.app.stop()
+        self.assertEqual(0, len(store))
+        self.assertIs(previous, handler_module.tag_value_cache)
+
+        # 重新启动时再次替换, 不保留停止前的有效值
+        store.put("t1", "SN1", "temp", 1)
+        await self.app.start(create_config(tables))
+        self.assertIs(store, handler_module.tag_value_cache)
+        self.assertIsNone(store.lookup("t1", "SN1", "temp"))
+        await self.app.stop()
+        self.assertIs(previous, handler_module.tag_value_cache)
+
+    async def test_restart_when_driver_config_changed(self):
+        tables = [create_table("t1", "a/#")]
+        await self.app.start(create_config(tables))
+        client = self.app.client
+
+        await self.app.start(create_config(tables, "tcp://127.0.0.2:1883"))
+        self.assertTrue(client.stopped)
+        self.assertIsNot(client, self.app.client)
+        self.assertEqual(2, len(self.app.clients))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,118 @@
+import struct
+import unittest
+
+import jsons
+
+from fakes import FakeDataSender
+from model import ModelConfig, CodecSettings
+from mqtt_driver import MqttSubscription
+from payload_codec import StructDevice, struct_format, create_decoder
+from script_engine import ScriptEngine
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+def create_table(codec: dict, extract: dict = None, device_level: int = None) -> ModelConfig:
+    return jsons.load({
+        "id": "t1",
+        "device": {
+            "settings": {"topic": "data/+", "deviceIdLevel": device_level, "codec": codec, "extract": extract,
+                         "parseScript": "function handler(topic, message) { return []; }"},
+            "tags": [
+                {"id": "temp", "name": "temp", "key": "temp", "offset": 4, "dataType": "float32"},
+                {"id": "count", "name": "count", "key": "count", "offset": 8, "dataType": "uint16"},
+                {"id": "alarm", "name": "alarm", "key": "alarm", "offset": 10, "dataType": "bool"},
+            ],
+        },
+        "devices": [
+            {"id": "SN1", "device": {"settings": {"customDeviceId": "101"}, "tags": []}},
+            {"id": "SN2", "device": {"settings": {"customDeviceId": "102"}, "tags": []}},
+        ],
+    }, ModelConfig)
+
+
+def values(point) -> dict:
+    return {field.tag.id: field.value for field in point.fields}
+
+
+class TestPayloadCodec(unittest.IsolatedAsyncioTestCase):
+
+    def test_struct_format(self):
+        self.assertEqual("h", struct_format("int16"))
+        self.assertEqual("d", struct_format("d"))
+        with self.assertRaises(ValueError):
+            struct_format("string")
+
+    def test_struct_layout(self):
+        table = create_table({"type": "struct", "deviceIdOffset": 0})
+        tags = table.device.tags
+
+        device = StructDevice("SN1", tags, ">")
+        self.assertEqual(">4xfH?", device.layout.format)
+        self.assertEqual(11, device.size)
+
+        # 数据点之间存在重叠时逐个读取
+        tags[1].offset = 5
+        device = StructDevice("SN1", tags, ">")
+        self.assertIsNone(device.layout)
+
+        frame = struct.pack(">Ifh?", 1, 1.5, 7, True)
+        self.assertEqual([1.5, 0xC000, True], [field.value for field in device.read(memoryview(frame), 0)])
+
+    async def test_struct_records(self):
+        sender = FakeDataSender()
+        table = create_table({"type": "struct", "byteOrder": "big", "recordSize": 20, "deviceIdOffset": 0,
+                              "deviceIdType": "uint32", "timeOffset": 12})
+        subscription = MqttSubscription(None, None, sender, table, ScriptEngine(cache_dir=None))
+        self.assertIsNone(subscription.parse_script)
+
+        payload = (struct.pack(">IfH?xQ", 101, 21.5, 3, True, 1700000000000) +
+                   struct.pack(">IfH?xQ", 999, 1.0, 1, False, 1700000000001) +
+                   struct.pack(">IfH?xQ", 102, -2.25, 65535, False, 1700000000002) +
+                   b"\x00\x01")
+        await subscription.handle_message("data/x", payload, 1000)
+
+        self.assertEqual(["SN1", "SN2"], [point.id for point in sender.points])
+        self.assertEqual([1700000000000, 1700000000002], [point.time for point in sender.points])
+        self.assertEqual({"temp": 21.5, "count": 3, "alarm": True}, values(sender.points[0]))
+        self.assertEqual({"temp": -2.25, "count": 65535, "alarm": False}, values(sender.points[1]))
+
+    async def test_struct_device_from_topic(self):
+        sender = FakeDataSender()
+        table = create_table({"type": "struct"}, device_level=1)
+        subscription = MqttSubscription(None, None, sender, table, ScriptEngine(cache_dir=None))
+
+        await subscription.handle_message("data/102", struct.pack("<IfH?", 0, 0.5, 2, False), 1000)
+        # 消息长度不足
+        await subscription.handle_message("data/101", b"\x00" * 8, 1000)
+
+        self.assertEqual(1, len(sender.points))
+        self.assertEqual(1000, sender.points[0].time)
+        self.assertEqual({"temp": 0.5, "count": 2, "alarm": False}, values(sender.points[0]))
+
+    @unittest.skipIf(msgpack is None, "msgpack 未安装")
+    async def test_msgpack(self):
+        sender = FakeDataSender()
+        table = create_table({"type": "msgpack"}, {"deviceIdPath": "id", "timePath": "ts"})
+        subscription = MqttSubscription(None, None, sender, table, ScriptEngine(cache_dir=None))
+
+        payload = msgpack.packb([{"id": 101, "ts": 5, "temp": 1.25, "count": 2}, {"id": "102", "alarm": True}])
+        await subscription.handle_message("data/x", payload, 1000)
+
+        self.assertEqual(["SN1", "SN2"], [point.id for point in sender.points])
+        self.assertEqual({"temp": 1.25, "count": 2}, values(sender.points[0]))
+        self.assertEqual(5, sender.points[0].time)
+        self.assertEqual({"alarm": True}, values(sender.points[1]))
+
+    def test_unsupported_codec(self):
+        with self.assertRaises(ValueError):
+            create_decoder(CodecSettings("xml", None, None, None, None, None, None, None))
+        with self.assertRaises(ValueError):
+            create_decoder(CodecSettings("protobuf", None, None, None, None, None, None, None))
+
+
+if __name__ == '__main__':
+    unittest.main()
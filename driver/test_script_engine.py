@@ -0,0 +1,87 @@
+import os
+import tempfile
+import unittest
+
+from script_engine import ScriptEngine, default_cache_dir
+
+js_script = """
+function handler(topic, message) {
+    var data = JSON.parse(message);
+    return [{"id": data.id, "fields": {"temp": data.temp, "ok": true, "values": [1, 2]}}];
+}
+"""
+
+py_script = """
+import json
+
+def handler(topic, message):
+    data = json.loads(message)
+    return [{"id": data["id"], "fields": {"temp": data["temp"], "ok": True, "values": [1, 2]}}]
+"""
+
+payload = '{"id": "SN10001", "temp": 12.5}'
+expected = [{"id": "SN10001", "fields": {"temp": 12.5, "ok": True, "values": [1, 2]}}]
+
+
+class TestScriptEngine(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.TemporaryDirectory()
+        self.engine = ScriptEngine(self.cache_dir.name)
+
+    def tearDown(self):
+        self.cache_dir.cleanup()
+
+    def test_javascript_result_is_native(self):
+        script = self.engine.compile(js_script)
+        result = script("data/SN10001", payload)
+        self.assertEqual(expected, result)
+        self.assertIsInstance(result[0], dict)
+
+    def test_python_script(self):
+        script = self.engine.compile(py_script, "python")
+        self.assertEqual(expected, script("data/SN10001", payload))
+
+    def test_function_expression(self):
+        script = self.engine.compile("(function(topic, message) { return [{\"id\": topic}]; });")
+        self.assertEqual([{"id": "a"}], script("a", ""))
+
+    def test_shared_by_content(self):
+        self.assertIs(self.engine.compile(js_script), self.engine.compile(js_script))
+        self.assertIsNot(self.engine.compile(js_script), self.engine.compile(js_script + "\n"))
+
+    def test_disk_cache(self):
+        self.engine.compile(js_script)
+        self.assertEqual(1, len(os.listdir(self.cache_dir.name)))
+
+        # 新的引擎实例直接从磁盘加载翻译结果
+        engine = ScriptEngine(self.cache_dir.name)
+        self.assertEqual(expected, engine.compile(js_script)("data/SN10001", payload))
+        self.assertEqual(1, len(os.listdir(self.cache_dir.name)))
+
+    def test_private_cache_dir(self):
+        self.assertFalse(default_cache_dir.startswith(tempfile.gettempdir()))
+
+        # 其它用户可以访问的目录移除访问权限
+        path = os.path.join(self.cache_dir.name, "shared")
+        os.makedirs(path)
+        os.chmod(path, 0o777)
+        self.assertEqual(path, ScriptEngine(path).cache_dir)
+        self.assertEqual(0o700, os.stat(path).st_mode & 0o777)
+
+        # 符号链接可能指向其它用户控制的目录, 不使用磁盘缓存
+        link = os.path.join(self.cache_dir.name, "link")
+        os.symlink(path, link)
+        engine = ScriptEngine(link)
+        self.assertIsNone(engine.cache_dir)
+        self.assertEqual(expected, engine.compile(js_script)("data/SN10001", payload))
+
+    def test_missing_entrypoint(self):
+        with self.assertRaises(ValueError):
+            self.engine.compile("def parse(topic, message):\n    return []", "python")
+        with self.assertRaises(ValueError):
+            self.engine.compile(js_script, "lua")
+
+
+if __name__ == '__main__':
+    unittest.main()
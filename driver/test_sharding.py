@@ -0,0 +1,152 @@
+import asyncio
+import threading
+import unittest
+from types import SimpleNamespace
+
+from airiot_python_sdk.driver.handler import DataHandlerChain
+
+from batch_sender import BatchDataSender
+from config_loader import load_driver_config
+from model import ShardSettings
+from sharding import PipeDataSender, ShardedIngest, partition_tables, shared_filter
+
+
+class FakeFloodClient:
+    """
+    模拟 MQTT 服务器. 连接后向每个主题发送 3 条消息
+    """
+
+    def __init__(self, client_id: str, settings):
+        self.client_id = client_id
+        self.on_connect = None
+        self.on_message = None
+        self.filters = []
+        self.thread = None
+
+    def subscribe(self, topics):
+        self.filters.extend(topic for topic, _ in topics)
+
+    def loop_start(self):
+        self.on_connect(self, None, None, 0)
+        self.thread = threading.Thread(target=self.__publish__)
+        self.thread.start()
+
+    def __publish__(self):
+        for topic_filter in self.filters:
+            topic = topic_filter.split("/", 2)[2] if topic_filter.startswith("$share/") else topic_filter
+            for i in range(3):
+                payload = '{{"id": "{}", "temp": {}}}'.format(topic.split("/")[0], i).encode("utf-8")
+                self.on_message(self, None, SimpleNamespace(topic=topic, payload=payload))
+
+    def loop_stop(self):
+        self.thread.join()
+
+    def disconnect(self):
+        pass
+
+
+def create_flood_client(client_id: str, settings) -> FakeFloodClient:
+    return FakeFloodClient(client_id, settings)
+
+
+class FakeSender:
+
+    def __init__(self):
+        self.handler_chain = DataHandlerChain([])
+        self.points = []
+
+    async def write_points(self, points):
+        self.points.extend(points)
+
+
+class FakeSdkSender:
+
+    def __init__(self):
+        self.handler_chain = DataHandlerChain([])
+        self.points = []
+
+    def __write_point__(self, point):
+        self.points.append(point)
+
+
+def create_table(table_id: str, devices: int) -> dict:
+    return {
+        "id": table_id,
+        "device": {
+            "settings": {"topic": "{}/data".format(table_id), "extract": {"deviceIdPath": "id"}},
+            "tags": [{"id": "temp", "name": "temp", "key": "temp"}],
+        },
+        "devices": [{"id": "{}-SN{}".format(table_id, i), "device": {"settings": {"customDeviceId": table_id},
+                                                                  "tags": []}}
+                    for i in range(devices)],
+    }
+
+
+def create_config(tables: list[dict]) -> dict:
+    return {"id": "d1", "name": "mqtt", "driverType": "mqtt", "device": {"settings": {"server": "tcp://a:1883"}},
+            "tables": tables}
+
+
+class TestSharding(unittest.IsolatedAsyncioTestCase):
+
+    def test_partition_tables(self):
+        tables = [create_table("t1", 1), create_table("t2", 8), create_table("t3", 4), create_table("t4", 3)]
+        partitions = partition_tables(tables, 2)
+        self.assertEqual([["t2"], ["t3", "t4", "t1"]],
+                         [[table["id"] for table in partition] for partition in partitions])
+        self.assertEqual(1, len(partition_tables(tables[:1], 4)))
+
+    def test_shared_filter(self):
+        self.assertEqual("$share/g1/a/#", shared_filter("a/#", "g1"))
+        self.assertEqual("a/#", shared_filter("a/#", None))
+
+    async def test_pipe_sender(self):
+        sent = []
+        sender = PipeDataSender(SimpleNamespace(send=sent.append), max_points=2)
+        tag = SimpleNamespace(key="temp")
+        point = SimpleNamespace(table="t1", id="SN1", time=5, fields=[SimpleNamespace(tag=tag, value=1.5)])
+
+        await sender.write_points([point])
+        self.assertEqual([], sent)
+        await sender.write_points([point])
+        self.assertEqual([[("t1", "SN1", 5, (("temp", 1.5),))] * 2], sent)
+        sender.flush()
+        self.assertEqual(1, len(sent))
+
+    async def test_restore_points(self):
+        config = create_config([create_table("t1", 1)])
+        sender = FakeSender()
+        shards = ShardedIngest("s1", config, load_driver_config(config).tables, ShardSettings(2, None, None), sender)
+
+        await shards.__write__([("t1", "t1-SN0", 5, (("temp", 1), ("x", 2))),
+                                ("t1", "SN9", 5, (("temp", 1),)),
+                                ("t9", "t1-SN0", 5, (("temp", 1),))])
+        self.assertEqual(1, len(sender.points))
+        self.assertEqual(["temp"], [field.tag.id for field in sender.points[0].fields])
+        self.assertEqual(2, shards.unknown)
+
+    async def test_processes(self):
+        for mode, processes, expected in (("table", 2, 9), ("share", 2, 18)):
+            with self.subTest(mode=mode):
+                config = create_config([create_table("t1", 1), create_table("t2", 1), create_table("t3", 1)])
+                sender = FakeSdkSender()
+                batch_sender = BatchDataSender(sender)
+                shards = ShardedIngest("s1", config, load_driver_config(config).tables,
+                                       ShardSettings(processes, mode, None), batch_sender, create_flood_client)
+                shards.start(asyncio.get_running_loop())
+                self.assertEqual(2, len(shards.processes))
+
+                for _ in range(200):
+                    if shards.received >= expected:
+                        break
+                    await asyncio.sleep(0.05)
+                await shards.stop()
+
+                # 共享订阅时模拟的服务器向每个连接都发送了消息
+                self.assertEqual(expected, shards.received)
+                self.assertEqual(expected, len(sender.points))
+                self.assertEqual({"t1", "t2", "t3"}, {point.table for point in sender.points})
+
+
+if __name__ == '__main__':
+    unittest.main()
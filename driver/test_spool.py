@@ -0,0 +1,100 @@
+import os
+import tempfile
+import unittest
+
+from spool import EvictionPolicy, SegmentSpool
+
+
+def records(start: int, count: int) -> list[tuple[str, str, str]]:
+    return [("t1", "SN{}".format(i), '{{"value": {}}}'.format(i)) for i in range(start, start + count)]
+
+
+def read_all(spool: SegmentSpool) -> list[str]:
+    result = spool.read(1000)
+    if len(result) > 0:
+        spool.commit(result[-1][1], len(result))
+    return [record[1] for record, _ in result]
+
+
+class TestSegmentSpool(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = self.directory.name
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_append_and_read_segments(self):
+        spool = SegmentSpool(self.path, max_bytes=10000, segment_bytes=100)
+        spool.append(records(0, 10))
+        self.assertGreater(len(spool.segments), 1)
+        self.assertEqual(10, spool.pending)
+
+        result = spool.read(4)
+        self.assertEqual(["SN0", "SN1", "SN2", "SN3"], [record[1] for record, _ in result])
+        # 未提交时再次读取相同的记录
+        self.assertEqual(result, spool.read(4))
+
+        spool.commit(result[-1][1], 4)
+        self.assertEqual(["SN{}".format(i) for i in range(4, 10)], read_all(spool))
+        self.assertEqual(0, spool.pending)
+        # 已发送完成的分段被删除
+        self.assertEqual(1, len(spool.segments))
+        spool.close()
+
+    def test_recover(self):
+        spool = SegmentSpool(self.path, max_bytes=10000, segment_bytes=100)
+        spool.append(records(0, 10))
+        result = spool.read(3)
+        spool.commit(result[-1][1], 3)
+        spool.close()
+
+        spool = SegmentSpool(self.path, max_bytes=10000, segment_bytes=100)
+        self.assertEqual(7, spool.pending)
+        spool.append(records(10, 2))
+        self.assertEqual(["SN{}".format(i) for i in range(3, 12)], read_all(spool))
+        spool.close()
+
+    def test_drop_oldest(self):
+        spool = SegmentSpool(self.path, max_bytes=200, segment_bytes=100)
+        spool.append(records(0, 20))
+        self.assertLessEqual(spool.size, 200)
+        self.assertEqual(20, spool.pending + spool.evicted)
+        self.assertGreater(spool.evicted, 0)
+
+        # 保留最新的数据
+        self.assertEqual("SN19", read_all(spool)[-1])
+        spool.close()
+
+    def test_drop_newest(self):
+        spool = SegmentSpool(self.path, max_bytes=200, segment_bytes=100, policy=EvictionPolicy.DROP_NEWEST)
+        spool.append(records(0, 20))
+        self.assertLessEqual(spool.size, 200)
+        self.assertEqual("SN0", read_all(spool)[0])
+        self.assertEqual(20, spool.written + spool.evicted)
+        spool.close()
+
+    def test_skip_corrupted_record(self):
+        spool = SegmentSpool(self.path, max_bytes=10000, segment_bytes=10000)
+        spool.append(records(0, 3))
+        spool.close()
+
+        # 修改第二条记录的内容
+        segment = os.path.join(self.path, sorted(os.listdir(self.path))[0])
+        with open(segment, "r+b") as file:
+            data = bytearray(file.read())
+            index = data.index(b"SN1")
+            data[index + 2] = ord("X")
+            file.seek(0)
+            file.write(data)
+
+        spool = SegmentSpool(self.path, max_bytes=10000, segment_bytes=10000)
+        self.assertEqual(["SN0"], read_all(spool))
+        self.assertEqual(["SN2"], read_all(spool))
+        self.assertEqual(0, spool.pending)
+        spool.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+import unittest
+
+from config_loader import load_table
+from fakes import FakeDataSender
+from mqtt_driver import MqttSubscription
+from script_engine import ScriptEngine
+from tag_registry import TagRegistry
+
+
+def create_table(table_id: str) -> dict:
+    return {
+        "id": table_id,
+        "device": {
+            "settings": {"topic": "data/+", "extract": {"deviceIdPath": "id"},
+                         "parseScript": "function handler(topic, message) { return []; }"},
+            "tags": [{"id": "temp", "name": "temp", "key": "temp"}, {"id": "hum", "name": "hum", "key": "hum"}],
+        },
+        "devices": [
+            {"id": "SN1", "device": {"settings": {}, "tags": []}},
+            {"id": "SN2"},
+            {"id": "SN3", "device": {"settings": {}, "tags": [{"id": "temp", "name": "temp", "key": "t"}]}},
+            {"id": "SN4", "device": {"settings": {}, "tags": [{"id": "temp", "name": "temp", "key": "t"}]}},
+        ],
+    }
+
+
+class TestTagRegistry(unittest.TestCase):
+
+    def test_intern(self):
+        table = load_table(create_table("t1"))
+        table.merge_devices()
+        tags = table.device.tags
+
+        registry = TagRegistry()
+        a = registry.register("SN1", tags)
+        self.assertIs(a, registry.register("SN2", list(tags)))
+        self.assertIsNot(a, registry.register("SN3", tags[:1]))
+        self.assertEqual(2, len(registry.sets))
+        self.assertEqual(3, len(registry))
+
+        self.assertIs(tags[1], registry.resolve("SN2", "hum"))
+        self.assertIsNone(registry.resolve("SN3", "hum"))
+        self.assertIsNone(registry.resolve("SN4", "temp"))
+        self.assertIsNone(registry.get("SN4"))
+        with self.assertRaises(TypeError):
+            registry.get("SN1")["x"] = tags[0]
+
+        # 生成器只遍历一次
+        self.assertEqual(2, len(registry.intern(tag for tag in tags)))
+
+        registry.clear()
+        self.assertNotIn("SN1", registry)
+        self.assertEqual(0, len(registry.sets))
+
+    def test_intern_by_content(self):
+        table = load_table(create_table("t1"))
+        table.merge_devices()
+        sn3, sn4 = table.devices[2].device.tags, table.devices[3].device.tags
+        self.assertIsNot(sn3[0], sn4[0])
+
+        # 自定义数据点的设备配置相同时共享同一个集合, 使用第一次注册的数据点对象
+        registry = TagRegistry()
+        a = registry.register("SN3", sn3)
+        self.assertIs(a, registry.register("SN4", sn4))
+        self.assertIs(sn3[0], registry.resolve("SN4", "t"))
+        self.assertEqual(1, len(registry.sets))
+
+        # 内容不同时不共享
+        raw = create_table("t1")
+        raw["devices"][3]["device"]["tags"][0]["fixed"] = 2
+        table = load_table(raw)
+        table.merge_devices()
+        self.assertIsNot(a, registry.register("SN4", table.devices[3].device.tags))
+        self.assertEqual(2, len(registry.sets))
+
+    def test_subscription(self):
+        engine = ScriptEngine(cache_dir=None)
+        t1 = MqttSubscription(None, None, FakeDataSender(), load_table(create_table("t1")), engine)
+        t2 = MqttSubscription(None, None, FakeDataSender(), load_table(create_table("t2")), engine)
+
+        # 每个订阅持有自己的注册表
+        self.assertIsNot(t1.device_tags, t2.device_tags)
+        self.assertIs(t1.device_tags.get("SN1"), t1.device_tags.get("SN2"))
+        self.assertEqual(["t", "hum"], list(t1.device_tags.get("SN3")))
+        self.assertIs(t1.device_tags.get("SN3"), t1.device_tags.get("SN4"))
+
+        # 数据点相同的设备共享提取规则
+        devices = t1.extractor.devices
+        self.assertIs(devices["SN1"].keys, devices["SN2"].keys)
+        self.assertEqual("SN2", devices["SN2"].device_id)
+        self.assertIsNot(devices["SN1"].keys, devices["SN3"].keys)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+import unittest
+
+import airiot_python_sdk.driver.handler as handler_module
+from airiot_python_sdk.driver.handler.invalid_range_value_handler import InvalidRangeValueDataHandler
+from airiot_python_sdk.driver.handler.valid_range_value_handler import ValidRangeValueDataHandler
+from airiot_python_sdk.driver.model.tag import Tag, TagValue, Range, RangeCondition
+
+from tag_value_store import TagValueStore, install_tag_value_store
+
+
+class TestTagValueStore(unittest.IsolatedAsyncioTestCase):
+
+    async def test_set_and_get(self):
+        store = TagValueStore(shards=4)
+        await store.set_value("t1", "SN1", "a", 1.5)
+        await store.set_value("t1", "SN2", "b", 2)
+        await store.set_value("t1", "SN1", "a", 3.5)
+
+        self.assertEqual(3.5, await store.get_value("t1", "SN1", "a"))
+        self.assertEqual(3.5, await store.get("t1", "SN1", "a"))
+        self.assertIsNone(await store.get_value("t1", "SN1", "b"))
+        self.assertIsNone(await store.get_value("t2", "SN1", "a"))
+        self.assertEqual({"a": 3.5}, store.device_values("t1", "SN1"))
+        self.assertEqual(2, len(store))
+
+        # 同一工作表的设备共享数据点槽位
+        self.assertEqual(["a", "b"], store.layouts["t1"].tag_ids)
+
+    async def test_export_and_load(self):
+        store = TagValueStore()
+        store.put("t1", "SN1", "a", 1, 1000)
+        store.put("t1", "SN1", "b", "x", 2000)
+        store.put("t2", "SN9", "a", True, 3000)
+
+        records = sorted(store.export())
+        self.assertEqual([("t1", "SN1", "a", 1, 1000), ("t1", "SN1", "b", "x", 2000), ("t2", "SN9", "a", True, 3000)],
+                         records)
+        self.assertEqual({("t1", "SN1"): {"a": (1, 1000), "b": ("x", 2000)}, ("t2", "SN9"): {"a": (True, 3000)}},
+                         store.snapshot())
+
+        restored = TagValueStore(shards=2)
+        self.assertEqual(3, restored.load(records))
+        self.assertEqual(store.snapshot(), restored.snapshot())
+
+        self.assertEqual(1, store.remove_tables(["t1", "t3"]))
+        self.assertEqual({("t2", "SN9"): {"a": (True, 3000)}}, store.snapshot())
+        self.assertEqual(["t2"], list(store.layouts))
+
+        store.clear()
+        self.assertEqual(0, len(store))
+
+    async def test_install(self):
+        store = TagValueStore()
+        previous = install_tag_value_store(store)
+        try:
+            self.assertIs(store, handler_module.tag_value_cache)
+
+            conditions = [RangeCondition("number", "range", 0, 100, None, True, "overflow")]
+            valid = Tag("valid", "valid", TagValue(None, None, None, None),
+                        Range("valid", conditions, None, None, None, "latest", None), None, None)
+            invalid = Tag("invalid", "invalid", TagValue(None, None, None, None),
+                          Range("invalid", conditions, None, None, None, "latest", None), None, None)
+
+            # 使用最新有效值替换无效值
+            store.put("t1", "SN1", "valid", 50)
+            self.assertEqual({"valid": 50}, await ValidRangeValueDataHandler().handle("t1", "SN1", valid, 120))
+
+            store.put("t1", "SN1", "invalid", 150)
+            self.assertEqual({"invalid": 150, "invalid__invalid__type": "overflow"},
+                             await InvalidRangeValueDataHandler().handle("t1", "SN1", invalid, 10))
+        finally:
+            install_tag_value_store(previous)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+import unittest
+
+from paho.mqtt.client import topic_matches_sub
+
+from topic_trie import TopicTrie, minimal_filters, filter_covers
+
+filters = ["+/telemetry/#", "a/telemetry/#", "a/+/x", "a/b/x", "#", "a/#", "a", "$SYS/#", "+/+", "a/b/c/d"]
+
+topics = ["a", "a/b", "a/telemetry", "a/telemetry/x", "b/telemetry/1/2", "a/b/x", "a/c/x", "a/b/c/d", "$SYS/a",
+          "$SYS", "/a", "a/", "x/y/z"]
+
+
+class TestTopicTrie(unittest.TestCase):
+
+    def test_match_same_as_paho(self):
+        trie = TopicTrie()
+        for topic_filter in filters:
+            trie.insert(topic_filter, topic_filter)
+
+        for topic in topics:
+            expected = sorted(topic_filter for topic_filter in filters if topic_matches_sub(topic_filter, topic))
+            self.assertEqual(expected, sorted(trie.match(topic)), topic)
+
+    def test_same_value_once(self):
+        trie = TopicTrie()
+        value = object()
+        trie.insert("a/#", value)
+        trie.insert("a/+", value)
+        self.assertEqual([value], trie.match("a/b"))
+
+    def test_remove(self):
+        trie = TopicTrie()
+        trie.insert("a/+/c", 1)
+        trie.insert("a/#", 2)
+        self.assertEqual(2, len(trie))
+
+        self.assertTrue(trie.remove("a/+/c", 1))
+        self.assertFalse(trie.remove("a/+/c", 1))
+        self.assertEqual([2], trie.match("a/b/c"))
+        self.assertNotIn("+", trie.root.children["a"].children)
+
+        self.assertTrue(trie.remove("a/#", 2))
+        self.assertEqual(0, len(trie.root.children))
+
+    def test_invalid_filter(self):
+        trie = TopicTrie()
+        for topic_filter in ["", "a/#/b", "a/b#", "a+/b"]:
+            with self.assertRaises(ValueError):
+                trie.insert(topic_filter, 1)
+
+    def test_minimal_filters(self):
+        self.assertEqual(["+/telemetry/#", "a/+/x"],
+                         minimal_filters(["+/telemetry/#", "a/telemetry/#", "a/+/x", "a/b/x", "a/+/x", None]))
+        self.assertEqual(["#", "$SYS/#"], minimal_filters(filters))
+
+        self.assertTrue(filter_covers("a/#", "a"))
+        self.assertTrue(filter_covers("+/+", "a/+"))
+        self.assertFalse(filter_covers("a/+", "a/#"))
+        self.assertFalse(filter_covers("+/x", "$SYS/x"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,108 @@
+import json
+import math
+import tempfile
+import unittest
+from datetime import datetime, timedelta, timezone
+
+import jsons
+
+from airiot_python_sdk.driver.config import MqttConfig
+from airiot_python_sdk.driver.handler import DataHandlerChain
+from airiot_python_sdk.driver.model.point import FieldType, SimplePoint
+from airiot_python_sdk.driver.model.warning import (Table, TableData, WarningData, WarningField, WarningRecovery,
+                                                    WarningRecoveryData)
+from airiot_python_sdk.driver.service.mqtt_data_sender import MQTTDataSender
+
+from batch_sender import BatchDataSender
+from fakes import FakePublishClient
+from spool import SegmentSpool
+from uplink_codec import (MsgpackPointEncoder, PointEncoder, create_point_encoder, dumps_point, dumps_recovery,
+                          dumps_warning, msgpack)
+
+
+def create_points() -> list[SimplePoint]:
+    sent = SimplePoint("t1", "SN1", {"a": 1, "b": 2.5, "c": "温度", "d": True, "e": None, "f": [1, 2.0],
+                                     "g": math.nan, "h": b"\x01\x02"}, None, 1000, {"a": FieldType.Int})
+    sent.source = "device"
+    return [
+        sent,
+        SimplePoint("t1", "SN2", {"a": 1}, "c1", None, {}),
+        SimplePoint("t1", "SN3", {"time": datetime(2024, 1, 1, tzinfo=timezone.utc)}, None, 1, {}),
+    ]
+
+
+class TestUplinkCodec(unittest.TestCase):
+
+    def test_same_as_jsons(self):
+        for point in create_points():
+            self.assertEqual(jsons.dumps(point), dumps_point(point))
+
+        for time in (datetime(2024, 1, 1, 1, 2, 3, 456789, tzinfo=timezone.utc),
+                     datetime(2024, 1, 1, tzinfo=timezone(timedelta(hours=8)))):
+            warning = WarningData("w1", Table("t1"), TableData("SN1"), "高", "r1", [WarningField("a", 1, "A")],
+                                  ["超限"], "未处理", "未确认", time, True, True, "温度过高")
+            self.assertEqual(jsons.dumps(warning), dumps_warning(warning))
+
+            recovery = WarningRecovery(["w1"], WarningRecoveryData(time, [WarningField("a", 1)]))
+            self.assertEqual(jsons.dumps(recovery), dumps_recovery(recovery))
+
+    def test_field_types_none(self):
+        point = SimplePoint("t1", "SN1", {"a": 1})
+        self.assertEqual({"cid": None, "fieldTypes": None, "fields": {"a": 1}, "id": "SN1", "table": "t1",
+                          "time": None}, json.loads(dumps_point(point)))
+
+    def test_create_encoder(self):
+        self.assertIsInstance(create_point_encoder(None), PointEncoder)
+        self.assertIsInstance(create_point_encoder("json"), PointEncoder)
+        with self.assertRaises(ValueError):
+            create_point_encoder("xml")
+
+    @unittest.skipIf(msgpack is None, "msgpack is not installed")
+    def test_msgpack(self):
+        encoder = create_point_encoder("msgpack")
+        self.assertIsInstance(encoder, MsgpackPointEncoder)
+
+        point = create_points()[0]
+        expected = json.loads(dumps_point(point))
+        expected["fields"]["h"] = b"\x01\x02"
+        actual = msgpack.unpackb(encoder.encode(point), raw=False)
+        self.assertTrue(math.isnan(actual["fields"].pop("g")))
+        expected["fields"].pop("g")
+        self.assertEqual(expected, actual)
+
+        point = create_points()[1]
+        self.assertEqual(encoder.encode(point), encoder.from_json(dumps_point(point)))
+
+
+@unittest.skipIf(msgpack is None, "msgpack is not installed")
+class TestBatchSenderEncoder(unittest.IsolatedAsyncioTestCase):
+
+    async def test_spool_keeps_json(self):
+        sender = MQTTDataSender("p1", "d1", "driver", "s1", MqttConfig(), DataHandlerChain([]))
+        sender.client = FakePublishClient()
+        encoder = MsgpackPointEncoder()
+
+        with tempfile.TemporaryDirectory() as path:
+            spool = SegmentSpool(path, max_bytes=1024 * 1024, segment_bytes=64 * 1024)
+            batch = BatchDataSender(sender, spool=spool, encoder=encoder)
+
+            point = SimplePoint("t1", "SN1", {"a": 1}, None, 1000, {})
+            batch.publish([point])
+            self.assertEqual(encoder.encode(point), sender.client.messages[0][1])
+
+            sender.client.connected = False
+            batch.publish([SimplePoint("t1", "SN2", {"a": 2}, None, 1000, {})])
+            self.assertEqual("SN2", json.loads(spool.read(1)[0][0][2])["id"])
+
+            sender.client.connected = True
+            self.assertEqual(1, batch.replay(10))
+            self.assertEqual({"a": 2}, msgpack.unpackb(sender.client.messages[1][1])["fields"])
+            await batch.stop()
+
+    def test_generic_sender_uses_json(self):
+        batch = BatchDataSender(object(), encoder=MsgpackPointEncoder())
+        self.assertEqual(type(batch.encoder), PointEncoder)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,157 @@
+import asyncio
+import json
+import threading
+import unittest
+from datetime import datetime, timezone
+
+from airiot_python_sdk.driver.config import MqttConfig
+from airiot_python_sdk.driver.handler import DataHandlerChain
+from airiot_python_sdk.driver.model.warning import (Table, TableData, WarningData, WarningRecovery,
+                                                    WarningRecoveryData)
+from airiot_python_sdk.driver.service.mqtt_data_sender import MQTTDataSender
+from paho.mqtt import client as mqtt_client
+
+from warning_sender import WarningSender
+
+
+class FakeMqttClient:
+    """
+    模拟 MQTT 客户端. ack 为 True 时在网络线程中确认消息, 为 False 时不确认
+    """
+
+    def __init__(self, ack: bool = True):
+        self.ack = ack
+        self.connected = True
+        self.messages = []
+        self.mid = 0
+
+    def is_connected(self) -> bool:
+        return self.connected
+
+    def publish(self, topic: str, payload: str = None, qos: int = 0) -> mqtt_client.MQTTMessageInfo:
+        self.mid += 1
+        info = mqtt_client.MQTTMessageInfo(self.mid)
+        if not self.connected:
+            info.rc = mqtt_client.MQTT_ERR_NO_CONN
+            return info
+
+        self.messages.append((topic, payload, qos))
+        if self.ack:
+            threading.Timer(0.01, info._set_as_published).start()
+        return info
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def create_warning(device_id: str, rule_id: str) -> WarningData:
+    return WarningData("w-{}-{}".format(device_id, rule_id), Table("t1"), TableData(device_id), "高", rule_id, [],
+                       ["超限"], "未处理", "未确认",
+                       datetime(2024, 1, 1, tzinfo=timezone.utc), True, True, "温度过高")
+
+
+class TestWarningSender(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.sender = MQTTDataSender("p1", "d1", "driver", "s1", MqttConfig(), DataHandlerChain([]))
+        self.sender.client = FakeMqttClient()
+
+    async def test_send_in_background(self):
+        warnings = WarningSender(self.sender, batch_size=2)
+        warnings.start()
+
+        self.assertTrue(warnings.send_warning(create_warning("SN1", "r1")))
+        self.assertTrue(warnings.send_warning(create_warning("SN2", "r1")))
+        recovery = WarningRecovery(["w-SN1-r1"], WarningRecoveryData(None, []))
+        self.assertTrue(warnings.send_warning_recovery("t1", "SN1", recovery))
+        # 放入队列后立即返回
+        self.assertEqual(0, len(self.sender.client.messages))
+
+        await warnings.stop()
+
+        topics = [topic for topic, _, _ in self.sender.client.messages]
+        self.assertEqual(["warningStorage/p1/t1/SN1", "warningStorage/p1/t1/SN2", "warningUpdate/p1/t1/SN1"], topics)
+        self.assertEqual(1, self.sender.client.messages[0][2])
+        self.assertEqual("r1", json.loads(self.sender.client.messages[0][1])["ruleid"])
+        self.assertEqual({"queued": 3, "pending": 0, "deduplicated": 0, "dropped": 0, "acked": 3, "failed": 0},
+                         warnings.stats())
+
+    async def test_deduplicate(self):
+        clock = FakeClock()
+        warnings = WarningSender(self.sender, dedup_window=10, clock=clock)
+
+        self.assertTrue(warnings.send_warning(create_warning("SN1", "r1")))
+        self.assertFalse(warnings.send_warning(create_warning("SN1", "r1")))
+        self.assertTrue(warnings.send_warning(create_warning("SN1", "r2")))
+        self.assertTrue(warnings.send_warning(create_warning("SN2", "r1")))
+        clock.now = 10
+        self.assertTrue(warnings.send_warning(create_warning("SN1", "r1")))
+        self.assertEqual(1, warnings.deduplicated)
+
+        clock.now = 15
+        warnings.__prune__()
+        self.assertEqual([("warning", "t1", "SN1", "r1")], list(warnings.recent))
+
+    async def test_queue_full(self):
+        warnings = WarningSender(self.sender, queue_size=2)
+        for i in range(5):
+            warnings.send_warning(create_warning("SN{}".format(i), "r1"))
+        self.assertEqual(2, len(warnings.queue))
+        self.assertEqual(3, warnings.dropped)
+
+    async def test_dropped_not_deduplicated(self):
+        warnings = WarningSender(self.sender, queue_size=1, dedup_window=10, clock=FakeClock())
+        self.assertTrue(warnings.send_warning(create_warning("SN1", "r1")))
+        self.assertFalse(warnings.send_warning(create_warning("SN2", "r1")))
+        self.assertEqual([("warning", "t1", "SN1", "r1")], list(warnings.recent))
+
+        # 因队列已满被丢弃的报警再次产生时放入队列
+        warnings.queue.clear()
+        self.assertTrue(warnings.send_warning(create_warning("SN2", "r1")))
+        self.assertEqual((1, 0), (warnings.dropped, warnings.deduplicated))
+
+    async def test_ack_timeout(self):
+        self.sender.client = FakeMqttClient(ack=False)
+        warnings = WarningSender(self.sender, timeout=0.05)
+        warnings.send_warning(create_warning("SN1", "r1"))
+        warnings.send_warning(create_warning("SN2", "r1"))
+
+        self.assertEqual(0, await warnings.flush())
+        self.assertEqual(2, warnings.failed)
+
+    async def test_keep_when_disconnected(self):
+        self.sender.client.connected = False
+        warnings = WarningSender(self.sender)
+        warnings.send_warning(create_warning("SN1", "r1"))
+        warnings.send_warning(create_warning("SN2", "r1"))
+
+        self.assertEqual(0, await warnings.flush())
+        self.assertEqual(2, len(warnings.queue))
+
+        self.sender.client.connected = True
+        self.assertEqual(2, await warnings.flush())
+        self.assertEqual(0, len(warnings.queue))
+
+    async def test_storm_does_not_block(self):
+        warnings = WarningSender(self.sender, dedup_window=60)
+        warnings.start()
+
+        loop = asyncio.get_running_loop()
+        begin = loop.time()
+        for i in range(5000):
+            warnings.send_warning(create_warning("SN{}".format(i % 100), "r{}".format(i % 3)))
+        self.assertLess(loop.time() - begin, 1)
+
+        await warnings.stop()
+        self.assertEqual(300, warnings.acked)
+        self.assertEqual(4700, warnings.deduplicated)
+
+
+if __name__ == '__main__':
+    unittest.main()
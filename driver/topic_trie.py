@@ -0,0 +1,190 @@
+from typing import Generic, Iterable, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+class TopicNode(Generic[T]):
+    """
+    主题树节点
+
+    Attributes:
+        children: 子节点. key 为主题层级, 包括通配符 +
+        values: 主题过滤器在该节点结束的订阅
+        multi: 以 # 结束的主题过滤器的订阅, 匹配该节点及其所有子层级
+    """
+
+    __slots__ = ("children", "values", "multi")
+
+    def __init__(self):
+        self.children: dict[str, TopicNode[T]] = {}
+        self.values: list[T] = []
+        self.multi: list[T] = []
+
+    def empty(self) -> bool:
+        return len(self.children) == 0 and len(self.values) == 0 and len(self.multi) == 0
+
+
+def validate_filter(topic_filter: str):
+    """
+    检查 MQTT 主题过滤器是否正确
+    :param topic_filter: 主题过滤器
+    """
+    if topic_filter is None or len(topic_filter) == 0:
+        raise ValueError("主题过滤器不能为空")
+
+    levels = topic_filter.split("/")
+    for i, level in enumerate(levels):
+        if "#" in level and (level != "#" or i != len(levels) - 1):
+            raise ValueError("主题过滤器 '{}' 中的 # 必须单独作为最后一个层级".format(topic_filter))
+        if "+" in level and level != "+":
+            raise ValueError("主题过滤器 '{}' 中的 + 必须单独作为一个层级".format(topic_filter))
+
+
+class TopicTrie(Generic[T]):
+    """
+    MQTT 主题树. 按主题层级保存主题过滤器及其订阅, 匹配主题的时间只与主题层级数量有关, 与订阅数量无关.
+
+    匹配规则与 MQTT 协议相同:
+        + 匹配一个层级, # 匹配当前层级及其所有子层级(包括父层级本身, 例如 a/# 匹配 a).
+        以 $ 开头的主题不匹配第一个层级为通配符的过滤器.
+    """
+
+    root: TopicNode[T]
+
+    def __init__(self):
+        self.root = TopicNode()
+        self.size = 0
+
+    def __len__(self) -> int:
+        return self.size
+
+    def insert(self, topic_filter: str, value: T):
+        """
+        添加订阅
+        :param topic_filter: 主题过滤器
+        :param value: 订阅
+        """
+        validate_filter(topic_filter)
+
+        node = self.root
+        for level in topic_filter.split("/"):
+            if level == "#":
+                node.multi.append(value)
+                self.size += 1
+                return
+
+            child = node.children.get(level)
+            if child is None:
+                child = node.children[level] = TopicNode()
+            node = child
+
+        node.values.append(value)
+        self.size += 1
+
+    def remove(self, topic_filter: str, value: T) -> bool:
+        """
+        删除订阅
+        :param topic_filter: 主题过滤器
+        :param value: 订阅
+        :return: 如果订阅存在并被删除则返回 True
+        """
+        path = [self.root]
+        levels = topic_filter.split("/")
+        for level in levels:
+            if level == "#":
+                break
+            child = path[-1].children.get(level)
+            if child is None:
+                return False
+            path.append(child)
+
+        node = path[-1]
+        values = node.multi if levels[-1] == "#" else node.values
+        if value not in values:
+            return False
+        values.remove(value)
+        self.size -= 1
+
+        # 删除空节点
+        for i in range(len(path) - 1, 0, -1):
+            if not path[i].empty():
+                break
+            del path[i - 1].children[levels[i - 1]]
+
+        return True
+
+    def match(self, topic: str) -> list[T]:
+        """
+        获取与主题匹配的所有订阅. 同一个订阅只返回一次
+        :param topic: 消息主题
+        :return: 匹配的订阅
+        """
+        levels = topic.split("/")
+        result = []
+        self.__match__(self.root, levels, 0, topic.startswith("$"), result)
+
+        if len(result) > 1:
+            unique = []
+            for value in result:
+                if not any(value is item for item in unique):
+                    unique.append(value)
+            return unique
+        return result
+
+    def __match__(self, node: TopicNode[T], levels: list[str], index: int, system: bool, result: list[T]):
+        wildcard = not (system and index == 0)
+
+        if wildcard:
+            result.extend(node.multi)
+
+        if index == len(levels):
+            result.extend(node.values)
+            return
+
+        child = node.children.get(levels[index])
+        if child is not None:
+            self.__match__(child, levels, index + 1, system, result)
+
+        if wildcard:
+            child = node.children.get("+")
+            if child is not None:
+                self.__match__(child, levels, index + 1, system, result)
+
+
+def filter_covers(general: str, specific: str) -> bool:
+    """
+    判断主题过滤器 general 匹配的主题是否包含 specific 匹配的所有主题
+    """
+    general_levels = general.split("/")
+    specific_levels = specific.split("/")
+
+    for i, level in enumerate(general_levels):
+        if level == "#":
+            # 以 $ 开头的主题不匹配第一个层级为通配符的过滤器
+            return not (i == 0 and specific.startswith("$"))
+        if i >= len(specific_levels):
+            return False
+
+        other = specific_levels[i]
+        if level == "+":
+            if other == "#" or (i == 0 and other.startswith("$")):
+                return False
+        elif level != other:
+            return False
+
+    return len(general_levels) == len(specific_levels)
+
+
+def minimal_filters(topic_filters: Iterable[Optional[str]]) -> list[str]:
+    """
+    合并主题过滤器, 去掉被其它过滤器包含的过滤器, 得到需要向 MQTT 服务器订阅的最少的主题过滤器
+    :param topic_filters: 主题过滤器
+    :return: 需要订阅的主题过滤器, 保持原有顺序
+    """
+    unique = []
+    for topic_filter in topic_filters:
+        if topic_filter is not None and topic_filter not in unique:
+            unique.append(topic_filter)
+
+    return [topic_filter for topic_filter in unique
+            if not any(other != topic_filter and filter_covers(other, topic_filter) for other in unique)]
@@ -0,0 +1,181 @@
+"""
+上行数据编码.
+
+SDK 使用 jsons.dumps 编码发送到平台的数据, jsons 每次都通过反射遍历对象的属性, 编码一个数据点需要数十微秒.
+该模块按 SimplePoint、WarningData 及 WarningRecovery 的结构直接生成字典后使用 json(C 实现) 编码, 结果与 jsons.dumps 相同:
+键按字母顺序排列, 枚举值使用名称, datetime 等其它类型的值仍然交给 jsons 转换.
+
+注: SimplePoint.fieldTypes 为 None 时 jsons 只输出 cid(jsons 的缺陷), 这里输出 "fieldTypes": null.
+
+数据点可以使用以下格式发送, 在驱动实例配置的 uplink.format 中选择:
+
+- json: JSON(默认)
+- msgpack: MessagePack, 结构与 JSON 相同, 数据点名称等字符串不再转义, 消息更小. 需要平台支持并安装 msgpack
+
+报警及报警恢复信息总是使用 JSON 格式. 数据缓冲中保存的是 JSON 格式, 重新发送时转换为配置的格式.
+"""
+import json
+from datetime import datetime
+from enum import Enum
+from typing import Optional
+
+import jsons
+
+from airiot_python_sdk.driver.model.point import SimplePoint
+from airiot_python_sdk.driver.model.warning import WarningData, WarningField, WarningRecovery
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+JSON = "json"
+MSGPACK = "msgpack"
+
+
+def _default(value: any) -> any:
+    """
+    转换 json 不支持的值, 与 jsons 相同
+    """
+    if isinstance(value, Enum):
+        return value.name
+    return jsons.dump(value)
+
+
+_json_encoder = json.JSONEncoder(default=_default)
+
+_missing = object()
+
+
+def point_to_dict(point: SimplePoint) -> dict[str, any]:
+    """
+    将 SimplePoint 转换为字典. 键的顺序与 jsons 相同
+    """
+    field_types = point.fieldTypes
+    if field_types:
+        field_types = {key: kind.name if isinstance(kind, Enum) else kind for key, kind in field_types.items()}
+
+    result = {
+        "cid": point.cid,
+        "fieldTypes": field_types,
+        "fields": point.fields,
+        "id": point.id,
+    }
+    # source 只在发送时设置
+    source = getattr(point, "source", _missing)
+    if source is not _missing:
+        result["source"] = source
+    result["table"] = point.table
+    result["time"] = point.time
+    return result
+
+
+def _field_to_dict(field: WarningField) -> dict[str, any]:
+    return {"id": field.id, "name": field.name, "value": field.value}
+
+
+def _time(value: any) -> any:
+    return jsons.dump(value) if isinstance(value, datetime) else value
+
+
+def warning_to_dict(warning: WarningData) -> dict[str, any]:
+    """
+    将 WarningData 转换为字典. 键的顺序与 jsons 相同
+    """
+    return {
+        "alert": warning.alert,
+        "desc": warning.desc,
+        "fields": None if warning.fields is None else [_field_to_dict(field) for field in warning.fields],
+        "handle": warning.handle,
+        "id": warning.id,
+        "level": warning.level,
+        "processed": warning.processed,
+        "ruleid": warning.ruleid,
+        "status": warning.status,
+        "table": {"id": warning.table.id},
+        "tableData": {"id": warning.tableData.id},
+        "time": _time(warning.time),
+        "type": warning.type,
+    }
+
+
+def recovery_to_dict(recovery: WarningRecovery) -> dict[str, any]:
+    """
+    将 WarningRecovery 转换为字典. 键的顺序与 jsons 相同
+    """
+    data = recovery.data
+    return {
+        "data": None if data is None else {
+            "recoveryFields": None if data.recoveryFields is None
+            else [_field_to_dict(field) for field in data.recoveryFields],
+            "recoveryTime": _time(data.recoveryTime),
+        },
+        "id": recovery.id,
+    }
+
+
+def dumps_point(point: SimplePoint) -> str:
+    return _json_encoder.encode(point_to_dict(point))
+
+
+def dumps_warning(warning: WarningData) -> str:
+    return _json_encoder.encode(warning_to_dict(warning))
+
+
+def dumps_recovery(recovery: WarningRecovery) -> str:
+    return _json_encoder.encode(recovery_to_dict(recovery))
+
+
+class PointEncoder:
+    """
+    数据点编码器. 默认为 JSON 格式
+
+    Attributes:
+        format: 编码格式
+    """
+
+    format: str = JSON
+
+    def encode(self, point: SimplePoint) -> str | bytes:
+        """
+        按配置的格式编码数据点
+        """
+        return dumps_point(point)
+
+    def from_json(self, payload: str) -> str | bytes:
+        """
+        将数据缓冲中的 JSON 数据转换为配置的格式
+        """
+        return payload
+
+
+class MsgpackPointEncoder(PointEncoder):
+    """
+    MessagePack 格式的数据点编码器
+    """
+
+    format: str = MSGPACK
+
+    def __init__(self):
+        if msgpack is None:
+            raise ValueError("使用 MessagePack 格式需要安装 msgpack")
+        self.packer = msgpack.Packer(default=_default, use_bin_type=True)
+
+    def encode(self, point: SimplePoint) -> bytes:
+        return self.packer.pack(point_to_dict(point))
+
+    def from_json(self, payload: str) -> bytes:
+        return self.packer.pack(json.loads(payload))
+
+
+def create_point_encoder(format: Optional[str]) -> PointEncoder:
+    """
+    创建数据点编码器
+    :param format: 编码格式. json(默认) 或 msgpack
+    :raise ValueError: 不支持的格式
+    """
+    if format is None or format == JSON:
+        return PointEncoder()
+    if format == MSGPACK:
+        return MsgpackPointEncoder()
+    raise ValueError("不支持的上行数据格式: {}".format(format))
@@ -0,0 +1,267 @@
+"""
+报警发送队列.
+
+SDK 的 MQTTDataSender 发送每条报警后同步等待最多 5 秒, 报警集中产生时调用方被长时间阻塞.
+WarningSender 将报警及报警恢复信息放入队列后立即返回, 由后台任务批量发送: 每批消息先全部发布, 再统一等待服务器确认.
+与平台的连接断开时报警保留在队列中, 连接恢复后继续发送.
+
+配置了去重窗口时, 窗口内同一设备同一报警规则(报警恢复按报警 ID)的重复报警只发送第一条, 报警风暴时大部分报警在入队时被丢弃.
+"""
+import asyncio
+import collections
+import logging
+import time
+import traceback
+from typing import Callable, Optional
+
+from paho.mqtt import client as mqtt_client
+
+from airiot_python_sdk.driver import DataSender
+from airiot_python_sdk.driver.model.warning import WarningData, WarningRecovery
+from airiot_python_sdk.driver.service.kafka_data_sender import KafkaDataSender
+from airiot_python_sdk.driver.service.mqtt_data_sender import MQTTDataSender
+from uplink_codec import dumps_recovery, dumps_warning
+
+logger = logging.getLogger("warning_sender")
+
+# 队列中的报警: (去重 key, 报警或报警恢复信息)
+WarningItem = tuple[tuple, any]
+
+
+class WarningSender:
+    """
+    报警发送队列. 只在驱动事件循环中使用
+
+    Attributes:
+        sender: SDK 的数据发送器
+        queue_size: 队列大小
+        batch_size: 每批发送的最大数量
+        dedup_window: 去重窗口(秒). 0 表示不去重
+        qos: 报警消息的服务质量(MQTT)
+        timeout: 等待服务器确认的最长时间(秒)
+        queued: 进入队列的报警数量
+        deduplicated: 被去重丢弃的报警数量
+        dropped: 队列已满时丢弃的报警数量
+        acked: 发送成功的报警数量. Kafka 发送器为写入发送队列的数量
+        failed: 发送失败或等待确认超时的报警数量
+    """
+
+    sender: DataSender
+    queue_size: int
+    batch_size: int
+    dedup_window: float
+    qos: int
+    timeout: float
+
+    queued: int = 0
+    deduplicated: int = 0
+    dropped: int = 0
+    acked: int = 0
+    failed: int = 0
+
+    def __init__(self, sender: DataSender, queue_size: int = 10000, batch_size: int = 500, dedup_window: float = 0,
+                 qos: int = 1, timeout: float = 5, clock: Callable[[], float] = time.monotonic):
+        if queue_size <= 0 or batch_size <= 0:
+            raise ValueError("queue_size and batch_size must be greater than 0")
+
+        self.sender = sender
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.dedup_window = dedup_window
+        self.qos = qos
+        self.timeout = timeout
+        self.clock = clock
+
+        self.queue: collections.deque[WarningItem] = collections.deque()
+        # 去重窗口内已接收的报警. key 为去重 key, value 为接收时间
+        self.recent: dict[tuple, float] = {}
+        self.wakeup = asyncio.Event()
+        self.flush_task: Optional[asyncio.Task] = None
+
+    def start(self):
+        """
+        启动后台发送任务. 必须在驱动事件循环中调用
+        """
+        if self.flush_task is None:
+            self.flush_task = asyncio.get_running_loop().create_task(self.__flush_loop__())
+
+    async def stop(self):
+        """
+        停止后台发送任务, 并发送队列中的报警. 未连接时队列中的报警被丢弃
+        """
+        if self.flush_task is not None:
+            self.flush_task.cancel()
+            await asyncio.gather(self.flush_task, return_exceptions=True)
+            self.flush_task = None
+
+        await self.flush()
+        if len(self.queue) > 0:
+            logger.error("报警发送队列停止时仍有 %d 条报警未发送", len(self.queue))
+            self.queue.clear()
+
+    def send_warning(self, warning: WarningData) -> bool:
+        """
+        发送报警信息. 放入队列后立即返回
+        :param warning: 报警信息
+        :return: 是否放入队列. 重复的报警或队列已满时返回 False
+        """
+        return self.__put__(("warning", warning.table.id, warning.tableData.id, warning.ruleid), warning)
+
+    def send_warning_recovery(self, table_id: str, device_id: str, recovery: WarningRecovery) -> bool:
+        """
+        发送报警恢复信息. 放入队列后立即返回
+        :param table_id: 报警设备所属工作表标识
+        :param device_id: 报警设备编号
+        :param recovery: 报警恢复信息
+        :return: 是否放入队列. 重复的报警恢复或队列已满时返回 False
+        """
+        return self.__put__(("recovery", table_id, device_id, tuple(recovery.id)), recovery)
+
+    def __put__(self, key: tuple, item: any) -> bool:
+        now = None
+        if self.dedup_window > 0:
+            now = self.clock()
+            received = self.recent.get(key)
+            if received is not None and now - received < self.dedup_window:
+                self.deduplicated += 1
+                return False
+
+        if len(self.queue) >= self.queue_size:
+            self.dropped += 1
+            # 只记录部分日志, 避免报警风暴时大量输出
+            if self.dropped & (self.dropped - 1) == 0:
+                logger.warning("报警发送队列已满, 累计丢弃: %d", self.dropped)
+            return False
+
+        # 放入队列后才记录, 因队列已满被丢弃的报警再次产生时不作为重复报警
+        if now is not None:
+            self.recent[key] = now
+        self.queue.append((key, item))
+        self.queued += 1
+        self.wakeup.set()
+        return True
+
+    def connected(self) -> bool:
+        sender = self.sender
+        if isinstance(sender, MQTTDataSender):
+            return sender.client is not None and sender.client.is_connected()
+        if isinstance(sender, KafkaDataSender):
+            return sender.client is not None
+        return True
+
+    async def flush(self) -> int:
+        """
+        按批发送队列中的报警, 直到队列为空或连接断开
+        :return: 发送成功的数量
+        """
+        acked = 0
+        while len(self.queue) > 0 and self.connected():
+            batch = [self.queue.popleft() for _ in range(min(self.batch_size, len(self.queue)))]
+            acked += await self.__send_batch__(batch)
+        return acked
+
+    async def __send_batch__(self, batch: list[WarningItem]) -> int:
+        sender = self.sender
+        if isinstance(sender, MQTTDataSender):
+            pending = []
+            for index, (key, item) in enumerate(batch):
+                try:
+                    payload = dumps_warning(item) if key[0] == "warning" else dumps_recovery(item)
+                    info = sender.client.publish(self.__topic__(key), payload=payload, qos=self.qos)
+                except Exception as e:
+                    logger.error("发布报警失败: %s, %s", key, e)
+                    self.failed += 1
+                    continue
+
+                if info.rc == mqtt_client.MQTT_ERR_NO_CONN:
+                    # 连接已断开, 剩余的报警放回队列
+                    self.queue.extendleft(reversed(batch[index:]))
+                    break
+                if info.rc != mqtt_client.MQTT_ERR_SUCCESS:
+                    logger.error("发布报警失败: %s, %s", key, mqtt_client.error_string(info.rc))
+                    self.failed += 1
+                    continue
+                pending.append(info)
+
+            acked = await self.__wait_published__(pending)
+            self.acked += acked
+            self.failed += len(pending) - acked
+            if acked < len(pending):
+                logger.error("报警发送等待确认超时, 数量: %d", len(pending) - acked)
+            return acked
+
+        acked = 0
+        for key, item in batch:
+            try:
+                if isinstance(sender, KafkaDataSender):
+                    # 写入 producer 的发送队列, 不阻塞
+                    self.__send__(key, item)
+                else:
+                    await asyncio.get_running_loop().run_in_executor(None, self.__send__, key, item)
+                acked += 1
+            except Exception as e:
+                logger.error("发送报警失败: %s, %s", key, e)
+                self.failed += 1
+        self.acked += acked
+        return acked
+
+    def __send__(self, key: tuple, item: any):
+        if key[0] == "warning":
+            self.sender.send_warning(item)
+        else:
+            self.sender.send_warning_recovery(key[1], key[2], item)
+
+    def __topic__(self, key: tuple) -> str:
+        kind = "warningStorage" if key[0] == "warning" else "warningUpdate"
+        return "{}/{}/{}/{}".format(kind, self.sender.project_id, key[1], key[2])
+
+    async def __wait_published__(self, pending: list[mqtt_client.MQTTMessageInfo]) -> int:
+        """
+        等待所有消息被服务器确认(QoS 0 为写入网络)
+        :return: 在超时时间内确认的数量
+        """
+        total = len(pending)
+        deadline = time.monotonic() + self.timeout
+        interval = 0.001
+        while True:
+            pending = [info for info in pending if not info.is_published()]
+            if len(pending) == 0 or time.monotonic() >= deadline:
+                return total - len(pending)
+            # 确认在 MQTT 网络线程中完成, 逐步增加检查间隔
+            await asyncio.sleep(interval)
+            interval = min(interval * 2, 0.05)
+
+    def __prune__(self):
+        """
+        清除超出去重窗口的记录
+        """
+        if self.dedup_window <= 0 or len(self.recent) == 0:
+            return
+        expired = self.clock() - self.dedup_window
+        self.recent = {key: received for key, received in self.recent.items() if received > expired}
+
+    async def __flush_loop__(self):
+        while True:
+            await self.wakeup.wait()
+            self.wakeup.clear()
+            try:
+                await self.flush()
+                self.__prune__()
+            except Exception as e:
+                traceback.print_exception(e)
+                logger.error("发送报警异常: %s", e)
+
+            if len(self.queue) > 0:
+                # 未连接时等待后重试
+                await asyncio.sleep(1)
+                self.wakeup.set()
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "queued": self.queued,
+            "pending": len(self.queue),
+            "deduplicated": self.deduplicated,
+            "dropped": self.dropped,
+            "acked": self.acked,
+            "failed": self.failed,
+        }
@@ -0,0 +1,179 @@
+"""
+流程脚本的批量执行.
+
+流程对大量记录逐条调用插件时, 每条记录都需要单独解析配置、查询编译缓存并执行脚本. 脚本可以额外定义
+execute_batch(inputs_list), 参数为输入参数列表, 返回与之一一对应的执行结果列表. BatchGatherer 将短时间内收到的
+同一项目、同一脚本的任务合并为一批, 只占用一个并发位置并调用一次 execute_batch, 再将结果分别返回给各个任务.
+"""
+import asyncio
+import functools
+import logging
+import re
+from typing import Optional
+
+from flow_plugin.budget import BudgetExceeded
+from flow_plugin.executor import ScriptExecutor
+
+logger = logging.getLogger("python-script-plugin")
+
+# 只检查脚本中顶层定义的 execute_batch 函数. 未匹配的脚本逐个执行, 误匹配的脚本在执行时逐个调用 execute
+batch_pattern = re.compile(r"^def\s+execute_batch\s*\(", re.MULTILINE)
+
+
+@functools.lru_cache(maxsize=1024)
+def supports_batch(script: str) -> bool:
+    """
+    脚本是否定义了 execute_batch
+    :param script: 脚本内容
+    """
+    return batch_pattern.search(script) is not None
+
+
+class PendingBatch:
+    """
+    等待执行的一批任务
+
+    Attributes:
+        script: 脚本内容
+        inputs: 各任务的输入参数
+        futures: 各任务的执行结果
+        timer: 等待时间结束后执行该批任务
+    """
+
+    script: str
+    inputs: list[dict]
+    futures: list[asyncio.Future]
+    timer: Optional[asyncio.TimerHandle]
+
+    def __init__(self, script: str):
+        self.script = script
+        self.inputs = []
+        self.futures = []
+        self.timer = None
+
+
+class BatchGatherer:
+    """
+    合并同一脚本的任务. 只在事件循环中使用
+
+    第一个任务到达后等待 window 秒, 期间收到的同一项目、同一脚本的任务合并为一批执行; 达到 max_size 时立即执行.
+    一批任务中某个任务的等待被取消时, 该任务仍然执行, 只是不再返回结果. 一批任务超出资源限制时, 拆分为单个任务
+    重新执行, 只有超出限制的任务失败
+
+    Attributes:
+        executor: 脚本执行后端
+        window: 合并任务的等待时间(秒)
+        max_size: 每批最多合并的任务数量
+        batches: 已执行的批次数量
+        items: 已执行的任务数量
+        splits: 超出资源限制后拆分执行的批次数量
+    """
+
+    executor: ScriptExecutor
+    window: float
+    max_size: int
+
+    batches: int = 0
+    items: int = 0
+    splits: int = 0
+
+    def __init__(self, executor: ScriptExecutor, window: float = 0.005, max_size: int = 1000):
+        if max_size <= 0:
+            raise ValueError("max_size must be greater than 0")
+        self.executor = executor
+        self.window = window
+        self.max_size = max_size
+        # 等待执行的任务. key 为 (项目ID, 脚本签名)
+        self.pending: dict[tuple[str, str], PendingBatch] = {}
+        # 正在执行的批次, 保持引用避免任务被回收
+        self.tasks: set[asyncio.Task] = set()
+
+    async def submit(self, project_id: str, inputs: dict, script: str, signature: str) -> dict:
+        """
+        执行脚本. 与同一脚本的其它任务合并执行
+        :param project_id: 项目ID
+        :param inputs: 输入参数
+        :param script: 脚本内容
+        :param signature: 脚本签名
+        :return: 脚本的执行结果
+        :raise Exception: 脚本执行失败
+        """
+        loop = asyncio.get_running_loop()
+        key = (project_id, signature)
+        batch = self.pending.get(key)
+        if batch is None:
+            batch = self.pending[key] = PendingBatch(script)
+            batch.timer = loop.call_later(self.window, self.__flush__, key)
+
+        future = loop.create_future()
+        batch.inputs.append(inputs)
+        batch.futures.append(future)
+        if len(batch.inputs) >= self.max_size:
+            batch.timer.cancel()
+            self.__flush__(key)
+
+        success, result = await future
+        if not success:
+            raise Exception(result)
+        return result
+
+    def __flush__(self, key: tuple[str, str]):
+        batch = self.pending.pop(key, None)
+        if batch is None:
+            return
+        task = asyncio.get_running_loop().create_task(self.__run__(key[0], key[1], batch))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def __run__(self, project_id: str, signature: str, batch: PendingBatch):
+        self.batches += 1
+        self.items += len(batch.inputs)
+        try:
+            results = await self.executor.submit_batch(project_id, batch.inputs, batch.script, signature)
+        except asyncio.CancelledError:
+            for future in batch.futures:
+                future.cancel()
+            raise
+        except BudgetExceeded as e:
+            if len(batch.inputs) == 1:
+                if not batch.futures[0].done():
+                    batch.futures[0].set_exception(e)
+                return
+            # 不能确定是哪个任务超出限制, 逐个重新执行
+            logger.warning("batch: budget exceeded, project = %s, size = %d, %s, 拆分为单个任务执行",
+                           project_id, len(batch.inputs), e)
+            self.splits += 1
+            await asyncio.gather(*[self.__retry__(project_id, signature, batch.script, inputs, future)
+                                   for inputs, future in zip(batch.inputs, batch.futures)])
+            return
+        except Exception as e:
+            # 子进程异常退出时同一批的任务都失败
+            for future in batch.futures:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for future, result in zip(batch.futures, results):
+            if not future.done():
+                future.set_result(result)
+
+    async def __retry__(self, project_id: str, signature: str, script: str, inputs: dict, future: asyncio.Future):
+        try:
+            result = await self.executor.submit(project_id, inputs, script, signature)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            if not future.done():
+                future.set_exception(e)
+            return
+        if not future.done():
+            future.set_result((True, result))
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "pending": sum(len(batch.inputs) for batch in self.pending.values()),
+            "batches": self.batches,
+            "items": self.items,
+            "splits": self.splits,
+        }
@@ -0,0 +1,68 @@
+"""
+流程脚本批量执行性能对比: 同一脚本的大量任务分别逐个执行及按 1/10/100/1000 合并为一批执行, 输出每秒完成的任务数量.
+
+运行方式(项目根目录下): python -m flow_plugin.bench_batch [任务数量] [执行方式]
+"""
+import asyncio
+import json
+import logging
+import sys
+import time
+
+from airiot_python_sdk.flow_plugin import FlowTask
+
+from flow_plugin.executor import create_executor
+from flow_plugin.python_script_plugin import PythonScriptPlugin
+from flow_plugin.script_cache import create_cache
+
+script = """
+def convert(inputs):
+    return {"id": inputs["id"], "value": round(inputs["value"] * 1.8 + 32, 2)}
+
+def execute(inputs):
+    return convert(inputs)
+
+def execute_batch(inputs_list):
+    return [convert(inputs) for inputs in inputs_list]
+"""
+
+
+def create_task(index: int) -> FlowTask:
+    config = json.dumps({"input": {"id": "SN{}".format(index), "value": index % 100}, "content": script})
+    return FlowTask("project1", "flow1", "job{}".format(index), "element1", "elementJob{}".format(index),
+                    config.encode("utf-8"))
+
+
+async def bench(name: str, mode: str, count: int, batch_window: float, batch_size: int):
+    plugin = PythonScriptPlugin(create_cache(), create_executor({"mode": mode}), batch_window=batch_window,
+                                batch_size=batch_size)
+    plugin.start()
+    try:
+        tasks = [create_task(i) for i in range(count)]
+        # 预热: 编译脚本并解析节点配置
+        await asyncio.gather(*[plugin.execute(task) for task in tasks[:10]])
+
+        start = time.perf_counter()
+        await asyncio.gather(*[plugin.execute(task) for task in tasks])
+        elapsed = time.perf_counter() - start
+        print("{:<12} 耗时: {:6.3f} s, 每秒任务数: {:10.1f}".format(name, elapsed, count / elapsed))
+    finally:
+        plugin.stop()
+
+
+async def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    mode = sys.argv[2] if len(sys.argv) > 2 else "thread"
+
+    # SDK 默认输出 DEBUG 日志, 只保留警告
+    logging.getLogger().setLevel(logging.WARNING)
+    logging.getLogger("python-script-plugin").setLevel(logging.WARNING)
+
+    print("任务数量: {}, 执行方式: {}".format(count, mode))
+    await bench("逐个执行", mode, count, 0, 1)
+    for size in (1, 10, 100, 1000):
+        await bench("batch={}".format(size), mode, count, 0.005, size)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,72 @@
+"""
+已编译脚本磁盘缓存的效果: 对比冷启动(没有磁盘缓存)与热启动(从磁盘缓存预加载)后每个脚本第一次执行的耗时.
+
+运行方式(项目根目录下): python -m flow_plugin.bench_bytecode_cache [脚本数量] [每个脚本的函数数量]
+"""
+import logging
+import sys
+import tempfile
+import time
+from typing import Optional
+
+from flow_plugin.python_script_plugin import PythonScriptPlugin
+from flow_plugin.script_cache import BytecodeStore, create_cache
+
+
+def create_script(index: int, functions: int) -> str:
+    lines = ["# script {}".format(index)]
+    for i in range(functions):
+        lines.append("def step{}(value):".format(i))
+        lines.append("    result = {'index': %d, 'value': value}" % i)
+        lines.append("    for key in ('a', 'b', 'c'):")
+        lines.append("        result[key] = [value * j for j in range(10) if j % 2 == 0]")
+        lines.append("    return result")
+    lines.append("def execute(inputs):")
+    lines.append("    return step0(inputs['value'])")
+    return "\n".join(lines)
+
+
+def first_execution(scripts: list[str], store: Optional[BytecodeStore]) -> tuple[float, float]:
+    """
+    启动插件并执行每个脚本一次
+    :return: (启动耗时, 第一次执行的平均耗时), 单位毫秒
+    """
+    plugin = PythonScriptPlugin(create_cache(), store=store)
+    begin = time.perf_counter()
+    plugin.start()
+    started = time.perf_counter() - begin
+
+    begin = time.perf_counter()
+    for script in scripts:
+        plugin._execute("p1", {"value": 1}, script)
+    elapsed = time.perf_counter() - begin
+    plugin.stop()
+    return started * 1000, elapsed * 1000 / len(scripts)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    functions = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+
+    logging.getLogger().setLevel(logging.WARNING)
+    logging.getLogger("python-script-plugin").setLevel(logging.WARNING)
+
+    scripts = [create_script(i, functions) for i in range(count)]
+    print("脚本数量: {}, 每个脚本 {} 行".format(count, scripts[0].count("\n") + 1))
+
+    with tempfile.TemporaryDirectory() as path:
+        started, latency = first_execution(scripts, None)
+        print("{:<24} 启动耗时: {:8.1f} ms, 第一次执行: {:7.2f} ms".format("冷启动(无磁盘缓存)", started, latency))
+
+        started, latency = first_execution(scripts, BytecodeStore(path, warm_size=0))
+        print("{:<24} 启动耗时: {:8.1f} ms, 第一次执行: {:7.2f} ms".format("冷启动(写入磁盘缓存)", started, latency))
+
+        started, latency = first_execution(scripts, BytecodeStore(path, warm_size=0))
+        print("{:<24} 启动耗时: {:8.1f} ms, 第一次执行: {:7.2f} ms".format("磁盘缓存(不预加载)", started, latency))
+
+        started, latency = first_execution(scripts, BytecodeStore(path, warm_size=count))
+        print("{:<24} 启动耗时: {:8.1f} ms, 第一次执行: {:7.2f} ms".format("热启动(预加载)", started, latency))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+流程脚本执行后端性能对比: 分别使用 inline、thread 及 process 方式并发执行计算密集及等待 IO 的脚本, 输出每秒完成的任务数量.
+
+运行方式(项目根目录下): python -m flow_plugin.bench_executor [任务数量] [线程或子进程数量]
+"""
+import asyncio
+import json
+import logging
+import sys
+import time
+
+from airiot_python_sdk.flow_plugin import FlowTask
+
+from flow_plugin.executor import InlineExecutor, ProcessExecutor, ScriptExecutor, ThreadExecutor
+from flow_plugin.python_script_plugin import PythonScriptPlugin
+from flow_plugin.script_cache import create_cache
+
+cpu_script = """
+def execute(inputs):
+    total = 0
+    for i in range(inputs["n"]):
+        total += i * i
+    return {"total": total}
+"""
+
+io_script = """
+import time
+
+def execute(inputs):
+    time.sleep(inputs["delay"])
+    return {"ok": True}
+"""
+
+
+def create_task(index: int, script: str, inputs: dict) -> FlowTask:
+    config = json.dumps({"input": inputs, "content": script}).encode("utf-8")
+    return FlowTask("project{}".format(index % 4), "flow1", "job{}".format(index), "element1",
+                    "elementJob{}".format(index), config)
+
+
+async def run(plugin: PythonScriptPlugin, tasks: list[FlowTask]) -> float:
+    start = time.perf_counter()
+    await asyncio.gather(*[plugin.execute(task) for task in tasks])
+    return time.perf_counter() - start
+
+
+async def bench(name: str, executor: ScriptExecutor, count: int):
+    plugin = PythonScriptPlugin(create_cache(), executor)
+    plugin.start()
+    try:
+        for label, script, inputs in (("计算密集", cpu_script, {"n": 200000}), ("等待 IO", io_script, {"delay": 0.02})):
+            # 预热: 启动子进程并编译脚本
+            await run(plugin, [create_task(i, script, inputs) for i in range(8)])
+            elapsed = await run(plugin, [create_task(i, script, inputs) for i in range(count)])
+            print("{:<8} {:<8} 耗时: {:6.2f} s, 每秒任务数: {:8.1f}".format(name, label, elapsed, count / elapsed))
+    finally:
+        plugin.stop()
+
+
+async def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 64
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+
+    # SDK 默认输出 DEBUG 日志, 只保留警告
+    logging.getLogger().setLevel(logging.WARNING)
+    logging.getLogger("python-script-plugin").setLevel(logging.WARNING)
+
+    print("任务数量: {}, 线程或子进程数量: {}".format(count, workers))
+    await bench("inline", InlineExecutor(), count)
+    await bench("thread", ThreadExecutor(workers), count)
+    await bench("process", ProcessExecutor(workers), count)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
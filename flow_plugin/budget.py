@@ -0,0 +1,136 @@
+"""
+流程脚本的资源限制.
+
+死循环或占用大量内存的脚本会一直占用执行位置, 流程任务也一直等待结果. 使用 process 方式执行时, 可以限制每个任务的
+CPU 时间、内存及执行时间, 在配置文件的 executor.budget 中设置, 并可以按项目覆盖:
+
+- cpu-time: CPU 时间上限(秒). 子进程使用 RLIMIT_CPU 限制, 超过时中断脚本
+- memory: 内存上限(MB), 即执行期间新增的虚拟内存. 子进程使用 RLIMIT_AS 限制, 超过时脚本申请内存失败
+- timeout: 执行时间上限(秒). 超过时终止子进程并启动新的子进程, 用于脚本等待 IO 或在 C 扩展中无法中断的情况
+
+超出限制的任务返回 BudgetExceeded, 不影响其它任务. 批量执行的一批任务超出限制时, 拆分为单个任务重新执行,
+只有超出限制的任务失败.
+"""
+import json
+from typing import Optional
+
+CPU_TIME = "cpu-time"
+MEMORY = "memory"
+TIMEOUT = "timeout"
+# 批量执行时 CPU 时间及执行时间上限最多放大的倍数. 超出限制的批次拆分为单个任务重新执行
+MAX_BATCH_SCALE = 10
+
+
+class Budget:
+    """
+    单个任务的资源限制. 值为 0 时不限制
+
+    Attributes:
+        cpu_time: CPU 时间上限(秒)
+        memory: 内存上限(MB)
+        timeout: 执行时间上限(秒). 为 0 且限制了 CPU 时间时, 为 CPU 时间上限的 2 倍加 1 秒
+    """
+
+    cpu_time: float
+    memory: int
+    timeout: float
+
+    def __init__(self, cpu_time: float = 0, memory: int = 0, timeout: float = 0):
+        self.cpu_time = cpu_time
+        self.memory = memory
+        self.timeout = timeout
+
+    def merge(self, config: Optional[dict]) -> "Budget":
+        """
+        使用配置中设置的值覆盖当前的限制
+        :param config: cpu-time, memory 及 timeout 配置
+        :return: 新的限制
+        """
+        config = config or {}
+        return Budget(config.get(CPU_TIME, self.cpu_time), config.get(MEMORY, self.memory),
+                      config.get(TIMEOUT, self.timeout))
+
+    def scale(self, size: int) -> "Budget":
+        """
+        批量执行时的限制. CPU 时间及执行时间上限按任务数量放大, 最多放大 MAX_BATCH_SCALE 倍, 内存上限不变
+        :param size: 任务数量
+        :return: 新的限制
+        """
+        scale = max(1, min(size, MAX_BATCH_SCALE))
+        return Budget(self.cpu_time * scale, self.memory, self.timeout * scale)
+
+    def deadline(self) -> float:
+        """
+        执行时间上限(秒). 为 0 时不限制
+        """
+        if self.timeout > 0:
+            return self.timeout
+        return self.cpu_time * 2 + 1 if self.cpu_time > 0 else 0
+
+    def limit(self, kind: str) -> float:
+        if kind == CPU_TIME:
+            return self.cpu_time
+        if kind == MEMORY:
+            return self.memory
+        return self.deadline()
+
+
+class BudgetPolicy:
+    """
+    全局及各项目的资源限制
+
+    Attributes:
+        default: 未单独设置的项目使用的限制
+        projects: 各项目的限制. key 为项目ID
+    """
+
+    default: Budget
+    projects: dict[str, Budget]
+
+    def __init__(self, default: Budget, projects: Optional[dict[str, Budget]] = None):
+        self.default = default
+        self.projects = projects or {}
+
+    def get(self, project_id: str) -> Budget:
+        return self.projects.get(project_id, self.default)
+
+
+class BudgetExceeded(Exception):
+    """
+    任务超出资源限制
+
+    Attributes:
+        kind: 超出的限制. cpu-time, memory 或 timeout
+        limit: 限制的值
+        project_id: 任务所属项目ID
+    """
+
+    kind: str
+    limit: float
+    project_id: str
+
+    def __init__(self, kind: str, limit: float, project_id: str):
+        super().__init__("超出资源限制, {} = {}".format(kind, limit))
+        self.kind = kind
+        self.limit = limit
+        self.project_id = project_id
+
+    def detail(self) -> str:
+        """
+        JSON 格式的详细信息, 用于返回给流程引擎
+        """
+        return json.dumps({"error": "budgetExceeded", "kind": self.kind, "limit": self.limit,
+                           "projectId": self.project_id})
+
+
+def load_budget_policy(config: Optional[dict]) -> Optional[BudgetPolicy]:
+    """
+    根据配置文件中的 executor.budget 配置创建资源限制
+    :param config: budget 配置. projects 中为各项目的限制, 未设置的值使用全局限制
+    :return: 资源限制. 未配置时返回 None
+    """
+    if not config:
+        return None
+    default = Budget().merge(config)
+    projects = {project_id: default.merge(project) for project_id, project in (config.get("projects") or {}).items()}
+    return BudgetPolicy(default, projects)
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# 流程插件在项目根目录下运行(python -m flow_plugin.main), 模块间使用 from flow_plugin.xxx import ... 的方式导入
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
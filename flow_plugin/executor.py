@@ -0,0 +1,585 @@
+"""
+流程脚本执行后端.
+
+SDK 的 FlowPluginLauncher 依次等待每个请求执行完成, 脚本又直接在事件循环中执行, 一个耗时的脚本会阻塞所有流程任务.
+脚本可以使用以下方式执行, 在配置文件的 executor.mode 中选择:
+
+- inline(默认): 在事件循环中逐个执行(原有方式). 只适合执行很快的脚本
+- thread: 在线程池中执行. 适合等待 IO 的脚本, 计算密集的脚本仍然受 GIL 限制
+- process: 在常驻的子进程中执行. 每个子进程缓存已编译的脚本, 计算密集的脚本可以并行执行, 并可以限制资源(见 budget)
+
+同时执行的任务数量受 concurrency 限制, 达到上限时按项目轮流执行等待中的任务, 一个项目的大量任务不会使其它项目的任务一直等待.
+"""
+import asyncio
+import collections
+import concurrent.futures
+import logging
+import math
+import multiprocessing
+import os
+import pickle
+import signal
+from abc import ABC, abstractmethod
+from multiprocessing.connection import Connection
+from multiprocessing.context import BaseContext
+from multiprocessing.process import BaseProcess
+from typing import Callable, Optional
+
+import yaml
+
+from flow_plugin.budget import CPU_TIME, MEMORY, TIMEOUT, Budget, BudgetExceeded, BudgetPolicy, load_budget_policy
+from flow_plugin.script_cache import BytecodeStore, create_cache
+
+try:
+    import resource
+except ImportError:
+    # Windows 不支持 resource, 只限制执行时间
+    resource = None
+
+logger = logging.getLogger("script-executor")
+
+INLINE = "inline"
+THREAD = "thread"
+PROCESS = "process"
+
+# 执行脚本的方法. 参数为 (项目ID, 输入参数, 脚本内容, 脚本签名), 返回脚本的执行结果
+ExecuteFunction = Callable[[str, dict, str, Optional[str]], dict]
+# 批量执行脚本的方法. 参数为 (项目ID, 输入参数列表, 脚本内容, 脚本签名),
+# 返回与输入参数一一对应的 (是否成功, 执行结果或错误信息) 列表
+BatchExecuteFunction = Callable[[str, list[dict], str, Optional[str]], list[tuple[bool, any]]]
+
+
+class FairLimiter:
+    """
+    按项目公平分配的并发限制. 只在事件循环中使用
+
+    达到并发上限时, 等待中的任务按项目排队, 有任务完成时按项目轮流唤醒
+
+    Attributes:
+        limit: 最大并发数量
+        running: 正在执行的任务数量
+    """
+
+    limit: int
+    running: int = 0
+
+    def __init__(self, limit: int):
+        if limit <= 0:
+            raise ValueError("limit must be greater than 0")
+        self.limit = limit
+        # 各项目等待中的任务. 按轮到的顺序排列
+        self.waiting: collections.OrderedDict[str, collections.deque[asyncio.Future]] = collections.OrderedDict()
+
+    @property
+    def pending(self) -> int:
+        """
+        等待执行的任务数量
+        """
+        return sum(len(queue) for queue in self.waiting.values())
+
+    async def acquire(self, project_id: str):
+        """
+        等待可以执行任务
+        :param project_id: 任务所属项目ID
+        """
+        if self.running < self.limit and len(self.waiting) == 0:
+            self.running += 1
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        queue = self.waiting.get(project_id)
+        if queue is None:
+            queue = self.waiting[project_id] = collections.deque()
+        queue.append(future)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # 已经分配到执行位置, 交给下一个任务
+                self.release()
+            else:
+                # release 可能已经取出了被取消的任务
+                if future in queue:
+                    queue.remove(future)
+                if len(queue) == 0 and self.waiting.get(project_id) is queue:
+                    del self.waiting[project_id]
+            raise
+
+    def release(self):
+        """
+        任务执行完成. 将执行位置交给下一个项目的任务
+        """
+        while len(self.waiting) > 0:
+            project_id, queue = next(iter(self.waiting.items()))
+            future = queue.popleft()
+            # 该项目还有等待中的任务时排到最后
+            del self.waiting[project_id]
+            if len(queue) > 0:
+                self.waiting[project_id] = queue
+            if not future.done():
+                future.set_result(None)
+                return
+        self.running -= 1
+
+
+class ScriptExecutor(ABC):
+    """
+    脚本执行后端
+
+    Attributes:
+        limiter: 并发限制
+        executed: 执行成功的任务数量
+        failed: 执行失败的任务数量
+    """
+
+    mode: str
+    limiter: FairLimiter
+
+    executed: int = 0
+    failed: int = 0
+
+    def __init__(self, concurrency: int):
+        self.limiter = FairLimiter(concurrency)
+
+    def start(self, execute: ExecuteFunction, execute_batch: Optional[BatchExecuteFunction] = None):
+        """
+        启动执行后端
+        :param execute: 在当前进程中执行脚本的方法
+        :param execute_batch: 在当前进程中批量执行脚本的方法
+        """
+        pass
+
+    def stop(self):
+        """
+        停止执行后端. 不再等待正在执行的脚本
+        """
+        pass
+
+    async def submit(self, project_id: str, inputs: dict, script: str, signature: Optional[str] = None) -> dict:
+        """
+        执行脚本. 达到并发上限时等待
+        :param project_id: 项目ID
+        :param inputs: 输入参数
+        :param script: 脚本内容
+        :param signature: 脚本签名. 为 None 时由编译缓存计算
+        :return: 脚本的执行结果
+        """
+        return await self.__submit__(project_id, inputs, script, signature, False)
+
+    async def submit_batch(self, project_id: str, inputs: list[dict], script: str,
+                           signature: Optional[str] = None) -> list[tuple[bool, any]]:
+        """
+        批量执行脚本, 占用一个并发位置. 达到并发上限时等待
+        :param project_id: 项目ID
+        :param inputs: 输入参数列表
+        :param script: 脚本内容
+        :param signature: 脚本签名. 为 None 时由编译缓存计算
+        :return: 与输入参数一一对应的 (是否成功, 执行结果或错误信息)
+        """
+        return await self.__submit__(project_id, inputs, script, signature, True)
+
+    async def __submit__(self, project_id: str, inputs: any, script: str, signature: Optional[str],
+                         batch: bool) -> any:
+        await self.limiter.acquire(project_id)
+        try:
+            result = await self.run(project_id, inputs, script, signature, batch)
+            self.executed += 1
+            return result
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            self.limiter.release()
+
+    @abstractmethod
+    async def run(self, project_id: str, inputs: any, script: str, signature: Optional[str], batch: bool) -> any:
+        pass
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "running": self.limiter.running,
+            "pending": self.limiter.pending,
+            "executed": self.executed,
+            "failed": self.failed,
+        }
+
+
+class InlineExecutor(ScriptExecutor):
+    """
+    在事件循环中执行脚本
+    """
+
+    mode: str = INLINE
+
+    def __init__(self, concurrency: int = 1):
+        super().__init__(concurrency)
+        self.execute = None
+        self.execute_batch = None
+
+    def start(self, execute: ExecuteFunction, execute_batch: Optional[BatchExecuteFunction] = None):
+        self.execute = execute
+        self.execute_batch = execute_batch
+
+    async def run(self, project_id: str, inputs: any, script: str, signature: Optional[str], batch: bool) -> any:
+        return (self.execute_batch if batch else self.execute)(project_id, inputs, script, signature)
+
+
+class ThreadExecutor(ScriptExecutor):
+    """
+    在线程池中执行脚本
+
+    Attributes:
+        workers: 线程数量
+    """
+
+    mode: str = THREAD
+    workers: int
+
+    def __init__(self, workers: int = 4, concurrency: Optional[int] = None):
+        super().__init__(workers if concurrency is None else concurrency)
+        self.workers = workers
+        self.execute = None
+        self.execute_batch = None
+        self.pool: Optional[concurrent.futures.ThreadPoolExecutor] = None
+
+    def start(self, execute: ExecuteFunction, execute_batch: Optional[BatchExecuteFunction] = None):
+        self.execute = execute
+        self.execute_batch = execute_batch
+        if self.pool is None:
+            self.pool = concurrent.futures.ThreadPoolExecutor(max_workers=self.workers,
+                                                              thread_name_prefix="python-script")
+
+    def stop(self):
+        if self.pool is not None:
+            self.pool.shutdown(wait=False, cancel_futures=True)
+            self.pool = None
+
+    async def run(self, project_id: str, inputs: any, script: str, signature: Optional[str], batch: bool) -> any:
+        return await asyncio.get_running_loop().run_in_executor(self.pool,
+                                                                self.execute_batch if batch else self.execute,
+                                                                project_id, inputs, script, signature)
+
+
+# 子进程中执行脚本的插件. 由 _init_worker 创建, 缓存该进程中已编译的脚本
+_worker_plugin = None
+
+# 子进程返回结果的状态. 超出资源限制时为 budget 中的 cpu-time, memory 或 timeout
+OK = "ok"
+ERROR = "error"
+
+
+class _CpuTimeExceeded(BaseException):
+    """
+    脚本超出 CPU 时间上限. 不继承 Exception, 不会被脚本中的 except Exception 捕获
+    """
+    pass
+
+
+def _on_cpu_time_exceeded(signum, frame):
+    raise _CpuTimeExceeded()
+
+
+def _init_worker(cache_size: int, cache_policy: str, cache_ttl: int, log_level: int, store: Optional[BytecodeStore]):
+    global _worker_plugin
+
+    from flow_plugin.python_script_plugin import PythonScriptPlugin
+
+    # 子进程与主进程中的插件使用相同的日志等级
+    logging.getLogger().setLevel(log_level)
+    _worker_plugin = PythonScriptPlugin(create_cache(cache_size, cache_policy, cache_ttl), store=store)
+    _worker_plugin.warm()
+
+
+def _run_in_worker(project_id: str, inputs: dict, script: str, signature: Optional[str]) -> dict:
+    return _worker_plugin._execute(project_id, inputs, script, signature)
+
+
+def _run_batch_in_worker(project_id: str, inputs: list[dict], script: str,
+                         signature: Optional[str]) -> list[tuple[bool, any]]:
+    return _worker_plugin._execute_batch(project_id, inputs, script, signature)
+
+
+def _memory_size() -> Optional[int]:
+    """
+    当前进程的虚拟内存大小(字节). 不是 Linux 系统时返回 None
+    """
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[0]) * resource.getpagesize()
+    except OSError:
+        return None
+
+
+def _set_limits(cpu_time: float, memory: int):
+    """
+    设置子进程的软限制. 硬限制降低后无法恢复, 只修改软限制. 值为 0 时恢复为硬限制
+    :param cpu_time: 本次执行的 CPU 时间上限(秒). RLIMIT_CPU 的精度为 1 秒
+    :param memory: 本次执行新增的虚拟内存上限(MB)
+    """
+    if resource is None:
+        return
+
+    _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+    soft = hard
+    if cpu_time > 0:
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        soft = math.ceil(usage.ru_utime + usage.ru_stime + cpu_time)
+        soft = soft if hard == resource.RLIM_INFINITY else min(soft, hard)
+    resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+
+    _, hard = resource.getrlimit(resource.RLIMIT_AS)
+    soft = hard
+    size = _memory_size() if memory > 0 else None
+    if size is not None:
+        soft = size + memory * 1024 * 1024
+        soft = soft if hard == resource.RLIM_INFINITY else min(soft, hard)
+    resource.setrlimit(resource.RLIMIT_AS, (soft, hard))
+
+
+def _worker_main(conn: Connection, cache_size: int, cache_policy: str, cache_ttl: int, log_level: int,
+                 store: Optional[BytecodeStore]):
+    """
+    子进程的主循环. 依次读取任务并返回 (状态, 执行结果或错误信息), 主进程关闭连接后退出
+    """
+    _init_worker(cache_size, cache_policy, cache_ttl, log_level, store)
+    if resource is not None:
+        # 超过 CPU 时间软限制后每秒收到一次 SIGXCPU, 在脚本中抛出异常
+        signal.signal(signal.SIGXCPU, _on_cpu_time_exceeded)
+
+    while True:
+        try:
+            batch, project_id, inputs, script, signature, cpu_time, memory = conn.recv()
+        except EOFError:
+            return
+
+        try:
+            try:
+                _set_limits(cpu_time, memory)
+                if batch:
+                    reply = (OK, _run_batch_in_worker(project_id, inputs, script, signature))
+                else:
+                    reply = (OK, _run_in_worker(project_id, inputs, script, signature))
+            finally:
+                _set_limits(0, 0)
+        except _CpuTimeExceeded:
+            reply = (CPU_TIME, None)
+        except MemoryError:
+            reply = (MEMORY if memory > 0 else ERROR, "内存不足")
+        except Exception as e:
+            reply = (ERROR, str(e))
+
+        try:
+            conn.send(reply)
+        except (pickle.PicklingError, TypeError, AttributeError) as e:
+            conn.send((ERROR, "执行结果无法序列化, {}".format(e)))
+
+
+class ScriptWorker:
+    """
+    执行脚本的子进程. 同一时间只执行一个任务
+
+    Attributes:
+        process: 子进程
+        conn: 与子进程通信的连接
+    """
+
+    process: BaseProcess
+    conn: Connection
+
+    def __init__(self, context: BaseContext, args: tuple):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_worker_main, args=(child_conn, *args), name="python-script-worker",
+                                       daemon=True)
+        self.process.start()
+        child_conn.close()
+
+    def call(self, message: tuple, timeout: float) -> tuple[str, any]:
+        """
+        发送任务并等待结果. 在线程中调用
+        :param message: 任务
+        :param timeout: 等待结果的时间(秒). 为 0 时一直等待
+        :return: (状态, 执行结果或错误信息). 超时时状态为 timeout
+        :raise EOFError: 子进程已退出
+        """
+        self.conn.send(message)
+        if not self.conn.poll(timeout if timeout > 0 else None):
+            return TIMEOUT, None
+        return self.conn.recv()
+
+    def kill(self):
+        """
+        终止子进程. 正在等待结果的线程随即收到 EOFError
+        """
+        self.process.kill()
+        self.process.join(1)
+
+
+class ProcessExecutor(ScriptExecutor):
+    """
+    在常驻的子进程中执行脚本. 子进程使用 spawn 方式启动, 每个子进程独立缓存已编译的脚本.
+    输入参数及执行结果需要可以被 pickle 序列化. 脚本中的全局变量只在所在的子进程中有效
+
+    每个子进程同时只执行一个任务, 可以按项目限制任务的 CPU 时间、内存及执行时间. 任务超过执行时间(watchdog)、
+    被取消或子进程异常退出时终止该子进程并启动新的子进程, 其它子进程上的任务不受影响; 空闲的子进程在分配任务前检查是否存活
+
+    Attributes:
+        workers: 子进程数量
+        cache_size: 每个子进程缓存的已编译脚本数量
+        store: 已编译脚本的磁盘缓存, 子进程启动时从中预加载脚本. 为 None 时不使用
+        budgets: 资源限制. 为 None 时不限制
+        restarts: 重新启动子进程的次数
+        exceeded: 各类资源限制被超出的次数
+    """
+
+    mode: str = PROCESS
+    workers: int
+    cache_size: int
+    store: Optional[BytecodeStore]
+    budgets: Optional[BudgetPolicy]
+
+    restarts: int = 0
+    exceeded: dict[str, int]
+
+    def __init__(self, workers: int = 0, concurrency: Optional[int] = None, cache_size: int = 1000,
+                 cache_policy: str = "lru", cache_ttl: int = 3600, store: Optional[BytecodeStore] = None,
+                 budgets: Optional[BudgetPolicy] = None):
+        workers = workers if workers > 0 else os.cpu_count() or 1
+        super().__init__(workers if concurrency is None else concurrency)
+        self.workers = workers
+        self.cache_size = cache_size
+        self.cache_policy = cache_policy
+        self.cache_ttl = cache_ttl
+        self.store = store
+        self.budgets = budgets
+        self.exceeded = {CPU_TIME: 0, MEMORY: 0, TIMEOUT: 0}
+        # gRPC 的线程在 fork 后不可用, 使用 spawn 启动子进程
+        self.context = multiprocessing.get_context("spawn")
+        # 空闲的子进程
+        self.idle: Optional[asyncio.Queue[ScriptWorker]] = None
+        # 所有子进程, 包括正在执行任务的子进程
+        self.processes: set[ScriptWorker] = set()
+        # 等待子进程返回结果的线程
+        self.threads: Optional[concurrent.futures.ThreadPoolExecutor] = None
+
+    def start(self, execute: ExecuteFunction, execute_batch: Optional[BatchExecuteFunction] = None):
+        if self.threads is not None:
+            return
+        self.threads = concurrent.futures.ThreadPoolExecutor(max_workers=self.workers,
+                                                             thread_name_prefix="python-script-worker")
+        self.idle = asyncio.Queue()
+        # 提前启动所有子进程, 避免第一批任务等待进程启动
+        for _ in range(self.workers):
+            self.idle.put_nowait(self.__spawn__())
+
+    def __spawn__(self) -> ScriptWorker:
+        log_level = logging.getLogger("python-script-plugin").getEffectiveLevel()
+        worker = ScriptWorker(self.context, (self.cache_size, self.cache_policy, self.cache_ttl, log_level, self.store))
+        self.processes.add(worker)
+        return worker
+
+    def __replace__(self, worker: ScriptWorker):
+        """
+        终止子进程并启动新的子进程, 保持子进程数量不变
+        """
+        worker.kill()
+        self.processes.discard(worker)
+        self.restarts += 1
+        self.idle.put_nowait(self.__spawn__())
+
+    async def __checkout__(self) -> ScriptWorker:
+        """
+        获取空闲的子进程. 空闲时退出的子进程(例如被系统终止)在此替换
+        """
+        while True:
+            worker = await self.idle.get()
+            if worker.process.is_alive():
+                return worker
+            logger.error("执行脚本的子进程已退出, exitcode = %s, 重新启动", worker.process.exitcode)
+            self.__replace__(worker)
+
+    def stop(self):
+        for worker in self.processes:
+            worker.process.terminate()
+        self.processes.clear()
+        if self.threads is not None:
+            self.threads.shutdown(wait=False, cancel_futures=True)
+            self.threads = None
+
+    async def run(self, project_id: str, inputs: any, script: str, signature: Optional[str], batch: bool) -> any:
+        budget = Budget() if self.budgets is None else self.budgets.get(project_id)
+        if batch:
+            budget = budget.scale(len(inputs))
+        message = (batch, project_id, inputs, script, signature, budget.cpu_time, budget.memory)
+
+        worker = await self.__checkout__()
+        try:
+            status, value = await asyncio.get_running_loop().run_in_executor(self.threads, worker.call, message,
+                                                                              budget.deadline())
+        except asyncio.CancelledError:
+            # 子进程仍在执行被取消的任务
+            self.__replace__(worker)
+            raise
+        except (EOFError, OSError):
+            # 脚本导致进程崩溃或进程被系统终止
+            logger.error("执行脚本的子进程异常退出, exitcode = %s, 重新启动", worker.process.exitcode)
+            self.__replace__(worker)
+            raise Exception("执行脚本的子进程异常退出")
+
+        if status == TIMEOUT:
+            logger.error("脚本执行超时, 终止子进程, project = %s, timeout = %s", project_id, budget.deadline())
+            self.__replace__(worker)
+        else:
+            self.idle.put_nowait(worker)
+
+        if status == OK:
+            return value
+        if status == ERROR:
+            raise Exception(value)
+        self.exceeded[status] += 1
+        raise BudgetExceeded(status, budget.limit(status), project_id)
+
+    def stats(self) -> dict[str, int]:
+        stats = super().stats()
+        stats["restarts"] = self.restarts
+        stats["exceeded"] = dict(self.exceeded)
+        return stats
+
+
+def load_plugin_config(path: str) -> dict:
+    """
+    读取配置文件, 用于获取 SDK 不支持的 executor 及 bytecode-cache 等配置
+    :param path: 配置文件路径
+    :return: 配置内容. 配置文件不存在时返回空字典
+    """
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        config = yaml.load(f, yaml.FullLoader)
+    return config if isinstance(config, dict) else {}
+
+
+def create_executor(config: Optional[dict], store: Optional[BytecodeStore] = None) -> ScriptExecutor:
+    """
+    根据配置文件中的 executor 配置创建脚本执行后端
+    :param config: executor 配置. 为 None 或未配置 mode 时在事件循环中逐个执行, 与之前的行为相同
+    :param store: 已编译脚本的磁盘缓存. 只用于 process 方式, 其它方式由插件使用
+    :raise ValueError: 不支持的执行方式
+    """
+    config = config or {}
+    mode = config.get("mode", INLINE)
+    workers = config.get("workers")
+    concurrency = config.get("concurrency")
+    budgets = load_budget_policy(config.get("budget"))
+    if budgets is not None and mode != PROCESS:
+        logger.warning("资源限制只在 process 方式下生效, 当前执行方式: %s", mode)
+    if mode == INLINE:
+        return InlineExecutor(1 if concurrency is None else concurrency)
+    if mode == THREAD:
+        return ThreadExecutor(4 if workers is None else workers, concurrency)
+    if mode == PROCESS:
+        cache = config.get("cache") or {}
+        return ProcessExecutor(0 if workers is None else workers, concurrency,
+                               cache_size=cache.get("max-size", 1000), cache_policy=cache.get("policy", "lru"),
+                               cache_ttl=cache.get("ttl", 3600), store=store, budgets=budgets)
+    raise ValueError("不支持的脚本执行方式: {}".format(mode))
+
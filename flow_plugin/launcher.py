@@ -0,0 +1,110 @@
+"""
+并发处理请求的流程插件启动器.
+
+SDK 的 FlowPluginLauncher 在收到请求后等待执行完成并返回结果, 才读取下一个请求, 同一时间只能执行一个任务.
+ConcurrentFlowPluginLauncher 为每个请求创建一个任务, 任务执行完成后立即返回结果, 结果的顺序与请求的顺序无关
+(流程引擎按 elementJob 匹配结果). 同时执行的任务数量由插件的脚本执行后端限制.
+"""
+import asyncio
+import logging
+import traceback
+from typing import Awaitable, Callable
+
+import grpc
+from grpc.aio import Metadata, StreamStreamCall
+
+from airiot_python_sdk.flow_plugin import FlowTask, startup
+from airiot_python_sdk.flow_plugin.launcher import FlowPluginLauncher
+from airiot_python_sdk.flow_plugin.protos.engine_pb2 import FlowRequest, FlowResponse
+
+from flow_plugin.budget import BudgetExceeded
+
+logger = logging.getLogger("flow_plugin_launcher")
+
+
+class ConcurrentFlowPluginLauncher(FlowPluginLauncher):
+    """
+    并发处理请求的流程插件启动器
+    """
+
+    def __metadata__(self) -> Metadata:
+        metadata = Metadata()
+        metadata.add("name", self.plugin.get_name().encode("utf-8").hex())
+        metadata.add("mode", self.plugin.get_type().value.encode("utf-8").hex())
+        return metadata
+
+    async def __register__(self):
+        self.register_stream = self.servicer.Register(metadata=self.__metadata__())
+        logger.info("plugin register successfully, start to receive requests")
+        await self.__serve__(self.register_stream, self.__handle_request__)
+
+    async def __debug_stream__(self):
+        self.debug_stream = self.servicer.DebugStream(metadata=self.__metadata__())
+        logger.info("plugin debug register successfully, start to receive debug requests")
+        await self.__serve__(self.debug_stream, self.__handle_debug_request__)
+
+    async def __handle_request__(self, request: FlowRequest) -> FlowResponse:
+        """
+        执行请求. 超出资源限制时在 detail 中返回 JSON 格式的详细信息, 其它情况与 SDK 相同
+        """
+        try:
+            result = await self.plugin.execute(
+                FlowTask(request.projectId, request.flowId, request.job, request.elementId,
+                         request.elementJob, request.config))
+            return FlowResponse(status=True, elementJob=request.elementJob,
+                                info=result.message, detail=result.details,
+                                result=self.json_encoder.encode(result.data).encode("utf-8"))
+        except BudgetExceeded as e:
+            logger.error("超出资源限制, project=%s, flowId=%s, job=%s, elementId=%s, elementJob=%s, %s",
+                         request.projectId, request.flowId, request.job,
+                         request.elementId, request.elementJob, e)
+            return FlowResponse(status=False, elementJob=request.elementJob,
+                                info="执行异常, {}".format(e), detail=e.detail())
+        except Exception as e:
+            traceback.print_exception(e)
+            logger.error("执行异常, project=%s, flowId=%s, job=%s, elementId=%s, elementJob=%s, exception=%s",
+                         request.projectId, request.flowId, request.job,
+                         request.elementId, request.elementJob, e)
+            return FlowResponse(status=False, elementJob=request.elementJob,
+                                info="执行异常, {}".format(e), detail="")
+
+    @staticmethod
+    async def __serve__(stream: StreamStreamCall, handler: Callable[[any], Awaitable[any]]):
+        """
+        读取请求并为每个请求创建任务, 任务执行完成后写回结果. 同一个流同时只能有一个写操作
+        :param stream: 请求流
+        :param handler: 请求处理方法
+        """
+        loop = asyncio.get_running_loop()
+        write_lock = asyncio.Lock()
+        tasks = set()
+
+        async def handle(request):
+            response = await handler(request)
+            try:
+                async with write_lock:
+                    await stream.write(response)
+            except Exception as e:
+                traceback.print_exception(e)
+                logger.error("返回执行结果失败, elementJob=%s, %s", request.elementJob, e)
+
+        try:
+            async for request in stream:
+                if request == grpc.aio.EOF:
+                    logger.info("stream closed")
+                    break
+
+                task = loop.create_task(handle(request))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        finally:
+            # 流关闭后不能再返回结果, 取消正在执行的任务
+            for task in tasks:
+                task.cancel()
+
+
+def install_concurrent_launcher():
+    """
+    替换 SDK Startup 使用的 FlowPluginLauncher. 必须在启动流程插件之前调用
+    """
+    startup.FlowPluginLauncher = ConcurrentFlowPluginLauncher
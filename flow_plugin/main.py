@@ -1,11 +1,24 @@
-from airiot_python_sdk.flow_plugin.startup import Startup
+from airiot_python_sdk.flow_plugin.startup import Startup, parser
 
+from flow_plugin.executor import PROCESS, create_executor, load_plugin_config
+from flow_plugin.launcher import install_concurrent_launcher
 from flow_plugin.python_script_plugin import PythonScriptPlugin
-from flow_plugin.script_cache import create_cache
+from flow_plugin.script_cache import create_bytecode_store, create_cache
 
 if __name__ == '__main__':
+    install_concurrent_launcher()
+
+    command_line, _ = parser.parse_known_args()
+    config = load_plugin_config(command_line.config)
+    store = create_bytecode_store(config.get("bytecode-cache"))
+    executor = create_executor(config.get("executor"), store)
+
+    batch = config.get("batch") or {}
+
     cache = create_cache()
-    plugin = PythonScriptPlugin(cache)
+    # 使用子进程执行时由子进程读取磁盘缓存
+    plugin = PythonScriptPlugin(cache, executor, store=None if executor.mode == PROCESS else store,
+                                batch_window=batch.get("window", 0) / 1000, batch_size=batch.get("max-size", 1000))
 
     startup = Startup()
     startup.run(plugin)
@@ -1,14 +1,23 @@
-import hashlib
 import json
 import logging
+import time
 import traceback
 from threading import Lock
+from types import CodeType
+from typing import Optional
 
 from airiot_python_sdk.flow_plugin import FlowPlugin, FlowTask, FlowResult, FlowPluginType, DebugTask, DebugResult
 from cacheout import Cache
 
+from flow_plugin.batching import BatchGatherer, supports_batch
+from flow_plugin.budget import BudgetExceeded
+from flow_plugin.executor import InlineExecutor, ScriptExecutor
+from flow_plugin.script_cache import BytecodeStore, CompileCache, ConfigCache, create_cache
+
 logger = logging.getLogger("python-script-plugin")
 entrypoint = "execute"
+# 可选的批量执行入口函数. 参数为输入参数列表, 返回与输入参数一一对应的执行结果列表
+batch_entrypoint = "execute_batch"
 globalParameters = {}
 
 
@@ -18,20 +27,43 @@ class Runner:
         if entrypoint not in ctx:
             raise Exception("未找到入口函数 execute")
         self.execute = ctx[entrypoint]
+        self.execute_batch = ctx.get(batch_entrypoint)
 
     def execute(self, inputs: dict) -> dict:
         return self.execute(inputs)
 
 
 class PythonScriptPlugin(FlowPlugin):
-    compile_lock = Lock()
     health_lock = Lock()
     jsonDecoder = json.JSONDecoder()
     jsonEncoder = json.JSONEncoder()
     cache: Cache
-
-    def __init__(self, cache: Cache):
+    # 已编译的脚本. 命中时不加锁, 同一脚本同时只编译一次
+    compiled: CompileCache
+    # 节点配置的解析缓存
+    configs: ConfigCache
+    # 已编译脚本的磁盘缓存. 为 None 时不使用
+    store: Optional[BytecodeStore]
+    # 启动时从磁盘缓存预加载的 code 对象. key 为脚本签名, 第一次执行该脚本时取出并执行脚本的顶层代码
+    warmed: dict[str, CodeType]
+    # 脚本执行后端. 默认在事件循环中执行
+    executor: ScriptExecutor
+    # 合并定义了 execute_batch 的脚本的任务. 为 None 时逐个执行
+    batch: Optional[BatchGatherer]
+
+    def __init__(self, cache: Cache, executor: Optional[ScriptExecutor] = None, config_cache: Optional[Cache] = None,
+                 store: Optional[BytecodeStore] = None, batch_window: float = 0, batch_size: int = 1000):
+        """
+        :param batch_window: 合并任务的等待时间(秒). 为 0 时不合并
+        :param batch_size: 每批最多合并的任务数量
+        """
         self.cache = cache
+        self.store = store
+        self.warmed = {}
+        self.compiled = CompileCache(cache, self.__compile__)
+        self.configs = ConfigCache(create_cache() if config_cache is None else config_cache)
+        self.executor = InlineExecutor() if executor is None else executor
+        self.batch = BatchGatherer(self.executor, batch_window, batch_size) if batch_window > 0 else None
 
     def get_name(self) -> str:
         return "pythonScript"
@@ -46,46 +78,83 @@ class PythonScriptPlugin(FlowPlugin):
             logger.info("connection state change: disconnected")
 
     def start(self):
-        logger.info("start python script plugin")
+        logger.info("start python script plugin, executor: %s", self.executor.mode)
+        self.warm()
+        self.executor.start(self._execute, self._execute_batch)
 
     def stop(self):
-        logger.info("stop python script plugin")
+        logger.info("stop python script plugin, stats: %s", self.stats())
+        self.executor.stop()
+        if self.store is not None:
+            self.store.touch(self.cache.keys())
+
+    def warm(self) -> int:
+        """
+        从磁盘缓存中读取最近使用的已编译脚本. 只读取 code 对象, 不执行脚本的顶层代码,
+        收到使用该脚本的请求时才执行
+        :return: 读取的脚本数量
+        """
+        if self.store is None:
+            return 0
+
+        begin = time.perf_counter()
+        for signature, code in self.store.warm():
+            self.warmed[signature] = code
+        logger.info("warm: %d scripts, %.1f ms", len(self.warmed), (time.perf_counter() - begin) * 1000)
+        return len(self.warmed)
+
+    def stats(self) -> dict[str, dict]:
+        """
+        获取编译缓存、配置缓存、执行后端及批量执行的统计信息. 使用子进程执行时, 子进程中的编译缓存不统计
+        """
+        return {
+            "compile": self.compiled.stats(),
+            "config": self.configs.stats(),
+            "executor": self.executor.stats(),
+            "store": {} if self.store is None else self.store.stats(),
+            "batch": {} if self.batch is None else self.batch.stats(),
+        }
 
     async def execute(self, request: FlowTask) -> FlowResult:
-        config = self.jsonDecoder.decode(request.config.decode("utf-8"))
-        inputs = config["input"]
-        content = config["content"]
+        inputs, content, signature = self.configs.decode(request.config)
 
-        # 执行脚本
+        # 执行脚本. 定义了 execute_batch 的脚本与相同脚本的其它任务合并执行
         try:
-            result = self._execute(request.projectId, inputs, content)
+            if self.batch is not None and supports_batch(content):
+                result = await self.batch.submit(request.projectId, inputs, content, signature)
+            else:
+                result = await self.executor.submit(request.projectId, inputs, content, signature)
             logger.debug("run: success, args = %s, result = %s, script: \r\n%s", inputs, result, content)
             return FlowResult(message="OK", details="", data=result)
+        except BudgetExceeded as e:
+            logger.warning("run: budget exceeded, project = %s, %s, script: \r\n%s", request.projectId, e, content)
+            raise
         except Exception as e:
             logger.error("run: failed, reason = %s, args = %s, script: \r\n%s", e, inputs, content)
             traceback.print_exc()
             raise Exception("执行脚本异常, {}".format(traceback.format_exc()))
 
     async def debug(self, task: DebugTask) -> DebugResult:
-        config = self.jsonDecoder.decode(task.config.decode("utf-8"))
-        inputs = config["input"]
-        content = config["content"]
+        inputs, content, signature = self.configs.decode(task.config)
         # 执行脚本
         try:
-            result = self._execute(task.projectId, inputs, content)
+            result = await self.executor.submit(task.projectId, inputs, content, signature)
             logger.debug("debug: success, args = %s, result = %s, script: \r\n%s", inputs, result, content)
             return DebugResult(success=True, reason="", detail="", value=result, logs=[])
+        except BudgetExceeded as e:
+            logger.warning("debug: budget exceeded, project = %s, %s, script: \r\n%s", task.projectId, e, content)
+            return DebugResult(success=False, reason=str(e), detail=e.detail(), value=None, logs=[])
         except Exception as e:
             logger.error("debug: failed, reason = %s, args = %s, script: \r\n%s", e, inputs, content)
             traceback.print_exc()
             raise Exception("执行调试脚本异常, {}".format(traceback.format_exc()))
 
-    def _execute(self, project_id: str, inputs: dict, script: str) -> dict:
+    def _execute(self, project_id: str, inputs: dict, script: str, signature: Optional[str] = None) -> dict:
 
         # 编译脚本
         try:
             logger.debug("compile: script\r\n%s", script)
-            runner = self.compile(project_id, script)
+            runner = self.compile(project_id, script, signature)
         except Exception as e:
             logger.error("compile: failed, error = %s, script: \r\n%s", e, script)
             traceback.print_exc()
@@ -102,29 +171,70 @@ class PythonScriptPlugin(FlowPlugin):
             result = runner.execute(inputs)
             logger.debug("run: success, args = %s, result = %s, script: \r\n%s", inputs, result, script)
             return result
+        except MemoryError:
+            # 由执行后端判断是否超出内存限制
+            raise
         except Exception as e:
             logger.error("run: failed, reason = %s, args = %s, script: \r\n%s", e, inputs, script)
             traceback.print_exc()
             raise Exception("执行脚本异常, {}".format(traceback.format_exc()))
 
-    def compile(self, project_id: str, script: str) -> Runner:
-        # 获取脚本的 md5 值
-        signature = hashlib.md5(script.encode("utf-8")).hexdigest()
-        with self.compile_lock:
-            # 如果脚本已经编译过, 则直接返回
-            if self.cache.has(signature):
-                logger.debug("compile: compiled. signature = %s, script: \r\n%s", signature, script)
-                return self.cache.get(signature)
+    def _execute_batch(self, project_id: str, inputs: list[dict], script: str,
+                       signature: Optional[str] = None) -> list[tuple[bool, any]]:
+        """
+        批量执行脚本. 脚本定义了 execute_batch 时调用一次, 否则逐个调用 execute
+        :return: 与输入参数一一对应的 (是否成功, 执行结果或错误信息). execute_batch 执行失败时所有任务都失败
+        """
+        try:
+            runner = self.compile(project_id, script, signature)
+        except Exception as e:
+            logger.error("compile: failed, error = %s, script: \r\n%s", e, script)
+            traceback.print_exc()
+            return [(False, "编译脚本异常, {}".format(traceback.format_exc()))] * len(inputs)
+
+        if runner.execute_batch is None:
+            results = []
+            for item in inputs:
+                try:
+                    results.append((True, runner.execute(item)))
+                except MemoryError:
+                    raise
+                except Exception as e:
+                    logger.error("run: failed, reason = %s, args = %s, script: \r\n%s", e, item, script)
+                    results.append((False, "执行脚本异常, {}".format(traceback.format_exc())))
+            return results
 
-            # 如果没有编译过则重新编译并缓存编译结果
-            logger.debug("compile: signature = %s, script: \r\n%s", signature, script)
+        try:
+            results = list(runner.execute_batch(inputs))
+            if len(results) != len(inputs):
+                raise Exception("execute_batch 返回 {} 个结果, 输入参数为 {} 个".format(len(results), len(inputs)))
+            logger.debug("run batch: success, size = %d, script: \r\n%s", len(inputs), script)
+            return [(True, result) for result in results]
+        except MemoryError:
+            raise
+        except Exception as e:
+            logger.error("run batch: failed, reason = %s, size = %d, script: \r\n%s", e, len(inputs), script)
+            traceback.print_exc()
+            return [(False, "执行脚本异常, {}".format(traceback.format_exc()))] * len(inputs)
+
+    def compile(self, project_id: str, script: str, signature: Optional[str] = None) -> Runner:
+        return self.compiled.get(script, signature)
 
-            ctx = {}
-            bytecode = compile(script, "<{}>".format(signature), "exec")
-            exec(bytecode, ctx)
+    def __compile__(self, signature: str, script: str) -> Runner:
+        # 未编译过的脚本, 优先使用预加载的 code 对象或从磁盘缓存读取, 否则编译并保存到磁盘缓存. 编译结果由 CompileCache 缓存
+        code = self.warmed.pop(signature, None)
+        if code is None and self.store is not None:
+            code = self.store.load(signature)
+        if code is None:
+            logger.debug("compile: signature = %s, script: \r\n%s", signature, script)
+            code = compile(script, "<{}>".format(signature), "exec")
+            if self.store is not None:
+                self.store.save(signature, code)
 
-            logger.debug("compile: signature = %s, script: \r\n%s \r\nctx = %s", signature, script, ctx)
+        return self.__load__(code)
 
-            runner = Runner(ctx)
-            self.cache.add(signature, runner)
-            return runner
+    @staticmethod
+    def __load__(code: CodeType) -> Runner:
+        ctx = {}
+        exec(code, ctx)
+        return Runner(ctx)
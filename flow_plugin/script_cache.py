@@ -1,8 +1,29 @@
+import concurrent.futures
+import hashlib
+import importlib.util
+import json
+import logging
+import marshal
+import mmap
+import os
+import stat
+import sys
+import time
+from threading import Lock
+from types import CodeType
+from typing import Callable, Iterable, Optional
+
 from cacheout import Cache
 from cacheout.lfu import LFUCache
 from cacheout.lru import LRUCache
 from cacheout.mru import MRUCache
 
+logger = logging.getLogger("script-cache")
+
+# 已编译脚本文件的头部. 不同 Python 版本的字节码不兼容, 版本不同的文件视为无效
+BYTECODE_HEADER = importlib.util.MAGIC_NUMBER
+BYTECODE_SUFFIX = ".bin"
+
 
 def create_cache(max_size: int = 1000, policy: str = "lru", ttl: int = 3600) -> Cache:
     if policy == "lru":
@@ -15,3 +36,333 @@ def create_cache(max_size: int = 1000, policy: str = "lru", ttl: int = 3600) ->
         return MRUCache(maxsize=max_size, ttl=ttl)
 
     raise Exception("Unsupported evict policy: {}".format(policy))
+
+
+def private_dir(path: str) -> str:
+    """
+    创建只有当前用户可以访问的目录(0700). 目录已存在时检查类型及所有者, 并移除其它用户的访问权限
+    :param path: 目录路径
+    :return: 目录路径
+    :raise PermissionError: 路径不是目录(包括符号链接)或目录不属于当前用户
+    """
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    info = os.lstat(path)
+    if not stat.S_ISDIR(info.st_mode):
+        raise PermissionError("缓存路径不是目录: {}".format(path))
+    if hasattr(os, "getuid"):
+        if info.st_uid != os.getuid():
+            raise PermissionError("缓存目录不属于当前用户: {}".format(path))
+        if info.st_mode & 0o077:
+            os.chmod(path, 0o700)
+    return path
+
+
+def script_signature(script: str) -> str:
+    """
+    计算脚本的签名(md5)
+    """
+    return hashlib.md5(script.encode("utf-8")).hexdigest()
+
+
+class CompileCache:
+    """
+    已编译脚本的缓存.
+
+    命中时只查询 cacheout 缓存, 不使用全局锁. 未命中时同一脚本只编译一次(single-flight):
+    同时请求同一脚本的其它线程等待第一个线程的编译结果, 编译不同脚本的线程互不等待.
+    统计值在多线程下为近似值
+
+    Attributes:
+        cache: 缓存已编译的脚本. key 为脚本签名
+        hits: 命中次数
+        misses: 未命中并编译的次数
+        coalesced: 等待其它线程编译结果的次数
+        compile_time: 编译的总耗时(秒)
+    """
+
+    cache: Cache
+
+    hits: int = 0
+    misses: int = 0
+    coalesced: int = 0
+    compile_time: float = 0.0
+
+    def __init__(self, cache: Cache, compiler: Callable[[str, str], any]):
+        """
+        :param cache: 缓存
+        :param compiler: 编译脚本的方法. 参数为 (脚本签名, 脚本内容), 返回编译结果
+        """
+        self.cache = cache
+        self.compiler = compiler
+        # 保护 inflight
+        self.lock = Lock()
+        # 正在编译的脚本. key 为脚本签名
+        self.inflight: dict[str, concurrent.futures.Future] = {}
+
+    def get(self, script: str, signature: Optional[str] = None) -> any:
+        """
+        获取已编译的脚本, 未编译时编译并缓存
+        :param script: 脚本内容
+        :param signature: 脚本签名. 为 None 时计算 md5
+        :return: 编译结果
+        :raise Exception: 编译失败. 等待同一次编译的所有线程都抛出相同的异常
+        """
+        if signature is None:
+            signature = script_signature(script)
+
+        compiled = self.cache.get(signature)
+        if compiled is not None:
+            self.hits += 1
+            return compiled
+
+        with self.lock:
+            # 可能在等待锁时已经编译完成
+            compiled = self.cache.get(signature)
+            if compiled is not None:
+                self.hits += 1
+                return compiled
+
+            future = self.inflight.get(signature)
+            owner = future is None
+            if owner:
+                future = self.inflight[signature] = concurrent.futures.Future()
+                self.misses += 1
+            else:
+                self.coalesced += 1
+
+        if not owner:
+            return future.result()
+
+        try:
+            begin = time.perf_counter()
+            compiled = self.compiler(signature, script)
+            self.compile_time += time.perf_counter() - begin
+            self.cache.set(signature, compiled)
+            future.set_result(compiled)
+            return compiled
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self.lock:
+                del self.inflight[signature]
+
+    def stats(self) -> dict[str, any]:
+        return {
+            "size": self.cache.size(),
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "compileTime": round(self.compile_time * 1000, 3),
+        }
+
+
+class ConfigCache:
+    """
+    节点配置的解析缓存. 同一流程节点每次请求的配置相同, 按配置的原始内容缓存脚本内容及签名,
+    命中时只解析输入参数, 不再解析整个配置及计算脚本签名. 输入参数每次重新解析, 脚本修改输入参数不影响其它请求
+
+    Attributes:
+        cache: key 为配置的原始内容, value 为 (输入参数 JSON, 脚本内容, 脚本签名)
+        hits: 命中次数
+        misses: 未命中次数
+    """
+
+    cache: Cache
+
+    hits: int = 0
+    misses: int = 0
+
+    json_decoder = json.JSONDecoder()
+    json_encoder = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"))
+
+    def __init__(self, cache: Cache):
+        self.cache = cache
+
+    def decode(self, config: bytes) -> tuple[dict, str, str]:
+        """
+        解析节点配置
+        :param config: 节点配置的原始内容
+        :return: (输入参数, 脚本内容, 脚本签名)
+        """
+        cached = self.cache.get(config)
+        if cached is not None:
+            self.hits += 1
+            inputs, content, signature = cached
+            return self.json_decoder.decode(inputs), content, signature
+
+        self.misses += 1
+        decoded = self.json_decoder.decode(config.decode("utf-8"))
+        inputs = decoded["input"]
+        content = decoded["content"]
+        signature = script_signature(content)
+        self.cache.set(config, (self.json_encoder.encode(inputs), content, signature))
+        return inputs, content, signature
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "size": self.cache.size(),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+class BytecodeStore:
+    """
+    已编译脚本的磁盘缓存. 保存 marshal 序列化的 code 对象, 插件重新启动或启动新的副本时不需要重新编译.
+
+    读取的 code 对象会被执行, 缓存目录及各版本的子目录只允许当前用户访问, 创建时检查所有者.
+    按 Python 版本分目录保存, 文件名为脚本签名. 读取时使用 mmap 映射文件, 每次读取更新文件的修改时间,
+    总大小超过上限时删除修改时间最早(最久未使用)的文件. 多个副本可以共享同一目录, 写入时先写临时文件再重命名
+
+    Attributes:
+        path: 当前 Python 版本的缓存目录
+        max_bytes: 缓存文件的总大小上限(字节)
+        warm_size: 启动时预加载的脚本数量
+        loads: 从磁盘读取成功的次数
+        saves: 写入磁盘的次数
+        evicted: 因超过大小上限删除的文件数量
+    """
+
+    path: str
+    max_bytes: int
+    warm_size: int
+
+    loads: int = 0
+    saves: int = 0
+    evicted: int = 0
+
+    def __init__(self, path: str, max_bytes: int = 64 * 1024 * 1024, warm_size: int = 200):
+        """
+        :raise PermissionError: 缓存目录不属于当前用户
+        """
+        if max_bytes <= 0:
+            raise ValueError("max_bytes must be greater than 0")
+        self.path = private_dir(os.path.join(private_dir(path), sys.implementation.cache_tag))
+        self.max_bytes = max_bytes
+        self.warm_size = warm_size
+
+    def __entry_path__(self, signature: str) -> str:
+        return os.path.join(self.path, signature + BYTECODE_SUFFIX)
+
+    def load(self, signature: str, touch: bool = True) -> Optional[CodeType]:
+        """
+        读取已编译的脚本
+        :param signature: 脚本签名
+        :param touch: 是否更新最近使用时间
+        :return: code 对象. 不存在或文件无效时返回 None
+        """
+        path = self.__entry_path__(signature)
+        try:
+            with open(path, "rb") as f:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                    if mapped[:len(BYTECODE_HEADER)] != BYTECODE_HEADER:
+                        logger.warning("已编译脚本文件无效: %s", path)
+                        return None
+                    with memoryview(mapped) as view:
+                        code = marshal.loads(view[len(BYTECODE_HEADER):])
+            if touch:
+                # 修改时间作为最近使用时间
+                os.utime(path)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, EOFError, TypeError) as e:
+            logger.warning("读取已编译脚本失败: %s, %s", path, e)
+            return None
+
+        self.loads += 1
+        return code
+
+    def save(self, signature: str, code: CodeType):
+        """
+        保存已编译的脚本. 超过大小上限时删除最久未使用的文件
+        :param signature: 脚本签名
+        :param code: code 对象
+        """
+        path = self.__entry_path__(signature)
+        tmp_path = "{}.{}.tmp".format(path, os.getpid())
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(BYTECODE_HEADER)
+                marshal.dump(code, f)
+            os.replace(tmp_path, path)
+        except (OSError, ValueError) as e:
+            logger.warning("写入已编译脚本失败: %s, %s", path, e)
+            return
+
+        self.saves += 1
+        self.__evict__()
+
+    def touch(self, signatures: Iterable[str]):
+        """
+        更新最近使用时间. 内存缓存命中时不读取磁盘, 停止时更新内存中的脚本, 下次启动时优先预加载
+        :param signatures: 脚本签名
+        """
+        for signature in signatures:
+            try:
+                os.utime(self.__entry_path__(signature))
+            except OSError:
+                pass
+
+    def __entries__(self) -> list[os.DirEntry]:
+        """
+        所有已编译脚本文件, 按最近使用时间倒序排列
+        """
+        try:
+            with os.scandir(self.path) as entries:
+                files = [entry for entry in entries if entry.name.endswith(BYTECODE_SUFFIX)]
+        except FileNotFoundError:
+            return []
+        files.sort(key=lambda entry: entry.stat().st_mtime, reverse=True)
+        return files
+
+    def __evict__(self):
+        total = 0
+        for entry in self.__entries__():
+            size = entry.stat().st_size
+            total += size
+            if total <= self.max_bytes:
+                continue
+            try:
+                os.remove(entry.path)
+                self.evicted += 1
+            except OSError:
+                # 可能已被其它副本删除
+                pass
+            total -= size
+
+    def warm(self) -> list[tuple[str, CodeType]]:
+        """
+        读取最近使用的 warm_size 个已编译脚本
+        :return: [(脚本签名, code 对象)]
+        """
+        result = []
+        for entry in self.__entries__()[:self.warm_size]:
+            signature = entry.name[:-len(BYTECODE_SUFFIX)]
+            code = self.load(signature, touch=False)
+            if code is not None:
+                result.append((signature, code))
+        return result
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "loads": self.loads,
+            "saves": self.saves,
+            "evicted": self.evicted,
+        }
+
+
+def create_bytecode_store(config: Optional[dict]) -> Optional[BytecodeStore]:
+    """
+    根据配置文件中的 bytecode-cache 配置创建已编译脚本的磁盘缓存
+    :param config: bytecode-cache 配置. 为 None 或未配置 path 时不使用磁盘缓存
+    """
+    if config is None or not config.get("path"):
+        return None
+    path = os.path.expanduser(config["path"])
+    try:
+        return BytecodeStore(path, max_bytes=config.get("max-size", 64) * 1024 * 1024,
+                             warm_size=config.get("warm", 200))
+    except OSError as e:
+        logger.warning("已编译脚本的缓存目录不可用, 不使用磁盘缓存: %s", e)
+        return None
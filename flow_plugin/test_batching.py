@@ -0,0 +1,153 @@
+import asyncio
+import json
+import unittest
+
+from airiot_python_sdk.flow_plugin import FlowTask
+
+from flow_plugin.batching import supports_batch
+from flow_plugin.budget import BudgetExceeded, load_budget_policy
+from flow_plugin.executor import ProcessExecutor, ThreadExecutor
+from flow_plugin.python_script_plugin import PythonScriptPlugin
+from flow_plugin.script_cache import create_cache
+
+batch_script = """
+calls = []
+
+def execute(inputs):
+    return {"value": inputs["value"] * 2, "batch": 0}
+
+def execute_batch(inputs_list):
+    calls.append(len(inputs_list))
+    if any(inputs["value"] < 0 for inputs in inputs_list):
+        raise ValueError("negative value")
+    return [{"value": inputs["value"] * 2, "batch": len(calls)} for inputs in inputs_list]
+"""
+
+single_script = """
+def execute(inputs):
+    if inputs["value"] < 0:
+        raise ValueError("negative value")
+    return {"value": inputs["value"] * 2}
+"""
+
+# 定义了 execute_batch 但返回的结果数量不正确
+broken_script = """
+def execute(inputs):
+    return {}
+
+def execute_batch(inputs_list):
+    return []
+"""
+
+
+# value 为负数的任务执行时间超出限制
+slow_script = """
+import time
+
+def execute(inputs):
+    if inputs["value"] < 0:
+        time.sleep(5)
+    return {"value": inputs["value"] * 2, "batch": 0}
+
+def execute_batch(inputs_list):
+    return [execute(inputs) for inputs in inputs_list]
+"""
+
+
+def create_task(project_id: str, value: int, script: str) -> FlowTask:
+    config = json.dumps({"input": {"value": value}, "content": script}).encode("utf-8")
+    return FlowTask(project_id, "flow1", "job1", "element1", "elementJob{}".format(value), config)
+
+
+class TestBatching(unittest.IsolatedAsyncioTestCase):
+
+    def test_supports_batch(self):
+        self.assertTrue(supports_batch(batch_script))
+        self.assertFalse(supports_batch(single_script))
+        self.assertFalse(supports_batch("def execute(inputs):\n    return execute_batch([inputs])"))
+
+    async def test_gather(self):
+        plugin = PythonScriptPlugin(create_cache(), batch_window=0.05, batch_size=4)
+        plugin.start()
+
+        tasks = [plugin.execute(create_task("p1", i, batch_script)) for i in range(6)]
+        tasks.append(plugin.execute(create_task("p2", 6, batch_script)))
+        results = await asyncio.gather(*tasks)
+
+        self.assertEqual([i * 2 for i in range(7)], [result.data["value"] for result in results])
+        # 达到 max_size 时立即执行, 其余任务等待时间结束后执行, 不同项目的任务不合并
+        self.assertEqual([4, 2, 1], plugin.compile("p1", batch_script).ctx["calls"])
+        self.assertEqual({"pending": 0, "batches": 3, "items": 7, "splits": 0}, plugin.batch.stats())
+        self.assertEqual(3, plugin.executor.executed)
+
+    async def test_batch_failure(self):
+        plugin = PythonScriptPlugin(create_cache(), batch_window=0.05)
+        plugin.start()
+
+        results = await asyncio.gather(plugin.execute(create_task("p1", 1, batch_script)),
+                                       plugin.execute(create_task("p1", -1, batch_script)),
+                                       return_exceptions=True)
+        # execute_batch 执行失败时同一批的任务都失败
+        self.assertIsInstance(results[0], Exception)
+        self.assertIn("negative value", str(results[1]))
+
+        with self.assertRaises(Exception) as context:
+            await plugin.execute(create_task("p1", 1, broken_script))
+        self.assertIn("execute_batch 返回 0 个结果", str(context.exception))
+
+    def test_fallback(self):
+        plugin = PythonScriptPlugin(create_cache())
+        results = plugin._execute_batch("p1", [{"value": 1}, {"value": -1}, {"value": 3}], single_script)
+
+        # 未定义 execute_batch 的脚本逐个执行, 一个任务失败不影响其它任务
+        self.assertEqual((True, {"value": 2}), results[0])
+        self.assertFalse(results[1][0])
+        self.assertIn("negative value", results[1][1])
+        self.assertEqual((True, {"value": 6}), results[2])
+
+        results = plugin._execute_batch("p1", [{"value": 1}], "def execute(inputs)")
+        self.assertFalse(results[0][0])
+        self.assertIn("编译脚本异常", results[0][1])
+
+    async def test_single_without_window(self):
+        plugin = PythonScriptPlugin(create_cache(), ThreadExecutor(workers=2))
+        plugin.start()
+        try:
+            # 未配置等待时间时逐个调用 execute
+            result = await plugin.execute(create_task("p1", 5, batch_script))
+            self.assertEqual({"value": 10, "batch": 0}, result.data)
+            self.assertIsNone(plugin.batch)
+        finally:
+            plugin.stop()
+
+    async def test_process(self):
+        plugin = PythonScriptPlugin(create_cache(), ProcessExecutor(workers=1), batch_window=0.05)
+        plugin.start()
+        try:
+            results = await asyncio.gather(*[plugin.execute(create_task("p1", i, batch_script)) for i in range(5)])
+            self.assertEqual([i * 2 for i in range(5)], [result.data["value"] for result in results])
+            self.assertEqual({1}, {result.data["batch"] for result in results})
+        finally:
+            plugin.stop()
+
+    async def test_split_when_budget_exceeded(self):
+        budgets = load_budget_policy({"timeout": 0.5})
+        plugin = PythonScriptPlugin(create_cache(), ProcessExecutor(workers=1, budgets=budgets), batch_window=0.05)
+        plugin.start()
+        try:
+            results = await asyncio.gather(*[plugin.execute(create_task("p1", i, slow_script)) for i in (1, -1, 2)],
+                                           return_exceptions=True)
+
+            # 超出限制的一批任务拆分为单个任务执行, 只有超出限制的任务失败
+            self.assertEqual({"value": 2, "batch": 0}, results[0].data)
+            self.assertIsInstance(results[1], BudgetExceeded)
+            self.assertEqual(("timeout", 0.5), (results[1].kind, results[1].limit))
+            self.assertEqual({"value": 4, "batch": 0}, results[2].data)
+            self.assertEqual(1, plugin.batch.stats()["splits"])
+            self.assertEqual(2, plugin.executor.restarts)
+        finally:
+            plugin.stop()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,144 @@
+import asyncio
+import json
+import unittest
+
+from airiot_python_sdk.flow_plugin import DebugTask, FlowTask
+from airiot_python_sdk.flow_plugin.protos.engine_pb2 import FlowRequest
+
+from flow_plugin.budget import Budget, BudgetExceeded, load_budget_policy
+from flow_plugin.executor import ProcessExecutor, create_executor
+from flow_plugin.launcher import ConcurrentFlowPluginLauncher
+from flow_plugin.python_script_plugin import PythonScriptPlugin
+from flow_plugin.script_cache import create_cache
+
+script = """
+import os
+import time
+
+def execute(inputs):
+    action = inputs.get("action")
+    if action == "loop":
+        # 捕获 Exception 的脚本也会被中断
+        try:
+            while True:
+                pass
+        except Exception:
+            return {"caught": True}
+    if action == "memory":
+        return {"size": len(bytearray(inputs["size"] * 1024 * 1024))}
+    if action == "sleep":
+        time.sleep(inputs["delay"])
+    if action == "exit":
+        os._exit(1)
+    return {"pid": os.getpid()}
+"""
+
+
+def create_config(**inputs) -> bytes:
+    return json.dumps({"input": inputs, "content": script}).encode("utf-8")
+
+
+def create_task(project_id: str, **inputs) -> FlowTask:
+    return FlowTask(project_id, "flow1", "job1", "element1", "elementJob1", create_config(**inputs))
+
+
+class TestBudget(unittest.IsolatedAsyncioTestCase):
+
+    def test_load_budget_policy(self):
+        self.assertIsNone(load_budget_policy(None))
+
+        budgets = load_budget_policy({"cpu-time": 2, "memory": 256, "projects": {"p1": {"cpu-time": 10}}})
+        self.assertEqual((2, 256, 5), (budgets.get("p2").cpu_time, budgets.get("p2").memory,
+                                       budgets.get("p2").deadline()))
+        # 项目未设置的值使用全局限制
+        self.assertEqual((10, 256), (budgets.get("p1").cpu_time, budgets.get("p1").memory))
+        self.assertEqual(0, Budget().deadline())
+        self.assertEqual(3, Budget(cpu_time=1, timeout=3).deadline())
+
+        # 批量执行时最多放大 MAX_BATCH_SCALE 倍
+        budget = Budget(1, 64, 2).scale(3)
+        self.assertEqual((3, 64, 6), (budget.cpu_time, budget.memory, budget.timeout))
+        budget = Budget(1, 64, 2).scale(1000)
+        self.assertEqual((10, 64, 20), (budget.cpu_time, budget.memory, budget.timeout))
+
+        executor = create_executor({"mode": "process", "budget": {"timeout": 1}})
+        self.assertEqual(1, executor.budgets.get("p1").timeout)
+
+    async def test_process_budget(self):
+        budgets = load_budget_policy({"cpu-time": 1, "memory": 64, "timeout": 3,
+                                      "projects": {"p2": {"timeout": 0.5}}})
+        plugin = PythonScriptPlugin(create_cache(), ProcessExecutor(workers=1, budgets=budgets))
+        plugin.start()
+        try:
+            pid = (await plugin.execute(create_task("p1"))).data["pid"]
+
+            with self.assertRaises(BudgetExceeded) as context:
+                await plugin.execute(create_task("p1", action="loop"))
+            self.assertEqual(("cpu-time", 1, "p1"), (context.exception.kind, context.exception.limit,
+                                                     context.exception.project_id))
+
+            with self.assertRaises(BudgetExceeded) as context:
+                await plugin.execute(create_task("p1", action="memory", size=256))
+            self.assertEqual("memory", context.exception.kind)
+            self.assertEqual({"size": 16 * 1024 * 1024},
+                             (await plugin.execute(create_task("p1", action="memory", size=16))).data)
+
+            # 超出 CPU 时间及内存限制时子进程继续使用
+            self.assertEqual(pid, (await plugin.execute(create_task("p1"))).data["pid"])
+
+            with self.assertRaises(BudgetExceeded) as context:
+                await plugin.execute(create_task("p2", action="sleep", delay=5))
+            self.assertEqual(("timeout", 0.5), (context.exception.kind, context.exception.limit))
+
+            # 超时后终止子进程并启动新的子进程
+            self.assertNotEqual(pid, (await plugin.execute(create_task("p1"))).data["pid"])
+            self.assertEqual(1, plugin.executor.restarts)
+            self.assertEqual({"cpu-time": 1, "memory": 1, "timeout": 1}, plugin.executor.stats()["exceeded"])
+        finally:
+            plugin.stop()
+
+    async def test_process_recovery(self):
+        executor = ProcessExecutor(workers=1, concurrency=2)
+        plugin = PythonScriptPlugin(create_cache(), executor)
+        plugin.start()
+        try:
+            with self.assertRaises(Exception):
+                await plugin.execute(create_task("p1", action="exit"))
+
+            # 被取消的任务所在的子进程被替换, 不占用执行位置
+            task = asyncio.create_task(plugin.execute(create_task("p1", action="sleep", delay=5)))
+            await asyncio.sleep(0.5)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+
+            result = await asyncio.wait_for(plugin.execute(create_task("p1")), 10)
+            self.assertIn("pid", result.data)
+            self.assertEqual(2, executor.restarts)
+            self.assertEqual(1, len(executor.processes))
+        finally:
+            plugin.stop()
+
+    async def test_structured_failure(self):
+        budgets = load_budget_policy({"timeout": 0.5})
+        plugin = PythonScriptPlugin(create_cache(), ProcessExecutor(workers=1, budgets=budgets))
+        plugin.start()
+        try:
+            launcher = ConcurrentFlowPluginLauncher(None, plugin)
+            response = await launcher.__handle_request__(
+                FlowRequest(projectId="p1", flowId="flow1", job="job1", elementId="element1", elementJob="ej1",
+                            config=create_config(action="sleep", delay=5)))
+            self.assertFalse(response.status)
+            self.assertEqual({"error": "budgetExceeded", "kind": "timeout", "limit": 0.5, "projectId": "p1"},
+                             json.loads(response.detail))
+
+            result = await plugin.debug(DebugTask("p1", "flow1", "element1",
+                                                  create_config(action="sleep", delay=5)))
+            self.assertFalse(result.success)
+            self.assertEqual("timeout", json.loads(result.detail)["kind"])
+        finally:
+            plugin.stop()
+
+
+if __name__ == '__main__':
+    unittest.main()
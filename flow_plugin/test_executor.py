@@ -0,0 +1,196 @@
+import asyncio
+import json
+import os
+import unittest
+
+import grpc
+from airiot_python_sdk.flow_plugin import FlowTask
+
+from flow_plugin.executor import FairLimiter, InlineExecutor, ProcessExecutor, ThreadExecutor, create_executor
+from flow_plugin.launcher import ConcurrentFlowPluginLauncher
+from flow_plugin.python_script_plugin import PythonScriptPlugin
+from flow_plugin.script_cache import create_cache
+
+script = """
+import os
+import time
+
+def execute(inputs):
+    time.sleep(inputs.get("delay", 0))
+    return {"value": inputs["value"] * 2, "pid": os.getpid()}
+"""
+
+
+def create_task(project_id: str, value: int, delay: float = 0) -> FlowTask:
+    config = json.dumps({"input": {"value": value, "delay": delay}, "content": script}).encode("utf-8")
+    return FlowTask(project_id, "flow1", "job1", "element1", "elementJob{}".format(value), config)
+
+
+class FakeStream:
+    """
+    模拟请求流. 写入结果时检查是否有并发写入
+    """
+
+    def __init__(self, requests: list):
+        self.requests = requests
+        self.responses = []
+        self.writing = False
+        self.done = asyncio.Event()
+
+    def __aiter__(self):
+        return self.__iterate__()
+
+    async def __iterate__(self):
+        for request in self.requests:
+            yield request
+        await self.done.wait()
+        yield grpc.aio.EOF
+
+    async def write(self, response):
+        assert not self.writing
+        self.writing = True
+        await asyncio.sleep(0)
+        self.writing = False
+        self.responses.append(response)
+        if len(self.responses) == len(self.requests):
+            self.done.set()
+
+
+class TestFairLimiter(unittest.IsolatedAsyncioTestCase):
+
+    async def test_round_robin(self):
+        limiter = FairLimiter(1)
+        await limiter.acquire("p0")
+
+        order = []
+
+        async def run(project_id: str, index: int):
+            await limiter.acquire(project_id)
+            order.append("{}-{}".format(project_id, index))
+            limiter.release()
+
+        # p1 的任务先进入队列, 但每个项目轮流执行
+        tasks = [asyncio.create_task(run("p1", i)) for i in range(3)]
+        tasks += [asyncio.create_task(run("p2", i)) for i in range(2)]
+        await asyncio.sleep(0)
+        self.assertEqual(5, limiter.pending)
+
+        limiter.release()
+        await asyncio.gather(*tasks)
+        self.assertEqual(["p1-0", "p2-0", "p1-1", "p2-1", "p1-2"], order)
+        self.assertEqual(0, limiter.running)
+
+    async def test_cancel(self):
+        limiter = FairLimiter(1)
+        await limiter.acquire("p1")
+        waiting = asyncio.create_task(limiter.acquire("p1"))
+        await asyncio.sleep(0)
+        waiting.cancel()
+        await asyncio.gather(waiting, return_exceptions=True)
+        self.assertEqual(0, limiter.pending)
+
+        limiter.release()
+        self.assertEqual(0, limiter.running)
+
+    async def test_cancel_before_release(self):
+        limiter = FairLimiter(1)
+        await limiter.acquire("p1")
+        waiting = asyncio.create_task(limiter.acquire("p1"))
+        other = asyncio.create_task(limiter.acquire("p2"))
+        await asyncio.sleep(0)
+
+        # 任务被取消后、恢复执行前 release 已经取出了该任务
+        waiting.cancel()
+        limiter.release()
+        with self.assertRaises(asyncio.CancelledError):
+            await waiting
+        await other
+        self.assertEqual((0, 1), (limiter.pending, limiter.running))
+
+        limiter.release()
+        self.assertEqual(0, limiter.running)
+
+
+class TestExecutor(unittest.IsolatedAsyncioTestCase):
+
+    async def test_thread_does_not_block_loop(self):
+        plugin = PythonScriptPlugin(create_cache(), ThreadExecutor(workers=4))
+        plugin.start()
+        try:
+            ticks = 0
+
+            async def tick():
+                nonlocal ticks
+                while True:
+                    await asyncio.sleep(0.01)
+                    ticks += 1
+
+            ticker = asyncio.create_task(tick())
+            results = await asyncio.gather(*[plugin.execute(create_task("p1", i, 0.1)) for i in range(4)])
+            ticker.cancel()
+
+            self.assertEqual([0, 2, 4, 6], [result.data["value"] for result in results])
+            # 脚本在线程中执行时事件循环继续运行, 4 个任务并发执行
+            self.assertGreater(ticks, 3)
+            self.assertEqual(4, plugin.executor.executed)
+        finally:
+            plugin.stop()
+
+    async def test_inline(self):
+        plugin = PythonScriptPlugin(create_cache())
+        self.assertIsInstance(plugin.executor, InlineExecutor)
+        plugin.start()
+        result = await plugin.execute(create_task("p1", 21))
+        self.assertEqual(42, result.data["value"])
+
+        with self.assertRaises(Exception):
+            await plugin.execute(FlowTask("p1", "f1", "j1", "e1", "ej1",
+                                          json.dumps({"input": {}, "content": script}).encode("utf-8")))
+        self.assertEqual({"running": 0, "pending": 0, "executed": 1, "failed": 1}, plugin.executor.stats())
+
+    async def test_process(self):
+        plugin = PythonScriptPlugin(create_cache(), ProcessExecutor(workers=2))
+        plugin.start()
+        try:
+            results = await asyncio.gather(*[plugin.execute(create_task("p{}".format(i % 2), i)) for i in range(6)])
+            self.assertEqual([i * 2 for i in range(6)], [result.data["value"] for result in results])
+            self.assertNotIn(os.getpid(), [result.data["pid"] for result in results])
+        finally:
+            plugin.stop()
+
+    def test_create_executor(self):
+        # 默认在事件循环中逐个执行
+        executor = create_executor(None)
+        self.assertIsInstance(executor, InlineExecutor)
+        self.assertEqual(1, executor.limiter.limit)
+        self.assertIsInstance(create_executor({"workers": 4}), InlineExecutor)
+        self.assertIsInstance(create_executor({"mode": "thread"}), ThreadExecutor)
+        self.assertIsInstance(create_executor({"mode": "inline"}), InlineExecutor)
+        executor = create_executor({"mode": "process", "workers": 3, "concurrency": 6, "cache": {"max-size": 10}})
+        self.assertEqual((3, 6, 10), (executor.workers, executor.limiter.limit, executor.cache_size))
+        with self.assertRaises(ValueError):
+            create_executor({"mode": "gpu"})
+
+
+class TestConcurrentLauncher(unittest.IsolatedAsyncioTestCase):
+
+    async def test_results_as_completed(self):
+        stream = FakeStream([create_task("p1", 1, 0.2), create_task("p1", 2, 0.1), create_task("p2", 3, 0)])
+
+        plugin = PythonScriptPlugin(create_cache(), ThreadExecutor(workers=3))
+        plugin.start()
+        try:
+            async def handle(request: FlowTask) -> str:
+                result = await plugin.execute(request)
+                return "{}={}".format(request.elementJob, result.data["value"])
+
+            await asyncio.wait_for(ConcurrentFlowPluginLauncher.__serve__(stream, handle), 5)
+        finally:
+            plugin.stop()
+
+        # 执行完成后立即返回结果, 不按请求的顺序
+        self.assertEqual(["elementJob3=6", "elementJob2=4", "elementJob1=2"], stream.responses)
+
+
+if __name__ == '__main__':
+    unittest.main()
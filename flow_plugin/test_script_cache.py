@@ -0,0 +1,172 @@
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+from flow_plugin.python_script_plugin import PythonScriptPlugin
+from flow_plugin.script_cache import BytecodeStore, CompileCache, ConfigCache, create_bytecode_store, create_cache, \
+    script_signature
+
+
+class TestCompileCache(unittest.TestCase):
+
+    def test_single_flight(self):
+        calls = []
+
+        def compiler(signature: str, script: str):
+            calls.append(signature)
+            time.sleep(0.1)
+            return script.upper()
+
+        cache = CompileCache(create_cache(), compiler)
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(cache.get("abc"))) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(["ABC"] * 8, results)
+        self.assertEqual([script_signature("abc")], calls)
+        self.assertEqual("ABC", cache.get("abc"))
+
+        stats = cache.stats()
+        self.assertEqual(1, stats["misses"])
+        self.assertEqual(8, stats["hits"] + stats["coalesced"])
+        self.assertGreaterEqual(stats["compileTime"], 100)
+
+    def test_failure(self):
+        attempts = []
+
+        def compiler(signature: str, script: str):
+            attempts.append(signature)
+            raise SyntaxError("invalid syntax")
+
+        cache = CompileCache(create_cache(), compiler)
+        with self.assertRaises(SyntaxError):
+            cache.get("x", "s1")
+        # 编译失败不缓存, 再次请求时重新编译
+        with self.assertRaises(SyntaxError):
+            cache.get("x", "s1")
+        self.assertEqual(["s1", "s1"], attempts)
+        self.assertEqual({}, cache.inflight)
+
+
+class TestConfigCache(unittest.TestCase):
+
+    def test_decode(self):
+        configs = ConfigCache(create_cache())
+        raw = json.dumps({"input": {"a": [1, 2], "名称": "值"}, "content": "def execute(inputs): pass"}).encode("utf-8")
+
+        inputs, content, signature = configs.decode(raw)
+        self.assertEqual({"a": [1, 2], "名称": "值"}, inputs)
+        self.assertEqual(script_signature(content), signature)
+
+        # 修改输入参数不影响缓存
+        inputs["a"].append(3)
+        cached_inputs, cached_content, cached_signature = configs.decode(bytes(raw))
+        self.assertEqual({"a": [1, 2], "名称": "值"}, cached_inputs)
+        self.assertIs(content, cached_content)
+        self.assertEqual({"size": 1, "hits": 1, "misses": 1}, configs.stats())
+
+    def test_plugin_compiles_once(self):
+        plugin = PythonScriptPlugin(create_cache())
+        script = "def execute(inputs):\n    return {'value': inputs['value'] + 1}\n"
+        for i in range(3):
+            self.assertEqual({"value": i + 1}, plugin._execute("p1", {"value": i}, script))
+        self.assertEqual(1, plugin.stats()["compile"]["misses"])
+        self.assertEqual(2, plugin.stats()["compile"]["hits"])
+
+
+class TestBytecodeStore(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_load_and_save(self):
+        store = BytecodeStore(self.dir.name)
+        self.assertIsNone(store.load("s1"))
+
+        store.save("s1", compile("value = 1 + 1", "<s1>", "exec"))
+        ctx = {}
+        exec(store.load("s1"), ctx)
+        self.assertEqual(2, ctx["value"])
+
+        # 其它 Python 版本或损坏的文件
+        with open(os.path.join(store.path, "s2.bin"), "wb") as f:
+            f.write(b"\x00\x00\x00\x00data")
+        self.assertIsNone(store.load("s2"))
+        with open(os.path.join(store.path, "s3.bin"), "wb") as f:
+            f.write(b"")
+        self.assertIsNone(store.load("s3"))
+
+    def test_evict_least_recently_used(self):
+        code = compile("value = '{}'".format("x" * 1000), "<s>", "exec")
+        store = BytecodeStore(self.dir.name, max_bytes=3000)
+        for i, signature in enumerate(("s1", "s2")):
+            store.save(signature, code)
+            os.utime(os.path.join(store.path, signature + ".bin"), (1000 + i, 1000 + i))
+
+        # s1 最近被使用, 写入 s3 后删除 s2
+        store.load("s1")
+        store.save("s3", code)
+        self.assertEqual(["s1.bin", "s3.bin"], sorted(os.listdir(store.path)))
+        self.assertEqual(1, store.evicted)
+
+    def test_warm_start(self):
+        script = "def execute(inputs):\n    return {'value': inputs['value'] * 3}\n"
+        store = BytecodeStore(self.dir.name)
+        plugin = PythonScriptPlugin(create_cache(), store=store)
+        plugin.start()
+        self.assertEqual({"value": 3}, plugin._execute("p1", {"value": 1}, script))
+        plugin.stop()
+
+        # 重新启动后从磁盘缓存预加载, 不需要编译
+        plugin = PythonScriptPlugin(create_cache(), store=BytecodeStore(self.dir.name, warm_size=10))
+        plugin.start()
+        self.assertEqual(1, len(plugin.warmed))
+        self.assertEqual({"value": 6}, plugin._execute("p1", {"value": 2}, script))
+        plugin.stop()
+        self.assertEqual({}, plugin.warmed)
+        self.assertEqual(0, plugin.store.saves)
+        self.assertEqual(1, plugin.store.loads)
+
+    def test_warm_defers_exec(self):
+        marker = os.path.join(self.dir.name, "marker")
+        script = "open({!r}, 'a').write('x')\n\ndef execute(inputs):\n    return {{}}\n".format(marker)
+        plugin = PythonScriptPlugin(create_cache(), store=BytecodeStore(self.dir.name))
+        plugin._execute("p1", {}, script)
+        os.remove(marker)
+
+        # 预加载时不执行脚本的顶层代码, 第一次执行时才执行
+        plugin = PythonScriptPlugin(create_cache(), store=BytecodeStore(self.dir.name))
+        self.assertEqual(1, plugin.warm())
+        self.assertFalse(os.path.exists(marker))
+        plugin._execute("p1", {}, script)
+        with open(marker) as f:
+            self.assertEqual("x", f.read())
+
+    def test_private_dir(self):
+        path = os.path.join(self.dir.name, "shared")
+        os.makedirs(path)
+        os.chmod(path, 0o777)
+        store = BytecodeStore(path)
+        self.assertEqual(0o700, os.stat(path).st_mode & 0o777)
+        self.assertEqual(0o700, os.stat(store.path).st_mode & 0o777)
+
+        # 符号链接可能指向其它用户控制的目录
+        link = os.path.join(self.dir.name, "link")
+        os.symlink(path, link)
+        with self.assertRaises(PermissionError):
+            BytecodeStore(link)
+        self.assertIsNone(create_bytecode_store({"path": link}))
+        self.assertIsNotNone(create_bytecode_store({"path": path}))
+
+
+if __name__ == '__main__':
+    unittest.main()